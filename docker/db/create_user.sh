@@ -9,4 +9,5 @@ $POSTGRES <<-EOSQL
 CREATE USER ${POSTGRES_ADMIN_USER} WITH CREATEDB SUPERUSER PASSWORD '${POSTGRES_ADMIN_PASSWORD}';
 \c iris_db;
 CREATE EXTENSION IF NOT EXISTS pgcrypto CASCADE;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 EOSQL
\ No newline at end of file
@@ -135,3 +135,6 @@ def shutdown_session(exception=None):
 
 
 from app import views
+from app.iris_engine.utils.tracker import init_activity_tracking
+
+init_activity_tracking(app)
@@ -0,0 +1,54 @@
+"""Add timeline events full-text and trigram search
+
+Revision ID: 0b7e4f9a2d63
+Revises: f3b9d6a2c814
+Create Date: 2026-10-18 16:04:33.118402
+
+"""
+from alembic import op
+
+from app.alembic.alembic_utils import _table_has_column
+
+
+# revision identifiers, used by Alembic.
+revision = '0b7e4f9a2d63'
+down_revision = 'f3b9d6a2c814'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('COMMIT')
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    # The search vector is maintained by PostgreSQL and is not mapped on the model. The content and raw fields are
+    # truncated so that very large raw lines cannot exceed the tsvector size limit, they remain fully searchable
+    # with the trigram indexes
+    if not _table_has_column('cases_events', 'event_search_vector'):
+        op.execute(
+            "ALTER TABLE cases_events ADD COLUMN event_search_vector tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('simple'::regconfig, coalesce(event_title, '')), 'A') || "
+            "setweight(to_tsvector('simple'::regconfig, coalesce(event_tags, '')), 'B') || "
+            "setweight(to_tsvector('simple'::regconfig, left(coalesce(event_content, ''), 100000)), 'B') || "
+            "setweight(to_tsvector('simple'::regconfig, coalesce(event_source, '')), 'C') || "
+            "setweight(to_tsvector('simple'::regconfig, left(coalesce(event_raw, ''), 100000)), 'D')"
+            ") STORED"
+        )
+
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_cases_events_search_vector '
+        'ON cases_events USING gin (event_search_vector)'
+    )
+
+    for column in ['event_title', 'event_content', 'event_source', 'event_tags', 'event_raw']:
+        op.execute(
+            f'CREATE INDEX IF NOT EXISTS ix_cases_events_{column}_trgm '
+            f'ON cases_events USING gin ({column} gin_trgm_ops)'
+        )
+
+    return
+
+
+def downgrade():
+    pass
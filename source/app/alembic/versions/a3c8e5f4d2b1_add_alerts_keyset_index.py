@@ -0,0 +1,30 @@
+"""Add alerts keyset pagination index
+
+Revision ID: a3c8e5f4d2b1
+Revises: 11aa5b725b8e
+Create Date: 2026-10-18 09:12:41.528113
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c8e5f4d2b1'
+down_revision = '11aa5b725b8e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('COMMIT')
+
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_alerts_source_event_time_alert_id '
+        'ON alerts (alert_source_event_time, alert_id)'
+    )
+
+    return
+
+
+def downgrade():
+    pass
@@ -0,0 +1,53 @@
+"""Add the kind of the user activities and their indexes
+
+Revision ID: a4c7e1f9b352
+Revises: e9c4b2a7d815
+Create Date: 2026-10-18 21:42:13.518204
+
+"""
+from alembic import op
+
+from app.alembic.alembic_utils import _table_has_column
+
+# revision identifiers, used by Alembic.
+revision = 'a4c7e1f9b352'
+down_revision = 'e9c4b2a7d815'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('COMMIT')
+
+    if not _table_has_column('user_activity', 'activity_kind'):
+        # A constant default does not rewrite the table
+        op.execute("ALTER TABLE user_activity ADD COLUMN activity_kind text NOT NULL DEFAULT 'case'")
+
+        # The activities which were told apart by the prefix of their description
+        op.execute(
+            "UPDATE user_activity SET activity_kind = 'global' "
+            "WHERE case_id IS NULL "
+            "OR activity_desc LIKE '[Unbound]%' "
+            "OR activity_desc LIKE 'Started a search for %' "
+            "OR activity_desc LIKE 'Started a global search for %' "
+            "OR activity_desc LIKE 'Updated global task %' "
+            "OR activity_desc LIKE 'Created new global task %' "
+            "OR activity_desc LIKE 'Deleted global task %' "
+            "OR activity_desc LIKE 'Started a new case creation %'"
+        )
+
+    op.execute('COMMIT')
+
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_user_activity_case_id_activity_date '
+        'ON user_activity (case_id, activity_date)'
+    )
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_user_activity_activity_date ON user_activity (activity_date)'
+    )
+
+    return
+
+
+def downgrade():
+    pass
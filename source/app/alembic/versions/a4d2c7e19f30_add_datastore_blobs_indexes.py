@@ -0,0 +1,34 @@
+"""Index datastore files by hash and local name for the shared blobs
+
+Revision ID: a4d2c7e19f30
+Revises: 0b7e4f9a2d63
+Create Date: 2026-10-18 17:21:09.524871
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d2c7e19f30'
+down_revision = '0b7e4f9a2d63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('COMMIT')
+
+    # The data_store_blob table is created with the models. Files stored before remain in their own location and
+    # are not shared
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_data_store_file_file_sha256 ON data_store_file (file_sha256)'
+    )
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_data_store_file_file_local_name ON data_store_file (file_local_name)'
+    )
+
+    return
+
+
+def downgrade():
+    pass
@@ -0,0 +1,38 @@
+"""Index IOC links and assets for the cross-case links
+
+Revision ID: b81e5d3a6c47
+Revises: a4d2c7e19f30
+Create Date: 2026-10-18 18:02:41.307516
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81e5d3a6c47'
+down_revision = 'a4d2c7e19f30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('COMMIT')
+
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_ioc_link_ioc_id_case_id ON ioc_link (ioc_id, case_id)'
+    )
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_ioc_link_case_id ON ioc_link (case_id)'
+    )
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_case_assets_case_id ON case_assets (case_id)'
+    )
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_case_assets_asset_name_asset_type_id ON case_assets (asset_name, asset_type_id)'
+    )
+
+    return
+
+
+def downgrade():
+    pass
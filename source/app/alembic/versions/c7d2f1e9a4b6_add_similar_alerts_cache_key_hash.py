@@ -0,0 +1,51 @@
+"""Add similar alerts cache key hash and indexes
+
+Revision ID: c7d2f1e9a4b6
+Revises: a3c8e5f4d2b1
+Create Date: 2026-10-18 10:02:17.311842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.alembic.alembic_utils import _table_has_column
+
+# revision identifiers, used by Alembic.
+revision = 'c7d2f1e9a4b6'
+down_revision = 'a3c8e5f4d2b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('COMMIT')
+
+    if not _table_has_column('similar_alerts_cache', 'key_hash'):
+        op.add_column('similar_alerts_cache', sa.Column('key_hash', sa.BigInteger, nullable=True))
+
+    # Same hash as get_observable_key_hash: first 64 bits of md5('<kind>:<type_id>:<value>')
+    op.execute(
+        "UPDATE similar_alerts_cache SET key_hash = ('x' || substr(md5("
+        "'asset:' || coalesce(asset_type_id::text, '') || ':' || asset_name), 1, 16))::bit(64)::bigint "
+        "WHERE key_hash IS NULL AND asset_name IS NOT NULL"
+    )
+    op.execute(
+        "UPDATE similar_alerts_cache SET key_hash = ('x' || substr(md5("
+        "'ioc:' || coalesce(ioc_type_id::text, '') || ':' || ioc_value), 1, 16))::bit(64)::bigint "
+        "WHERE key_hash IS NULL AND ioc_value IS NOT NULL"
+    )
+
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_similar_alerts_cache_customer_key_created '
+        'ON similar_alerts_cache (customer_id, key_hash, created_at)'
+    )
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_similar_alerts_cache_alert_id '
+        'ON similar_alerts_cache (alert_id)'
+    )
+
+    return
+
+
+def downgrade():
+    pass
@@ -0,0 +1,37 @@
+"""Make user case effective access unique per user and case
+
+Revision ID: d41b8e3c92f7
+Revises: c7d2f1e9a4b6
+Create Date: 2026-10-18 11:26:03.884127
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41b8e3c92f7'
+down_revision = 'c7d2f1e9a4b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('COMMIT')
+
+    # Keep the most recent row of each pair, its level is fixed by the next recompute anyway
+    op.execute(
+        'DELETE FROM user_case_effective_access a '
+        'USING user_case_effective_access b '
+        'WHERE a.user_id = b.user_id AND a.case_id = b.case_id AND a.id < b.id'
+    )
+
+    op.execute(
+        'CREATE UNIQUE INDEX IF NOT EXISTS uq_user_case_effective_access_user_case '
+        'ON user_case_effective_access (user_id, case_id)'
+    )
+
+    return
+
+
+def downgrade():
+    pass
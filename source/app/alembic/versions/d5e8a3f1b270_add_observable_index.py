@@ -0,0 +1,62 @@
+"""Backfill the observable index with the IOCs and assets of the cases
+
+Revision ID: d5e8a3f1b270
+Revises: b81e5d3a6c47
+Create Date: 2026-10-18 19:14:52.618203
+
+"""
+from alembic import op
+
+from app.alembic.alembic_utils import _has_table
+
+# revision identifiers, used by Alembic.
+revision = 'd5e8a3f1b270'
+down_revision = 'b81e5d3a6c47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('COMMIT')
+
+    # The observable_index table is created with the models
+    if not _has_table('observable_index'):
+        return
+
+    # Same normalization as normalize_observable_value and same hash as get_observable_key_hash
+    op.execute(
+        "INSERT INTO observable_index (observable_kind, object_id, type_id, value, normalized_value, key_hash, "
+        "customer_id, case_id, first_seen, last_seen) "
+        "SELECT 'ioc', ioc.ioc_id, ioc.ioc_type_id, ioc.ioc_value, lower(btrim(ioc.ioc_value, E' \\t\\r\\n')), "
+        "('x' || substr(md5('ioc:' || coalesce(ioc.ioc_type_id::text, '') || ':' || ioc.ioc_value), 1, 16))"
+        "::bit(64)::bigint, "
+        "cases.client_id, cases.case_id, "
+        "coalesce(cases.open_date::timestamp, now() at time zone 'utc'), "
+        "coalesce(cases.open_date::timestamp, now() at time zone 'utc') "
+        "FROM ioc_link "
+        "JOIN ioc ON ioc.ioc_id = ioc_link.ioc_id "
+        "JOIN cases ON cases.case_id = ioc_link.case_id "
+        "WHERE ioc.ioc_value IS NOT NULL "
+        "ON CONFLICT ON CONSTRAINT uq_observable_index_kind_object_case DO NOTHING"
+    )
+    op.execute(
+        "INSERT INTO observable_index (observable_kind, object_id, type_id, value, normalized_value, key_hash, "
+        "customer_id, case_id, first_seen, last_seen) "
+        "SELECT 'asset', case_assets.asset_id, case_assets.asset_type_id, case_assets.asset_name, "
+        "lower(btrim(case_assets.asset_name, E' \\t\\r\\n')), "
+        "('x' || substr(md5('asset:' || coalesce(case_assets.asset_type_id::text, '') || ':' || "
+        "case_assets.asset_name), 1, 16))::bit(64)::bigint, "
+        "cases.client_id, cases.case_id, "
+        "coalesce(case_assets.date_added, now() at time zone 'utc'), "
+        "coalesce(case_assets.date_update, case_assets.date_added, now() at time zone 'utc') "
+        "FROM case_assets "
+        "JOIN cases ON cases.case_id = case_assets.case_id "
+        "WHERE case_assets.asset_name IS NOT NULL "
+        "ON CONFLICT ON CONSTRAINT uq_observable_index_kind_object_case DO NOTHING"
+    )
+
+    return
+
+
+def downgrade():
+    pass
@@ -0,0 +1,59 @@
+"""Do not store deny_all user case effective access
+
+Revision ID: e58a2c71b9d4
+Revises: d41b8e3c92f7
+Create Date: 2026-10-18 14:02:47.315208
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e58a2c71b9d4'
+down_revision = 'd41b8e3c92f7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('COMMIT')
+
+    # deny_all is now the implicit default, the absence of row denies the access
+    op.execute(
+        'DELETE FROM user_case_effective_access WHERE access_level = 1'
+    )
+
+    # The access derived from the customers was checked on the fly when no row was stored, it is not anymore.
+    # The missing rows are written as ac_recompute_effective_access does, the existing ones are kept
+    op.execute("""
+        WITH grants AS (
+            SELECT user_id, case_id, max(access_level) AS access_level, 1 AS precedence
+            FROM user_case_access
+            GROUP BY user_id, case_id
+            UNION ALL
+            SELECT ucl.user_id, c.case_id, max(ucl.access_level), 2
+            FROM user_client ucl
+            JOIN cases c ON c.client_id = ucl.client_id
+            GROUP BY ucl.user_id, c.case_id
+            UNION ALL
+            SELECT ug.user_id, g.case_id, max(g.access_level), 3
+            FROM user_group ug
+            JOIN group_case_access g ON g.group_id = ug.group_id
+            GROUP BY ug.user_id, g.case_id
+        ), effective AS (
+            SELECT DISTINCT ON (user_id, case_id) user_id, case_id, access_level
+            FROM grants
+            ORDER BY user_id, case_id, precedence
+        )
+        INSERT INTO user_case_effective_access (user_id, case_id, access_level)
+        SELECT user_id, case_id, access_level
+        FROM effective
+        WHERE access_level <> 1
+        ON CONFLICT (user_id, case_id) DO NOTHING
+    """)
+
+    return
+
+
+def downgrade():
+    pass
@@ -0,0 +1,76 @@
+"""Add the search vectors and indexes of the global search
+
+Revision ID: e9c4b2a7d815
+Revises: d5e8a3f1b270
+Create Date: 2026-10-18 20:07:36.184920
+
+"""
+import logging
+
+from alembic import op
+
+from app.alembic.alembic_utils import _table_has_column
+
+# revision identifiers, used by Alembic.
+revision = 'e9c4b2a7d815'
+down_revision = 'd5e8a3f1b270'
+branch_labels = None
+depends_on = None
+
+log = logging.getLogger('alembic.runtime.migration')
+
+
+def upgrade():
+    op.execute('COMMIT')
+
+    # Same expressions as the generated columns of the models
+    if not _table_has_column('notes', 'note_search_vector'):
+        op.execute(
+            "ALTER TABLE notes ADD COLUMN note_search_vector tsvector GENERATED ALWAYS AS "
+            "(to_tsvector('simple'::regconfig, coalesce(note_title, '') || ' ' || coalesce(note_content, ''))) STORED"
+        )
+
+    if not _table_has_column('comments', 'comment_search_vector'):
+        op.execute(
+            "ALTER TABLE comments ADD COLUMN comment_search_vector tsvector GENERATED ALWAYS AS "
+            "(to_tsvector('simple'::regconfig, coalesce(comment_text, ''))) STORED"
+        )
+
+    op.execute('COMMIT')
+
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_notes_note_search_vector ON notes USING gin (note_search_vector)'
+    )
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_comments_comment_search_vector ON comments USING gin (comment_search_vector)'
+    )
+
+    op.execute('COMMIT')
+
+    # The substring searches are served by trigram indexes. Without the extension they still work, only slower, and
+    # the indexes can be created later with "flask search reindex"
+    try:
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute('COMMIT')
+
+    except Exception as e:
+        op.execute('ROLLBACK')
+        log.warning(f'Unable to create the pg_trgm extension, the trigram search indexes are not created: {e}')
+        return
+
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_notes_note_content_trgm ON notes USING gin (note_content gin_trgm_ops)'
+    )
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_comments_comment_text_trgm ON comments USING gin (comment_text gin_trgm_ops)'
+    )
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_observable_index_normalized_value_trgm '
+        'ON observable_index USING gin (normalized_value gin_trgm_ops)'
+    )
+
+    return
+
+
+def downgrade():
+    pass
@@ -0,0 +1,30 @@
+"""Add timeline window index
+
+Revision ID: f3b9d6a2c814
+Revises: e58a2c71b9d4
+Create Date: 2026-10-18 15:21:09.642517
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b9d6a2c814'
+down_revision = 'e58a2c71b9d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('COMMIT')
+
+    op.execute(
+        'CREATE INDEX IF NOT EXISTS ix_cases_events_case_id_event_date_event_id '
+        'ON cases_events (case_id, event_date, event_id)'
+    )
+
+    return
+
+
+def downgrade():
+    pass
@@ -20,6 +20,7 @@ import os
 from flask import Blueprint
 from flask import redirect
 from flask import render_template
+from flask import request
 from flask import url_for
 from flask_wtf import FlaskForm
 
@@ -29,6 +30,7 @@ from app.datamgmt.activities.activities_db import get_users_activities
 from app.models.authorization import Permissions
 from app.util import ac_api_requires
 from app.util import ac_requires
+from app.util import response_error
 from app.util import response_success
 
 activities_blueprint = Blueprint(
@@ -54,24 +56,24 @@ def activities_index(caseid: int, url_redir):
 @activities_blueprint.route('/activities/list', methods=['GET'])
 @ac_api_requires(Permissions.activities_read, Permissions.all_activities_read)
 def list_activities():
-    # Get User activities from database
+    try:
+        activities = get_users_activities(cursor=request.args.get('cursor'),
+                                          limit=request.args.get('per_page', type=int))
 
-    user_activities = get_users_activities()
+    except ValueError as e:
+        return response_error(str(e))
 
-    data = [row._asdict() for row in user_activities]
-    data = sorted(data, key=lambda i: i['activity_date'], reverse=True)
-
-    return response_success("", data=data)
+    return response_success("", data=activities)
 
 
 @activities_blueprint.route('/activities/list-all', methods=['GET'])
 @ac_api_requires(Permissions.all_activities_read)
 def list_all_activities():
-    # Get User activities from database
-
-    user_activities = get_all_users_activities()
+    try:
+        activities = get_all_users_activities(cursor=request.args.get('cursor'),
+                                              limit=request.args.get('per_page', type=int))
 
-    data = [row._asdict() for row in user_activities]
-    data = sorted(data, key=lambda i: i['activity_date'], reverse=True)
+    except ValueError as e:
+        return response_error(str(e))
 
-    return response_success("", data=data)
+    return response_success("", data=activities)
@@ -27,16 +27,17 @@ from werkzeug import Response
 import app
 from app import db
 from app.blueprints.case.case_comments import case_comment_update
-from app.datamgmt.alerts.alerts_db import get_filtered_alerts, get_alert_by_id, create_case_from_alert
+from app.datamgmt.alerts.alerts_db import get_filtered_alerts, get_filtered_alerts_by_cursor, get_alert_by_id, create_case_from_alert
 from app.datamgmt.alerts.alerts_db import merge_alert_in_case, unmerge_alert_from_case, cache_similar_alert
 from app.datamgmt.alerts.alerts_db import get_related_alerts, get_related_alerts_details
 from app.datamgmt.alerts.alerts_db import get_alert_comments, delete_alert_comment, get_alert_comment
-from app.datamgmt.alerts.alerts_db import delete_similar_alert_cache, delete_alerts
-from app.datamgmt.alerts.alerts_db import create_case_from_alerts
+from app.datamgmt.alerts.alerts_db import delete_similar_alert_cache, delete_alerts, refresh_similar_alert_cache
+from app.datamgmt.alerts.alerts_db import create_case_from_alerts, add_alerts_batch, get_alerts_by_ids
 from app.datamgmt.case.case_db import get_case
 from app.datamgmt.manage.manage_access_control_db import check_ua_case_client, user_has_client_access
 from app.iris_engine.access_control.utils import ac_set_new_case_access
 from app.iris_engine.module_handler.module_handler import call_modules_hook
+from app.iris_engine.tasker.tasks import dispatch_alerts_post_process
 from app.iris_engine.utils.tracker import track_activity
 from app.models.alerts import AlertStatus
 from app.models.authorization import Permissions
@@ -44,6 +45,7 @@ from app.schema.marshables import AlertSchema, CaseSchema, CommentSchema, CaseAs
 from app.util import ac_api_requires
 from app.util import response_error, add_obj_history_entry, ac_requires
 from app.util import response_success
+from app.util import str_to_bool
 
 alerts_blueprint = Blueprint(
     'alerts',
@@ -111,27 +113,57 @@ def alerts_list_route() -> Response:
 
     alert_schema = AlertSchema()
 
+    filters = {
+        'start_date': request.args.get('source_start_date'),
+        'end_date': request.args.get('source_end_date'),
+        'title': request.args.get('alert_title'),
+        'description': request.args.get('alert_description'),
+        'status': request.args.get('alert_status_id', type=int),
+        'severity': request.args.get('alert_severity_id', type=int),
+        'owner': request.args.get('alert_owner_id', type=int),
+        'source': request.args.get('alert_source'),
+        'tags': request.args.get('alert_tags'),
+        'classification': request.args.get('alert_classification_id', type=int),
+        'client': request.args.get('alert_customer_id'),
+        'case_id': request.args.get('case_id', type=int),
+        'alert_ids': alert_ids,
+        'assets': alert_assets,
+        'iocs': alert_iocs,
+        'resolution_status': request.args.get('alert_resolution_id', type=int),
+        'current_user_id': current_user.id
+    }
+
+    if 'cursor' in request.args:
+        # Keyset pagination - the total is only computed on demand
+        count_mode = request.args.get('total_count', 'none')
+        if count_mode not in ['exact', 'estimated', 'none']:
+            return response_error('Invalid total_count, expected one of exact, estimated or none')
+
+        try:
+            filtered_data = get_filtered_alerts_by_cursor(
+                cursor=request.args.get('cursor'),
+                per_page=per_page,
+                sort=request.args.get('sort'),
+                count_mode=count_mode,
+                **filters
+            )
+
+        except ValueError as e:
+            return response_error(str(e))
+
+        alerts = {
+            'total': filtered_data['total'],
+            'alerts': alert_schema.dump(filtered_data['items'], many=True),
+            'next_cursor': filtered_data['next_cursor']
+        }
+
+        return response_success(data=alerts)
+
     filtered_data = get_filtered_alerts(
-        start_date=request.args.get('source_start_date'),
-        end_date=request.args.get('source_end_date'),
-        title=request.args.get('alert_title'),
-        description=request.args.get('alert_description'),
-        status=request.args.get('alert_status_id', type=int),
-        severity=request.args.get('alert_severity_id', type=int),
-        owner=request.args.get('alert_owner_id', type=int),
-        source=request.args.get('alert_source'),
-        tags=request.args.get('alert_tags'),
-        classification=request.args.get('alert_classification_id', type=int),
-        client=request.args.get('alert_customer_id'),
-        case_id=request.args.get('case_id', type=int),
-        alert_ids=alert_ids,
         page=page,
         per_page=per_page,
         sort=request.args.get('sort'),
-        assets=alert_assets,
-        iocs=alert_iocs,
-        resolution_status=request.args.get('alert_resolution_id', type=int),
-        current_user_id=current_user.id
+        **filters
     )
 
     if filtered_data is None:
@@ -190,6 +222,22 @@ def alerts_add_route() -> Response:
         new_alert.iocs = iocs
         new_alert.assets = assets
 
+        if _is_async_post_processing_requested():
+            # Only persist the alert, the rest is handled by the alerts post-processing task
+            add_obj_history_entry(new_alert, 'Alert created')
+            db.session.add(new_alert)
+            db.session.commit()
+
+            is_queued = dispatch_alerts_post_process([new_alert.alert_id], init_user=current_user.name,
+                                                     user_id=current_user.id)
+
+            app.socket_io.emit('new_alert', json.dumps({
+                'alert_id': new_alert.alert_id
+            }), namespace='/alerts')
+
+            return response_success(msg='Alert accepted', data=alert_schema.dump(new_alert),
+                                    status=202 if is_queued else 200)
+
         # Add the new alert to the session and commit it
         db.session.add(new_alert)
         db.session.commit()
@@ -220,6 +268,131 @@ def alerts_add_route() -> Response:
         return response_error(str(e))
 
 
+@alerts_blueprint.route('/alerts/batch/add', methods=['POST'])
+@ac_api_requires(Permissions.alerts_write)
+def alerts_batch_add_route() -> Response:
+    """
+    Add multiple alerts to the database in a single transaction
+
+    The body is expected to be {"alerts": [<alert>, ...]}, each alert following the format of /alerts/add.
+    Invalid alerts are reported in the results and do not prevent the valid ones from being created.
+    As for /alerts/add, the async query parameter defers the post-processing of the alerts to the worker.
+
+    returns:
+        Response: The response, with one result per alert, in the order they were provided
+    """
+    if not request.json:
+        return response_error('No JSON data provided')
+
+    alerts_data = request.get_json().get('alerts')
+    if not isinstance(alerts_data, list) or not alerts_data:
+        return response_error('No alerts provided')
+
+    max_batch_size = app.app.config.get('ALERTS_BATCH_MAX_SIZE')
+    if len(alerts_data) > max_batch_size:
+        return response_error(f'Too many alerts in the batch. Maximum is {max_batch_size}')
+
+    alert_schema = AlertSchema()
+    ioc_schema = IocSchema()
+    asset_schema = CaseAssetsSchema()
+
+    results = []
+    pending_alerts = []
+    clients_access = {}
+
+    for index, data in enumerate(alerts_data):
+        if not isinstance(data, dict):
+            results.append({'index': index, 'success': False, 'error': 'Invalid alert format'})
+            continue
+
+        try:
+            iocs_list = data.pop('alert_iocs', [])
+            assets_list = data.pop('alert_assets', [])
+
+            iocs = ioc_schema.load(iocs_list, many=True)
+            assets = asset_schema.load(assets_list, many=True)
+
+            new_alert = alert_schema.load(data)
+
+        except marshmallow.exceptions.ValidationError as e:
+            results.append({'index': index, 'success': False, 'error': 'Data error',
+                            'data': e.normalized_messages()})
+            continue
+
+        # Verify the user is entitled to create an alert for the client
+        if new_alert.alert_customer_id not in clients_access:
+            clients_access[new_alert.alert_customer_id] = user_has_client_access(current_user.id,
+                                                                                 new_alert.alert_customer_id)
+
+        if not clients_access[new_alert.alert_customer_id]:
+            results.append({'index': index, 'success': False,
+                            'error': 'User not entitled to create alerts for the client'})
+            continue
+
+        new_alert.alert_creation_time = datetime.utcnow()
+        new_alert.iocs = iocs
+        new_alert.assets = assets
+
+        add_obj_history_entry(new_alert, 'Alert created')
+
+        pending_alerts.append((index, new_alert, assets_list, iocs_list))
+
+    is_async = _is_async_post_processing_requested()
+
+    try:
+        created, failed = add_alerts_batch(pending_alerts, cache_similarities=not is_async)
+
+    except Exception as e:
+        app.app.logger.exception(e)
+        db.session.rollback()
+        return response_error('Unable to save the alerts. Check server logs')
+
+    results.extend(created)
+    results.extend(failed)
+    results.sort(key=lambda result: result['index'])
+
+    created_ids = [result['alert_id'] for result in created]
+    is_queued = False
+    if created_ids:
+        if is_async:
+            is_queued = dispatch_alerts_post_process(created_ids, init_user=current_user.name,
+                                                     user_id=current_user.id)
+
+        else:
+            alerts_by_index = {index: alert for index, alert, _, _ in pending_alerts}
+            new_alerts = [alerts_by_index[result['index']] for result in created]
+
+            call_modules_hook('on_postload_alert_create', data=new_alerts)
+
+            track_activity(f"created {len(created_ids)} alerts in batch "
+                           f"#{','.join(str(alert_id) for alert_id in created_ids)}", ctx_less=True)
+
+        # Emit a single socket io event for the whole batch
+        app.socket_io.emit('new_alert', json.dumps({
+            'alert_ids': created_ids,
+            'alerts_count': len(created_ids)
+        }), namespace='/alerts')
+
+    data = {
+        'created': len(created_ids),
+        'failed': len(results) - len(created_ids),
+        'results': results
+    }
+
+    if not created_ids:
+        return response_error('No alerts created', data=data)
+
+    return response_success(msg=f'{len(created_ids)} alerts created', data=data, status=202 if is_queued else 200)
+
+
+def _is_async_post_processing_requested() -> bool:
+    async_arg = request.args.get('async')
+    if async_arg is None:
+        return app.app.config.get('ALERTS_ASYNC_POST_PROCESSING')
+
+    return str_to_bool(async_arg)
+
+
 @alerts_blueprint.route('/alerts/<int:alert_id>', methods=['GET'])
 @ac_api_requires(Permissions.alerts_read)
 def alerts_get_route(alert_id) -> Response:
@@ -361,6 +534,9 @@ def alerts_update_route(alert_id) -> Response:
         # Save the changes
         db.session.commit()
 
+        if 'assets' in data or 'iocs' in data:
+            refresh_similar_alert_cache(updated_alert)
+
         updated_alert = call_modules_hook('on_postload_alert_update', data=updated_alert)
 
         if do_resolution_hook:
@@ -414,15 +590,32 @@ def alerts_batch_update_route() -> Response:
     if not alert_ids:
         return response_error('No alert IDs provided')
 
+    try:
+        alert_ids = [int(alert_id) for alert_id in alert_ids]
+    except (TypeError, ValueError):
+        return response_error('Invalid alert id')
+
     alert_schema = AlertSchema()
 
-    # Process each alert ID
+    alerts = {alert.alert_id: alert for alert in get_alerts_by_ids(alert_ids)}
+
+    # Check all the alerts before updating any of them
     for alert_id in alert_ids:
-        alert = get_alert_by_id(alert_id)
+        alert = alerts.get(alert_id)
         if not alert:
             return response_error(f'Alert with ID {alert_id} not found')
 
-        try:
+        # Check if the user has access to the client
+        if not user_has_client_access(current_user.id, alert.alert_customer_id):
+            return response_error('User not entitled to update alerts for the client', status=403)
+
+    updated_alerts = []
+    alerts_activity = []
+
+    try:
+        # Process each alert ID
+        for alert_id in alert_ids:
+            alert = alerts[alert_id]
 
             activity_data = []
             for key, value in updates.items():
@@ -431,26 +624,33 @@ def alerts_batch_update_route() -> Response:
                 if old_value != value:
                     activity_data.append(f"\"{key}\"")
 
-            # Check if the user has access to the client
-            if not user_has_client_access(current_user.id, alert.alert_customer_id):
-                return response_error('User not entitled to update alerts for the client', status=403)
-
             # Deserialize the JSON data into an Alert object
             alert_schema.load(updates, instance=alert, partial=True)
 
             db.session.commit()
 
-            alert = call_modules_hook('on_postload_alert_update', data=alert)
+            updated_alerts.append(alert)
+            alerts_activity.append(activity_data)
 
-            if activity_data:
-                track_activity(f"updated alert #{alert_id}: {','.join(activity_data)}", ctx_less=True)
-                add_obj_history_entry(alert, f"updated alert: {','.join(activity_data)}")
+    except Exception as e:
+        # Handle any errors during deserialization or DB operations. The alerts already updated are still
+        # passed to the modules
+        db.session.rollback()
+        if updated_alerts:
+            call_modules_hook('on_postload_alert_update', data=updated_alerts)
 
-            db.session.commit()
+        return response_error(str(e))
 
-        except Exception as e:
-            # Handle any errors during deserialization or DB operations
-            return response_error(str(e))
+    # Modules get all the updated alerts at once. What they return is not used, so the activities are always
+    # attached to the alerts they describe
+    call_modules_hook('on_postload_alert_update', data=updated_alerts)
+
+    for alert, activity_data in zip(updated_alerts, alerts_activity):
+        if activity_data:
+            track_activity(f"updated alert #{alert.alert_id}: {','.join(activity_data)}", ctx_less=True)
+            add_obj_history_entry(alert, f"updated alert: {','.join(activity_data)}")
+
+    db.session.commit()
 
     # Return a success response
     return response_success(msg='Batch update successful')
@@ -779,19 +979,24 @@ def alerts_batch_merge_route() -> Response:
         return response_error('User not entitled to merge alerts for the case', status=403)
 
     try:
-        # Merge the alerts into a case
-        for alert_id in alert_ids.split(','):
-            alert_id = int(alert_id)
+        alerts = get_alerts_by_ids([int(alert_id) for alert_id in alert_ids.split(',')])
+    except (TypeError, ValueError):
+        return response_error('Invalid alert id')
+
+    # Check all the alerts before merging any of them
+    for alert in alerts:
+        if not user_has_client_access(current_user.id, alert.alert_customer_id):
+            return response_error('User not entitled to merge alerts for the client', status=403)
 
-            alert = get_alert_by_id(alert_id)
-            if not alert:
-                continue
+    merged_alerts = []
 
-            # Check if the user has access to the client
-            if not user_has_client_access(current_user.id, alert.alert_customer_id):
-                return response_error('User not entitled to merge alerts for the client', status=403)
+    try:
+        merged_status_id = AlertStatus.query.filter_by(status_name='Merged').first().status_id
 
-            alert.alert_status_id = AlertStatus.query.filter_by(status_name='Merged').first().status_id
+        # Merge the alerts into a case
+        for alert in alerts:
+
+            alert.alert_status_id = merged_status_id
             db.session.commit()
 
             # Merge alert in the case
@@ -800,8 +1005,23 @@ def alerts_batch_merge_route() -> Response:
 
             add_obj_history_entry(alert, f"Alert merged into existing case #{target_case_id}")
 
-            alert = call_modules_hook('on_postload_alert_merge', data=alert)
+            merged_alerts.append(alert)
+
+    except Exception as e:
+        app.app.logger.exception(e)
+        # Handle any errors during deserialization or DB operations. The alerts already merged are still passed to
+        # the modules
+        db.session.rollback()
+        if merged_alerts:
+            call_modules_hook('on_postload_alert_merge', data=merged_alerts)
+
+        return response_error(str(e))
 
+    # Modules get all the merged alerts at once
+    if merged_alerts:
+        call_modules_hook('on_postload_alert_merge', data=merged_alerts)
+
+    try:
         if note:
             case.description += f"\n\n### Escalation note\n\n{note}\n\n" if case.description else f"\n\n{note}\n\n"
             db.session.commit()
@@ -814,7 +1034,6 @@ def alerts_batch_merge_route() -> Response:
 
     except Exception as e:
         app.app.logger.exception(e)
-        # Handle any errors during deserialization or DB operations
         return response_error(str(e))
 
 
@@ -849,24 +1068,24 @@ def alerts_batch_escalate_route() -> Response:
     case_template_id: int = data.get('case_template_id', None)
 
     try:
-        # Merge the alerts into a case
-        for alert_id in alert_ids.split(','):
-            alert_id = int(alert_id)
+        merged_status_id = AlertStatus.query.filter_by(status_name='Merged').first().status_id
 
-            alert = get_alert_by_id(alert_id)
-            if not alert:
-                continue
+        # Merge the alerts into a case
+        for alert in get_alerts_by_ids([int(alert_id) for alert_id in alert_ids.split(',')]):
 
             # Check if the user has access to the client
             if not user_has_client_access(current_user.id, alert.alert_customer_id):
                 return response_error('User not entitled to escalate alerts for the client', status=403)
 
-            alert.alert_status_id = AlertStatus.query.filter_by(status_name='Merged').first().status_id
-            db.session.commit()
-            alert = call_modules_hook('on_postload_alert_escalate', data=alert)
-
+            alert.alert_status_id = merged_status_id
             alerts_list.append(alert)
 
+        db.session.commit()
+
+        # Modules get all the escalated alerts at once
+        if alerts_list:
+            alerts_list = call_modules_hook('on_postload_alert_escalate', data=alerts_list)
+
         # Merge alerts in the case
         case = create_case_from_alerts(alerts_list, iocs_list=iocs_import_list, assets_list=assets_import_list,
                                        note=note, import_as_event=import_as_event, case_tags=case_tags,
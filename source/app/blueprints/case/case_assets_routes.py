@@ -44,16 +44,16 @@ from app.datamgmt.case.case_assets_db import get_assets_types
 from app.datamgmt.case.case_assets_db import get_case_asset_comment
 from app.datamgmt.case.case_assets_db import get_case_asset_comments
 from app.datamgmt.case.case_assets_db import get_case_assets_comments_count
+from app.datamgmt.case.case_assets_db import get_case_similar_assets
 from app.datamgmt.case.case_assets_db import get_compromise_status_list
 from app.datamgmt.case.case_assets_db import get_linked_iocs_finfo_from_asset
 from app.datamgmt.case.case_assets_db import get_linked_iocs_id_from_asset
-from app.datamgmt.case.case_assets_db import get_similar_assets
 from app.datamgmt.case.case_assets_db import set_ioc_links
 from app.datamgmt.case.case_db import get_case
 from app.datamgmt.case.case_db import get_case_client_id
 from app.datamgmt.case.case_iocs_db import get_iocs
 from app.datamgmt.manage.manage_attribute_db import get_default_custom_attributes
-from app.datamgmt.manage.manage_users_db import get_user_cases_fast
+from app.datamgmt.observables.observables_db import reindex_observable
 from app.datamgmt.states import get_assets_state
 from app.datamgmt.states import update_assets_state
 from app.forms import AssetBasicForm
@@ -119,17 +119,13 @@ def case_list_assets(caseid):
         else:
             cache_ioc_link[ioc.asset_id].append(ioc._asdict())
 
-    cases_access = get_user_cases_fast(current_user.id)
+    # Find similar assets from other cases with the same customer
+    similar_assets = get_case_similar_assets(caseid, customer_id, current_user.id)
 
     for asset in assets:
         asset = asset._asdict()
 
-        if len(assets) < 300:
-            # Find similar assets from other cases with the same customer
-            asset['link'] = list(get_similar_assets(
-                asset['asset_name'], asset['asset_type_id'], caseid, customer_id, cases_access))
-        else:
-            asset['link'] = []
+        asset['link'] = similar_assets.get(asset['asset_id'], [])
 
         asset['ioc_links'] = cache_ioc_link.get(asset['asset_id'])
 
@@ -372,6 +368,7 @@ def asset_update(cur_id, caseid):
         add_asset_schema.is_unique_for_cid(caseid, request_data)
         asset_schema = add_asset_schema.load(request_data, instance=asset)
 
+        reindex_observable('asset', asset_schema.asset_id, asset_schema.asset_type_id, asset_schema.asset_name)
         update_assets_state(caseid=caseid)
         db.session.commit()
 
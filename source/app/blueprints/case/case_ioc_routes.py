@@ -40,9 +40,9 @@ from app.datamgmt.case.case_iocs_db import delete_ioc_comment
 from app.datamgmt.case.case_iocs_db import get_case_ioc_comment
 from app.datamgmt.case.case_iocs_db import get_case_ioc_comments
 from app.datamgmt.case.case_iocs_db import get_case_iocs_comments_count
+from app.datamgmt.case.case_iocs_db import get_case_iocs_links
 from app.datamgmt.case.case_iocs_db import get_detailed_iocs
 from app.datamgmt.case.case_iocs_db import get_ioc
-from app.datamgmt.case.case_iocs_db import get_ioc_links
 from app.datamgmt.case.case_iocs_db import get_ioc_type_id
 from app.datamgmt.case.case_iocs_db import get_ioc_types_list
 from app.datamgmt.case.case_iocs_db import get_tlps
@@ -94,16 +94,16 @@ def case_ioc(caseid, url_redir):
 def case_list_ioc(caseid):
     iocs = get_detailed_iocs(caseid)
 
+    # Get links of the IoCs seen in other cases
+    iocs_links = get_case_iocs_links(caseid, current_user.id)
+
     ret = {}
     ret['ioc'] = []
 
     for ioc in iocs:
         out = ioc._asdict()
 
-        # Get links of the IoCs seen in other cases
-        ial = get_ioc_links(ioc.ioc_id, caseid)
-
-        out['link'] = [row._asdict() for row in ial]
+        out['link'] = iocs_links.get(ioc.ioc_id, [])
         # Legacy, must be changed next version
         out['misp_link'] = None
 
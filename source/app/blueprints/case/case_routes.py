@@ -29,8 +29,6 @@ from flask_login import current_user
 from flask_socketio import emit
 from flask_socketio import join_room
 from flask_wtf import FlaskForm
-from sqlalchemy import and_
-from sqlalchemy import desc
 
 from app import app
 from app import db
@@ -42,6 +40,7 @@ from app.blueprints.case.case_notes_routes import case_notes_blueprint
 from app.blueprints.case.case_rfiles_routes import case_rfiles_blueprint
 from app.blueprints.case.case_tasks_routes import case_tasks_blueprint
 from app.blueprints.case.case_timeline_routes import case_timeline_blueprint
+from app.datamgmt.activities.activities_db import get_case_activities
 from app.datamgmt.case.case_db import case_exists, get_review_id_from_name
 from app.datamgmt.case.case_db import case_get_desc_crc
 from app.datamgmt.case.case_db import get_activities_report_template
@@ -62,9 +61,7 @@ from app.iris_engine.access_control.utils import ac_set_case_access_for_users
 from app.iris_engine.module_handler.module_handler import list_available_pipelines
 from app.iris_engine.utils.tracker import track_activity
 from app.models import CaseStatus, ReviewStatusList
-from app.models import UserActivity
 from app.models.authorization import CaseAccessLevel
-from app.models.authorization import User
 from app.schema.marshables import TaskLogSchema, CaseSchema, CaseDetailsSchema
 from app.util import ac_api_case_requires, add_obj_history_entry
 from app.util import ac_case_requires
@@ -218,23 +215,14 @@ def summary_fetch(caseid):
 @case_blueprint.route('/case/activities/list', methods=['GET'])
 @ac_api_case_requires(CaseAccessLevel.read_only, CaseAccessLevel.full_access)
 def activity_fetch(caseid):
-    ua = UserActivity.query.with_entities(
-        UserActivity.activity_date,
-        User.name,
-        UserActivity.activity_desc,
-        UserActivity.is_from_api
-    ).filter(and_(
-        UserActivity.case_id == caseid,
-        UserActivity.display_in_ui == True
-    )).join(
-        UserActivity.user
-    ).order_by(
-        desc(UserActivity.activity_date)
-    ).limit(40).all()
-
-    output = [a._asdict() for a in ua]
-
-    return response_success("", data=output)
+    try:
+        activities = get_case_activities(caseid, cursor=request.args.get('cursor'),
+                                         limit=request.args.get('per_page', default=40, type=int))
+
+    except ValueError as e:
+        return response_error(str(e))
+
+    return response_success("", data=activities)
 
 
 @case_blueprint.route("/case/export", methods=['GET'])
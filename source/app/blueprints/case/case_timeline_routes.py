@@ -17,16 +17,19 @@
 #  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 # IMPORTS ------------------------------------------------
-import csv
 import json
+import os
 import urllib.parse
+from collections import defaultdict
 from datetime import datetime
 
 import marshmallow
 from flask import Blueprint
+from flask import Response
 from flask import redirect
 from flask import render_template
 from flask import request
+from flask import stream_with_context
 from flask import url_for
 from flask_login import current_user
 from flask_wtf import FlaskForm
@@ -34,9 +37,12 @@ from sqlalchemy import and_
 
 from app import db
 from app import app
+from app.business.errors import BusinessProcessingError
+from app.business.events_import import build_events_import_path
+from app.business.events_import import check_events_file
+from app.business.events_import import import_events_file
 from app.blueprints.case.case_comments import case_comment_update
-from app.datamgmt.case.case_assets_db import get_asset_by_name
-from app.datamgmt.case.case_events_db import add_comment_to_event, get_category_by_name, get_default_category
+from app.datamgmt.case.case_events_db import add_comment_to_event
 from app.datamgmt.case.case_events_db import delete_event
 from app.datamgmt.case.case_events_db import delete_event_comment
 from app.datamgmt.case.case_events_db import get_case_assets_for_tm
@@ -50,15 +56,21 @@ from app.datamgmt.case.case_events_db import get_event_assets_ids
 from app.datamgmt.case.case_events_db import get_event_category
 from app.datamgmt.case.case_events_db import get_event_iocs_ids
 from app.datamgmt.case.case_events_db import get_events_categories
+from app.datamgmt.case.case_events_db import get_timeline_histogram
+from app.datamgmt.case.case_events_db import get_timeline_links_condition
+from app.datamgmt.case.case_events_db import get_timeline_search
+from app.datamgmt.case.case_events_db import get_timeline_window
 from app.datamgmt.case.case_events_db import save_event_category
 from app.datamgmt.case.case_events_db import update_event_assets
 from app.datamgmt.case.case_events_db import update_event_iocs
-from app.datamgmt.case.case_iocs_db import get_ioc_by_value
 from app.datamgmt.manage.manage_attribute_db import get_default_custom_attributes
+from app.datamgmt.reporter.report_db import iter_case_tm_jsonl
 from app.datamgmt.states import get_timeline_state
 from app.datamgmt.states import update_timeline_state
 from app.forms import CaseEventForm
 from app.iris_engine.module_handler.module_handler import call_modules_hook
+from app.iris_engine.tasker.tasks import is_task_of
+from app.iris_engine.tasker.tasks import task_import_events
 from app.iris_engine.utils.collab import collab_notify
 from app.iris_engine.utils.common import parse_bf_date_format
 from app.iris_engine.utils.tracker import track_activity
@@ -76,13 +88,23 @@ from app.models.models import Ioc
 from app.models.models import IocLink
 from app.schema.marshables import CommentSchema
 from app.schema.marshables import EventSchema
+from app.util import AlchemyEncoder
 from app.util import ac_api_case_requires
 from app.util import ac_case_requires
 from app.util import add_obj_history_entry
 from app.util import response_error
 from app.util import response_success
+from app.util import response_success_stream
+from iris_interface.IrisInterfaceStatus import IIStatus
 
 
+# Number of events fetched at once from the database while a timeline is streamed
+TIMELINE_STREAM_BATCH_SIZE = 1000
+
+# Number of events returned by the windowed timeline API
+TIMELINE_WINDOW_DEFAULT_SIZE = 200
+TIMELINE_WINDOW_MAX_SIZE = 2000
+
 event_tags = ["Network", "Server", "ActiveDirectory", "Computer", "Malware", "User Interaction"]
 
 case_timeline_blueprint = Blueprint('case_timeline',
@@ -211,6 +233,21 @@ def case_get_timeline_state(caseid):
         return response_error('No timeline state for this case. Add an event to begin')
 
 
+def _group_by_event(rows, formatter):
+    """
+    Group the links rows by event ID once, so each event reads its own links instead of scanning all of them
+    """
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[row.event_id].append(formatter(row))
+
+    return grouped
+
+
+def _timeline_wants_ndjson():
+    return request.args.get('format') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson'
+
+
 @case_timeline_blueprint.route('/case/timeline/visualize/data/by-asset', methods=['GET'])
 @ac_api_case_requires(CaseAccessLevel.read_only, CaseAccessLevel.full_access)
 def case_getgraph_assets(caseid):
@@ -228,21 +265,22 @@ def case_getgraph_assets(caseid):
         CasesEvent.event_date
     ).all()
 
+    assets_by_event = _group_by_event(assets_cache, lambda asset: asset.asset_name)
+
     tim = []
     for row in timeline:
-        for asset in assets_cache:
-            if asset.event_id == row.event_id:
-                tmp = {}
-                tmp['date'] = row.event_date
-                tmp['group'] = asset.asset_name
-                tmp['content'] = row.event_title
-                tmp['title'] = f"{row.event_date.strftime('%Y-%m-%dT%H:%M:%S')} - {row.event_content}"
+        for asset_name in assets_by_event.get(row.event_id, []):
+            tmp = {}
+            tmp['date'] = row.event_date
+            tmp['group'] = asset_name
+            tmp['content'] = row.event_title
+            tmp['title'] = f"{row.event_date.strftime('%Y-%m-%dT%H:%M:%S')} - {row.event_content}"
 
-                if row.event_color:
-                    tmp['style'] = f'background-color: {row.event_color};'
+            if row.event_color:
+                tmp['style'] = f'background-color: {row.event_color};'
 
-                tmp['unique_id'] = row.event_id
-                tim.append(tmp)
+            tmp['unique_id'] = row.event_id
+            tim.append(tmp)
 
     res = {
         "events": tim
@@ -325,15 +363,7 @@ def case_gettimeline_api(asset_id, caseid):
         CasesEvent.event_date
     ).outerjoin(
         CasesEvent.category
-    ).all()
-
-    assets_cache = CaseAssets.query.with_entities(
-        CaseAssets.asset_id,
-        CaseAssets.asset_name,
-        CaseEventsAssets.event_id
-    ).filter(
-        CaseEventsAssets.case_id == caseid,
-    ).join(CaseEventsAssets.asset).all()
+    ).yield_per(TIMELINE_STREAM_BATCH_SIZE)
 
     iocs_cache = CaseEventsIoc.query.with_entities(
         Ioc.ioc_id,
@@ -345,55 +375,60 @@ def case_gettimeline_api(asset_id, caseid):
         CaseEventsIoc.ioc
     ).all()
 
-    tim = []
-    for row in timeline:
-        ras = row._asdict()
-        ras['event_date'] = ras['event_date'].strftime('%Y-%m-%dT%H:%M:%S.%f')
-        ras['event_date_wtz'] = ras['event_date_wtz'].strftime('%Y-%m-%dT%H:%M:%S.%f')
-
-        alki = []
-        cache = {}
-        for asset in assets_cache:
-            if asset.event_id == ras['event_id']:
-                if asset.asset_id not in cache:
-                    cache[asset.asset_id] = asset.asset_name
-
-                alki.append(asset._asdict())
-
-        alki = []
-        cache = {}
-        for ioc in iocs_cache:
-            if ioc.event_id == ras['event_id']:
-                if ioc.ioc_id not in cache:
-                    cache[ioc.ioc_id] = ioc.ioc_value
+    iocs_by_event = _group_by_event(iocs_cache, lambda ioc: ioc._asdict())
 
-                alki.append(ioc._asdict())
+    def timeline_rows():
+        for row in timeline:
+            ras = row._asdict()
+            ras['event_date'] = ras['event_date'].strftime('%Y-%m-%dT%H:%M:%S.%f')
+            ras['event_date_wtz'] = ras['event_date_wtz'].strftime('%Y-%m-%dT%H:%M:%S.%f')
+            ras['iocs'] = iocs_by_event.get(ras['event_id'], [])
 
-        ras['iocs'] = alki
+            yield ras
 
-        tim.append(ras)
+    return response_success_stream("", data={"state": get_timeline_state(caseid=caseid)},
+                                   items_key="timeline", items=timeline_rows(),
+                                   ndjson=_timeline_wants_ndjson())
 
-    resp = {
-        "timeline": tim,
-        "state": get_timeline_state(caseid=caseid)
+
+def _format_timeline_asset(asset):
+    return {
+        "name": "{} ({})".format(asset.asset_name, asset.type),
+        "ip": asset.asset_ip,
+        "description": asset.asset_description,
+        "compromised": asset.asset_compromise_status_id == CompromiseStatus.compromised.value
+    }
+
+
+def _format_timeline_ioc(ioc):
+    return {
+        "name": "{}".format(ioc.ioc_value),
+        "description": ioc.ioc_description
     }
 
-    return response_success("", data=resp)
 
+def _format_timeline_event(row, assets_by_event, iocs_by_event):
+    ras = row._asdict()
 
-@case_timeline_blueprint.route('/case/timeline/advanced-filter', methods=['GET'])
-@ac_api_case_requires(CaseAccessLevel.read_only, CaseAccessLevel.full_access)
-def case_filter_timeline(caseid):
-    args = request.args.to_dict()
-    query_filter = args.get('q')
+    ras['event_date'] = ras['event_date'].strftime('%Y-%m-%dT%H:%M:%S.%f')
+    ras['event_date_wtz'] = ras['event_date_wtz'].strftime('%Y-%m-%dT%H:%M:%S.%f') if ras[
+        'event_date_wtz'] else None
+    ras['event_added'] = ras['event_added'].strftime('%Y-%m-%dT%H:%M:%S')
 
-    try:
+    ras['assets'] = assets_by_event.get(row.event_id, [])
+    ras['iocs'] = iocs_by_event.get(row.event_id, [])
 
-        filter_d = dict(json.loads(urllib.parse.unquote_plus(query_filter)))
+    return ras
 
-    except Exception as e:
-        return response_error('Invalid query string')
 
+def _parse_timeline_filter(caseid, filter_d):
+    """
+    Build the SQL condition of a timeline filter, as sent by the timeline UI. The assets and IOCs parts of the
+    filter are returned along, as they are matched against the events links.
+
+    raises:
+        ValueError: If the filter is invalid
+    """
     assets = filter_d.get('asset')
     assets_id = filter_d.get('asset_id')
     event_ids = filter_d.get('event_id')
@@ -408,8 +443,10 @@ def case_filter_timeline(caseid):
     titles = filter_d.get('title')
     sources = filter_d.get('source')
     flag = filter_d.get('flag')
+    searches = filter_d.get('search')
 
     condition = (CasesEvent.case_id == caseid)
+    search_rank = None
 
     if assets:
         assets = [asset.lower() for asset in assets]
@@ -478,12 +515,68 @@ def case_filter_timeline(caseid):
     if event_ids:
         try:
             event_ids = [int(event_id) for event_id in event_ids]
-        except Exception as e:
-            return response_error('Invalid event id')
+        except Exception:
+            raise ValueError('Invalid event id')
 
         condition = and_(condition,
                          CasesEvent.event_id.in_(event_ids))
 
+    if searches:
+        search_condition, search_rank = get_timeline_search(searches)
+        condition = and_(condition, search_condition)
+
+    return {
+        'condition': condition,
+        'search_rank': search_rank,
+        'assets': assets,
+        'assets_id': assets_id,
+        'iocs': iocs,
+        'iocs_id': iocs_id
+    }
+
+
+def _load_timeline_filter(caseid):
+    """
+    Read and parse the timeline filter of the request q parameter. No filter means the whole case timeline
+    """
+    query_filter = request.args.get('q')
+    if not query_filter:
+        return _parse_timeline_filter(caseid, {})
+
+    try:
+        filter_d = dict(json.loads(urllib.parse.unquote_plus(query_filter)))
+
+    except Exception:
+        raise ValueError('Invalid query string')
+
+    return _parse_timeline_filter(caseid, filter_d)
+
+
+@case_timeline_blueprint.route('/case/timeline/advanced-filter', methods=['GET'])
+@ac_api_case_requires(CaseAccessLevel.read_only, CaseAccessLevel.full_access)
+def case_filter_timeline(caseid):
+    args = request.args.to_dict()
+    query_filter = args.get('q')
+
+    try:
+
+        filter_d = dict(json.loads(urllib.parse.unquote_plus(query_filter)))
+
+    except Exception as e:
+        return response_error('Invalid query string')
+
+    try:
+        timeline_filter = _parse_timeline_filter(caseid, filter_d)
+
+    except ValueError as e:
+        return response_error(str(e))
+
+    condition = timeline_filter['condition']
+    assets = timeline_filter['assets']
+    assets_id = timeline_filter['assets_id']
+    iocs = timeline_filter['iocs']
+    iocs_id = timeline_filter['iocs_id']
+
     timeline = CasesEvent.query.with_entities(
         CasesEvent.event_id,
         CasesEvent.event_uuid,
@@ -501,13 +594,22 @@ def case_filter_timeline(caseid):
         User.user,
         CasesEvent.event_added,
         EventCategory.name.label("category_name")
-    ).filter(condition).order_by(
-        CasesEvent.event_date
-    ).outerjoin(
+    ).filter(condition).outerjoin(
         CasesEvent.category
     ).join(
         CasesEvent.user
-    ).all()
+    )
+
+    search_rank = timeline_filter['search_rank']
+    if search_rank is not None:
+        timeline = timeline.add_columns(search_rank.label('search_rank'))
+
+    if search_rank is not None and request.args.get('order') == 'rank':
+        timeline = timeline.order_by(search_rank.desc(), CasesEvent.event_date)
+    else:
+        timeline = timeline.order_by(CasesEvent.event_date)
+
+    timeline = timeline.yield_per(TIMELINE_STREAM_BATCH_SIZE)
 
     assets_cache_condition = and_(
         CaseEventsAssets.case_id == caseid
@@ -553,119 +655,220 @@ def case_filter_timeline(caseid):
         CaseEventsIoc.ioc
     ).all()
 
-    assets_map = {}
     cache = {}
+    assets_matches = defaultdict(int)
     for asset in assets_cache:
         if asset.asset_id not in cache:
             cache[asset.asset_id] = [asset.asset_name, asset.type]
 
         if (assets and asset.asset_name.lower() in assets) \
                 or (assets_id and asset.asset_id in assets_id):
-            if asset.event_id in assets_map:
-                assets_map[asset.event_id] += 1
-            else:
-                assets_map[asset.event_id] = 1
+            assets_matches[asset.event_id] += 1
 
-    assets_filter = []
     len_assets = 0
     if assets:
         len_assets += len(assets)
     if assets_id:
         len_assets += len(assets_id)
 
-    for event_id in assets_map:
-        if assets_map[event_id] == len_assets:
-            assets_filter.append(event_id)
+    assets_filter = {event_id for event_id, matches in assets_matches.items() if matches == len_assets}
 
-    iocs_filter = []
+    iocs_filter = set()
     if iocs:
-        for ioc in iocs_cache:
-            if ioc.event_id not in iocs_filter and ioc.ioc_value.lower() in iocs:
-                iocs_filter.append(ioc.event_id)
+        iocs_filter = {ioc.event_id for ioc in iocs_cache if ioc.ioc_value.lower() in iocs}
 
-    tim = []
-    events_list = []
-    for row in timeline:
-        if assets is not None or assets_id is not None:
-            if row.event_id not in assets_filter:
-                continue
-
-        if iocs is not None:
-            if row.event_id not in iocs_filter:
-                continue
-
-        ras = row._asdict()
-
-        ras['event_date'] = ras['event_date'].strftime('%Y-%m-%dT%H:%M:%S.%f')
-        ras['event_date_wtz'] = ras['event_date_wtz'].strftime('%Y-%m-%dT%H:%M:%S.%f') if ras[
-            'event_date_wtz'] else None
-        ras['event_added'] = ras['event_added'].strftime('%Y-%m-%dT%H:%M:%S')
-
-        if row.event_id not in events_list:
-            events_list.append(row.event_id)
-
-        alki = []
-        for asset in assets_cache:
-
-            if asset.event_id == ras['event_id']:
-                alki.append(
-                    {
-                        "name": "{} ({})".format(asset.asset_name, asset.type),
-                        "ip": asset.asset_ip,
-                        "description": asset.asset_description,
-                        "compromised": asset.asset_compromise_status_id == CompromiseStatus.compromised.value
-                    }
-                )
-
-        ras['assets'] = alki
-
-        alki = []
-        for ioc in iocs_cache:
-            if ioc.event_id == ras['event_id']:
+    assets_by_event = _group_by_event(assets_cache, _format_timeline_asset)
+    iocs_by_event = _group_by_event(iocs_cache, _format_timeline_ioc)
+
+    iocs_rows_by_event = _group_by_event(iocs_cache, lambda ioc: ioc)
+
+    events_list = set()
+
+    def timeline_rows():
+        for row in timeline:
+            if assets is not None or assets_id is not None:
+                if row.event_id not in assets_filter:
+                    continue
+
+            if iocs is not None:
+                if row.event_id not in iocs_filter:
+                    continue
+
+            events_list.add(row.event_id)
+
+            for ioc in iocs_rows_by_event.get(row.event_id, []):
                 if ioc.ioc_id not in cache:
                     cache[ioc.ioc_id] = [ioc.ioc_value]
 
-                alki.append(
-                    {
-                        "name": "{}".format(ioc.ioc_value),
-                        "description": ioc.ioc_description
-                    }
-                )
+            yield _format_timeline_event(row, assets_by_event, iocs_by_event)
 
-        ras['iocs'] = alki
+    if request.cookies.get('session'):
 
-        tim.append(ras)
+        def timeline_tail():
+            case_iocs = IocLink.query.with_entities(
+                Ioc.ioc_id,
+                Ioc.ioc_value,
+                Ioc.ioc_description,
+            ).filter(
+                IocLink.case_id == caseid,
+                Ioc.ioc_id == IocLink.ioc_id
+            ).all()
+
+            events_comments_map = {}
+            events_comments_set = get_case_events_comments_count(list(events_list))
+            for k, v in events_comments_set:
+                events_comments_map.setdefault(k, []).append(v)
+
+            return {
+                "comments_map": events_comments_map,
+                "assets": cache,
+                "iocs": [ioc._asdict() for ioc in case_iocs],
+                "categories": [cat.name for cat in get_events_categories()],
+                "state": get_timeline_state(caseid=caseid)
+            }
+
+        return response_success_stream("ok", items_key="tim", items=timeline_rows(), tail=timeline_tail,
+                                       ndjson=_timeline_wants_ndjson())
+
+    return response_success_stream("ok", data={"state": get_timeline_state(caseid=caseid)},
+                                   items_key="timeline", items=timeline_rows(),
+                                   ndjson=_timeline_wants_ndjson())
+
+
+def _get_timeline_context(caseid):
+    """
+    Return the assets, IOCs and events categories of a case, as used by the timeline view
+    """
+    case_assets = CaseAssets.query.with_entities(
+        CaseAssets.asset_id,
+        CaseAssets.asset_name,
+        AssetsType.asset_name.label('type')
+    ).filter(
+        CaseAssets.case_id == caseid
+    ).join(CaseAssets.asset_type).all()
 
-    if request.cookies.get('session'):
+    case_iocs = IocLink.query.with_entities(
+        Ioc.ioc_id,
+        Ioc.ioc_value,
+        Ioc.ioc_description,
+    ).filter(
+        IocLink.case_id == caseid,
+        Ioc.ioc_id == IocLink.ioc_id
+    ).all()
 
-        iocs = IocLink.query.with_entities(
-            Ioc.ioc_id,
-            Ioc.ioc_value,
-            Ioc.ioc_description,
-        ).filter(
-            IocLink.case_id == caseid,
-            Ioc.ioc_id == IocLink.ioc_id
-        ).all()
-
-        events_comments_map = {}
-        events_comments_set = get_case_events_comments_count(events_list)
-        for k, v in events_comments_set:
-            events_comments_map.setdefault(k, []).append(v)
-
-        resp = {
-            "tim": tim,
-            "comments_map": events_comments_map,
-            "assets": cache,
-            "iocs": [ioc._asdict() for ioc in iocs],
-            "categories": [cat.name for cat in get_events_categories()],
-            "state": get_timeline_state(caseid=caseid)
-        }
+    return {
+        "assets": {asset.asset_id: [asset.asset_name, asset.type] for asset in case_assets},
+        "iocs": [ioc._asdict() for ioc in case_iocs],
+        "categories": [cat.name for cat in get_events_categories()]
+    }
 
-    else:
-        resp = {
-            "timeline": tim,
-            "state": get_timeline_state(caseid=caseid)
-        }
+
+@case_timeline_blueprint.route('/case/timeline/events/window', methods=['GET'])
+@ac_api_case_requires(CaseAccessLevel.read_only, CaseAccessLevel.full_access)
+def case_timeline_window(caseid):
+    """
+    Return a slice of the timeline, so the UI only fetches the events it displays. The slice is taken around the
+    date given in the around parameter, or after / before a cursor returned by a previous call. The q parameter
+    takes the same filter as the advanced filter.
+    """
+    try:
+        timeline_filter = _load_timeline_filter(caseid)
+
+        size = request.args.get('size', TIMELINE_WINDOW_DEFAULT_SIZE, type=int)
+        if size < 1 or size > TIMELINE_WINDOW_MAX_SIZE:
+            raise ValueError(f'Invalid size, must be between 1 and {TIMELINE_WINDOW_MAX_SIZE}')
+
+        around = request.args.get('around')
+        if around:
+            around = parse_bf_date_format(around)
+            if around is None:
+                raise ValueError('Invalid around date')
+
+        condition = and_(timeline_filter['condition'],
+                         get_timeline_links_condition(caseid,
+                                                      assets=timeline_filter['assets'],
+                                                      assets_id=timeline_filter['assets_id'],
+                                                      iocs=timeline_filter['iocs']))
+
+        window = get_timeline_window(condition, size,
+                                     around=around or None,
+                                     after=request.args.get('after'),
+                                     before=request.args.get('before'))
+
+    except ValueError as e:
+        return response_error(str(e))
+
+    events_ids = [event.event_id for event in window['events']]
+
+    assets_links = CaseAssets.query.with_entities(
+        CaseEventsAssets.event_id,
+        CaseAssets.asset_name,
+        AssetsType.asset_name.label('type'),
+        CaseAssets.asset_ip,
+        CaseAssets.asset_description,
+        CaseAssets.asset_compromise_status_id
+    ).filter(
+        CaseEventsAssets.case_id == caseid,
+        CaseEventsAssets.event_id.in_(events_ids)
+    ).join(CaseEventsAssets.asset).join(CaseAssets.asset_type).all()
+
+    iocs_links = CaseEventsIoc.query.with_entities(
+        CaseEventsIoc.event_id,
+        Ioc.ioc_value,
+        Ioc.ioc_description
+    ).filter(
+        CaseEventsIoc.case_id == caseid,
+        CaseEventsIoc.event_id.in_(events_ids)
+    ).join(
+        CaseEventsIoc.ioc
+    ).all()
+
+    assets_by_event = _group_by_event(assets_links, _format_timeline_asset)
+    iocs_by_event = _group_by_event(iocs_links, _format_timeline_ioc)
+
+    events_comments_map = {}
+    for k, v in get_case_events_comments_count(events_ids):
+        events_comments_map.setdefault(k, []).append(v)
+
+    resp = {
+        "tim": [_format_timeline_event(event, assets_by_event, iocs_by_event) for event in window['events']],
+        "comments_map": events_comments_map,
+        "previous_cursor": window['previous_cursor'],
+        "next_cursor": window['next_cursor'],
+        "state": get_timeline_state(caseid=caseid)
+    }
+
+    if not request.args.get('after') and not request.args.get('before'):
+        # The first window of a view also carries what the filter completion and the IOCs highlighting need
+        resp.update(_get_timeline_context(caseid))
+
+    return response_success("ok", data=resp)
+
+
+@case_timeline_blueprint.route('/case/timeline/events/histogram', methods=['GET'])
+@ac_api_case_requires(CaseAccessLevel.read_only, CaseAccessLevel.full_access)
+def case_timeline_histogram(caseid):
+    """
+    Count the events of the timeline by hour or by day, with the same filter as the advanced filter
+    """
+    try:
+        timeline_filter = _load_timeline_filter(caseid)
+
+        condition = and_(timeline_filter['condition'],
+                         get_timeline_links_condition(caseid,
+                                                      assets=timeline_filter['assets'],
+                                                      assets_id=timeline_filter['assets_id'],
+                                                      iocs=timeline_filter['iocs']))
+
+        buckets = get_timeline_histogram(condition, request.args.get('bucket', 'day'))
+
+    except ValueError as e:
+        return response_error(str(e))
+
+    resp = {
+        "buckets": [{"start": bucket.bucket, "count": bucket.count} for bucket in buckets],
+        "state": get_timeline_state(caseid=caseid)
+    }
 
     return response_success("ok", data=resp)
 
@@ -990,178 +1193,171 @@ def case_event_date_convert(caseid):
 
 
 # BEGIN_RS_CODE
-@case_timeline_blueprint.route('/case/timeline/events/csv_upload', methods=['POST'])
-@ac_api_case_requires(CaseAccessLevel.full_access)
-def case_events_upload_csv(caseid):
-    event_schema = EventSchema()
+def _upload_events_options():
+    return {
+        option: request.form.get(option) == 'true' if option != 'event_source' else request.form.get(option)
+        for option in ['event_sync_iocs_assets', 'event_in_summary', 'event_in_graph', 'event_source']
+        if request.form.get(option) is not None
+    }
+
+
+def _discard_events_upload(file_path):
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+
+def _import_events_upload(caseid, file_path, file_format, options):
+    """
+    Import an uploaded events file. Large files are imported by the worker, and a task ID is returned to follow the
+    import. The file is removed once imported, or when the import fails
+    """
+    queued = False
 
-    jsdata = request.get_json()
-    app.logger.info("Starting CSV import")
-    event_fields = [
-        "event_date",
-        "event_tz",
-        "event_title",
-        "event_category",
-        "event_content",
-        "event_raw",
-        "event_source",
-        "event_assets",
-        "event_iocs",
-        "event_tags"
-    ]
-
-    csv_lines = jsdata["CSVData"].splitlines()
-
-    csv_options = jsdata.get('CSVOptions') if jsdata.get('CSVOptions') else {}
-
-    event_sync_iocs_assets = csv_options.get('event_sync_iocs_assets') if csv_options.get(
-        'event_sync_iocs_assets') else False
-    event_in_summary = csv_options.get('event_in_summary') if csv_options.get('event_in_summary') else False
-    event_in_graph = csv_options.get('event_in_graph') if csv_options.get('event_in_graph') else True
-    event_source = csv_options.get('event_source') if csv_options.get('event_source') else ''
-
-    csv_data = list(csv.DictReader(csv_lines, delimiter=','))
-    missing_fields = []
-    row0 = csv_data[0]
-    for fld in event_fields:
-        if row0.get(fld) is None:
-            missing_fields.append(fld)
-
-    if len(missing_fields) > 0:
-        csv_fields = list(row0.keys())
-        msg = f"Bad SCV Fields Mapping. Fields missing: [{','.join(missing_fields)}]"
-        data = {"error_code": "BAD_FIELDS_MAPPING", "expected": ','.join(event_fields), "found": ','.join(csv_fields),
-                "missing": ','.join(missing_fields)}
-        app.logger.warning(data)
-
-        return response_error(msg=msg, data=data)
-
-    DEFAULT_CAT_ID = get_default_category().id
-
-    # ==========================  checking data validity (assets, ioc, categories, etc... )  ==========================
-    line = 0
-    csv_lines = []
     try:
+        check_events_file(file_path, file_format)
 
-        for row in csv_data:
-            event_title = row.get('event_title')
-            event_assets = row.get('event_assets')
-            event_iocs = row.get('event_iocs')
-            event_tags = row.get('event_tags')
-            event_category_name = row.pop('event_category')
+        if os.path.getsize(file_path) >= app.config.get('TIMELINE_IMPORT_ASYNC_MIN_SIZE'):
+            try:
+                task = task_import_events.delay(file_path=file_path, caseid=caseid, user_id=current_user.id,
+                                                file_format=file_format, options=options)
+                queued = True
 
-            line += 1
+                return response_success("Events import queued", data={'task_id': task.id}, status=202)
 
-            if len(event_title) == 0:
-                return response_error(msg=f"Data error",
-                                      data={"Error": f"Event Title can not be empty.\nrow number: {line}"})
+            except Exception as e:
+                app.logger.warning(f'Unable to queue the events import, running it synchronously: {e}')
+
+        imported = import_events_file(file_path, caseid, current_user.id, file_format=file_format, options=options)
+
+    except BusinessProcessingError as e:
+        return response_error(msg=e.get_message(), data=e.get_data())
 
-            assets = []
-            for asset_name in event_assets.split(";"):
-                if asset_name == '':
-                    continue
-                asset = get_asset_by_name(asset_name, caseid)
-                if asset:
-                    assets.append(asset.asset_id)
-                else:
-                    return response_error(msg=f"Data error", data={
-                        "Error": f"Asset not recognized : {asset_name}.\nrow number: {line}"})
-
-            row['event_assets'] = assets
-
-            iocs = []
-            for ioc_value in event_iocs.split("|"):
-                if ioc_value == '':
-                    continue
-                ioc = get_ioc_by_value(ioc_value, caseid)
-                if ioc:
-                    iocs.append(ioc.ioc_id)
-                else:
-                    return response_error(msg=f"Data error",
-                                          data={"Error": f"IoC not recognized : {ioc_value}.\nrow number: {line}"})
-            row['event_iocs'] = iocs
-
-            if (event_category_name is not None) and (event_category_name != ''):
-                event_category = get_category_by_name(event_category_name)
-                if event_category:
-                    row['event_category_id'] = event_category.id
-                else:
-                    return response_error(msg=f"Data error", data={
-                        "Error": f"event_category not recognized : {event_category}.\nrow number: {line}"})
-            else:
-                row['event_category_id'] = DEFAULT_CAT_ID
-
-            if event_tags:
-                row['event_tags'] = ','.join(event_tags.split('|'))
-
-            row['event_in_summary'] = event_in_summary
-            row['event_in_graph'] = event_in_graph
-            row['event_source'] = event_source
-
-            csv_lines.append(row)
     except Exception as e:
-        return response_error(msg=f"Data error", data={"Exception": f"Unhandled error {e}.\nrow number: {line}"})
+        db.session.rollback()
+        app.logger.exception(e)
+
+        return response_error(msg=f"Unable to import the {file_format.upper()} file, please check the server logs")
+
+    finally:
+        # Removed by the worker once imported when queued
+        if not queued:
+            _discard_events_upload(file_path)
+
+    app.logger.info(f"{file_format.upper()} import done, {imported} events added")
+
+    return response_success(msg=f"Events added ({file_format.upper()} File)", data={'imported': imported})
+
 
-    # ========================== begin saving data ============================
-    session = db.session.begin_nested()
-    line = 0
+def _save_events_upload(file_path, save):
+    """
+    Write an uploaded events file, returns an error response if it can't be written
+    """
     try:
-        for row in csv_lines:
-            if row is None:
-                continue
-            line += 1
+        save()
 
-            request_data = call_modules_hook('on_preload_event_create', data=row, caseid=caseid)
-            event = event_schema.load(request_data)
-            event.event_date, event.event_date_wtz = event_schema.validate_date(request_data.get(u'event_date'),
-                                                                                request_data.get(u'event_tz'))
-            event.case_id = caseid
-            event.event_added = datetime.utcnow()
-            event.user_id = current_user.id
+    except Exception as e:
+        _discard_events_upload(file_path)
+        app.logger.exception(e)
 
-            add_obj_history_entry(event, 'created')
+        return response_error(msg="Unable to save the uploaded file, please check the server logs")
 
-            db.session.add(event)
-            update_timeline_state(caseid=caseid)
+    return None
 
-            save_event_category(event.event_id, request_data.get('event_category_id'))
 
-            setattr(event, 'event_category_id', request_data.get('event_category_id'))
+@case_timeline_blueprint.route('/case/timeline/events/csv_upload', methods=['POST'])
+@ac_api_case_requires(CaseAccessLevel.full_access)
+def case_events_upload_csv(caseid):
+    """
+    Import the events of a CSV file. The file is either uploaded as the file field of a multipart form, with the
+    options as form fields, or sent as a string in the CSVData field of a JSON body with the options in CSVOptions.
+    """
+    app.logger.info("Starting CSV import")
 
-            success, log = update_event_assets(event_id=event.event_id,
-                                               caseid=caseid,
-                                               assets_list=request_data.get('event_assets'),
-                                               iocs_list=request_data.get('event_iocs'),
-                                               sync_iocs_assets=event_sync_iocs_assets)
-            if not success:
-                raise Exception(f'Error while saving linked assets\nlog:{log}')
+    file_path = build_events_import_path('csv')
 
-            success, log = update_event_iocs(event_id=event.event_id,
-                                             caseid=caseid,
-                                             iocs_list=request_data.get('event_iocs'))
-            if not success:
-                raise Exception(f'Error while saving linked iocs\nlog:{log}')
+    uploaded_file = request.files.get('file')
+    if uploaded_file:
+        # Saved by chunks, the CSV is never fully loaded in memory
+        error = _save_events_upload(file_path, lambda: uploaded_file.save(file_path))
+        options = _upload_events_options()
 
-            setattr(event, 'event_category_id', request_data.get('event_category_id'))
+    else:
+        jsdata = request.get_json()
+        if not jsdata or not jsdata.get('CSVData'):
+            return response_error("No CSV data provided")
 
-            event = call_modules_hook('on_postload_event_create', data=event, caseid=caseid)
+        def write_csv_data():
+            with open(file_path, 'w', encoding='utf-8') as csv_file:
+                csv_file.write(jsdata.get('CSVData'))
 
-            track_activity("added event {}".format(event.event_id), caseid=caseid)
+        error = _save_events_upload(file_path, write_csv_data)
+        options = jsdata.get('CSVOptions') if jsdata.get('CSVOptions') else {}
 
-    except marshmallow.exceptions.ValidationError as e:
-        return response_error(msg="Data error", data=e.normalized_messages())
+    if error:
+        return error
 
-    except Exception as e:
-        return response_error(msg=f"Data error", data={"Error": f"{e}"})
+    return _import_events_upload(caseid, file_path, 'csv', options)
 
-    # db.session.commit()
-    try:
-        session.commit()
-    except:
-        pass
 
-    app.logger.info("======================== END_CSV_IMPORT ==========================================")
+@case_timeline_blueprint.route('/case/timeline/events/jsonl_upload', methods=['POST'])
+@ac_api_case_requires(CaseAccessLevel.full_access)
+def case_events_upload_jsonl(caseid):
+    """
+    Import the events of a JSON lines file, as written by the timeline export, uploaded as the file field of a
+    multipart form with the options as form fields.
+    """
+    uploaded_file = request.files.get('file')
+    if not uploaded_file:
+        return response_error("No JSONL file provided")
+
+    app.logger.info("Starting JSONL import")
+
+    file_path = build_events_import_path('jsonl')
+    error = _save_events_upload(file_path, lambda: uploaded_file.save(file_path))
+    if error:
+        return error
+
+    return _import_events_upload(caseid, file_path, 'jsonl', _upload_events_options())
 
-    return response_success(msg="Events added (CSV File)")
+
+@case_timeline_blueprint.route('/case/timeline/events/csv_upload/<task_id>', methods=['GET'])
+@case_timeline_blueprint.route('/case/timeline/events/jsonl_upload/<task_id>', methods=['GET'])
+@ac_api_case_requires(CaseAccessLevel.full_access)
+def case_events_upload_status(task_id, caseid):
+    """
+    Return the progress of an import queued in the case by the current user
+    """
+    task = task_import_events.AsyncResult(task_id)
+    if task.state != 'PENDING' and not is_task_of(task, caseid, current_user.id):
+        return response_error('Unknown task', status=404)
+
+    data = {
+        'task_id': task_id,
+        'state': task.state,
+        'progress': task.info if task.state == 'PROGRESS' else None
+    }
+
+    if task.state == 'SUCCESS' and isinstance(task.info, IIStatus):
+        data['success'] = task.info.is_success()
+        data['message'] = task.info.get_message()
+        data['logs'] = task.info.get_logs()
+
+    return response_success(data=data)
+
+
+@case_timeline_blueprint.route('/case/timeline/events/export', methods=['GET'])
+@ac_api_case_requires(CaseAccessLevel.read_only, CaseAccessLevel.full_access)
+def case_events_export_jsonl(caseid):
+    """
+    Stream the case timeline as JSON lines, one event per line with its category, linked assets and IOCs and custom
+    attributes. The file can be imported back with the JSONL upload.
+    """
+    def generate_jsonl():
+        for record in iter_case_tm_jsonl(caseid):
+            yield json.dumps(record, cls=AlchemyEncoder) + '\n'
+
+    return Response(stream_with_context(generate_jsonl()), mimetype='application/x-ndjson', headers={
+        'Content-Disposition': f'attachment; filename=case_{caseid}_timeline.jsonl'
+    })
 
 # END_RS_CODE
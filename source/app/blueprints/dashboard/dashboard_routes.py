@@ -298,7 +298,7 @@ def add_gtask(caseid):
         return response_error(msg="Data error", data=e.__str__())
 
     gtask = call_modules_hook('on_postload_global_task_create', data=gtask, caseid=caseid)
-    track_activity("created new global task \'{}\'".format(gtask.task_title), caseid=caseid)
+    track_activity("created new global task \'{}\'".format(gtask.task_title), caseid=caseid, kind='global')
 
     return response_success('Task added', data=gtask_schema.dump(gtask))
 
@@ -351,7 +351,8 @@ def edit_gtask(cur_id, caseid):
     except marshmallow.exceptions.ValidationError as e:
         return response_error(msg="Data error", data=e.messages)
 
-    track_activity("updated global task {} (status {})".format(task.task_title, task.task_status_id), caseid=caseid)
+    track_activity("updated global task {} (status {})".format(task.task_title, task.task_status_id), caseid=caseid,
+                   kind='global')
 
     return response_success('Task updated', data=gtask_schema.dump(gtask))
 
@@ -374,6 +375,6 @@ def gtask_delete(cur_id, caseid):
     db.session.commit()
 
     call_modules_hook('on_postload_global_task_delete', data=request.get_json(), caseid=caseid)
-    track_activity("deleted global task ID {}".format(cur_id), caseid=caseid)
+    track_activity("deleted global task ID {}".format(cur_id), caseid=caseid, kind='global')
 
     return response_success("Task deleted")
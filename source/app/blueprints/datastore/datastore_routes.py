@@ -31,6 +31,12 @@ from werkzeug.utils import redirect
 
 import app
 from app import db
+from app.business.datastore_uploads import append_upload_chunk
+from app.business.datastore_uploads import cancel_upload
+from app.business.datastore_uploads import complete_upload
+from app.business.datastore_uploads import create_upload
+from app.business.datastore_uploads import get_upload
+from app.business.errors import BusinessProcessingError
 from app.datamgmt.datastore.datastore_db import datastore_add_child_node
 from app.datamgmt.datastore.datastore_db import datastore_add_file_as_evidence
 from app.datamgmt.datastore.datastore_db import datastore_add_file_as_ioc
@@ -42,8 +48,10 @@ from app.datamgmt.datastore.datastore_db import datastore_get_interactive_path_n
 from app.datamgmt.datastore.datastore_db import datastore_get_local_file_path
 from app.datamgmt.datastore.datastore_db import datastore_get_path_node
 from app.datamgmt.datastore.datastore_db import datastore_get_standard_path
+from app.datamgmt.datastore.datastore_db import datastore_release_blob
 from app.datamgmt.datastore.datastore_db import datastore_rename_node
 from app.datamgmt.datastore.datastore_db import ds_list_tree
+from app.datamgmt.states import update_datastore_state
 from app.forms import ModalDSFileForm
 from app.iris_engine.utils.tracker import track_activity
 from app.models.authorization import CaseAccessLevel
@@ -209,9 +217,11 @@ def datastore_update_file(cur_id: int, caseid: int):
         dsf.file_is_ioc = request.form.get('file_is_ioc') is not None or request.form.get('file_is_ioc') is True
         dsf.file_is_evidence = request.form.get('file_is_evidence') is not None or request.form.get('file_is_evidence') is True
 
+        update_datastore_state(caseid)
         db.session.commit()
 
         if request.files.get('file_content'):
+            previous_local_name = dsf_sc.file_local_name
             ds_location = datastore_get_standard_path(dsf_sc, caseid)
             dsf_sc.file_local_name, dsf_sc.file_size, dsf_sc.file_sha256 = dsf_schema.ds_store_file(
                 request.files.get('file_content'),
@@ -222,8 +232,11 @@ def datastore_update_file(cur_id: int, caseid: int):
             if dsf_sc.file_is_ioc and not dsf_sc.file_password:
                 dsf_sc.file_password = 'infected'
 
+            update_datastore_state(caseid)
             db.session.commit()
 
+            datastore_release_blob(previous_local_name)
+
         msg_added_as = ''
         if dsf.file_is_ioc:
             datastore_add_file_as_ioc(dsf, caseid)
@@ -256,6 +269,7 @@ def datastore_move_file(cur_id: int, caseid: int):
         return response_error('Invalid destination node ID for this case')
 
     dsf.file_parent_id = dsp.path_id
+    update_datastore_state(caseid)
     db.session.commit()
 
     track_activity(f'File \"{dsf.file_original_name}\" moved to \"{dsp.path_name}\" in DS', caseid=caseid)
@@ -281,6 +295,7 @@ def datastore_move_folder(cur_id: int, caseid: int):
         return response_error("If that's true, then I've made a mistake, and you should kill me now.")
 
     dsp.path_parent_id = dsp_dst.path_id
+    update_datastore_state(caseid)
     db.session.commit()
 
     dsf_folder_schema = DSPathSchema()
@@ -346,16 +361,10 @@ def datastore_add_file(cur_id: int, caseid: int):
             dsf_sc.file_is_ioc,
             dsf_sc.file_password)
 
+        update_datastore_state(caseid)
         db.session.commit()
 
-        msg_added_as = ''
-        if dsf_sc.file_is_ioc:
-            datastore_add_file_as_ioc(dsf_sc, caseid)
-            msg_added_as += 'and added in IOC'
-
-        if dsf_sc.file_is_evidence:
-            datastore_add_file_as_evidence(dsf_sc, caseid)
-            msg_added_as += ' and evidence' if len(msg_added_as) > 0 else 'and added in evidence'
+        msg_added_as = _datastore_link_added_file(dsf_sc, caseid)
 
         track_activity(f"File \"{dsf_sc.file_original_name}\" added to DS", caseid=caseid)
         return response_success(f'File saved in datastore {msg_added_as}', data=dsf_schema.dump(dsf_sc))
@@ -364,6 +373,116 @@ def datastore_add_file(cur_id: int, caseid: int):
         return response_error(msg="Data error", data=e.messages)
 
 
+def _datastore_link_added_file(dsf_sc, caseid):
+    msg_added_as = ''
+    if dsf_sc.file_is_ioc:
+        datastore_add_file_as_ioc(dsf_sc, caseid)
+        msg_added_as += 'and added in IOC'
+
+    if dsf_sc.file_is_evidence:
+        datastore_add_file_as_evidence(dsf_sc, caseid)
+        msg_added_as += ' and evidence' if len(msg_added_as) > 0 else 'and added in evidence'
+
+    return msg_added_as
+
+
+@datastore_blueprint.route('/datastore/file/upload/<int:cur_id>/init', methods=['POST'])
+@ac_api_case_requires(CaseAccessLevel.full_access)
+def datastore_upload_file_init(cur_id: int, caseid: int):
+    """
+    Start a chunked upload of a file in a folder of the datastore. Expects the fields of the file, as for
+    /datastore/file/add, along with its size in file_size. The chunks are then sent to
+    /datastore/file/upload/<upload_id>/chunk and the upload is completed with /datastore/file/upload/<upload_id>/complete
+    """
+    data = request.form if request.form else (request.get_json(silent=True) or {})
+
+    try:
+        file_size = int(data.get('file_size'))
+    except (TypeError, ValueError):
+        return response_error('Invalid file size')
+
+    try:
+        upload = create_upload(caseid, cur_id, current_user.id, data, file_size, upload_id=data.get('upload_id'))
+
+    except BusinessProcessingError as e:
+        return response_error(e.get_message(), data=e.get_data())
+
+    del upload['fields']
+    return response_success('Upload started', data=upload)
+
+
+@datastore_blueprint.route('/datastore/file/upload/<upload_id>', methods=['GET'])
+@ac_api_case_requires(CaseAccessLevel.full_access)
+def datastore_upload_file_status(upload_id: str, caseid: int):
+
+    try:
+        upload = get_upload(caseid, upload_id, current_user.id)
+
+    except BusinessProcessingError as e:
+        return response_error(e.get_message(), data=e.get_data())
+
+    del upload['fields']
+    return response_success('', data=upload)
+
+
+@datastore_blueprint.route('/datastore/file/upload/<upload_id>/chunk', methods=['POST'])
+@ac_api_case_requires(CaseAccessLevel.full_access)
+def datastore_upload_file_chunk(upload_id: str, caseid: int):
+    """
+    Receive a chunk of an upload, at the offset given in offset. The chunk is either sent as a file_content file, or
+    as the raw body of the request with the offset in the query string.
+    """
+    offset = request.values.get('offset')
+    try:
+        offset = int(offset)
+    except (TypeError, ValueError):
+        return response_error('Invalid chunk offset')
+
+    chunk = request.files.get('file_content')
+    stream = chunk.stream if chunk else request.stream
+
+    try:
+        new_offset = append_upload_chunk(caseid, upload_id, current_user.id, offset, stream)
+
+    except BusinessProcessingError as e:
+        return response_error(e.get_message(), data=e.get_data())
+
+    return response_success('', data={'upload_id': upload_id, 'offset': new_offset})
+
+
+@datastore_blueprint.route('/datastore/file/upload/<upload_id>/complete', methods=['POST'])
+@ac_api_case_requires(CaseAccessLevel.full_access)
+def datastore_upload_file_complete(upload_id: str, caseid: int):
+    """
+    Create the file of a fully received upload. The password of the file, if any, is sent again in file_password
+    """
+    data = request.form if request.form else (request.get_json(silent=True) or {})
+
+    try:
+        dsf_sc = complete_upload(caseid, upload_id, current_user.id, file_password=data.get('file_password'))
+
+    except BusinessProcessingError as e:
+        return response_error(e.get_message(), data=e.get_data())
+
+    msg_added_as = _datastore_link_added_file(dsf_sc, caseid)
+
+    track_activity(f"File \"{dsf_sc.file_original_name}\" added to DS", caseid=caseid)
+    return response_success(f'File saved in datastore {msg_added_as}', data=DSFileSchema().dump(dsf_sc))
+
+
+@datastore_blueprint.route('/datastore/file/upload/<upload_id>/cancel', methods=['POST'])
+@ac_api_case_requires(CaseAccessLevel.full_access)
+def datastore_upload_file_cancel(upload_id: str, caseid: int):
+
+    try:
+        cancel_upload(caseid, upload_id, current_user.id)
+
+    except BusinessProcessingError as e:
+        return response_error(e.get_message(), data=e.get_data())
+
+    return response_success('Upload canceled')
+
+
 @datastore_blueprint.route('/datastore/file/add-interactive', methods=['POST'])
 @ac_api_case_requires(CaseAccessLevel.full_access)
 def datastore_add_interactive_file(caseid: int):
@@ -236,8 +236,10 @@ def list_dim_tasks(count):
             kwargs = json.loads(row.kwargs.decode('utf-8'))
             if kwargs:
                 user = kwargs.get('init_user')
-                case_name = f"Case #{kwargs.get('caseid')}"
-                task_name = f"{kwargs.get('module_name')}::{kwargs.get('hook_name')}"
+                if kwargs.get('caseid'):
+                    case_name = f"Case #{kwargs.get('caseid')}"
+                if kwargs.get('module_name'):
+                    task_name = f"{kwargs.get('module_name')}::{kwargs.get('hook_name')}"
 
         try:
             result = pickle.loads(row.result)
@@ -20,16 +20,20 @@ from flask import url_for
 from flask_wtf import FlaskForm
 from werkzeug.utils import redirect
 
+from app import app
 from app.business.users import _reset_user_mfa
 from app.iris_engine.access_control.utils import ac_recompute_all_users_effective_ac
 from app.iris_engine.access_control.utils import ac_recompute_effective_ac
 from app.iris_engine.access_control.utils import ac_trace_effective_user_permissions
 from app.iris_engine.access_control.utils import ac_trace_user_effective_cases_access_2
+from app.iris_engine.tasker.tasks import task_recompute_all_users_effective_access
 from app.models.authorization import Permissions
 from app.util import ac_api_requires
 from app.util import ac_requires
 from app.util import response_success
 
+log = app.logger
+
 manage_ac_blueprint = Blueprint(
         'access_control',
         __name__,
@@ -52,9 +56,31 @@ def manage_ac_index(caseid, url_redir):
 @ac_api_requires(Permissions.server_administrator)
 def manage_ac_compute_effective_all_ac():
 
-    ac_recompute_all_users_effective_ac()
+    try:
+        task = task_recompute_all_users_effective_access.delay()
 
-    return response_success('Updated')
+    except Exception as e:
+        log.warning(f'Unable to queue the effective access recompute, running it synchronously: {e}')
+        ac_recompute_all_users_effective_ac()
+
+        return response_success('Updated')
+
+    return response_success('Recompute queued', data={'task_id': task.id}, status=202)
+
+
+@manage_ac_blueprint.route('/manage/access-control/recompute-effective-users-ac/<task_id>', methods=['GET'])
+@ac_api_requires(Permissions.server_administrator)
+def manage_ac_compute_effective_all_ac_status(task_id):
+
+    task = task_recompute_all_users_effective_access.AsyncResult(task_id)
+
+    data = {
+        'task_id': task_id,
+        'state': task.state,
+        'progress': task.info if task.state == 'PROGRESS' else None
+    }
+
+    return response_success(data=data)
 
 
 @manage_ac_blueprint.route('/manage/access-control/recompute-effective-user-ac/<int:cur_id>', methods=['GET'])
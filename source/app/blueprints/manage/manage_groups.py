@@ -341,7 +341,9 @@ def manage_groups_cac_add_case(cur_id):
 
     group = get_group_details(cur_id)
 
-    ac_recompute_effective_ac_from_users_list(group.group_members)
+    ac_recompute_effective_ac_from_users_list(group.group_members,
+                                              cases_ids=None if data.get('auto_follow_cases') is True
+                                              else data.get('cases_list'))
 
     return response_success(data=group)
 
@@ -378,7 +380,7 @@ def manage_groups_cac_delete_case(cur_id):
         return response_error(msg=str(e))
 
     if success:
-        ac_recompute_effective_ac_from_users_list(group.group_members)
+        ac_recompute_effective_ac_from_users_list(group.group_members, cases_ids=data.get('cases'))
         return response_success(msg="Cases access removed from group")
 
     return response_error(msg=logs)
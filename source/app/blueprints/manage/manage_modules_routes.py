@@ -41,6 +41,7 @@ from app.forms import AddModuleForm
 from app.forms import UpdateModuleParameterForm
 from app.iris_engine.module_handler.module_handler import check_module_health
 from app.iris_engine.module_handler.module_handler import instantiate_module_from_name
+from app.iris_engine.module_handler.module_handler import invalidate_modules_hooks_cache
 from app.iris_engine.module_handler.module_handler import iris_update_hooks
 from app.iris_engine.module_handler.module_handler import register_module
 from app.iris_engine.utils.tracker import track_activity
@@ -120,6 +121,7 @@ def add_module():
 
         # Registers into Iris DB for further calls
         module, message = register_module(module_name)
+        invalidate_modules_hooks_cache()
         if module is None:
             track_activity(f"addition of IRIS module {module_name} was attempted and failed", ctx_less=True)
             return response_error(f'Unable to register module: {message}')
@@ -177,6 +179,7 @@ def update_module_param(param_name):
     parameter_value = request.json.get('parameter_value')
 
     if iris_module_save_parameter(mod_id, mod_config, parameter['param_name'], parameter_value):
+        invalidate_modules_hooks_cache()
         track_activity(f"parameter {parameter['param_name']} of mod ({mod_name})  #{mod_id} was updated",
                        ctx_less=True)
 
@@ -220,6 +223,8 @@ def enable_module(mod_id):
     if not iris_module_enable_by_id(mod_id):
         return response_error('Unable to enable module')
 
+    invalidate_modules_hooks_cache()
+
     success, logs = iris_update_hooks(module_name, mod_id)
     if not success:
         return response_error("Unable to update hooks when enabling module", data=logs)
@@ -233,6 +238,7 @@ def enable_module(mod_id):
 @ac_api_requires(Permissions.server_administrator)
 def disable_module(module_id):
     if iris_module_disable_by_id(module_id):
+        invalidate_modules_hooks_cache()
 
         track_activity(f"IRIS module #{module_id} disabled", ctx_less=True)
         return response_success('Module disabled')
@@ -246,6 +252,7 @@ def view_delete_module(module_id):
     try:
 
         delete_module_from_id(module_id=module_id)
+        invalidate_modules_hooks_cache()
         track_activity(f"IRIS module #{module_id} deleted", ctx_less=True)
         return response_success("Deleted")
 
@@ -291,6 +298,7 @@ def import_mod_config(module_id):
         if not iris_module_save_parameter(module_id, mod_config, param_name, parameter_value):
             logs.append(f'Unable to save parameter {param_name}')
 
+    invalidate_modules_hooks_cache()
     track_activity(f"parameters of mod #{module_id} were updated from config file", ctx_less=True)
 
     if len(logs) == 0:
@@ -16,114 +16,125 @@
 #  along with this program; if not, write to the Free Software Foundation,
 #  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
-import os
-import tempfile
-
 from flask import Blueprint
 from flask import request
 from flask import send_file
-
+from flask import url_for
+from flask_login import current_user
+
+from app import app
+from app.business.errors import BusinessProcessingError
+from app.business.reports import generate_report
+from app.business.reports import get_report_artifact
+from app.business.reports import get_report_artifact_path
 from app.iris_engine.module_handler.module_handler import call_modules_hook
-from app.iris_engine.reporter.reporter import IrisMakeDocReport
-from app.iris_engine.reporter.reporter import IrisMakeMdReport
-from app.iris_engine.utils.tracker import track_activity
-from app.models import CaseTemplateReport
-from app.util import FileRemover
+from app.iris_engine.tasker.tasks import is_task_of
+from app.iris_engine.tasker.tasks import task_generate_report
+from app.models.authorization import CaseAccessLevel
+from app.util import ac_api_case_requires
 from app.util import ac_api_requires
 from app.util import ac_requires_case_identifier
 from app.util import response_error
+from app.util import response_success
+from iris_interface.IrisInterfaceStatus import IIStatus
 
 reports_blueprint = Blueprint('reports', __name__, template_folder='templates')
 
-file_remover = FileRemover()
 
+def _build_download_url(token, caseid):
+    return url_for('reports.download_report_artifact', token=token, cid=caseid)
 
-@reports_blueprint.route('/case/report/generate-activities/<int:report_id>', methods=['GET'])
-@ac_api_requires()
-@ac_requires_case_identifier()
-def download_case_activity(report_id, caseid):
 
-    call_modules_hook('on_preload_activities_report_create', data=report_id, caseid=caseid)
-    if report_id:
-        report = CaseTemplateReport.query.filter(CaseTemplateReport.id == report_id).first()
-        if report:
-            tmp_dir = tempfile.mkdtemp()
+def _generate_case_report(report_id, caseid, doc_type, preload_hook):
+    """
+    Generate a report, or serve it from its artifact if the case did not change since it was generated.
 
-            safe_mode = False
+    With the async query parameter set to true, the report is generated by the worker, and a task ID is returned
+    to follow the generation. The download URL is returned directly when the artifact already exists.
+    """
+    safe_mode = request.args.get('safe-mode') == 'true'
 
-            if request.args.get('safe-mode') == 'true':
-                safe_mode = True
+    call_modules_hook(preload_hook, data=report_id, caseid=caseid)
 
-            # Get file extension
-            _, report_format = os.path.splitext(report.internal_reference)
-            
-            # Depending on the template format, the generation process is different
-            if report_format == ".docx":
-                mreport = IrisMakeDocReport(tmp_dir, report_id, caseid, safe_mode)
-                fpath, logs = mreport.generate_doc_report(doc_type="Activities")
+    try:
+        if request.args.get('async') == 'true':
+            token = get_report_artifact(caseid, report_id, doc_type, safe_mode, current_user.id)
+            if token:
+                return response_success('Report already generated',
+                                        data={'task_id': None, 'download_url': _build_download_url(token, caseid)})
 
-            elif report_format == ".md" or report_format == ".html" :
-                mreport = IrisMakeMdReport(tmp_dir, report_id, caseid, safe_mode)
-                fpath, logs = mreport.generate_md_report(doc_type="Activities")
+            try:
+                task = task_generate_report.delay(caseid=caseid, report_id=report_id, doc_type=doc_type,
+                                                  safe_mode=safe_mode, user_id=current_user.id)
 
-            else:
-                return response_error("Report error", "Unknown report format.")
+                return response_success('Report generation queued', data={'task_id': task.id}, status=202)
 
-            if fpath is None:
-                track_activity("failed to generate a report")
-                return response_error(msg="Failed to generate the report", data=logs)
+            except Exception as e:
+                app.logger.warning(f'Unable to queue the report generation, running it synchronously: {e}')
 
-            call_modules_hook('on_postload_activities_report_create', data=report_id, caseid=caseid)
-            resp = send_file(fpath, as_attachment=True)
-            file_remover.cleanup_once_done(resp, tmp_dir)
+            token = generate_report(caseid, report_id, doc_type, safe_mode, current_user.id)
 
-            track_activity("generated a report")
+            return response_success('Report generated',
+                                    data={'task_id': None, 'download_url': _build_download_url(token, caseid)})
 
-            return resp
+        token = generate_report(caseid, report_id, doc_type, safe_mode, current_user.id)
 
-    return response_error("Unknown report", status=404)
+    except BusinessProcessingError as e:
+        if e.get_message() == 'Unknown report':
+            return response_error(e.get_message(), status=404)
 
+        return response_error(msg=e.get_message(), data=e.get_data())
 
-@reports_blueprint.route("/case/report/generate-investigation/<int:report_id>", methods=['GET'])
+    return send_file(get_report_artifact_path(caseid, token), as_attachment=True)
+
+
+@reports_blueprint.route('/case/report/generate-activities/<int:report_id>', methods=['GET'])
 @ac_api_requires()
 @ac_requires_case_identifier()
-def _gen_report(report_id, caseid):
+def download_case_activity(report_id, caseid):
+    return _generate_case_report(report_id, caseid, 'Activities', 'on_preload_activities_report_create')
 
-    safe_mode = False
 
-    call_modules_hook('on_preload_report_create', data=report_id, caseid=caseid)
-    if report_id:
-        report = CaseTemplateReport.query.filter(CaseTemplateReport.id == report_id).first()
-        if report:
-            tmp_dir = tempfile.mkdtemp()
+@reports_blueprint.route("/case/report/generate-investigation/<int:report_id>", methods=['GET'])
+@ac_api_requires()
+@ac_requires_case_identifier()
+def _gen_report(report_id, caseid):
+    return _generate_case_report(report_id, caseid, 'Investigation', 'on_preload_report_create')
 
-            if request.args.get('safe-mode') == 'true':
-                safe_mode = True
 
-            _, report_format = os.path.splitext(report.internal_reference)
-            
-            if report_format == ".md" or report_format == ".html":
-                mreport = IrisMakeMdReport(tmp_dir, report_id, caseid, safe_mode)
-                fpath, logs = mreport.generate_md_report(doc_type="Investigation")
+@reports_blueprint.route('/case/report/status/<task_id>', methods=['GET'])
+@ac_api_case_requires(CaseAccessLevel.read_only, CaseAccessLevel.full_access)
+def report_generation_status(task_id, caseid):
+    """
+    Return the state of a report generation queued in the case by the current user
+    """
+    task = task_generate_report.AsyncResult(task_id)
+    if task.state != 'PENDING' and not is_task_of(task, caseid, current_user.id):
+        return response_error('Unknown task', status=404)
 
-            elif report_format == ".docx":
-                mreport = IrisMakeDocReport(tmp_dir, report_id, caseid, safe_mode)
-                fpath, logs = mreport.generate_doc_report(doc_type="Investigation")
+    data = {
+        'task_id': task_id,
+        'state': task.state,
+        'logs': task.info if task.state == 'PROGRESS' else []
+    }
 
-            else:
-                return response_error("Report error", "Unknown report format.")
+    if task.state == 'SUCCESS' and isinstance(task.info, IIStatus):
+        data['success'] = task.info.is_success()
+        data['message'] = task.info.get_message()
+        data['logs'] = task.info.get_logs()
 
-            if fpath is None:
-                track_activity("failed to generate the report")
-                return response_error(msg="Failed to generate the report", data=logs)
+        if task.info.is_success():
+            data['download_url'] = _build_download_url(task.info.get_data().get('artifact'), caseid)
 
-            call_modules_hook('on_postload_report_create', data=fpath, caseid=caseid)
+    return response_success(data=data)
 
-            resp = send_file(fpath, as_attachment=True)
-            file_remover.cleanup_once_done(resp, tmp_dir)
 
-            track_activity("generated a report")
+@reports_blueprint.route('/case/report/download/<token>', methods=['GET'])
+@ac_api_case_requires(CaseAccessLevel.read_only, CaseAccessLevel.full_access)
+def download_report_artifact(token, caseid):
 
-            return resp
+    fpath = get_report_artifact_path(caseid, token)
+    if not fpath:
+        return response_error("Unknown report", status=404)
 
-    return response_error("Unknown report", status=404)
+    return send_file(fpath, as_attachment=True)
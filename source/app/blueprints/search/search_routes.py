@@ -17,27 +17,25 @@
 #  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 # IMPORTS ------------------------------------------------
+import click
 from flask import Blueprint
 from flask import redirect
 from flask import render_template
 from flask import request
 from flask import url_for
-from sqlalchemy import and_
+from flask_login import current_user
 
+from app.datamgmt.observables.observables_db import OBSERVABLE_KINDS
+from app.datamgmt.observables.observables_db import get_observable_pivot
+from app.datamgmt.search.search_db import global_search
+from app.datamgmt.search.search_db import reindex_search
 from app.forms import SearchForm
 from app.iris_engine.access_control.utils import ac_flag_match_mask
 from app.iris_engine.utils.tracker import track_activity
-from app.models import Comments
 from app.models.authorization import Permissions
-from app.models.cases import Cases
-from app.models.models import Client
-from app.models.models import Ioc
-from app.models.models import IocLink
-from app.models.models import IocType
-from app.models.models import Notes
-from app.models.models import Tlp
 from app.util import ac_api_requires
 from app.util import ac_requires
+from app.util import response_error
 from app.util import response_success
 
 search_blueprint = Blueprint('search',
@@ -52,83 +50,44 @@ def search_file_post():
     jsdata = request.get_json()
     search_value = jsdata.get('search_value')
     search_type = jsdata.get('search_type')
-    files = []
-    search_condition = and_()
-
-    track_activity("started a global search for {} on {}".format(search_value, search_type))
-
-    if search_type == "ioc":
-        res = Ioc.query.with_entities(
-                            Ioc.ioc_value.label('ioc_name'),
-                            Ioc.ioc_description.label('ioc_description'),
-                            Ioc.ioc_misp,
-                            IocType.type_name,
-                            Tlp.tlp_name,
-                            Tlp.tlp_bscolor,
-                            Cases.name.label('case_name'),
-                            Cases.case_id,
-                            Client.name.label('customer_name')
-                    ).filter(
-                        and_(
-                            Ioc.ioc_value.like(search_value),
-                            IocLink.ioc_id == Ioc.ioc_id,
-                            IocLink.case_id == Cases.case_id,
-                            Client.client_id == Cases.client_id,
-                            Ioc.ioc_tlp_id == Tlp.tlp_id,
-                            search_condition
-                        )
-                    ).join(Ioc.ioc_type).all()
-
-        files = [row._asdict() for row in res]
-
-    if search_type == "notes":
-
-        ns = []
-        if search_value:
-            search_value = "%{}%".format(search_value)
-            ns = Notes.query.filter(
-                Notes.note_content.like(search_value),
-                Cases.client_id == Client.client_id,
-                search_condition
-            ).with_entities(
-                Notes.note_id,
-                Notes.note_title,
-                Cases.name.label('case_name'),
-                Client.name.label('client_name'),
-                Cases.case_id
-            ).join(
-                Notes.case
-            ).order_by(
-                Client.name
-            ).all()
-
-            ns = [row._asdict() for row in ns]
-
-        files = ns
-
-    if search_type == "comments":
-        search_value = "%{}%".format(search_value)
-        comments = Comments.query.filter(
-            Comments.comment_text.like(search_value),
-            Cases.client_id == Client.client_id,
-            search_condition
-        ).with_entities(
-            Comments.comment_id,
-            Comments.comment_text,
-            Cases.name.label('case_name'),
-            Client.name.label('customer_name'),
-            Cases.case_id
-        ).join(
-            Comments.case
-        ).join(
-            Cases.client
-        ).order_by(
-            Client.name
-        ).all()
-
-        files = [row._asdict() for row in comments]
-
-    return response_success("Results fetched", files)
+
+    try:
+        case_id = int(jsdata['case_id']) if jsdata.get('case_id') else None
+        per_page = int(jsdata['per_page']) if jsdata.get('per_page') else None
+    except (TypeError, ValueError):
+        return response_error('Invalid case ID or page size')
+
+    if not jsdata.get('cursor'):
+        track_activity("started a global search for {} on {}".format(search_value, search_type), kind='global')
+
+    try:
+        results = global_search(search_type, search_value, current_user.id, case_id=case_id,
+                                cursor=jsdata.get('cursor'), limit=per_page)
+
+    except ValueError as e:
+        return response_error(str(e))
+
+    return response_success("Results fetched", results)
+
+
+@search_blueprint.route('/search/observables/pivot', methods=['GET'])
+@ac_api_requires(Permissions.search_across_cases)
+def search_observable_pivot():
+    observable_value = request.args.get('value')
+    if not observable_value:
+        return response_error('A value to pivot on is required')
+
+    observable_kind = request.args.get('kind')
+    if observable_kind is not None and observable_kind not in OBSERVABLE_KINDS:
+        return response_error(f'Invalid observable kind, expected one of {", ".join(OBSERVABLE_KINDS)}')
+
+    observables = get_observable_pivot(observable_value, current_user.id,
+                                       observable_kind=observable_kind,
+                                       type_id=request.args.get('type_id', type=int),
+                                       customer_id=request.args.get('customer_id', type=int),
+                                       limit=request.args.get('limit', type=int))
+
+    return response_success('Observables fetched', observables)
 
 
 @search_blueprint.route('/search', methods=['GET'])
@@ -140,3 +99,9 @@ def search_file_get(caseid, url_redir):
     form = SearchForm(request.form)
     return render_template('search.html', form=form)
 
+
+@search_blueprint.cli.command('reindex')
+@click.option('--no-concurrently', is_flag=True, help='Build the indexes faster, locking writes meanwhile')
+def search_reindex(no_concurrently):
+    """Rebuild the observable index and the indexes of the global search."""
+    reindex_search(concurrently=not no_concurrently, log=click.echo)
@@ -37,6 +37,7 @@ from app.models import ReviewStatusList
 from app.iris_engine.module_handler.module_handler import call_modules_hook
 from app.iris_engine.utils.tracker import track_activity
 from app.iris_engine.access_control.utils import ac_set_new_case_access
+from app.iris_engine.access_control.utils import ac_recompute_effective_access
 
 from app.datamgmt.case.case_db import save_case_tags
 from app.datamgmt.case.case_db import register_case_protagonists
@@ -50,9 +51,11 @@ from app.datamgmt.manage.manage_cases_db import delete_case
 from app.datamgmt.manage.manage_cases_db import reopen_case
 from app.datamgmt.manage.manage_cases_db import map_alert_resolution_to_case_status
 from app.datamgmt.manage.manage_cases_db import close_case
+from app.datamgmt.observables.observables_db import update_case_observables_customer
 from app.datamgmt.case.case_db import get_case
 
 from app.business.errors import BusinessProcessingError
+from app.business.reports import delete_case_report_artifacts
 from app.business.permissions import check_current_user_has_some_case_access
 from app.business.permissions import check_current_user_has_some_permission
 
@@ -136,6 +139,7 @@ def delete(case_identifier):
             track_activity(f'tried to delete case {case_identifier}, but it doesn\'t exist',
                            caseid=case_identifier, ctx_less=True)
             raise BusinessProcessingError('Tried to delete a non-existing case')
+        delete_case_report_artifacts(case_identifier)
         call_modules_hook('on_postload_case_delete', data=case_identifier, caseid=case_identifier)
         track_activity(f'case {case_identifier} deleted successfully', ctx_less=True)
     except Exception as e:
@@ -155,6 +159,7 @@ def update(case_identifier, request_data):
 
         previous_case_state = case_i.state_id
         case_previous_reviewer_id = case_i.reviewer_id
+        case_previous_client_id = case_i.client_id
         closed_state_id = get_case_state_by_name('Closed').state_id
 
         # If user tries to update the customer, check if the user has access to the new customer
@@ -173,6 +178,13 @@ def update(case_identifier, request_data):
 
         db.session.commit()
 
+        if case_previous_client_id != case.client_id:
+            # The customer members access is derived from the case customer
+            ac_recompute_effective_access(cases_ids=[case.case_id])
+
+            update_case_observables_customer(case.case_id, case.client_id)
+            db.session.commit()
+
         if previous_case_state != case.state_id:
             if case.state_id == closed_state_id:
                 track_activity('case closed', caseid=case_identifier)
@@ -0,0 +1,365 @@
+#  IRIS Source Code
+#  Copyright (C) 2024 - DFIR-IRIS
+#  contact@dfir-iris.org
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 3 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import marshmallow.exceptions
+
+from app import app
+from app import db
+from app.business.errors import BusinessProcessingError
+from app.datamgmt.datastore.datastore_db import datastore_archive_file
+from app.datamgmt.datastore.datastore_db import datastore_delete_file
+from app.datamgmt.datastore.datastore_db import datastore_get_file
+from app.datamgmt.datastore.datastore_db import datastore_get_path_node
+from app.datamgmt.datastore.datastore_db import datastore_reference_blob
+from app.datamgmt.states import update_datastore_state
+from app.datamgmt.datastore.datastore_db import datastore_get_standard_path
+from app.schema.marshables import DSFileSchema
+from app.util import add_obj_history_entry
+from app.util import save_stream_sha256sum
+
+# Fields of the upload form kept until the upload completes and the datastore file is created. The password of the
+# file is not written on disk, it is sent again to complete the upload
+UPLOAD_FILE_FIELDS = ['file_original_name', 'file_description', 'file_tags', 'file_is_ioc', 'file_is_evidence']
+
+# Running hash of each upload received by this process, along with the offset it has been computed up to. It is
+# rebuilt from the partial file when missing, i.e. when resuming after a restart or on another process
+_uploads_hashes = {}
+_uploads_locks = {}
+_uploads_locks_guard = threading.Lock()
+
+
+def _get_uploads_dir(caseid):
+    # Staged in the datastore so the completed file is moved in place without being copied
+    uploads_dir = Path(app.config['DATASTORE_PATH']) / '.uploads' / f'case-{int(caseid)}'
+    uploads_dir.mkdir(parents=True, exist_ok=True)
+
+    return uploads_dir
+
+
+def _get_upload_paths(caseid, upload_id):
+    try:
+        upload_id = str(uuid.UUID(str(upload_id)))
+    except ValueError:
+        raise BusinessProcessingError('Invalid upload ID')
+
+    uploads_dir = _get_uploads_dir(caseid)
+
+    return uploads_dir / f'{upload_id}.json', uploads_dir / f'{upload_id}.part'
+
+
+def _get_upload_lock(upload_id):
+    with _uploads_locks_guard:
+        return _uploads_locks.setdefault(upload_id, threading.Lock())
+
+
+def _release_upload(upload_id):
+    _uploads_hashes.pop(upload_id, None)
+    with _uploads_locks_guard:
+        _uploads_locks.pop(upload_id, None)
+
+
+def _get_upload_hash(upload_id, part_path, offset):
+    offset_hashed, sha256_hash = _uploads_hashes.get(upload_id, (None, None))
+    if offset_hashed == offset:
+        return sha256_hash
+
+    sha256_hash = hashlib.sha256()
+    with open(part_path, 'rb') as f:
+        for byte_block in iter(lambda: f.read(1024 * 1024), b""):
+            sha256_hash.update(byte_block)
+
+    return sha256_hash
+
+
+def _prune_expired_uploads(caseid):
+    expiry = time.time() - app.config['DATASTORE_UPLOAD_EXPIRY']
+
+    # The partial file is written at each chunk, so it tells when the upload was last active
+    for part_path in _get_uploads_dir(caseid).glob('*.part'):
+        if part_path.stat().st_mtime < expiry:
+            _release_upload(part_path.stem)
+            part_path.with_suffix('.json').unlink(missing_ok=True)
+            part_path.unlink(missing_ok=True)
+
+
+def get_upload(caseid, upload_id, user_id):
+    """
+    Return the state of an upload, with the offset the next chunk is expected at. Only the user who started the
+    upload can access it.
+
+    raises:
+        BusinessProcessingError: If the upload does not exist or was started by another user
+    """
+    meta_path, part_path = _get_upload_paths(caseid, upload_id)
+    if not meta_path.is_file() or not part_path.is_file():
+        raise BusinessProcessingError('Unknown upload')
+
+    with open(meta_path, 'r') as fin:
+        upload = json.load(fin)
+
+    if upload.get('user_id') != user_id:
+        raise BusinessProcessingError('Unknown upload')
+
+    # The partial file is the reference, so the offset is right even if a chunk was interrupted
+    upload['offset'] = part_path.stat().st_size
+
+    return upload
+
+
+def create_upload(caseid, path_id, user_id, form, file_size, upload_id=None):
+    """
+    Start a chunked upload of a file in a datastore folder. The fields of the file are validated now and only used
+    once the upload completes. A client provided upload ID can be used, for instance the uuid of a Dropzone file.
+
+    returns:
+        dict: The state of the upload
+
+    raises:
+        BusinessProcessingError: If the folder is unknown, the file fields are invalid or the upload already exists
+    """
+    dsp = datastore_get_path_node(path_id, caseid)
+    if not dsp:
+        raise BusinessProcessingError('Invalid path node for this case')
+
+    if file_size is None or file_size < 0:
+        raise BusinessProcessingError('Invalid file size')
+
+    fields = {field: form.get(field) for field in UPLOAD_FILE_FIELDS if form.get(field) is not None}
+
+    try:
+        DSFileSchema().load(dict(fields, file_password=form.get('file_password')) if form.get('file_password')
+                            else fields, partial=True)
+    except marshmallow.exceptions.ValidationError as e:
+        raise BusinessProcessingError('Data error', e.messages)
+
+    _prune_expired_uploads(caseid)
+
+    upload_id = upload_id or str(uuid.uuid4())
+    meta_path, part_path = _get_upload_paths(caseid, upload_id)
+    if meta_path.exists():
+        raise BusinessProcessingError('Upload already exists')
+
+    upload = {
+        'upload_id': str(uuid.UUID(str(upload_id))),
+        'path_id': dsp.path_id,
+        'user_id': user_id,
+        'file_size': file_size,
+        'fields': fields,
+        'has_password': bool(form.get('file_password')),
+        'created': datetime.datetime.utcnow().isoformat()
+    }
+
+    part_path.touch()
+    with open(meta_path, 'w') as fout:
+        json.dump(upload, fout)
+
+    upload['offset'] = 0
+    upload['chunk_size'] = app.config['DATASTORE_UPLOAD_CHUNK_SIZE']
+
+    return upload
+
+
+def append_upload_chunk(caseid, upload_id, user_id, offset, stream):
+    """
+    Append a chunk to an upload, hashing it while it is written. A chunk sent again after a lost response, i.e.
+    at an offset already received, is acknowledged without being written.
+
+    returns:
+        int: The offset the next chunk is expected at
+
+    raises:
+        BusinessProcessingError: If the upload is unknown, the chunk is not at the expected offset or the chunk goes
+            beyond the announced file size. The data then holds the expected offset to resume from.
+    """
+    upload = get_upload(caseid, upload_id, user_id)
+    upload_id = upload['upload_id']
+    _, part_path = _get_upload_paths(caseid, upload_id)
+
+    lock = _get_upload_lock(upload_id)
+    if not lock.acquire(blocking=False):
+        raise BusinessProcessingError('A chunk of this upload is already being received',
+                                      {'offset': upload['offset']})
+
+    try:
+        current_offset = part_path.stat().st_size
+        if offset < current_offset:
+            return current_offset
+
+        if offset != current_offset:
+            raise BusinessProcessingError('Unexpected chunk offset', {'offset': current_offset})
+
+        # Hash a copy, the running hash must not move on if the chunk is rejected
+        sha256_hash = _get_upload_hash(upload_id, part_path, current_offset).copy()
+        written, sha256_hash = save_stream_sha256sum(stream, part_path, sha256_hash=sha256_hash, mode='ab')
+
+        new_offset = current_offset + written
+        if new_offset > upload['file_size']:
+            os.truncate(part_path, current_offset)
+            raise BusinessProcessingError('Chunk exceeds the file size', {'offset': current_offset})
+
+        _uploads_hashes[upload_id] = (new_offset, sha256_hash)
+
+    finally:
+        lock.release()
+
+    return new_offset
+
+
+def complete_upload(caseid, upload_id, user_id, file_password=None):
+    """
+    Create the datastore file of a fully received upload. The file is moved to the blob of its content and not
+    copied, or dropped if the blob is already stored. When it has to be encrypted, files from
+    DATASTORE_ARCHIVE_ASYNC_MIN_SIZE are archived by the worker and can only be downloaded once archived.
+    The password of the file, if it was set when starting the upload, has to be sent again.
+
+    returns:
+        DataStoreFile: The created file
+
+    raises:
+        BusinessProcessingError: If the upload is unknown or incomplete, the password is missing or the file can't
+            be archived
+    """
+    upload = get_upload(caseid, upload_id, user_id)
+    upload_id = upload['upload_id']
+    meta_path, part_path = _get_upload_paths(caseid, upload_id)
+
+    if upload['offset'] != upload['file_size']:
+        raise BusinessProcessingError('Upload is incomplete', {'offset': upload['offset']})
+
+    if upload.get('has_password') and not file_password:
+        raise BusinessProcessingError('The password of the file is required to complete the upload')
+
+    fields = dict(upload['fields'], file_password=file_password) if file_password else upload['fields']
+
+    dsp = datastore_get_path_node(upload['path_id'], caseid)
+    if not dsp:
+        raise BusinessProcessingError('Invalid path node for this case')
+
+    lock = _get_upload_lock(upload_id)
+    if not lock.acquire(blocking=False):
+        raise BusinessProcessingError('A chunk of this upload is already being received',
+                                      {'offset': upload['offset']})
+
+    try:
+        file_hash = _get_upload_hash(upload_id, part_path, upload['offset']).hexdigest().upper()
+
+        try:
+            dsf_sc = DSFileSchema().load(fields, partial=True)
+        except marshmallow.exceptions.ValidationError as e:
+            raise BusinessProcessingError('Data error', e.messages)
+
+        dsf_sc.file_parent_id = dsp.path_id
+        dsf_sc.added_by_user_id = user_id
+        dsf_sc.file_date_added = datetime.datetime.now()
+        dsf_sc.file_local_name = 'tmp_xc'
+        dsf_sc.file_case_id = caseid
+        dsf_sc.file_size = upload['file_size']
+        dsf_sc.file_sha256 = file_hash
+        add_obj_history_entry(dsf_sc, 'created')
+
+        if dsf_sc.file_is_ioc and not dsf_sc.file_password:
+            dsf_sc.file_password = 'infected'
+
+        db.session.add(dsf_sc)
+        db.session.commit()
+
+        ds_location = datastore_get_standard_path(dsf_sc, caseid)
+        os.replace(part_path, ds_location)
+        meta_path.unlink(missing_ok=True)
+
+    finally:
+        lock.release()
+        _release_upload(upload_id)
+
+    blob_path, is_stored = datastore_reference_blob(dsf_sc.file_sha256, dsf_sc.file_size, dsf_sc.file_password)
+
+    # Only point to the blob, so a clear file waiting to be archived is never served
+    dsf_sc.file_local_name = blob_path.as_posix()
+    update_datastore_state(caseid, userid=user_id)
+    db.session.commit()
+
+    if is_stored:
+        ds_location.unlink(missing_ok=True)
+
+    elif not dsf_sc.file_password:
+        os.replace(ds_location, blob_path)
+
+    elif dsf_sc.file_size >= app.config['DATASTORE_ARCHIVE_ASYNC_MIN_SIZE']:
+        _archive_upload_async(dsf_sc, caseid, ds_location)
+
+    else:
+        archive_uploaded_file(dsf_sc.file_id, caseid, ds_location.as_posix())
+
+    return dsf_sc
+
+
+def _archive_upload_async(dsf, caseid, file_path):
+    from app.iris_engine.tasker.tasks import task_archive_datastore_file
+
+    try:
+        task_archive_datastore_file.delay(dsf.file_id, caseid, file_path.as_posix())
+    except Exception as e:
+        app.logger.warning(f'Unable to archive file {dsf.file_id} in the worker, archiving it now: {e}')
+        archive_uploaded_file(dsf.file_id, caseid, file_path.as_posix())
+
+
+def archive_uploaded_file(file_id, caseid, file_path):
+    """
+    Encrypt an uploaded datastore file in its archive, with the password of the file. If the archiving fails, the
+    file is removed from the datastore, so that it is never listed without its content.
+
+    raises:
+        BusinessProcessingError: If the file is unknown or the archiving fails
+    """
+    dsf = datastore_get_file(file_id, caseid)
+    if not dsf:
+        # Deleted before being archived
+        Path(file_path).unlink(missing_ok=True)
+        raise BusinessProcessingError('Invalid file ID for this case')
+
+    try:
+        datastore_archive_file(file_path, dsf.file_sha256, dsf.file_local_name, dsf.file_password)
+    except Exception as e:
+        app.logger.exception(e)
+        Path(file_path).unlink(missing_ok=True)
+        datastore_delete_file(file_id, caseid)
+        raise BusinessProcessingError('Unable to archive the file', str(e))
+
+
+def cancel_upload(caseid, upload_id, user_id):
+    """
+    Abort an upload and remove what has been received
+
+    raises:
+        BusinessProcessingError: If the upload is unknown
+    """
+    upload = get_upload(caseid, upload_id, user_id)
+    meta_path, part_path = _get_upload_paths(caseid, upload['upload_id'])
+
+    part_path.unlink(missing_ok=True)
+    meta_path.unlink(missing_ok=True)
+    _release_upload(upload['upload_id'])
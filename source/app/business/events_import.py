@@ -0,0 +1,536 @@
+#  IRIS Source Code
+#  Copyright (C) 2024 - DFIR-IRIS
+#  contact@dfir-iris.org
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 3 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import copy
+import csv
+import json
+import os
+import uuid
+from datetime import datetime
+
+from marshmallow.exceptions import ValidationError
+from sqlalchemy import insert
+
+from app import app
+from app import db
+from app.business.errors import BusinessProcessingError
+from app.datamgmt.case.case_events_db import get_default_category
+from app.datamgmt.manage.manage_attribute_db import get_default_custom_attributes
+from app.datamgmt.manage.manage_tags_db import add_db_tag
+from app.datamgmt.states import update_timeline_state
+from app.iris_engine.module_handler.module_handler import call_modules_hook
+from app.iris_engine.utils.tracker import track_activity
+from app.models import CaseAssets
+from app.models import CaseEventCategory
+from app.models import CaseEventsAssets
+from app.models import CaseEventsIoc
+from app.models import CasesEvent
+from app.models import EventCategory
+from app.models import Ioc
+from app.models import IocAssetLink
+from app.models import IocLink
+from app.models.authorization import User
+from app.schema.marshables import EVENT_COLORS
+from app.schema.marshables import EventSchema
+
+EVENTS_CSV_FIELDS = [
+    "event_date",
+    "event_tz",
+    "event_title",
+    "event_category",
+    "event_content",
+    "event_raw",
+    "event_source",
+    "event_assets",
+    "event_iocs",
+    "event_tags"
+]
+
+EVENTS_IMPORT_FORMATS = ['csv', 'jsonl']
+
+# Flags of the events which can be set by the records, and the values accepted for them in CSV columns
+_EVENT_FLAGS = ['event_in_summary', 'event_in_graph', 'event_is_flagged']
+_FLAG_VALUES = {'true': True, '1': True, 'false': False, '0': False}
+
+# Number of values looked up at once when resolving the assets, IOCs and categories names
+_LOOKUP_CHUNK_SIZE = 5000
+
+
+def build_events_import_path(file_format='csv'):
+    """
+    Return a new path where an uploaded events file can be stored until it is imported. The path is under the
+    uploads directory, which is shared with the workers
+    """
+    import_dir = os.path.join(app.config['UPLOADED_PATH'], 'timeline_imports')
+    os.makedirs(import_dir, exist_ok=True)
+
+    return os.path.join(import_dir, f'{uuid.uuid4()}.{file_format}')
+
+
+def _open_events_csv(file_path):
+    return open(file_path, newline='', encoding='utf-8-sig')
+
+
+def check_events_csv_header(file_path):
+    """
+    Check the CSV has all the expected events fields
+
+    raises:
+        BusinessProcessingError: If fields are missing
+    """
+    with _open_events_csv(file_path) as csv_file:
+        csv_fields = csv.DictReader(csv_file, delimiter=',').fieldnames or []
+
+    missing_fields = [field for field in EVENTS_CSV_FIELDS if field not in csv_fields]
+    if missing_fields:
+        data = {"error_code": "BAD_FIELDS_MAPPING", "expected": ','.join(EVENTS_CSV_FIELDS),
+                "found": ','.join(csv_fields), "missing": ','.join(missing_fields)}
+        app.logger.warning(data)
+
+        raise BusinessProcessingError(f"Bad SCV Fields Mapping. Fields missing: [{','.join(missing_fields)}]", data)
+
+
+def check_events_file(file_path, file_format):
+    """
+    Check an events file can be imported. Only the CSV header is checked, JSONL records are checked while imported
+
+    raises:
+        BusinessProcessingError: If the format is unknown or CSV fields are missing
+    """
+    if file_format not in EVENTS_IMPORT_FORMATS:
+        raise BusinessProcessingError(f"Unsupported events format {file_format}",
+                                      {"expected": ','.join(EVENTS_IMPORT_FORMATS)})
+
+    if file_format == 'csv':
+        check_events_csv_header(file_path)
+
+
+def _split_values(value, separator):
+    if isinstance(value, list):
+        return [str(item) for item in value if item not in (None, '')]
+
+    return [item for item in (value or '').split(separator) if item != '']
+
+
+def _read_events_csv(file_path):
+    """
+    Yield the line number and the event record of each CSV row. Tags are separated with | in the CSV
+    """
+    with _open_events_csv(file_path) as csv_file:
+        for line, row in enumerate(csv.DictReader(csv_file, delimiter=','), start=1):
+            event_tags = row.get('event_tags')
+            row['event_tags'] = ','.join(event_tags.split('|')) if event_tags else event_tags
+            row['event_assets'] = _split_values(row.get('event_assets'), ';')
+            row['event_iocs'] = _split_values(row.get('event_iocs'), '|')
+
+            yield line, row
+
+
+def _read_events_jsonl(file_path):
+    """
+    Yield the line number and the event record of each JSON line, as written by the timeline export. Assets and
+    IOCs are lists of names and values, tags either a list or a comma separated string
+    """
+    with open(file_path, encoding='utf-8-sig') as jsonl_file:
+        for line, raw_line in enumerate(jsonl_file, start=1):
+            if not raw_line.strip():
+                continue
+
+            try:
+                record = json.loads(raw_line)
+            except ValueError:
+                raise BusinessProcessingError("Data error", {"Error": f"Invalid JSON.\nrow number: {line}"})
+
+            if not isinstance(record, dict):
+                raise BusinessProcessingError("Data error", {"Error": f"Expected a JSON object.\nrow number: {line}"})
+
+            event_tags = record.get('event_tags')
+            if isinstance(event_tags, list) and all(isinstance(tag, str) for tag in event_tags):
+                record['event_tags'] = ','.join(event_tags)
+            record['event_assets'] = _split_values(record.get('event_assets'), ';')
+            record['event_iocs'] = _split_values(record.get('event_iocs'), '|')
+
+            yield line, record
+
+
+_EVENTS_READERS = {
+    'csv': _read_events_csv,
+    'jsonl': _read_events_jsonl
+}
+
+
+def _lookup_chunks(values):
+    values = list(values)
+    for index in range(0, len(values), _LOOKUP_CHUNK_SIZE):
+        yield values[index:index + _LOOKUP_CHUNK_SIZE]
+
+
+def _resolve_assets(caseid, assets_names):
+    assets = {}
+    for names in _lookup_chunks(assets_names):
+        rows = CaseAssets.query.with_entities(
+            CaseAssets.asset_name,
+            CaseAssets.asset_id
+        ).filter(
+            CaseAssets.case_id == caseid,
+            CaseAssets.asset_name.in_(names)
+        ).order_by(
+            CaseAssets.asset_id
+        ).all()
+
+        for row in rows:
+            assets.setdefault(row.asset_name, row.asset_id)
+
+    return assets
+
+
+def _resolve_iocs(caseid, iocs_values):
+    iocs = {}
+    for values in _lookup_chunks(iocs_values):
+        rows = IocLink.query.with_entities(
+            Ioc.ioc_value,
+            Ioc.ioc_id
+        ).filter(
+            IocLink.case_id == caseid,
+            Ioc.ioc_value.in_(values)
+        ).join(
+            IocLink.ioc
+        ).order_by(
+            Ioc.ioc_id
+        ).all()
+
+        for row in rows:
+            iocs.setdefault(row.ioc_value, row.ioc_id)
+
+    return iocs
+
+
+def _resolve_categories(categories_names):
+    categories = {}
+    for names in _lookup_chunks(categories_names):
+        rows = EventCategory.query.with_entities(
+            EventCategory.name,
+            EventCategory.id
+        ).filter(
+            EventCategory.name.in_(names)
+        ).all()
+
+        for row in rows:
+            categories.setdefault(row.name, row.id)
+
+    return categories
+
+
+def _split_tags(event_tags):
+    return [tag.strip() for tag in (event_tags or '').split(',') if tag.strip()]
+
+
+def _check_event_record(record, line):
+    """
+    Apply the rules of EventSchema which do not depend on the database to a record
+    """
+    event_title = record.get('event_title')
+    if not event_title:
+        raise BusinessProcessingError("Data error",
+                                      {"Error": f"Event Title can not be empty.\nrow number: {line}"})
+
+    if not isinstance(event_title, str) or len(event_title) < 2:
+        raise BusinessProcessingError("Data error",
+                                      {"Error": f"Event Title must be at least 2 characters.\nrow number: {line}"})
+
+    event_tags = record.get('event_tags')
+    if event_tags is not None and not isinstance(event_tags, str):
+        raise BusinessProcessingError("Data error",
+                                      {"Error": f"All event tags must be strings.\nrow number: {line}"})
+
+
+def _scan_events(records):
+    """
+    First pass on the events: check the records and collect the distinct assets, IOCs, categories names and tags, so
+    they are each resolved once
+    """
+    assets_names = {}
+    iocs_values = {}
+    categories_names = {}
+    tags = set()
+    rows_count = 0
+
+    for line, record in records:
+        _check_event_record(record, line)
+
+        tags.update(_split_tags(record.get('event_tags')))
+
+        for asset_name in record['event_assets']:
+            assets_names.setdefault(asset_name, line)
+
+        for ioc_value in record['event_iocs']:
+            iocs_values.setdefault(ioc_value, line)
+
+        if record.get('event_category'):
+            categories_names.setdefault(record.get('event_category'), line)
+
+        rows_count += 1
+
+    return assets_names, iocs_values, categories_names, tags, rows_count
+
+
+def _check_resolved(names, resolved, kind):
+    for name, line in names.items():
+        if name not in resolved:
+            raise BusinessProcessingError("Data error", {"Error": f"{kind} not recognized : {name}.\nrow number: {line}"})
+
+
+def _get_event_flag(record, line, flag, default):
+    value = record.get(flag)
+    if value is None or value == '':
+        return default
+
+    if isinstance(value, bool):
+        return value
+
+    if str(value).strip().lower() not in _FLAG_VALUES:
+        raise BusinessProcessingError("Data error", {"Error": f"Invalid {flag}, expected true or false.\n"
+                                                              f"row number: {line}"})
+
+    return _FLAG_VALUES[str(value).strip().lower()]
+
+
+def _merge_event_attributes(record, line, default_attributes):
+    """
+    Set the values of the custom attributes of a record on a copy of the default ones, as done for new events.
+    Values are either raw or, as exported, the attribute with its value. Unknown tabs and fields are ignored.
+    """
+    attributes = record.get('custom_attributes')
+    merged = copy.deepcopy(default_attributes)
+    if attributes is None or attributes == '':
+        return merged
+
+    if not isinstance(attributes, dict):
+        raise BusinessProcessingError("Data error", {"Error": f"Custom attributes must be an object.\n"
+                                                              f"row number: {line}"})
+
+    for tab, tab_fields in attributes.items():
+        if not isinstance(tab_fields, dict) or not isinstance(merged.get(tab), dict):
+            continue
+
+        for field, value in tab_fields.items():
+            if field not in merged[tab]:
+                continue
+
+            merged[tab][field]['value'] = value.get('value') if isinstance(value, dict) else value
+
+    return merged
+
+
+def _build_event_row(record, line, caseid, user, options, event_schema, default_attributes):
+    try:
+        event_date, event_date_wtz = event_schema.validate_date(record.get('event_date'), record.get('event_tz'))
+
+    except ValidationError:
+        raise BusinessProcessingError("Data error", {"Error": f"Invalid date time.\nrow number: {line}"})
+
+    # Same whitelist as the events API, the color ends up in a style attribute of the timeline
+    event_color = record.get('event_color')
+    if event_color not in EVENT_COLORS:
+        event_color = ''
+
+    return {
+        'case_id': caseid,
+        'event_title': record.get('event_title'),
+        'event_content': record.get('event_content'),
+        'event_raw': record.get('event_raw'),
+        'event_source': options.get('event_source') or record.get('event_source'),
+        'event_tags': ','.join(_split_tags(record.get('event_tags'))),
+        'event_tz': record.get('event_tz'),
+        'event_date': event_date,
+        'event_date_wtz': event_date_wtz,
+        'event_color': event_color,
+        'custom_attributes': _merge_event_attributes(record, line, default_attributes),
+        'event_in_summary': _get_event_flag(record, line, 'event_in_summary',
+                                            bool(options.get('event_in_summary'))),
+        'event_in_graph': _get_event_flag(record, line, 'event_in_graph',
+                                          options.get('event_in_graph') if options.get('event_in_graph') is not None
+                                          else True),
+        'event_is_flagged': _get_event_flag(record, line, 'event_is_flagged', False),
+        'event_added': datetime.utcnow(),
+        'user_id': user.id,
+        'modification_history': {
+            str(datetime.now().timestamp()): {
+                'user': user.user,
+                'user_id': user.id,
+                'action': 'created'
+            }
+        }
+    }
+
+
+def _insert_events_batch(batch, caseid, assets, iocs, categories, default_category_id, assets_iocs_pairs,
+                         sync_iocs_assets):
+    """
+    Insert a batch of events and their links with one statement per table
+    """
+    events_ids = db.session.scalars(
+        insert(CasesEvent).returning(CasesEvent.event_id, sort_by_parameter_order=True),
+        [event for event, _ in batch]
+    ).all()
+
+    categories_rows = []
+    assets_rows = []
+    iocs_rows = []
+    for event_id, (_, record) in zip(events_ids, batch):
+        category_name = record.get('event_category')
+        categories_rows.append({
+            'event_id': event_id,
+            'category_id': categories[category_name] if category_name else default_category_id
+        })
+
+        events_assets = {assets[name] for name in record['event_assets']}
+        events_iocs = {iocs[value] for value in record['event_iocs']}
+
+        assets_rows.extend({'event_id': event_id, 'asset_id': asset_id, 'case_id': caseid}
+                           for asset_id in events_assets)
+        iocs_rows.extend({'event_id': event_id, 'ioc_id': ioc_id, 'case_id': caseid} for ioc_id in events_iocs)
+
+        if sync_iocs_assets:
+            assets_iocs_pairs.update((asset_id, ioc_id) for asset_id in events_assets for ioc_id in events_iocs)
+
+    db.session.execute(insert(CaseEventCategory), categories_rows)
+
+    if assets_rows:
+        db.session.execute(insert(CaseEventsAssets), assets_rows)
+
+    if iocs_rows:
+        db.session.execute(insert(CaseEventsIoc), iocs_rows)
+
+    return events_ids
+
+
+def _link_iocs_assets(assets_iocs_pairs):
+    """
+    Create the IOCs to assets links which do not exist yet
+    """
+    if not assets_iocs_pairs:
+        return
+
+    existing_pairs = set()
+    for assets_ids in _lookup_chunks({asset_id for asset_id, _ in assets_iocs_pairs}):
+        existing_pairs.update(
+            (link.asset_id, link.ioc_id) for link in IocAssetLink.query.with_entities(
+                IocAssetLink.asset_id,
+                IocAssetLink.ioc_id
+            ).filter(
+                IocAssetLink.asset_id.in_(assets_ids)
+            ).all()
+        )
+
+    missing_pairs = assets_iocs_pairs - existing_pairs
+    if missing_pairs:
+        db.session.execute(insert(IocAssetLink), [
+            {'asset_id': asset_id, 'ioc_id': ioc_id} for asset_id, ioc_id in missing_pairs
+        ])
+
+
+def import_events_file(file_path, caseid, user_id, file_format='csv', options=None, progress_callback=None):
+    """
+    Import the events of a CSV or JSONL file in a case. Assets, IOCs and categories names are resolved once per
+    distinct value, events and links are inserted by batches, and the timeline state is updated once. The import is
+    done in a single transaction, so an invalid record leaves the timeline untouched.
+
+    The on_preload_event_create hook is not called, and on_postload_event_create is called with lists of events.
+
+    args:
+        file_path: Path of the events file
+        caseid: Case to import the events in
+        user_id: User importing the events
+        file_format: Format of the file, one of EVENTS_IMPORT_FORMATS
+        options: Optional import options, event_source, event_in_summary, event_in_graph and
+                 event_sync_iocs_assets
+        progress_callback: Optional callable receiving the number of processed records and the total
+
+    returns:
+        int: The number of imported events
+
+    raises:
+        BusinessProcessingError: If the file is invalid
+    """
+    options = options or {}
+    batch_size = app.config.get('TIMELINE_IMPORT_BATCH_SIZE')
+    user = User.query.filter(User.id == user_id).first()
+
+    check_events_file(file_path, file_format)
+    read_events = _EVENTS_READERS[file_format]
+
+    assets_names, iocs_values, categories_names, tags, rows_count = _scan_events(read_events(file_path))
+
+    assets = _resolve_assets(caseid, assets_names)
+    _check_resolved(assets_names, assets, 'Asset')
+
+    iocs = _resolve_iocs(caseid, iocs_values)
+    _check_resolved(iocs_values, iocs, 'IoC')
+
+    categories = _resolve_categories(categories_names)
+    _check_resolved(categories_names, categories, 'event_category')
+
+    default_category_id = get_default_category().id
+    event_schema = EventSchema()
+    default_attributes = get_default_custom_attributes('event')
+    sync_iocs_assets = bool(options.get('event_sync_iocs_assets'))
+    assets_iocs_pairs = set()
+    events_ids = []
+
+    try:
+        batch = []
+        for line, record in read_events(file_path):
+            batch.append((_build_event_row(record, line, caseid, user, options, event_schema, default_attributes),
+                          record))
+
+            if len(batch) >= batch_size:
+                events_ids.extend(_insert_events_batch(batch, caseid, assets, iocs, categories,
+                                                       default_category_id, assets_iocs_pairs, sync_iocs_assets))
+                batch = []
+
+                if progress_callback:
+                    progress_callback(len(events_ids), rows_count)
+
+        if batch:
+            events_ids.extend(_insert_events_batch(batch, caseid, assets, iocs, categories, default_category_id,
+                                                   assets_iocs_pairs, sync_iocs_assets))
+
+        _link_iocs_assets(assets_iocs_pairs)
+
+        update_timeline_state(caseid=caseid, userid=user_id)
+        db.session.commit()
+
+    except Exception:
+        db.session.rollback()
+        raise
+
+    # Registered as the events API does, once the events are committed as the tags are committed one by one
+    for tag in tags:
+        add_db_tag(tag)
+
+    if progress_callback:
+        progress_callback(rows_count, rows_count)
+
+    for index in range(0, len(events_ids), batch_size):
+        events = CasesEvent.query.filter(CasesEvent.event_id.in_(events_ids[index:index + batch_size])).all()
+        call_modules_hook('on_postload_event_create', data=events, caseid=caseid, init_user=user.name)
+
+    track_activity(f"imported {len(events_ids)} events from {file_format.upper()}", caseid=caseid, user_id=user_id)
+
+    return len(events_ids)
@@ -27,6 +27,7 @@ from app.datamgmt.case.case_iocs_db import add_ioc_link
 from app.datamgmt.case.case_iocs_db import check_ioc_type_id
 from app.datamgmt.case.case_iocs_db import get_iocs_by_case
 from app.datamgmt.case.case_iocs_db import delete_ioc
+from app.datamgmt.observables.observables_db import reindex_observable
 from app.datamgmt.states import update_ioc_state
 from app.schema.marshables import IocSchema
 from app.iris_engine.module_handler.module_handler import call_modules_hook
@@ -101,6 +102,7 @@ def update(identifier, request_json, case_identifier):
         if not check_ioc_type_id(type_id=ioc_sc.ioc_type_id):
             raise BusinessProcessingError('Not a valid IOC type')
 
+        reindex_observable('ioc', ioc_sc.ioc_id, ioc_sc.ioc_type_id, ioc_sc.ioc_value)
         update_ioc_state(case_identifier)
         db.session.commit()
 
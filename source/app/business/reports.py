@@ -0,0 +1,263 @@
+#  IRIS Source Code
+#  Copyright (C) 2024 - DFIR-IRIS
+#  contact@dfir-iris.org
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 3 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from datetime import datetime
+
+from sqlalchemy import func
+
+from app import app
+from app.business.errors import BusinessProcessingError
+from app.iris_engine.module_handler.module_handler import call_modules_hook
+from app.iris_engine.reporter.reporter import IrisMakeDocReport
+from app.iris_engine.reporter.reporter import IrisMakeMdReport
+from app.iris_engine.utils.tracker import track_activity
+from app.models import CaseTemplateReport
+from app.models import Cases
+from app.models import Comments
+from app.models import ObjectState
+from app.models import UserActivity
+from app.models.authorization import User
+
+REPORT_DOC_TYPES = ['Investigation', 'Activities']
+
+# Activities tracked by the generation itself, which must not make the next generation a new version
+_REPORT_GENERATED_ACTIVITY = "generated a report"
+_REPORT_FAILED_ACTIVITY = "failed to generate a report"
+
+_ARTIFACT_TOKEN_RE = re.compile(r'^\d+_(investigation|activities)_[01]_\d+-[0-9a-f]{16}$')
+
+
+def _get_reports_dir(caseid):
+    return os.path.join(app.config['UPLOADED_PATH'], 'reports', str(int(caseid)))
+
+
+def _get_report_template(report_id):
+    report = CaseTemplateReport.query.filter(CaseTemplateReport.id == report_id).first()
+    if not report:
+        raise BusinessProcessingError('Unknown report')
+
+    return report
+
+
+def get_case_report_version(caseid, report, doc_type):
+    """
+    Return a version of what a report of the case depends on: the case itself, the states of its objects, its
+    comments, the template and the day of generation. Activities reports also depend on the last case activity.
+    The version changes as soon as any of them changes, so an artifact of the same version can be served again.
+    """
+    case = Cases.query.with_entities(
+        Cases.name,
+        Cases.description,
+        Cases.soc_id,
+        Cases.client_id,
+        Cases.state_id,
+        Cases.status_id,
+        Cases.severity_id,
+        Cases.classification_id,
+        Cases.owner_id,
+        Cases.reviewer_id,
+        Cases.review_status_id,
+        Cases.close_date,
+        Cases.custom_attributes,
+        Cases.modification_history
+    ).filter(
+        Cases.case_id == caseid
+    ).first()
+
+    states = ObjectState.query.with_entities(
+        ObjectState.object_name,
+        ObjectState.object_state
+    ).filter(
+        ObjectState.object_case_id == caseid
+    ).order_by(
+        ObjectState.object_name
+    ).all()
+
+    comments = Comments.query.with_entities(
+        func.count(Comments.comment_id),
+        func.max(Comments.comment_date),
+        func.max(Comments.comment_update_date)
+    ).filter(
+        Comments.comment_case_id == caseid
+    ).first()
+
+    template_path = os.path.join(app.config['TEMPLATES_PATH'], report.internal_reference)
+
+    version = {
+        'case': case._asdict() if case else None,
+        'states': [tuple(state) for state in states],
+        'comments': tuple(comments) if comments else None,
+        'template': [report.id, report.internal_reference, report.naming_format,
+                     os.path.getmtime(template_path) if os.path.exists(template_path) else None],
+        'date': datetime.utcnow().strftime('%Y-%m-%d')
+    }
+
+    if doc_type == 'Activities':
+        version['last_activity'] = UserActivity.query.with_entities(
+            func.max(UserActivity.id)
+        ).filter(
+            UserActivity.case_id == caseid,
+            UserActivity.activity_desc.notin_([_REPORT_GENERATED_ACTIVITY.capitalize(),
+                                               _REPORT_FAILED_ACTIVITY.capitalize()])
+        ).scalar()
+
+    return hashlib.sha256(json.dumps(version, default=str, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _build_artifact_key(report_id, doc_type, safe_mode, user_id):
+    # The user is part of the key as the reports hold the name of the user generating them
+    return f'{int(report_id)}_{doc_type.lower()}_{int(bool(safe_mode))}_{int(user_id)}'
+
+
+def get_report_artifact(caseid, report_id, doc_type, safe_mode, user_id):
+    """
+    Return the token of the artifact already generated for the current version of the case, None if there is none
+    """
+    report = _get_report_template(report_id)
+    token = f'{_build_artifact_key(report_id, doc_type, safe_mode, user_id)}-' \
+            f'{get_case_report_version(caseid, report, doc_type)}'
+
+    if os.path.isdir(os.path.join(_get_reports_dir(caseid), token)):
+        return token
+
+    return None
+
+
+def get_report_artifact_path(caseid, token):
+    """
+    Return the path of the report file of an artifact, None if the artifact does not exist
+    """
+    if not token or not _ARTIFACT_TOKEN_RE.match(token):
+        return None
+
+    artifact_dir = os.path.join(_get_reports_dir(caseid), token)
+    if not os.path.isdir(artifact_dir):
+        return None
+
+    files = os.listdir(artifact_dir)
+    if not files:
+        return None
+
+    return os.path.join(artifact_dir, files[0])
+
+
+def _prune_report_artifacts(reports_dir, key, token):
+    for artifact in os.listdir(reports_dir):
+        if artifact.startswith(f'{key}-') and artifact != token:
+            shutil.rmtree(os.path.join(reports_dir, artifact), ignore_errors=True)
+
+
+def generate_report(caseid, report_id, doc_type, safe_mode, user_id):
+    """
+    Generate a report of a case and store it as an artifact of the current version of the case. If the artifact
+    already exists it is returned as is, and the on_postload hooks are not called again. Previous versions of the
+    artifact are removed.
+
+    args:
+        caseid: Case to generate the report of
+        report_id: Report template to use
+        doc_type: Investigation or Activities
+        safe_mode: Whether the images of the datastore are left out
+        user_id: User generating the report
+
+    returns:
+        str: The token of the artifact, to download it with get_report_artifact_path
+
+    raises:
+        BusinessProcessingError: If the template is unknown or the generation fails
+    """
+    if doc_type not in REPORT_DOC_TYPES:
+        raise BusinessProcessingError('Unknown report type')
+
+    report = _get_report_template(report_id)
+    user = User.query.filter(User.id == user_id).first()
+
+    key = _build_artifact_key(report_id, doc_type, safe_mode, user_id)
+    token = f'{key}-{get_case_report_version(caseid, report, doc_type)}'
+
+    reports_dir = _get_reports_dir(caseid)
+    artifact_dir = os.path.join(reports_dir, token)
+    if os.path.isdir(artifact_dir):
+        app.logger.info(f'Report {token} of case {caseid} already generated')
+        return token
+
+    os.makedirs(reports_dir, exist_ok=True)
+
+    # Generated aside, then moved in place so a partial report is never served
+    tmp_dir = tempfile.mkdtemp(dir=reports_dir, prefix='.')
+
+    _, report_format = os.path.splitext(report.internal_reference)
+
+    app.logger.info(f'Generating the {doc_type.lower()} report of case {caseid} with template {report.name}')
+
+    if report_format == ".docx":
+        mreport = IrisMakeDocReport(tmp_dir, report_id, caseid, safe_mode, user_name=user.name)
+        result = mreport.generate_doc_report(doc_type=doc_type)
+
+    elif report_format == ".md" or report_format == ".html":
+        mreport = IrisMakeMdReport(tmp_dir, report_id, caseid, safe_mode, user_name=user.name)
+        result = mreport.generate_md_report(doc_type=doc_type)
+
+    else:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise BusinessProcessingError('Report error', 'Unknown report format.')
+
+    fpath, logs = result if result else (None, 'Unable to build the report data')
+    if fpath is None:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        track_activity(_REPORT_FAILED_ACTIVITY, caseid=caseid, user_id=user_id)
+        raise BusinessProcessingError('Failed to generate the report', logs)
+
+    # Only keep the report file in the artifact
+    for file_name in os.listdir(tmp_dir):
+        file_path = os.path.join(tmp_dir, file_name)
+        if file_path != fpath:
+            if os.path.isdir(file_path):
+                shutil.rmtree(file_path, ignore_errors=True)
+            else:
+                os.remove(file_path)
+
+    try:
+        os.rename(tmp_dir, artifact_dir)
+    except OSError:
+        # Generated concurrently by another request, which serves as the generation of the report and calls the hooks
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return token
+
+    _prune_report_artifacts(reports_dir, key, token)
+
+    if doc_type == 'Investigation':
+        call_modules_hook('on_postload_report_create', data=get_report_artifact_path(caseid, token), caseid=caseid,
+                          init_user=user.name)
+    else:
+        call_modules_hook('on_postload_activities_report_create', data=report_id, caseid=caseid,
+                          init_user=user.name)
+
+    track_activity(_REPORT_GENERATED_ACTIVITY, caseid=caseid, user_id=user_id)
+
+    return token
+
+
+def delete_case_report_artifacts(caseid):
+    shutil.rmtree(_get_reports_dir(caseid), ignore_errors=True)
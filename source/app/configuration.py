@@ -354,6 +354,26 @@ class Config:
 
     DROPZONE_TIMEOUT = 15 * 60 * 10000  # 15 Minutes of uploads per file
 
+    ALERTS_BATCH_MAX_SIZE = int(config.load('IRIS', 'ALERTS_BATCH_MAX_SIZE', fallback=1000))
+    ALERTS_ASYNC_POST_PROCESSING = config.load('IRIS', 'ALERTS_ASYNC_POST_PROCESSING', fallback='False') == 'True'
+    ALERTS_POST_PROCESSING_CHUNK_SIZE = int(config.load('IRIS', 'ALERTS_POST_PROCESSING_CHUNK_SIZE', fallback=200))
+    ACCESS_CONTROL_CACHE_TTL = int(config.load('IRIS', 'ACCESS_CONTROL_CACHE_TTL', fallback=60))
+    MODULES_HOOKS_CACHE_TTL = int(config.load('IRIS', 'MODULES_HOOKS_CACHE_TTL', fallback=60))
+    ALERTS_CORRELATION_RETENTION_DAYS = int(config.load('IRIS', 'ALERTS_CORRELATION_RETENTION_DAYS', fallback=0))
+    TIMELINE_IMPORT_BATCH_SIZE = int(config.load('IRIS', 'TIMELINE_IMPORT_BATCH_SIZE', fallback=1000))
+    TIMELINE_IMPORT_ASYNC_MIN_SIZE = int(config.load('IRIS', 'TIMELINE_IMPORT_ASYNC_MIN_SIZE', fallback=1048576))
+    DATASTORE_UPLOAD_CHUNK_SIZE = int(config.load('IRIS', 'DATASTORE_UPLOAD_CHUNK_SIZE', fallback=8388608))
+    DATASTORE_UPLOAD_EXPIRY = int(config.load('IRIS', 'DATASTORE_UPLOAD_EXPIRY', fallback=86400))
+    DATASTORE_ARCHIVE_ASYNC_MIN_SIZE = int(config.load('IRIS', 'DATASTORE_ARCHIVE_ASYNC_MIN_SIZE', fallback=104857600))
+    DATASTORE_TREE_CACHE_TTL = int(config.load('IRIS', 'DATASTORE_TREE_CACHE_TTL', fallback=300))
+    SEARCH_PAGE_SIZE = int(config.load('IRIS', 'SEARCH_PAGE_SIZE', fallback=50))
+    SEARCH_MAX_PAGE_SIZE = int(config.load('IRIS', 'SEARCH_MAX_PAGE_SIZE', fallback=500))
+    ACTIVITY_TRACKING_MODE = config.load('IRIS', 'ACTIVITY_TRACKING_MODE', fallback='buffered')
+    ACTIVITY_QUEUE_SIZE = int(config.load('IRIS', 'ACTIVITY_QUEUE_SIZE', fallback=1000))
+    ACTIVITY_RETENTION_DAYS = int(config.load('IRIS', 'ACTIVITY_RETENTION_DAYS', fallback=0))
+    ACTIVITIES_PAGE_SIZE = int(config.load('IRIS', 'ACTIVITIES_PAGE_SIZE', fallback=1000))
+    ACTIVITIES_MAX_PAGE_SIZE = int(config.load('IRIS', 'ACTIVITIES_MAX_PAGE_SIZE', fallback=10000))
+
     """ Celery configuration
     Configure URL and backend
     """
@@ -16,14 +16,72 @@
 #  along with this program; if not, write to the Free Software Foundation,
 #  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+import base64
+import json
+from datetime import datetime
+from datetime import timedelta
+
 from sqlalchemy import and_
 from sqlalchemy import desc
+from sqlalchemy import tuple_
 
+from app import app
+from app import db
 from app.models import Cases
 from app.models.authorization import User
 from app.models.models import UserActivity
 
 
+def encode_activity_cursor(activity_date, activity_id):
+    """
+    Encode the position of the last activity of a page, the next page starts right after it
+    """
+    return base64.urlsafe_b64encode(json.dumps([activity_date.isoformat(), activity_id]).encode()).decode()
+
+
+def decode_activity_cursor(cursor):
+    """
+    Decode a cursor returned by a previous page
+
+    raises:
+        ValueError: If the cursor is not a valid cursor
+    """
+    try:
+        activity_date, activity_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        activity_date = datetime.fromisoformat(activity_date)
+    except (AttributeError, TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+
+    if not isinstance(activity_id, int):
+        raise ValueError('Invalid cursor')
+
+    return activity_date, activity_id
+
+
+def _paginate_activities(query, cursor, limit):
+    if limit is None:
+        limit = app.config['ACTIVITIES_PAGE_SIZE']
+    limit = max(1, min(limit, app.config['ACTIVITIES_MAX_PAGE_SIZE']))
+
+    # Keyset pagination on (activity_date, id), most recent first, so a page costs the same whatever its position
+    if cursor:
+        query = query.filter(
+            tuple_(UserActivity.activity_date, UserActivity.id) < tuple_(*decode_activity_cursor(cursor))
+        )
+
+    rows = query.order_by(desc(UserActivity.activity_date), desc(UserActivity.id)).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_activity_cursor(rows[-1].activity_date, rows[-1].activity_id)
+
+    return {
+        'activities': [row._asdict() for row in rows],
+        'next_cursor': next_cursor
+    }
+
+
 def get_auto_activities(caseid):
     """
     DB function to fetch the automatically generated activities
@@ -39,11 +97,7 @@ def get_auto_activities(caseid):
     ).filter(
         and_(
             UserActivity.case_id == caseid,
-            UserActivity.activity_desc.notlike('[Unbound]%'),
-            UserActivity.activity_desc.notlike('Started a search for %'),
-            UserActivity.activity_desc.notlike('Updated global task %'),
-            UserActivity.activity_desc.notlike('Created new global task %'),
-            UserActivity.activity_desc.notlike('Started a new case creation %'),
+            UserActivity.activity_kind == 'case',
             UserActivity.user_input == False
         )
     ).order_by(
@@ -81,52 +135,111 @@ def get_manual_activities(caseid):
     return manual_activities
 
 
-def get_users_activities():
-    user_activities = UserActivity.query.with_entities(
-        Cases.name.label("case_name"),
-        User.name.label("user_name"),
-        UserActivity.user_id,
-        UserActivity.case_id,
+def get_case_activities(caseid, cursor=None, limit=None):
+    """
+    Get a page of the activities of a case displayed in the UI, most recent first
+
+    args:
+        caseid (int): The case
+        cursor (str): The cursor returned with the previous page, to get the next one
+        limit (int): The number of activities of the page, ACTIVITIES_PAGE_SIZE by default
+
+    returns:
+        dict: The activities of the page and the cursor of the next page, None if it is the last one
+
+    raises:
+        ValueError: If the cursor is invalid
+    """
+    query = UserActivity.query.with_entities(
+        UserActivity.id.label("activity_id"),
         UserActivity.activity_date,
+        User.name,
         UserActivity.activity_desc,
-        UserActivity.user_input,
         UserActivity.is_from_api
-    ).filter(
+    ).filter(and_(
+        UserActivity.case_id == caseid,
         UserActivity.display_in_ui == True
-    ).outerjoin(
+    )).join(
         UserActivity.user
-    ).outerjoin(
-        UserActivity.case
-    ).order_by(desc(UserActivity.activity_date)).limit(10000).all()
+    )
 
-    return user_activities
+    return _paginate_activities(query, cursor, limit)
 
 
-def get_all_users_activities():
-    user_activities = UserActivity.query.with_entities(
+def _get_activities_query():
+    return UserActivity.query.with_entities(
+        UserActivity.id.label("activity_id"),
         Cases.name.label("case_name"),
         User.name.label("user_name"),
         UserActivity.user_id,
         UserActivity.case_id,
         UserActivity.activity_date,
         UserActivity.activity_desc,
+        UserActivity.activity_kind,
         UserActivity.user_input,
         UserActivity.is_from_api
-    ).join(
-        UserActivity.case
-    ).join(
+    ).outerjoin(
         UserActivity.user
-    ).order_by(desc(UserActivity.activity_date)).limit(10000).all()
+    ).outerjoin(
+        UserActivity.case
+    )
 
-    user_activities += UserActivity.query.with_entities(
-        UserActivity.case_id.label("case_name"),
-        UserActivity.user_id.label("user_name"),
-        UserActivity.activity_date,
-        UserActivity.activity_desc,
-        UserActivity.user_input,
-        UserActivity.is_from_api
-    ).filter(and_(
-        UserActivity.case_id == None
-    )).order_by(desc(UserActivity.activity_date)).limit(10000).all()
 
-    return user_activities
+def get_users_activities(cursor=None, limit=None):
+    """
+    Get a page of the activities of all users displayed in the UI, most recent first. Same arguments and result as
+    get_case_activities.
+    """
+    query = _get_activities_query().filter(
+        UserActivity.display_in_ui == True
+    )
+
+    return _paginate_activities(query, cursor, limit)
+
+
+def get_all_users_activities(cursor=None, limit=None):
+    """
+    Get a page of all the activities, including the ones not displayed in the UI, most recent first. Same arguments
+    and result as get_case_activities.
+    """
+    return _paginate_activities(_get_activities_query(), cursor, limit)
+
+
+def delete_case_activities(caseid):
+    UserActivity.query.filter(
+        UserActivity.case_id == caseid
+    ).delete(synchronize_session=False)
+
+
+def prune_user_activities(retention_days: int, batch_size: int = 10000) -> int:
+    """
+    Delete the activities older than the retention period. The activities entered by users, i.e. the task logs, are
+    content of the cases and are kept. Activities are deleted by batches, each in its own transaction, so the table
+    is never locked for long.
+
+    args:
+        retention_days (int): The number of days to keep
+        batch_size (int): The number of activities deleted by each transaction
+
+    returns:
+        int: The number of deleted activities
+    """
+    expiry = datetime.utcnow() - timedelta(days=retention_days)
+
+    deleted = 0
+    while True:
+        batch = UserActivity.query.with_entities(
+            UserActivity.id
+        ).filter(
+            UserActivity.activity_date < expiry,
+            UserActivity.user_input == False
+        ).limit(batch_size).scalar_subquery()
+
+        batch_deleted = UserActivity.query.filter(
+            UserActivity.id.in_(batch)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+        deleted += batch_deleted
+        if batch_deleted < batch_size:
+            return deleted
@@ -17,15 +17,17 @@
 #  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 from copy import deepcopy
 
+import base64
 import json
 from datetime import datetime, timedelta
 from flask_login import current_user
 from functools import reduce
 from operator import and_
-from sqlalchemy import desc, asc, func, tuple_, or_
+from sqlalchemy import desc, asc, func, tuple_, insert
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import aliased, make_transient
-from sqlalchemy.orm import joinedload
-from typing import List, Tuple
+from sqlalchemy.orm import joinedload, selectinload
+from typing import List, Tuple, Dict
 
 import app
 from app import db
@@ -36,9 +38,10 @@ from app.datamgmt.manage.manage_access_control_db import get_user_clients_id
 from app.datamgmt.manage.manage_case_state_db import get_case_state_by_name
 from app.datamgmt.manage.manage_case_templates_db import get_case_template_by_id, \
     case_template_post_modifier
+from app.datamgmt.observables.observables_db import get_observable_key_hash
 from app.datamgmt.states import update_timeline_state
 from app.models import Cases, EventCategory, Tags, AssetsType, Comments, CaseAssets, alert_assets_association, \
-    alert_iocs_association, Ioc, IocLink
+    alert_iocs_association, Ioc, ObservableIndex
 from app.models.alerts import Alert, AlertStatus, AlertCaseAssociation, SimilarAlertsCache, AlertResolutionStatus
 from app.schema.marshables import EventSchema
 from app.util import add_obj_history_entry
@@ -51,7 +54,7 @@ def db_list_all_alerts():
     return db.session.query(Alert).all()
 
 
-def get_filtered_alerts(
+def _build_alerts_filter_conditions(
         start_date: str = None,
         end_date: str = None,
         title: str = None,
@@ -68,39 +71,8 @@ def get_filtered_alerts(
         assets: List[str] = None,
         iocs: List[str] = None,
         resolution_status: int = None,
-        page: int = 1,
-        per_page: int = 10,
-        sort: str = 'desc',
         current_user_id: int = None
-):
-    """
-    Get a list of alerts that match the given filter conditions
-
-    args:
-        start_date (datetime): The start date of the alert creation time
-        end_date (datetime): The end date of the alert creation time
-        title (str): The title of the alert
-        description (str): The description of the alert
-        status (str): The status of the alert
-        severity (str): The severity of the alert
-        owner (str): The owner of the alert
-        source (str): The source of the alert
-        tags (str): The tags of the alert
-        case_id (int): The case id of the alert
-        client (int): The client id of the alert
-        classification (int): The classification id of the alert
-        alert_ids (int): The alert ids
-        assets (list): The assets of the alert
-        iocs (list): The iocs of the alert
-        resolution_status (int): The resolution status of the alert
-        page (int): The page number
-        per_page (int): The number of alerts per page
-        sort (str): The sort order
-        current_user_id (int): The ID of the current user
-
-    returns:
-        list: A list of alerts that match the given filter conditions
-    """
+) -> list:
     # Build the filter conditions
     conditions = []
 
@@ -163,20 +135,88 @@ def get_filtered_alerts(
     if len(conditions) > 1:
         conditions = [reduce(and_, conditions)]
 
+    return conditions
+
+
+def _filtered_alerts_query(conditions: list):
+    # The many-to-one relationships are joined, the collections are fetched with one query each for the
+    # whole page, so that the rows of the page are not multiplied by the number of IOCs, assets and cases
+    return db.session.query(
+        Alert
+    ).filter(
+        *conditions
+    ).options(
+        joinedload(Alert.severity), joinedload(Alert.status), joinedload(Alert.customer),
+        selectinload(Alert.cases), selectinload(Alert.iocs), selectinload(Alert.assets)
+    )
+
+
+def get_filtered_alerts(
+        start_date: str = None,
+        end_date: str = None,
+        title: str = None,
+        description: str = None,
+        status: int = None,
+        severity: int = None,
+        owner: int = None,
+        source: str = None,
+        tags: str = None,
+        case_id: int = None,
+        client: int = None,
+        classification: int = None,
+        alert_ids: List[int] = None,
+        assets: List[str] = None,
+        iocs: List[str] = None,
+        resolution_status: int = None,
+        page: int = 1,
+        per_page: int = 10,
+        sort: str = 'desc',
+        current_user_id: int = None
+):
+    """
+    Get a list of alerts that match the given filter conditions
+
+    args:
+        start_date (datetime): The start date of the alert creation time
+        end_date (datetime): The end date of the alert creation time
+        title (str): The title of the alert
+        description (str): The description of the alert
+        status (str): The status of the alert
+        severity (str): The severity of the alert
+        owner (str): The owner of the alert
+        source (str): The source of the alert
+        tags (str): The tags of the alert
+        case_id (int): The case id of the alert
+        client (int): The client id of the alert
+        classification (int): The classification id of the alert
+        alert_ids (int): The alert ids
+        assets (list): The assets of the alert
+        iocs (list): The iocs of the alert
+        resolution_status (int): The resolution status of the alert
+        page (int): The page number
+        per_page (int): The number of alerts per page
+        sort (str): The sort order
+        current_user_id (int): The ID of the current user
+
+    returns:
+        list: A list of alerts that match the given filter conditions
+    """
+    conditions = _build_alerts_filter_conditions(
+        start_date=start_date, end_date=end_date, title=title, description=description, status=status,
+        severity=severity, owner=owner, source=source, tags=tags, case_id=case_id, client=client,
+        classification=classification, alert_ids=alert_ids, assets=assets, iocs=iocs,
+        resolution_status=resolution_status, current_user_id=current_user_id
+    )
+
     order_func = desc if sort == "desc" else asc
 
     try:
 
         # Query the alerts using the filter conditions
-        filtered_alerts = db.session.query(
-            Alert
-        ).filter(
-            *conditions
-        ).options(
-            joinedload(Alert.severity), joinedload(Alert.status), joinedload(Alert.customer), joinedload(Alert.cases),
-            joinedload(Alert.iocs), joinedload(Alert.assets)
+        filtered_alerts = _filtered_alerts_query(
+            conditions
         ).order_by(
-            order_func(Alert.alert_source_event_time)
+            order_func(Alert.alert_source_event_time), order_func(Alert.alert_id)
         ).paginate(page=page, per_page=per_page, error_out=False)
 
     except Exception as e:
@@ -186,6 +226,113 @@ def get_filtered_alerts(
     return filtered_alerts
 
 
+def encode_alerts_cursor(alert: Alert) -> str:
+    """
+    Build the cursor pointing right after the given alert, in the (alert_source_event_time, alert_id) order
+
+    args:
+        alert (Alert): The last alert of a page
+
+    returns:
+        str: The opaque cursor
+    """
+    cursor = json.dumps([alert.alert_source_event_time.isoformat(), alert.alert_id])
+    return base64.urlsafe_b64encode(cursor.encode('utf-8')).decode('utf-8')
+
+
+def decode_alerts_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decode a cursor built by encode_alerts_cursor
+
+    args:
+        cursor (str): The opaque cursor
+
+    returns:
+        tuple: (alert_source_event_time, alert_id)
+
+    raises:
+        ValueError: If the cursor is invalid
+    """
+    try:
+        event_time, alert_id = json.loads(base64.urlsafe_b64decode(cursor.encode('utf-8')))
+        return datetime.fromisoformat(event_time), int(alert_id)
+
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def _estimate_alerts_count(conditions: list) -> int:
+    # Rely on the planner estimation rather than a COUNT(*) over the whole filtered set
+    statement = db.session.query(Alert.alert_id).filter(*conditions).statement
+    compiled = statement.compile(dialect=db.engine.dialect, compile_kwargs={"render_postcompile": True})
+    plan = db.session.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def get_filtered_alerts_by_cursor(
+        cursor: str = None,
+        per_page: int = 10,
+        sort: str = 'desc',
+        count_mode: str = 'none',
+        **filters
+) -> Dict:
+    """
+    Get a page of alerts that match the given filter conditions, using keyset pagination on
+    (alert_source_event_time, alert_id). Unlike get_filtered_alerts, the cost of a page doesn't depend on its depth.
+
+    args:
+        cursor (str): The cursor returned with the previous page. None to get the first page
+        per_page (int): The number of alerts per page
+        sort (str): The sort order
+        count_mode (str): How to compute the total of alerts: 'exact', 'estimated' or 'none'
+        filters: The filters accepted by get_filtered_alerts
+
+    returns:
+        dict: The alerts of the page, the cursor of the next page (None if it's the last page) and the total
+
+    raises:
+        ValueError: If the cursor is invalid
+    """
+    conditions = _build_alerts_filter_conditions(**filters)
+
+    query = _filtered_alerts_query(conditions)
+
+    if cursor:
+        cursor_event_time, cursor_alert_id = decode_alerts_cursor(cursor)
+        cursor_key = tuple_(Alert.alert_source_event_time, Alert.alert_id)
+
+        if sort == 'desc':
+            query = query.filter(cursor_key < tuple_(cursor_event_time, cursor_alert_id))
+        else:
+            query = query.filter(cursor_key > tuple_(cursor_event_time, cursor_alert_id))
+
+    order_func = desc if sort == "desc" else asc
+
+    # Fetch one more alert to know if there is a next page
+    alerts = query.order_by(
+        order_func(Alert.alert_source_event_time), order_func(Alert.alert_id)
+    ).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(alerts) > per_page:
+        alerts = alerts[:per_page]
+        next_cursor = encode_alerts_cursor(alerts[-1])
+
+    total = None
+    if count_mode == 'exact':
+        total = db.session.query(func.count(Alert.alert_id)).filter(*conditions).scalar()
+
+    elif count_mode == 'estimated':
+        total = _estimate_alerts_count(conditions)
+
+    return {
+        'items': alerts,
+        'next_cursor': next_cursor,
+        'total': total
+    }
+
+
 def add_alert(
         title,
         description,
@@ -224,6 +371,87 @@ def add_alert(
     return alert
 
 
+def add_alerts_batch(pending_alerts: List[Tuple[int, Alert, List[dict], List[dict]]],
+                     cache_similarities: bool = True) -> Tuple[List[dict], List[dict]]:
+    """
+    Add a batch of alerts to the database in a single transaction.
+
+    The alerts, their IOCs and assets are flushed together so the ORM can group the inserts. If the batch
+    flush fails, each alert is retried in its own savepoint so that a single faulty alert doesn't prevent
+    the rest of the batch from being created. The similar alerts cache is then populated with one statement.
+
+    args:
+        pending_alerts (list): List of tuples (index, alert, assets, iocs) where assets and iocs are the raw
+                               dicts received for the alert
+        cache_similarities (bool): Whether to populate the similar alerts cache. Set to False when the cache
+                                   is populated later on by the alerts post-processing task
+
+    returns:
+        tuple: (created, failed) - created is a list of dicts with the index, alert ID and UUID of the new
+               alerts, failed is a list of dicts with the index and the error of the alerts not created
+    """
+    created = []
+    failed = []
+
+    if not pending_alerts:
+        return created, failed
+
+    # The event time is needed for the similarities cache. Grab it before the flush, as server side
+    # defaults are expired afterward and would need a query per alert to be read back
+    event_times = {id(alert): alert.alert_source_event_time for _, alert, _, _ in pending_alerts}
+
+    inserted = []
+    try:
+        with db.session.begin_nested():
+            db.session.add_all([alert for _, alert, _, _ in pending_alerts])
+            db.session.flush()
+
+        inserted = pending_alerts
+
+    except SQLAlchemyError as e:
+        app.app.logger.warning(f"Batch insert of alerts failed, retrying one by one: {e}")
+
+        for index, alert, assets, iocs in pending_alerts:
+            try:
+                with db.session.begin_nested():
+                    db.session.add(alert)
+                    db.session.flush()
+
+                inserted.append((index, alert, assets, iocs))
+
+            except SQLAlchemyError as e:
+                app.app.logger.exception(e)
+                failed.append({
+                    'index': index,
+                    'success': False,
+                    'error': 'Unable to save the alert. Check server logs'
+                })
+
+    cache_entries = []
+    for index, alert, assets, iocs in inserted:
+        cache_entries.append({
+            'customer_id': alert.alert_customer_id,
+            'assets': assets,
+            'iocs': iocs,
+            'alert_id': alert.alert_id,
+            'creation_date': event_times.get(id(alert))
+        })
+
+        created.append({
+            'index': index,
+            'success': True,
+            'alert_id': alert.alert_id,
+            'alert_uuid': str(alert.alert_uuid)
+        })
+
+    if cache_similarities:
+        cache_similar_alerts(cache_entries, commit=False)
+
+    db.session.commit()
+
+    return created, failed
+
+
 def get_alert_by_id(alert_id: int) -> Alert:
     """
     Get an alert from the database
@@ -242,6 +470,25 @@ def get_alert_by_id(alert_id: int) -> Alert:
     )
 
 
+def get_alerts_by_ids(alert_ids: List[int]) -> List[Alert]:
+    """
+    Get multiple alerts from the database, with their IOCs and assets
+
+    args:
+        alert_ids (list): The IDs of the alerts
+
+    returns:
+        list: The alerts that were retrieved from the database
+    """
+    return (
+        db.session.query(Alert)
+        .options(selectinload(Alert.iocs), selectinload(Alert.assets))
+        .filter(Alert.alert_id.in_(alert_ids))
+        .order_by(Alert.alert_id)
+        .all()
+    )
+
+
 def get_unspecified_event_category():
     """
     Get the id of the 'Unspecified' event category
@@ -757,19 +1004,79 @@ def cache_similar_alert(customer_id, assets, iocs, alert_id, creation_date):
         None
 
     """
-    for asset in assets:
-        cache_entry = SimilarAlertsCache(customer_id=customer_id, asset_name=asset['asset_name'],
-                                         asset_type_id=asset["asset_type_id"], alert_id=alert_id,
-                                         created_at=creation_date)
-        db.session.add(cache_entry)
+    cache_similar_alerts([{
+        'customer_id': customer_id,
+        'assets': assets,
+        'iocs': iocs,
+        'alert_id': alert_id,
+        'creation_date': creation_date
+    }])
 
-    for ioc in iocs:
-        cache_entry = SimilarAlertsCache(customer_id=customer_id, ioc_value=ioc['ioc_value'],
-                                         ioc_type_id=ioc['ioc_type_id'], alert_id=alert_id,
-                                         created_at=creation_date)
-        db.session.add(cache_entry)
 
-    db.session.commit()
+def cache_similar_alerts(entries: List[Dict], commit: bool = True):
+    """
+    Cache similar alerts of multiple alerts with a single insert statement
+
+    args:
+        entries (list): List of dicts with the keys customer_id, assets, iocs, alert_id and creation_date
+        commit (bool): Whether to commit the session
+
+    returns:
+        None
+    """
+    rows = []
+    for entry in entries:
+        created_at = entry.get('creation_date') or datetime.utcnow()
+
+        for asset in entry.get('assets') or []:
+            rows.append({
+                'customer_id': entry['customer_id'],
+                'alert_id': entry['alert_id'],
+                'asset_name': asset['asset_name'],
+                'asset_type_id': asset.get('asset_type_id'),
+                'ioc_value': None,
+                'ioc_type_id': None,
+                'created_at': created_at,
+                'key_hash': get_observable_key_hash('asset', asset.get('asset_type_id'), asset['asset_name'])
+            })
+
+        for ioc in entry.get('iocs') or []:
+            rows.append({
+                'customer_id': entry['customer_id'],
+                'alert_id': entry['alert_id'],
+                'asset_name': None,
+                'asset_type_id': None,
+                'ioc_value': ioc['ioc_value'],
+                'ioc_type_id': ioc.get('ioc_type_id'),
+                'created_at': created_at,
+                'key_hash': get_observable_key_hash('ioc', ioc.get('ioc_type_id'), ioc['ioc_value'])
+            })
+
+    if rows:
+        db.session.execute(insert(SimilarAlertsCache), rows)
+
+    if commit:
+        db.session.commit()
+
+
+def cache_similar_alerts_from_alerts(alerts: List[Alert], commit: bool = True):
+    """
+    Cache similar alerts from alerts already saved in the database, along with their IOCs and assets
+
+    args:
+        alerts (list): The alerts to cache
+        commit (bool): Whether to commit the session
+
+    returns:
+        None
+    """
+    cache_similar_alerts([{
+        'customer_id': alert.alert_customer_id,
+        'assets': [{'asset_name': asset.asset_name, 'asset_type_id': asset.asset_type_id} for asset in alert.assets],
+        'iocs': [{'ioc_value': ioc.ioc_value, 'ioc_type_id': ioc.ioc_type_id} for ioc in alert.iocs],
+        'alert_id': alert.alert_id,
+        'creation_date': alert.alert_source_event_time
+    } for alert in alerts], commit=commit)
 
 
 def delete_similar_alert_cache(alert_id):
@@ -800,6 +1107,40 @@ def delete_similar_alerts_cache(alert_ids: List[int]):
     db.session.commit()
 
 
+def refresh_similar_alert_cache(alert: Alert, commit: bool = True):
+    """
+    Rebuild the similar alerts cache entries of an alert, after its assets or IOCs changed
+
+    args:
+        alert (Alert): The alert
+        commit (bool): Whether to commit the session
+
+    returns:
+        None
+    """
+    SimilarAlertsCache.query.filter(SimilarAlertsCache.alert_id == alert.alert_id).delete()
+    cache_similar_alerts_from_alerts([alert], commit=commit)
+
+
+def prune_similar_alerts_cache(retention_days: int) -> int:
+    """
+    Delete the similar alerts cache entries older than the retention period.
+    Pruned alerts are no longer reported as similar, but are left untouched.
+
+    args:
+        retention_days (int): The number of days to keep
+
+    returns:
+        int: The number of deleted entries
+    """
+    deleted = SimilarAlertsCache.query.filter(
+        SimilarAlertsCache.created_at < datetime.utcnow() - timedelta(days=retention_days)
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+    return deleted
+
+
 def get_related_alerts(customer_id, assets, iocs, details=False):
     """
     Check if an alert is related to another alert
@@ -859,8 +1200,13 @@ def get_related_alerts_details(customer_id, assets, iocs, open_alerts, closed_al
             'edges': []
         }
 
-    asset_names = [(asset.asset_name, asset.asset_type_id) for asset in assets]
-    ioc_values = [(ioc.ioc_value, ioc.ioc_type_id) for ioc in iocs]
+    # Observables to look for, by key hash. The value is kept to rule out hash collisions
+    observable_keys = {}
+    for asset in assets:
+        observable_keys[get_observable_key_hash('asset', asset.asset_type_id, asset.asset_name)] = \
+            ('asset', asset.asset_name)
+    for ioc in iocs:
+        observable_keys[get_observable_key_hash('ioc', ioc.ioc_type_id, ioc.ioc_value)] = ('ioc', ioc.ioc_value)
 
     asset_type_alias = aliased(AssetsType)
     alert_status_filter = []
@@ -877,22 +1223,19 @@ def get_related_alerts_details(customer_id, assets, iocs, open_alerts, closed_al
         ).filter(AlertStatus.status_name.in_(['Closed', 'Merged', 'Escalated'])).all()
         alert_status_filter += [status_id[0] for status_id in closed_alert_status_ids]
 
+    # Single lookup on the (customer_id, key_hash, created_at) index
     conditions = and_(
         SimilarAlertsCache.customer_id == customer_id,
-        and_(or_(
-            tuple_(SimilarAlertsCache.asset_name, SimilarAlertsCache.asset_type_id).in_(asset_names),
-            tuple_(SimilarAlertsCache.ioc_value, SimilarAlertsCache.ioc_type_id).in_(ioc_values)
-        ),
+        SimilarAlertsCache.key_hash.in_(list(observable_keys.keys())),
         SimilarAlertsCache.created_at >= (func.now() - timedelta(days=days_back))
-        )
     )
 
     if alert_status_filter:
         conditions = and_(conditions, Alert.alert_status_id.in_(alert_status_filter))
 
     related_alerts = (
-        db.session.query(Alert, SimilarAlertsCache.asset_name, SimilarAlertsCache.ioc_value,
-                         asset_type_alias.asset_icon_not_compromised)
+        db.session.query(Alert, SimilarAlertsCache.key_hash, SimilarAlertsCache.asset_name,
+                         SimilarAlertsCache.ioc_value, asset_type_alias.asset_icon_not_compromised)
         .join(SimilarAlertsCache, Alert.alert_id == SimilarAlertsCache.alert_id)
         .outerjoin(asset_type_alias, SimilarAlertsCache.asset_type_id == asset_type_alias.asset_id)
         .filter(conditions)
@@ -901,16 +1244,27 @@ def get_related_alerts_details(customer_id, assets, iocs, open_alerts, closed_al
     )
 
     alerts_dict = {}
+    matched_keys = set()
+
+    for alert, key_hash, asset_name, ioc_value, asset_icon_not_compromised in related_alerts:
+        observable_kind, observable_value = observable_keys[key_hash]
+
+        if observable_kind == 'asset' and asset_name != observable_value:
+            continue
+
+        if observable_kind == 'ioc' and ioc_value != observable_value:
+            continue
+
+        matched_keys.add(key_hash)
 
-    for alert, asset_name, ioc_value, asset_icon_not_compromised in related_alerts:
         if alert.alert_id not in alerts_dict:
             alerts_dict[alert.alert_id] = {'alert': alert, 'assets': [], 'iocs': []}
 
-        if any(name == asset_name for name, _ in asset_names):
+        if observable_kind == 'asset':
             asset_info = {'asset_name': asset_name, 'icon': asset_icon_not_compromised}
             alerts_dict[alert.alert_id]['assets'].append(asset_info)
 
-        if any(value == ioc_value for value, _ in ioc_values):
+        else:
             alerts_dict[alert.alert_id]['iocs'].append(ioc_value)
 
     nodes = []
@@ -989,44 +1343,35 @@ def get_related_alerts_details(customer_id, assets, iocs, open_alerts, closed_al
         if open_cases and closed_cases:
             close_condition = Cases.close_date.isnot(None) | Cases.close_date.is_(None)
 
-        matching_ioc_cases = (
-            db.session.query(IocLink)
-            .with_entities(IocLink.case_id, Ioc.ioc_value, Cases.name, Cases.close_date)
-            .join(IocLink.ioc)
-            .join(IocLink.case)
+        # The cases sharing the matched observables are found with the same key hashes in the observable index
+        matching_cases = (
+            db.session.query(ObservableIndex)
+            .with_entities(ObservableIndex.case_id, ObservableIndex.key_hash, ObservableIndex.value, Cases.name,
+                           Cases.close_date)
+            .join(ObservableIndex.case)
             .filter(
-                Ioc.ioc_value.in_(added_iocs),
+                ObservableIndex.key_hash.in_(list(matched_keys)),
                 close_condition
             )
             .distinct()
             .all()
         )
 
-        matching_asset_cases = (
-            db.session.query(CaseAssets)
-            .with_entities(CaseAssets.case_id, CaseAssets.asset_name, Cases.name, Cases.close_date)
-            .join(CaseAssets.case)
-            .filter(
-                CaseAssets.asset_name.in_(added_assets),
-                close_condition
-            )
-            .distinct(CaseAssets.case_id)
-            .all()
-        )
-
         cases_data = {}
 
-        for case_id, ioc_value, case_name, close_date in matching_ioc_cases:
-            if case_id not in cases_data:
-                cases_data[case_id] = {'name': case_name, 'matching_ioc': [], 'matching_assets': [],
-                                       'close_date': close_date}
-            cases_data[case_id]['matching_ioc'].append(ioc_value)
+        for case_id, key_hash, value, case_name, close_date in matching_cases:
+            observable_kind, observable_value = observable_keys[key_hash]
+            if value != observable_value:
+                continue
 
-        for case_id, asset_name, case_name, close_date in matching_asset_cases:
             if case_id not in cases_data:
                 cases_data[case_id] = {'name': case_name, 'matching_ioc': [], 'matching_assets': [],
                                        'close_date': close_date}
-            cases_data[case_id]['matching_assets'].append(asset_name)
+
+            if observable_kind == 'asset':
+                cases_data[case_id]['matching_assets'].append(value)
+            else:
+                cases_data[case_id]['matching_ioc'].append(value)
 
         for case_id in cases_data:
             if case_id not in added_cases:
@@ -21,8 +21,12 @@ import datetime
 from flask_login import current_user
 from sqlalchemy import and_
 from sqlalchemy import func
+from sqlalchemy.orm import aliased
 
 from app import db, app
+from app.datamgmt.observables.observables_db import index_asset
+from app.datamgmt.observables.observables_db import reindex_observable
+from app.datamgmt.observables.observables_db import unindex_observable
 from app.datamgmt.states import update_assets_state
 from app.models import AnalysisStatus, CaseStatus
 from app.models import AssetComments
@@ -37,6 +41,7 @@ from app.models import IocAssetLink
 from app.models import IocLink
 from app.models import IocType
 from app.models.authorization import User
+from app.models.authorization import UserCaseEffectiveAccess
 
 
 log = app.logger
@@ -49,6 +54,9 @@ def create_asset(asset, caseid, user_id):
     asset.user_id = user_id
 
     db.session.add(asset)
+    db.session.flush()
+
+    index_asset(asset)
     update_assets_state(caseid=caseid, userid=user_id)
 
     db.session.commit()
@@ -115,6 +123,7 @@ def update_asset(asset_name, asset_description, asset_ip, asset_info, asset_doma
     asset.analysis_status_id = analysis_status
     asset.asset_tags = asset_tags
 
+    reindex_observable('asset', asset.asset_id, asset.asset_type_id, asset.asset_name)
     update_assets_state(caseid=caseid)
 
     db.session.commit()
@@ -131,12 +140,14 @@ def delete_asset(asset_id, caseid):
             case_asset.asset_id == CaseEventsAssets.asset_id
         ).delete()
 
+        unindex_observable('asset', case_asset.asset_id)
         case_asset.case_id = None
         db.session.commit()
         return
 
     with db.session.begin_nested():
         delete_ioc_asset_link(asset_id)
+        unindex_observable('asset', asset_id)
 
         # Delete the relevant records from the CaseEventsAssets table
         CaseEventsAssets.query.filter(
@@ -232,25 +243,45 @@ def get_assets_ioc_links(caseid):
 
     return ioc_links_req
 
-def get_similar_assets(asset_name, asset_type_id, caseid, customer_id, cases_limitation):
+
+def get_case_similar_assets(caseid, customer_id, user_id):
+    """
+    Return the assets with the same name and type as each asset of a case, in the other cases of the same customer
+    the user can access. The similar assets of all the assets are resolved in a single query.
+
+    returns:
+        dict: The similar assets of each asset, by asset ID. Assets without similar asset are not in the dict.
+    """
+    case_asset = aliased(CaseAssets)
 
     linked_assets = CaseAssets.query.with_entities(
+        CaseAssets.asset_id,
         Cases.name.label('case_name'),
         Cases.open_date.label('case_open_date'),
         CaseAssets.asset_description,
         CaseAssets.asset_compromise_status_id,
-        CaseAssets.asset_id,
-        CaseAssets.case_id
+        CaseAssets.case_id,
+        case_asset.asset_id.label('case_asset_id')
+    ).join(
+        case_asset, and_(case_asset.asset_name == CaseAssets.asset_name,
+                         case_asset.asset_type_id == CaseAssets.asset_type_id,
+                         case_asset.case_id == caseid)
+    ).join(
+        UserCaseEffectiveAccess, and_(UserCaseEffectiveAccess.case_id == CaseAssets.case_id,
+                                      UserCaseEffectiveAccess.user_id == user_id)
+    ).join(
+        CaseAssets.case
     ).filter(
         Cases.client_id == customer_id,
         CaseAssets.case_id != caseid
-    ).filter(
-        CaseAssets.asset_name == asset_name,
-        CaseAssets.asset_type_id == asset_type_id,
-        Cases.case_id.in_(cases_limitation)
-    ).join(CaseAssets.case).all()
+    ).all()
+
+    similar_assets = {}
+    for lasset in linked_assets:
+        lasset = lasset._asdict()
+        similar_assets.setdefault(lasset.pop('case_asset_id'), []).append(lasset)
 
-    return (lasset._asdict() for lasset in linked_assets)
+    return similar_assets
 
 
 def delete_ioc_asset_link(asset_id):
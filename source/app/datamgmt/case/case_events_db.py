@@ -15,8 +15,18 @@
 #  You should have received a copy of the GNU Lesser General Public License
 #  along with this program; if not, write to the Free Software Foundation,
 #  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+import base64
+import json
+from datetime import datetime
+
 from flask_login import current_user
 from sqlalchemy import and_
+from sqlalchemy import func
+from sqlalchemy import literal_column
+from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy import true
+from sqlalchemy import tuple_
 
 from app import db
 from app.datamgmt.states import update_timeline_state
@@ -403,3 +413,207 @@ def get_default_category():
         EventCategory.name == "Unspecified"
     ).first()
 
+
+TIMELINE_HISTOGRAM_BUCKETS = ('hour', 'day')
+
+# Maintained by PostgreSQL from the title, tags, content, source and raw fields of the events, see the
+# 0b7e4f9a2d63 migration. It is not mapped on CasesEvent so it never ends up in the serialized events
+timeline_search_vector = literal_column('cases_events.event_search_vector')
+
+
+def get_timeline_search(searches):
+    """
+    Build the full-text search condition on the timeline events, and its rank. Each search uses the web search
+    syntax, so "quoted words" match a phrase, or matches either side, and -word excludes a word. All the searches
+    must match.
+
+    returns:
+        tuple: (condition, rank)
+    """
+    search_query = None
+    for search in searches:
+        query = func.websearch_to_tsquery(literal_column("'simple'::regconfig"), search)
+        search_query = query if search_query is None else search_query.op('&&')(query)
+
+    condition = timeline_search_vector.op('@@', is_comparison=True)(search_query)
+    rank = func.ts_rank_cd(timeline_search_vector, search_query)
+
+    return condition, rank
+
+
+def get_timeline_links_condition(caseid, assets=None, assets_id=None, iocs=None):
+    """
+    Translate the assets and IOCs parts of a timeline filter to a SQL condition on the events. An event matches the
+    assets filter if it is linked to all the requested assets, and the IOCs filter if it is linked to one of the
+    requested IOCs.
+    """
+    condition = true()
+
+    if assets or assets_id:
+        assets_links = select(
+            CaseEventsAssets.event_id
+        ).join(
+            CaseAssets, CaseAssets.asset_id == CaseEventsAssets.asset_id
+        ).where(
+            CaseEventsAssets.case_id == caseid,
+            or_(func.lower(CaseAssets.asset_name).in_(assets or []),
+                CaseAssets.asset_id.in_(assets_id or []))
+        ).group_by(
+            CaseEventsAssets.event_id
+        ).having(
+            func.count() == len(assets or []) + len(assets_id or [])
+        )
+
+        condition = and_(condition, CasesEvent.event_id.in_(assets_links))
+
+    if iocs:
+        iocs_links = select(
+            CaseEventsIoc.event_id
+        ).join(
+            Ioc, Ioc.ioc_id == CaseEventsIoc.ioc_id
+        ).where(
+            CaseEventsIoc.case_id == caseid,
+            func.lower(Ioc.ioc_value).in_(iocs)
+        )
+
+        condition = and_(condition, CasesEvent.event_id.in_(iocs_links))
+
+    return condition
+
+
+def encode_timeline_cursor(event_date, event_id):
+    """
+    Build an opaque cursor pointing at an event, in the (event_date, event_id) order of the timeline
+    """
+    cursor = json.dumps([event_date.isoformat(), event_id])
+    return base64.urlsafe_b64encode(cursor.encode('utf-8')).decode('utf-8')
+
+
+def decode_timeline_cursor(cursor):
+    """
+    Decode a cursor built by encode_timeline_cursor
+
+    raises:
+        ValueError: If the cursor is invalid
+    """
+    try:
+        event_date, event_id = json.loads(base64.urlsafe_b64decode(cursor.encode('utf-8')))
+        return datetime.fromisoformat(event_date), int(event_id)
+
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def _timeline_window_query(condition):
+    return CasesEvent.query.with_entities(
+        CasesEvent.event_id,
+        CasesEvent.event_uuid,
+        CasesEvent.event_date,
+        CasesEvent.event_date_wtz,
+        CasesEvent.event_tz,
+        CasesEvent.event_title,
+        CasesEvent.event_color,
+        CasesEvent.event_tags,
+        CasesEvent.event_content,
+        CasesEvent.event_in_summary,
+        CasesEvent.event_in_graph,
+        CasesEvent.event_is_flagged,
+        CasesEvent.parent_event_id,
+        User.user,
+        CasesEvent.event_added,
+        EventCategory.name.label("category_name")
+    ).filter(
+        condition
+    ).outerjoin(
+        CasesEvent.category
+    ).join(
+        CasesEvent.user
+    )
+
+
+def _timeline_window_slice(condition, key, forward, size, inclusive=False):
+    """
+    Fetch up to size events from a (event_date, event_id) key, and tell if more events are available
+    """
+    query = _timeline_window_query(condition)
+    event_key = tuple_(CasesEvent.event_date, CasesEvent.event_id)
+
+    if key is not None:
+        if forward:
+            query = query.filter(event_key >= key if inclusive else event_key > key)
+        else:
+            query = query.filter(event_key < key)
+
+    if forward:
+        query = query.order_by(CasesEvent.event_date.asc(), CasesEvent.event_id.asc())
+    else:
+        query = query.order_by(CasesEvent.event_date.desc(), CasesEvent.event_id.desc())
+
+    rows = query.limit(size + 1).all()
+    has_more = len(rows) > size
+    rows = rows[:size]
+
+    if not forward:
+        rows.reverse()
+
+    return rows, has_more
+
+
+def get_timeline_window(condition, size, around=None, after=None, before=None):
+    """
+    Return a slice of the timeline in the (event_date, event_id) order, keyed either on a date, with about half of
+    the events before and half after it, or on a cursor. Without key, the beginning of the timeline is returned.
+
+    returns:
+        dict: the events rows, and the cursors of the previous and next slices, None when there are no more events
+    """
+    if after is not None:
+        events, has_next = _timeline_window_slice(condition, decode_timeline_cursor(after), True, size)
+        has_previous = True
+
+    elif before is not None:
+        events, has_previous = _timeline_window_slice(condition, decode_timeline_cursor(before), False, size)
+        has_next = True
+
+    elif around is not None:
+        key = (around, 0)
+        previous_events, has_previous = _timeline_window_slice(condition, key, False, size // 2)
+        events, has_next = _timeline_window_slice(condition, key, True, size - len(previous_events),
+                                                  inclusive=True)
+        events = previous_events + events
+
+    else:
+        events, has_next = _timeline_window_slice(condition, None, True, size)
+        has_previous = False
+
+    return {
+        'events': events,
+        'previous_cursor': encode_timeline_cursor(events[0].event_date, events[0].event_id)
+        if events and has_previous else None,
+        'next_cursor': encode_timeline_cursor(events[-1].event_date, events[-1].event_id)
+        if events and has_next else None
+    }
+
+
+def get_timeline_histogram(condition, bucket):
+    """
+    Count the events of the timeline matching the condition, by hour or by day
+    """
+    if bucket not in TIMELINE_HISTOGRAM_BUCKETS:
+        raise ValueError('Invalid bucket')
+
+    bucket_start = func.date_trunc(bucket, CasesEvent.event_date).label('bucket')
+
+    return CasesEvent.query.with_entities(
+        bucket_start,
+        func.count(func.distinct(CasesEvent.event_id)).label('count')
+    ).filter(
+        condition,
+        CasesEvent.event_date.isnot(None)
+    ).outerjoin(
+        CasesEvent.category
+    ).group_by(
+        bucket_start
+    ).order_by(
+        bucket_start
+    ).all()
@@ -17,10 +17,13 @@
 #  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 from flask_login import current_user
 from sqlalchemy import and_
+from sqlalchemy.orm import aliased
 
 from app import db
+from app.datamgmt.observables.observables_db import index_ioc
+from app.datamgmt.observables.observables_db import reindex_observable
+from app.datamgmt.observables.observables_db import unindex_observable
 from app.datamgmt.states import update_ioc_state
-from app.iris_engine.access_control.utils import ac_get_fast_user_cases_access
 from app.models import CaseEventsIoc
 from app.models import Cases
 from app.models import Client
@@ -32,6 +35,7 @@ from app.models import IocLink
 from app.models import IocType
 from app.models import Tlp
 from app.models.authorization import User
+from app.models.authorization import UserCaseEffectiveAccess
 
 
 def get_iocs(caseid):
@@ -79,6 +83,7 @@ def update_ioc(ioc_type, ioc_tags, ioc_value, ioc_description, ioc_tlp, userid,
         ioc.ioc_tlp_id = ioc_tlp
         ioc.user_id = userid
 
+        reindex_observable('ioc', ioc.ioc_id, ioc.ioc_type_id, ioc.ioc_value)
         db.session.commit()
 
     else:
@@ -94,6 +99,8 @@ def delete_ioc(ioc, caseid):
             )
         ).delete()
 
+        unindex_observable('ioc', ioc.ioc_id, caseid=caseid)
+
         res = IocLink.query.filter(
                 IocLink.ioc_id == ioc.ioc_id,
                 ).all()
@@ -152,26 +159,40 @@ def get_detailed_iocs(caseid):
     return detailed_iocs
 
 
-def get_ioc_links(ioc_id, caseid):
-    search_condition = and_(Cases.case_id.in_([]))
+def get_case_iocs_links(caseid, user_id):
+    """
+    Return the other cases each IOC of a case is seen in, restricted to the cases the user can access.
+    The links of all the IOCs are resolved in a single query.
 
-    user_search_limitations = ac_get_fast_user_cases_access(current_user.id)
-    if user_search_limitations:
-        search_condition = and_(Cases.case_id.in_(user_search_limitations))
+    returns:
+        dict: The links of each IOC, by IOC ID. IOCs without link are not in the dict.
+    """
+    case_ioc_link = aliased(IocLink)
 
-    ioc_link = (IocLink.query.with_entities(
+    links = IocLink.query.with_entities(
+        IocLink.ioc_id,
         Cases.case_id,
         Cases.name.label('case_name'),
         Client.name.label('client_name')
-    ).filter(and_(
-        IocLink.ioc_id == ioc_id,
-        IocLink.case_id != caseid,
-        search_condition)
-    ).join(IocLink.case)
-     .join(Cases.client)
-     .all())
+    ).join(
+        case_ioc_link, and_(case_ioc_link.ioc_id == IocLink.ioc_id, case_ioc_link.case_id == caseid)
+    ).join(
+        UserCaseEffectiveAccess, and_(UserCaseEffectiveAccess.case_id == IocLink.case_id,
+                                      UserCaseEffectiveAccess.user_id == user_id)
+    ).join(
+        IocLink.case
+    ).join(
+        Cases.client
+    ).filter(
+        IocLink.case_id != caseid
+    ).all()
+
+    iocs_links = {}
+    for link in links:
+        link = link._asdict()
+        iocs_links.setdefault(link.pop('ioc_id'), []).append(link)
 
-    return ioc_link
+    return iocs_links
 
 
 def find_ioc(ioc_value, ioc_type_id):
@@ -222,6 +243,12 @@ def add_ioc_link(ioc_id, caseid):
         link.ioc_id = ioc_id
 
         db.session.add(link)
+
+        # Usually already loaded by the caller, so taken from the session
+        ioc = db.session.get(Ioc, ioc_id)
+        if ioc:
+            index_ioc(ioc, caseid)
+
         db.session.commit()
 
         return False
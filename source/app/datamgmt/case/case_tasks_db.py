@@ -29,6 +29,7 @@ from app.models import Cases
 from app.models import Comments
 from app.models import TaskComments
 from app.models import TaskStatus
+from app.models.authorization import CaseAccessLevel
 from app.models.authorization import User
 
 
@@ -184,7 +185,8 @@ def update_task_assignees(task, task_assignee_list, caseid):
     assignees_to_add = set_assignees - set_cur_assignees
     assignees_to_remove = set_cur_assignees - set_assignees
 
-    allowed_users = [u.get('user_id') for u in get_users_list_restricted_from_case(caseid)]
+    allowed_users = [u.get('user_id') for u in get_users_list_restricted_from_case(caseid)
+                     if u.get('user_access_level') != CaseAccessLevel.deny_all.value]
 
     for uid in assignees_to_add:
         if uid not in allowed_users:
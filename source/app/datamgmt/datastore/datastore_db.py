@@ -19,16 +19,26 @@
 #  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 import datetime
+import hashlib
+import os
+import pyminizip
+import shutil
+import tempfile
 from pathlib import Path
 
 from flask_login import current_user
 from sqlalchemy import and_
 from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
 
 from app import app
+from app import cache
 from app import db
 from app.datamgmt.case.case_iocs_db import add_ioc_link
+from app.datamgmt.states import get_datastore_state
+from app.datamgmt.states import update_datastore_state
 from app.models import CaseReceivedFile
+from app.models import DataStoreBlob
 from app.models import DataStoreFile
 from app.models import DataStorePath
 from app.models import Ioc
@@ -54,22 +64,12 @@ def datastore_get_root(cid):
 
     return dsp_root
 
-def ds_list_tree(cid):
-    dsp_root = datastore_get_root(cid)
-
-    dsp = DataStorePath.query.filter(
-        and_(DataStorePath.path_case_id == cid,
-             DataStorePath.path_is_root == False
-             )
-    ).order_by(
-        DataStorePath.path_parent_id
-    ).all()
-
-    dsf = DataStoreFile.query.filter(
-        DataStoreFile.file_case_id == cid
-    ).all()
 
-    dsp_root = dsp_root
+def _build_ds_tree(dsp_root, dsp, dsf):
+    """
+    Build the datastore tree in a single pass, attaching each node to its parent through a map of the folders.
+    In each folder the files come first, followed by the sub folders.
+    """
     droot_id = f"d-{dsp_root.path_id}"
 
     path_tree = {
@@ -81,50 +81,82 @@ def ds_list_tree(cid):
         }
     }
 
-    droot_children = path_tree[droot_id]["children"]
-
-    files_nodes = {}
+    folders_children = {dsp_root.path_id: path_tree[droot_id]["children"]}
+    folders_nodes = []
+    for dpath in dsp:
+        path_node = {
+            "name": dpath.path_name,
+            "type": "directory",
+            "children": {}
+        }
+        folders_children[dpath.path_id] = path_node["children"]
+        folders_nodes.append((dpath, path_node))
 
     for dfile in dsf:
-        dfnode = dfile.__dict__
-        dfnode.pop('_sa_instance_state')
+        dfnode = dfile._asdict()
         dfnode['type'] = "file"
-        dnode_id = f"f-{dfile.file_id}"
-        dnode_parent_id = f"d-{dfile.file_parent_id}"
 
-        if dnode_parent_id == droot_id:
-            droot_children.update({
-                dnode_id: dfnode
-            })
+        parent_children = folders_children.get(dfile.file_parent_id)
+        if parent_children is not None:
+            parent_children[f"f-{dfile.file_id}"] = dfnode
 
-        elif dnode_parent_id in files_nodes:
-            files_nodes[dnode_parent_id].update({
-                dnode_id: dfnode
-            })
+    for dpath, path_node in folders_nodes:
+        parent_children = folders_children.get(dpath.path_parent_id)
+        if parent_children is not None:
+            parent_children[f"d-{dpath.path_id}"] = path_node
 
-        else:
-            files_nodes[dnode_parent_id] = {dnode_id: dfnode}
+    return path_tree
 
-    for dpath in dsp:
-        dpath_id = f"d-{dpath.path_id}"
-        dpath_parent_id = f"d-{dpath.path_parent_id}"
-        path_node = {
-            dpath_id: {
-                "name": dpath.path_name,
-                "type": "directory",
-                "children": {}
-            }
-        }
 
-        path_node_files = files_nodes.get(dpath_id)
-        if path_node_files:
-            path_node[dpath_id]["children"].update(path_node_files)
+def _list_ds_tree_nodes(cid, condition=None):
+    dsp = DataStorePath.query.with_entities(
+        DataStorePath.path_id,
+        DataStorePath.path_name,
+        DataStorePath.path_parent_id
+    ).filter(
+        and_(DataStorePath.path_case_id == cid,
+             DataStorePath.path_is_root == False
+             )
+    ).order_by(
+        DataStorePath.path_parent_id
+    ).all()
+
+    dsf = DataStoreFile.query.with_entities(
+        *DataStoreFile.__table__.columns
+    ).filter(
+        condition if condition is not None else DataStoreFile.file_case_id == cid
+    ).all()
+
+    return dsp, dsf
+
 
-        if dpath_parent_id == droot_id:
-            droot_children.update(path_node)
+def ds_list_tree(cid):
+    """
+    Return the datastore tree of a case. The tree is cached for DATASTORE_TREE_CACHE_TTL seconds along with the
+    datastore state it was built at, and served as long as the state is unchanged.
+    """
+    ttl = app.config.get('DATASTORE_TREE_CACHE_TTL')
+    if not ttl:
+        dsp_root = datastore_get_root(cid)
+        return _build_ds_tree(dsp_root, *_list_ds_tree_nodes(cid))
+
+    state = get_datastore_state(cid)
+    if state is None:
+        # Cases created before the datastore state
+        update_datastore_state(cid)
+        db.session.commit()
+        state = get_datastore_state(cid)
+
+    cache_key = f'datastore_tree_{cid}'
+    cached = cache.get(cache_key)
+    if cached and cached[0] == state['object_state']:
+        return cached[1]
+
+    dsp_root = datastore_get_root(cid)
+    path_tree = _build_ds_tree(dsp_root, *_list_ds_tree_nodes(cid))
 
-        else:
-            datastore_iter_tree(dpath_parent_id, path_node, droot_children)
+    # Stored with the state read before the build, so a concurrent change only leads to a rebuild
+    cache.set(cache_key, (state['object_state'], path_tree), timeout=ttl)
 
     return path_tree
 
@@ -156,22 +188,11 @@ def init_ds_tree(cid):
         dsp_init.path_is_root = False
         db.session.add(dsp_init)
 
+    update_datastore_state(cid)
     db.session.commit()
     return dsp_root
 
 
-def datastore_iter_tree(path_parent_id, path_node, tree):
-    for parent_id, node in tree.items():
-        if parent_id == path_parent_id:
-            node["children"].update(path_node)
-            return tree
-
-        if isinstance(node, dict):
-            datastore_iter_tree(path_parent_id, path_node, node)
-
-    return None
-
-
 def datastore_add_child_node(parent_node, folder_name, cid):
     try:
 
@@ -193,6 +214,7 @@ def datastore_add_child_node(parent_node, folder_name, cid):
     dsp.path_is_root = False
 
     db.session.add(dsp)
+    update_datastore_state(cid)
     db.session.commit()
 
     return False, 'Folder added', dsp
@@ -213,6 +235,7 @@ def datastore_rename_node(parent_node, folder_name, cid):
         return True, 'Parent node is invalid for this case', None
 
     dsp_base.path_name = folder_name
+    update_datastore_state(cid)
     db.session.commit()
 
     return False, 'Folder renamed', dsp_base
@@ -234,6 +257,9 @@ def datastore_delete_node(node_id, cid):
 
     datastore_iter_deletion(dsp_base, cid)
 
+    update_datastore_state(cid)
+    db.session.commit()
+
     return False, 'Folder and children deleted'
 
 
@@ -264,12 +290,8 @@ def datastore_delete_files_of_path(node_id, cid):
 
     for dsf_list_item in dsf_list:
 
-        fln = Path(dsf_list_item.file_local_name)
-        if fln.is_file():
-            fln.unlink(missing_ok=True)
-
         db.session.delete(dsf_list_item)
-        db.session.commit()
+        datastore_release_blob(dsf_list_item.file_local_name)
 
     return
 
@@ -296,6 +318,7 @@ def datastore_get_interactive_path_node(cid):
         dsp.path_is_root = False
 
         db.session.add(dsp)
+        update_datastore_state(cid)
         db.session.commit()
 
     return dsp
@@ -319,6 +342,115 @@ def datastore_get_standard_path(datastore_file, cid):
     return target_path / f"dsf-{datastore_file.file_uuid}"
 
 
+def datastore_archive_file(file_path, file_hash, archive_path, password):
+    """
+    Encrypt a file in a zip archive, where it is stored under its hash. The file is moved rather than copied into
+    the archive staging directory, and removed once archived. The archive only appears once complete.
+    """
+    archive_path = Path(archive_path)
+    tmp_dir = Path(tempfile.mkdtemp(dir=archive_path.parent, prefix='.'))
+
+    try:
+        hashed_path = tmp_dir / file_hash
+        os.replace(file_path, hashed_path)
+
+        tmp_archive = tmp_dir / archive_path.name
+        pyminizip.compress(hashed_path.as_posix(), None, tmp_archive.as_posix(), password, 0)
+        os.replace(tmp_archive, archive_path)
+
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return archive_path.as_posix()
+
+
+def datastore_get_blob_key(file_hash, password=None):
+    """
+    Return the key of the blob holding a content. Encrypted contents are keyed by their password as well, as each
+    password gives a different archive
+    """
+    if not password:
+        return file_hash
+
+    return f'{file_hash}-{hashlib.sha256(password.encode()).hexdigest()[:16].upper()}.zip'
+
+
+def datastore_get_blob_path(blob_key):
+    blob_dir = Path(app.config['DATASTORE_PATH']) / 'blobs' / blob_key[:2]
+    blob_dir.mkdir(parents=True, exist_ok=True)
+
+    return blob_dir / blob_key
+
+
+def datastore_reference_blob(file_hash, file_size, password=None):
+    """
+    Take a reference on the blob of a content, creating the blob if it does not exist yet.
+    Returns the path of the blob and whether its content is already stored.
+    """
+    blob_key = datastore_get_blob_key(file_hash, password)
+    blob_path = datastore_get_blob_path(blob_key)
+
+    # Waits for a concurrent release of the same blob, which removes the blob content before committing
+    db.session.execute(
+        insert(DataStoreBlob).values(
+            blob_key=blob_key,
+            blob_sha256=file_hash,
+            blob_local_name=blob_path.as_posix(),
+            blob_size=file_size,
+            blob_ref_count=1,
+            blob_date_added=datetime.datetime.now()
+        ).on_conflict_do_update(
+            index_elements=[DataStoreBlob.blob_key],
+            set_={'blob_ref_count': DataStoreBlob.blob_ref_count + 1}
+        )
+    )
+    db.session.commit()
+
+    return blob_path, blob_path.is_file()
+
+
+def datastore_store_blob(file_path, file_hash, file_size, password=None):
+    """
+    Store a file as the blob of its content, encrypted if a password is given. The file is moved to the blob, or
+    removed if the blob already holds the same content. Returns the path of the blob, to use as file local name.
+    """
+    blob_path, is_stored = datastore_reference_blob(file_hash, file_size, password)
+
+    if is_stored:
+        Path(file_path).unlink(missing_ok=True)
+
+    elif password:
+        datastore_archive_file(file_path, file_hash, blob_path, password)
+
+    else:
+        os.replace(file_path, blob_path)
+
+    return blob_path.as_posix()
+
+
+def datastore_release_blob(local_name):
+    """
+    Release the reference of a file on its blob, removing the blob content with its last reference. Files stored
+    before the blobs are not shared and are removed right away.
+    """
+    blob = DataStoreBlob.query.filter(
+        DataStoreBlob.blob_local_name == str(local_name)
+    ).with_for_update().first()
+
+    if blob is None:
+        fln = Path(local_name)
+        if fln.is_file():
+            fln.unlink(missing_ok=True)
+
+    else:
+        blob.blob_ref_count -= 1
+        if blob.blob_ref_count <= 0:
+            db.session.delete(blob)
+            Path(blob.blob_local_name).unlink(missing_ok=True)
+
+    db.session.commit()
+
+
 def datastore_get_file(file_id, cid):
     dsf = DataStoreFile.query.filter(
         DataStoreFile.file_id == file_id,
@@ -337,12 +469,9 @@ def datastore_delete_file(cur_id, cid):
     if dsf is None:
         return True, 'Invalid DS file ID for this case'
 
-    fln = Path(dsf.file_local_name)
-    if fln.is_file():
-        fln.unlink(missing_ok=True)
-
     db.session.delete(dsf)
-    db.session.commit()
+    update_datastore_state(cid)
+    datastore_release_blob(dsf.file_local_name)
 
     return False, f'File {cur_id} deleted'
 
@@ -487,78 +616,13 @@ def datastore_filter_tree(filter_d, caseid):
                  )
         ).first()
 
-    dsp = DataStorePath.query.filter(
-        and_(DataStorePath.path_case_id == caseid,
-             DataStorePath.path_is_root == False
-             )
-    ).order_by(
-        DataStorePath.path_parent_id
-    ).all()
-
     try:
-        dsf = DataStoreFile.query.filter(
-            condition
-        ).all()
+        dsp, dsf = _list_ds_tree_nodes(caseid, condition)
 
     except Exception as e:
         return None, str(e)
 
-    dsp_root = dsp_root
-    droot_id = f"d-{dsp_root.path_id}"
-
-    path_tree = {
-        droot_id: {
-            "name": dsp_root.path_name,
-            "type": "directory",
-            "is_root": True,
-            "children": {}
-        }
-    }
-
-    droot_children = path_tree[droot_id]["children"]
-
-    files_nodes = {}
-
-    for dfile in dsf:
-        dfnode = dfile.__dict__
-        dfnode.pop('_sa_instance_state')
-        dfnode['type'] = "file"
-        dnode_id = f"f-{dfile.file_id}"
-        dnode_parent_id = f"d-{dfile.file_parent_id}"
-
-        if dnode_parent_id == droot_id:
-            droot_children.update({
-                dnode_id: dfnode
-            })
-
-        elif dnode_parent_id in files_nodes:
-            files_nodes[dnode_parent_id].update({
-                dnode_id: dfnode
-            })
-
-        else:
-            files_nodes[dnode_parent_id] = {dnode_id: dfnode}
-
-    for dpath in dsp:
-        dpath_id = f"d-{dpath.path_id}"
-        dpath_parent_id = f"d-{dpath.path_parent_id}"
-        path_node = {
-            dpath_id: {
-                "name": dpath.path_name,
-                "type": "directory",
-                "children": {}
-            }
-        }
-
-        path_node_files = files_nodes.get(dpath_id)
-        if path_node_files:
-            path_node[dpath_id]["children"].update(path_node_files)
-
-        if dpath_parent_id == droot_id:
-            droot_children.update(path_node)
-
-        else:
-            datastore_iter_tree(dpath_parent_id, path_node, droot_children)
+    path_tree = _build_ds_tree(dsp_root, dsp, dsf)
 
     return path_tree, 'Success'
 
@@ -18,18 +18,21 @@
 from datetime import datetime
 from datetime import date
 from datetime import timedelta
-from pathlib import Path
 
 from sqlalchemy import and_, desc, asc
 from sqlalchemy.orm import aliased
 from functools import reduce
 
 from app import db, app
+from app.datamgmt.activities.activities_db import delete_case_activities
 from app.datamgmt.alerts.alerts_db import search_alert_resolution_by_name
 from app.datamgmt.case.case_db import get_case_tags
+from app.datamgmt.datastore.datastore_db import datastore_release_blob
 from app.datamgmt.manage.manage_case_state_db import get_case_state_by_name
+from app.datamgmt.observables.observables_db import delete_case_observables
 from app.datamgmt.authorization import has_deny_all_access_level
 from app.datamgmt.states import delete_case_states
+from app.iris_engine.access_control.utils import ac_invalidate_access_cache
 from app.models import CaseAssets
 from app.models import CaseClassification
 from app.models import alert_assets_association
@@ -52,9 +55,7 @@ from app.models import IocLink
 from app.models import Notes
 from app.models import NotesGroup
 from app.models import NotesGroupLink
-from app.models import UserActivity
 from app.models.alerts import AlertCaseAssociation
-from app.models.authorization import CaseAccessLevel
 from app.models.authorization import GroupCaseAccess
 from app.models.authorization import OrganisationCaseAccess
 from app.models.authorization import User
@@ -165,12 +166,12 @@ def list_cases_dict(user_id):
 
 
 def user_list_cases_view(user_id):
+    # deny_all is implicit, every effective access row grants at least a read access
     res = UserCaseEffectiveAccess.query.with_entities(
         UserCaseEffectiveAccess.case_id
-    ).filter(and_(
-        UserCaseEffectiveAccess.user_id == user_id,
-        UserCaseEffectiveAccess.access_level != CaseAccessLevel.deny_all.value
-    )).all()
+    ).filter(
+        UserCaseEffectiveAccess.user_id == user_id
+    ).all()
 
     return [r.case_id for r in res]
 
@@ -315,9 +316,10 @@ def delete_case(case_id):
         return False
 
     delete_case_states(caseid=case_id)
-    UserActivity.query.filter(UserActivity.case_id == case_id).delete()
+    delete_case_activities(case_id)
     CaseReceivedFile.query.filter(CaseReceivedFile.case_id == case_id).delete()
     IocLink.query.filter(IocLink.case_id == case_id).delete()
+    delete_case_observables(case_id)
 
     CaseTags.query.filter(CaseTags.case_id == case_id).delete()
     CaseProtagonist.query.filter(CaseProtagonist.case_id == case_id).delete()
@@ -327,11 +329,8 @@ def delete_case(case_id):
 
     for dsf_list_item in dsf_list:
 
-        fln = Path(dsf_list_item.file_local_name)
-        if fln.is_file():
-            fln.unlink(missing_ok=True)
-
         db.session.delete(dsf_list_item)
+        datastore_release_blob(dsf_list_item.file_local_name)
     db.session.commit()
 
     DataStorePath.query.filter(DataStorePath.path_case_id == case_id).delete()
@@ -391,6 +390,8 @@ def delete_case(case_id):
     Cases.query.filter(Cases.case_id == case_id).delete()
     db.session.commit()
 
+    ac_invalidate_access_cache()
+
     return True
 
 
@@ -22,7 +22,8 @@ from app.datamgmt.case.case_db import get_case
 from app.datamgmt.manage.manage_cases_db import list_cases_id
 from app.iris_engine.access_control.utils import ac_access_level_mask_from_val_list, ac_ldp_group_removal
 from app.iris_engine.access_control.utils import ac_access_level_to_list
-from app.iris_engine.access_control.utils import ac_auto_update_user_effective_access
+from app.iris_engine.access_control.utils import ac_get_groups_cases_ids
+from app.iris_engine.access_control.utils import ac_recompute_effective_access
 from app.iris_engine.access_control.utils import ac_permission_to_list
 from app.models import Cases
 from app.models.authorization import Group
@@ -165,6 +166,7 @@ def update_group_members(group, members):
     users_to_add = set_members - set_cur_groups
     users_to_remove = set_cur_groups - set_members
 
+    updated_users = []
     for uid in users_to_add:
         user = User.query.filter(User.id == uid).first()
         if user:
@@ -172,9 +174,7 @@ def update_group_members(group, members):
             ug.group_id = group.group_id
             ug.user_id = user.id
             db.session.add(ug)
-
-        db.session.commit()
-        ac_auto_update_user_effective_access(uid)
+            updated_users.append(uid)
 
     for uid in users_to_remove:
         if current_user.id == uid and ac_ldp_group_removal(uid, group.group_id):
@@ -184,9 +184,13 @@ def update_group_members(group, members):
             and_(UserGroup.group_id == group.group_id,
                  UserGroup.user_id == uid)
         ).delete()
+        updated_users.append(uid)
+
+    db.session.commit()
 
-        db.session.commit()
-        ac_auto_update_user_effective_access(uid)
+    # Only the cases the group has access to are affected
+    ac_recompute_effective_access(users_ids=updated_users,
+                                  cases_ids=ac_get_groups_cases_ids([group.group_id]))
 
     return group
 
@@ -201,7 +205,7 @@ def remove_user_from_group(group, member):
     ).delete()
     db.session.commit()
 
-    ac_auto_update_user_effective_access(member.id)
+    ac_recompute_effective_access(users_ids=[member.id], cases_ids=ac_get_groups_cases_ids([group.group_id]))
 
     return group
 
@@ -20,6 +20,7 @@ from typing import List
 from functools import reduce
 from flask_login import current_user
 from sqlalchemy import and_, desc, asc
+from sqlalchemy import func
 
 import app
 from app import bc
@@ -28,6 +29,10 @@ from app.datamgmt.case.case_db import get_case
 from app.iris_engine.access_control.utils import ac_access_level_mask_from_val_list, ac_ldp_group_removal
 from app.iris_engine.access_control.utils import ac_access_level_to_list
 from app.iris_engine.access_control.utils import ac_auto_update_user_effective_access
+from app.iris_engine.access_control.utils import ac_get_clients_cases_ids
+from app.iris_engine.access_control.utils import ac_get_groups_cases_ids
+from app.iris_engine.access_control.utils import ac_recompute_effective_access
+from app.iris_engine.access_control.utils import ac_invalidate_access_cache
 from app.iris_engine.access_control.utils import ac_get_detailed_effective_permissions_from_groups
 from app.iris_engine.access_control.utils import ac_remove_case_access_from_user
 from app.iris_engine.access_control.utils import ac_set_case_access_for_user
@@ -126,7 +131,9 @@ def update_user_groups(user_id, groups):
 
     db.session.commit()
 
-    ac_auto_update_user_effective_access(user_id)
+    # Only the cases of the added or removed groups are affected
+    ac_recompute_effective_access(users_ids=[user_id],
+                                  cases_ids=ac_get_groups_cases_ids(list(groups_to_add | groups_to_remove)))
 
 
 def update_user_customers(user_id, customers):
@@ -155,7 +162,9 @@ def update_user_customers(user_id, customers):
             UserClient.client_id == client_id
         ).delete()
 
-    ac_auto_update_user_effective_access(user_id)
+    # Only the cases of the added or removed customers are affected
+    ac_recompute_effective_access(users_ids=[user_id],
+                                  cases_ids=ac_get_clients_cases_ids(list(customers_to_add | customers_to_remove)))
 
     db.session.commit()
 
@@ -393,7 +402,7 @@ def remove_cases_access_from_user(user_id, cases_list):
 
     db.session.commit()
 
-    ac_auto_update_user_effective_access(user_id)
+    ac_recompute_effective_access(users_ids=[user_id], cases_ids=cases_list)
     return True, 'Cases access removed'
 
 
@@ -514,7 +523,7 @@ def add_case_access_to_user(user, cases_list, access_level):
         db.session.add(oca)
 
     db.session.commit()
-    ac_auto_update_user_effective_access(user.id)
+    ac_recompute_effective_access(users_ids=[user.id], cases_ids=cases_list)
 
     return user, "Updated"
 
@@ -625,19 +634,19 @@ def get_users_list_restricted_user_view(user_id):
 
 
 def get_users_list_restricted_from_case(case_id):
-
-    users = UserCaseEffectiveAccess.query.with_entities(
+    # deny_all is implicit, users without an effective access row to the case are listed as denied
+    users = User.query.with_entities(
         User.id.label('user_id'),
         User.uuid.label('user_uuid'),
         User.name.label('user_name'),
         User.user.label('user_login'),
         User.active.label('user_active'),
         User.email.label('user_email'),
-        UserCaseEffectiveAccess.access_level.label('user_access_level')
-    ).filter(
-        UserCaseEffectiveAccess.case_id == case_id
-    ).join(
-        UserCaseEffectiveAccess.user
+        func.coalesce(UserCaseEffectiveAccess.access_level,
+                      CaseAccessLevel.deny_all.value).label('user_access_level')
+    ).outerjoin(
+        UserCaseEffectiveAccess, and_(UserCaseEffectiveAccess.user_id == User.id,
+                                      UserCaseEffectiveAccess.case_id == case_id)
     ).all()
 
     return [u._asdict() for u in users]
@@ -686,6 +695,8 @@ def delete_user(user_id):
     User.query.filter(User.id == user_id).delete()
     db.session.commit()
 
+    ac_invalidate_access_cache()
+
 
 def user_exists(user_name, user_email):
     user = User.query.filter_by(user=user_name).first()
@@ -0,0 +1,289 @@
+#  IRIS Source Code
+#  Copyright (C) 2024 - DFIR-IRIS
+#  contact@dfir-iris.org
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 3 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import datetime
+import hashlib
+
+from sqlalchemy import and_
+from sqlalchemy import select
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+
+from app import db
+from app.models import Cases
+from app.models import Client
+from app.models import ObservableIndex
+from app.models.authorization import UserCaseEffectiveAccess
+
+OBSERVABLE_KINDS = ['ioc', 'asset']
+
+# Same normalization as normalize_observable_value and same hash as get_observable_key_hash
+_INDEX_IOC_LINKS_SQL = (
+    "INSERT INTO observable_index (observable_kind, object_id, type_id, value, normalized_value, key_hash, "
+    "customer_id, case_id, first_seen, last_seen) "
+    "SELECT 'ioc', ioc.ioc_id, ioc.ioc_type_id, ioc.ioc_value, lower(btrim(ioc.ioc_value, E' \\t\\r\\n')), "
+    "('x' || substr(md5('ioc:' || coalesce(ioc.ioc_type_id::text, '') || ':' || ioc.ioc_value), 1, 16))"
+    "::bit(64)::bigint, "
+    "cases.client_id, cases.case_id, "
+    "coalesce(cases.open_date::timestamp, now() at time zone 'utc'), "
+    "coalesce(cases.open_date::timestamp, now() at time zone 'utc') "
+    "FROM ioc_link "
+    "JOIN ioc ON ioc.ioc_id = ioc_link.ioc_id "
+    "JOIN cases ON cases.case_id = ioc_link.case_id "
+    "WHERE ioc.ioc_value IS NOT NULL "
+    "ON CONFLICT ON CONSTRAINT uq_observable_index_kind_object_case DO NOTHING"
+)
+
+_INDEX_ASSETS_SQL = (
+    "INSERT INTO observable_index (observable_kind, object_id, type_id, value, normalized_value, key_hash, "
+    "customer_id, case_id, first_seen, last_seen) "
+    "SELECT 'asset', case_assets.asset_id, case_assets.asset_type_id, case_assets.asset_name, "
+    "lower(btrim(case_assets.asset_name, E' \\t\\r\\n')), "
+    "('x' || substr(md5('asset:' || coalesce(case_assets.asset_type_id::text, '') || ':' || "
+    "case_assets.asset_name), 1, 16))::bit(64)::bigint, "
+    "cases.client_id, cases.case_id, "
+    "coalesce(case_assets.date_added, now() at time zone 'utc'), "
+    "coalesce(case_assets.date_update, case_assets.date_added, now() at time zone 'utc') "
+    "FROM case_assets "
+    "JOIN cases ON cases.case_id = case_assets.case_id "
+    "WHERE case_assets.asset_name IS NOT NULL "
+    "ON CONFLICT ON CONSTRAINT uq_observable_index_kind_object_case DO NOTHING"
+)
+
+# Characters stripped from the values when normalizing them, same as the backfill of the index migration
+_STRIPPED_CHARS = ' \t\r\n'
+
+
+def normalize_observable_value(observable_value):
+    """
+    Normalize the value of an observable, so that the same observable is found whatever its case and the blanks
+    around it
+    """
+    if observable_value is None:
+        return None
+
+    return observable_value.strip(_STRIPPED_CHARS).lower()
+
+
+def get_observable_key_hash(observable_kind: str, observable_type_id: int, observable_value: str) -> int:
+    """
+    Get the hash under which an observable is indexed in the observable index and the similar alerts cache.
+    It is the first 64 bits of the MD5 of "<kind>:<type_id>:<value>", as a signed integer, so that it can
+    be computed identically in SQL with ('x' || substr(md5(key), 1, 16))::bit(64)::bigint
+
+    args:
+        observable_kind (str): Either 'asset' or 'ioc'
+        observable_type_id (int): The asset type ID or the IOC type ID
+        observable_value (str): The asset name or the IOC value
+
+    returns:
+        int: The key hash
+    """
+    key = f"{observable_kind}:{observable_type_id if observable_type_id is not None else ''}:{observable_value}"
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big', signed=True)
+
+
+def index_observable(observable_kind, object_id, type_id, value, caseid):
+    """
+    Add an observable of a case to the index, or mark it as seen again if it is already indexed for the case.
+    The change is committed by the caller.
+    """
+    if value is None:
+        return
+
+    now = datetime.datetime.utcnow()
+
+    stmt = insert(ObservableIndex).values(
+        observable_kind=observable_kind,
+        object_id=object_id,
+        type_id=type_id,
+        value=value,
+        normalized_value=normalize_observable_value(value),
+        key_hash=get_observable_key_hash(observable_kind, type_id, value),
+        customer_id=select(Cases.client_id).where(Cases.case_id == caseid).scalar_subquery(),
+        case_id=caseid,
+        first_seen=now,
+        last_seen=now
+    )
+
+    db.session.execute(
+        stmt.on_conflict_do_update(
+            constraint='uq_observable_index_kind_object_case',
+            set_={
+                'type_id': stmt.excluded.type_id,
+                'value': stmt.excluded.value,
+                'normalized_value': stmt.excluded.normalized_value,
+                'key_hash': stmt.excluded.key_hash,
+                'last_seen': stmt.excluded.last_seen
+            }
+        )
+    )
+
+
+def index_ioc(ioc, caseid):
+    index_observable('ioc', ioc.ioc_id, ioc.ioc_type_id, ioc.ioc_value, caseid)
+
+
+def index_asset(asset):
+    if asset.case_id is None:
+        # Asset of an alert, only indexed once in a case
+        return
+
+    index_observable('asset', asset.asset_id, asset.asset_type_id, asset.asset_name, asset.case_id)
+
+
+def reindex_observable(observable_kind, object_id, type_id, value):
+    """
+    Update the value of an observable in all the cases it is indexed for. The change is committed by the caller.
+    """
+    ObservableIndex.query.filter(
+        ObservableIndex.observable_kind == observable_kind,
+        ObservableIndex.object_id == object_id
+    ).update({
+        ObservableIndex.type_id: type_id,
+        ObservableIndex.value: value,
+        ObservableIndex.normalized_value: normalize_observable_value(value),
+        ObservableIndex.key_hash: get_observable_key_hash(observable_kind, type_id, value),
+        ObservableIndex.last_seen: datetime.datetime.utcnow()
+    }, synchronize_session=False)
+
+
+def unindex_observable(observable_kind, object_id, caseid=None):
+    """
+    Remove an observable from the index of a case, or of all cases if no case is given.
+    The change is committed by the caller.
+    """
+    query = ObservableIndex.query.filter(
+        ObservableIndex.observable_kind == observable_kind,
+        ObservableIndex.object_id == object_id
+    )
+
+    if caseid is not None:
+        query = query.filter(ObservableIndex.case_id == caseid)
+
+    query.delete(synchronize_session=False)
+
+
+def update_case_observables_customer(caseid, customer_id):
+    ObservableIndex.query.filter(
+        ObservableIndex.case_id == caseid
+    ).update({
+        ObservableIndex.customer_id: customer_id
+    }, synchronize_session=False)
+
+
+def delete_case_observables(caseid):
+    ObservableIndex.query.filter(
+        ObservableIndex.case_id == caseid
+    ).delete(synchronize_session=False)
+
+
+def rebuild_observable_index():
+    """
+    Rebuild the observable index from the IOC links and the assets of all the cases, in a single transaction.
+    The first and last seen dates of the observables are reset to the ones of their case or asset.
+
+    returns:
+        int: The number of indexed observables
+    """
+    ObservableIndex.query.delete(synchronize_session=False)
+    db.session.execute(text(_INDEX_IOC_LINKS_SQL))
+    db.session.execute(text(_INDEX_ASSETS_SQL))
+    db.session.commit()
+
+    return ObservableIndex.query.count()
+
+
+def get_observable_pivot(observable_value, user_id, observable_kind=None, type_id=None, customer_id=None,
+                         limit=None):
+    """
+    Pivot on an observable: return the cases the user can access in which it is found, whatever its case and the
+    blanks around it. This is a single lookup on the normalized value index of the observable index.
+
+    args:
+        observable_value (str): The IOC value or the asset name to look for
+        user_id (int): The user pivoting, only the cases they can access are returned
+        observable_kind (str): Only look for IOCs or for assets
+        type_id (int): Only look for observables of this IOC type or asset type
+        customer_id (int): Only look in the cases of this customer
+        limit (int): Maximum number of cases returned
+
+    returns:
+        list: The matching observables, each with the cases it is found in, most recently seen first
+    """
+    conditions = [ObservableIndex.normalized_value == normalize_observable_value(observable_value)]
+
+    if observable_kind is not None:
+        conditions.append(ObservableIndex.observable_kind == observable_kind)
+
+    if type_id is not None:
+        conditions.append(ObservableIndex.type_id == type_id)
+
+    if customer_id is not None:
+        conditions.append(ObservableIndex.customer_id == customer_id)
+
+    query = ObservableIndex.query.with_entities(
+        ObservableIndex.observable_kind,
+        ObservableIndex.object_id,
+        ObservableIndex.type_id,
+        ObservableIndex.value,
+        ObservableIndex.case_id,
+        ObservableIndex.first_seen,
+        ObservableIndex.last_seen,
+        Cases.name.label('case_name'),
+        Cases.close_date.label('case_close_date'),
+        Client.name.label('customer_name')
+    ).join(
+        UserCaseEffectiveAccess, and_(UserCaseEffectiveAccess.case_id == ObservableIndex.case_id,
+                                      UserCaseEffectiveAccess.user_id == user_id)
+    ).join(
+        ObservableIndex.case
+    ).join(
+        ObservableIndex.customer
+    ).filter(
+        *conditions
+    ).order_by(
+        ObservableIndex.last_seen.desc()
+    )
+
+    if limit:
+        query = query.limit(limit)
+
+    observables = {}
+    for row in query.all():
+        observable = observables.setdefault((row.observable_kind, row.type_id, row.value), {
+            'observable_kind': row.observable_kind,
+            'type_id': row.type_id,
+            'value': row.value,
+            'first_seen': row.first_seen,
+            'last_seen': row.last_seen,
+            'cases': []
+        })
+
+        observable['first_seen'] = min(observable['first_seen'], row.first_seen)
+        observable['cases'].append({
+            'case_id': row.case_id,
+            'case_name': row.case_name,
+            'case_close_date': row.case_close_date,
+            'customer_name': row.customer_name,
+            'object_id': row.object_id,
+            'first_seen': row.first_seen,
+            'last_seen': row.last_seen
+        })
+
+    return list(observables.values())
@@ -17,12 +17,12 @@
 #  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 import datetime
 import re
+from collections import defaultdict
+from itertools import islice
 
 from sqlalchemy import desc
+from sqlalchemy.orm import joinedload
 
-from app.business.iocs import get_iocs
-from app.datamgmt.case.case_notes_db import get_notes_from_group, get_case_note_comments
-from app.datamgmt.case.case_tasks_db import get_tasks_with_assignees
 from app.models import AnalysisStatus, CompromiseStatus, TaskAssignee, NotesGroupLink
 from app.models import AssetsType
 from app.models import CaseAssets
@@ -41,6 +41,7 @@ from app.models import IocAssetLink
 from app.models import IocLink
 from app.models import IocType
 from app.models import Notes
+from app.models import NotesComments
 from app.models import NotesGroup
 from app.models import TaskStatus
 from app.models import Tlp
@@ -50,7 +51,8 @@ from app.schema.marshables import CaseDetailsSchema, CommentSchema, CaseNoteSche
 
 def export_case_json(case_id):
     """
-    Fully export a case a JSON
+    Fully export a case a JSON. Each object type is loaded with a fixed number of queries, whatever the number of
+    objects in the case (the timeline with a fixed number of queries per TIMELINE_EXPORT_BATCH_SIZE events)
     """
     export = {}
     case = export_caseinfo_json(case_id)
@@ -78,26 +80,7 @@ def export_case_json_for_report(case_id):
     """
     Fully export of a case for report generation
     """
-    export = {}
-    case = export_caseinfo_json(case_id)
-
-    if not case:
-        export['errors'] = ["Invalid case number"]
-        return export
-
-    case['description'] = process_md_images_links_for_report(case['description'])
-
-    export['case'] = case
-    export['evidences'] = export_case_evidences_json(case_id)
-    export['timeline'] = export_case_tm_json(case_id)
-    export['iocs'] = export_case_iocs_json(case_id)
-    export['assets'] = export_case_assets_json(case_id)
-    export['tasks'] = export_case_tasks_json(case_id)
-    export['notes'] = export_case_notes_json(case_id)
-    export['comments'] = export_case_comments_json(case_id)
-    export['export_date'] = datetime.datetime.utcnow()
-
-    return export
+    return export_case_json(case_id)
 
 
 def export_case_json_extended(case_id):
@@ -188,9 +171,29 @@ def export_case_notes_json_extended(case_id):
         NotesGroup.group_case_id == case_id
     ).all()
 
+    notes = NotesGroupLink.query.with_entities(
+        NotesGroupLink.group_id,
+        Notes.note_id,
+        Notes.note_uuid,
+        Notes.note_title,
+        User.user,
+        Notes.note_lastupdate
+    ).filter(
+        NotesGroupLink.case_id == case_id
+    ).join(
+        NotesGroupLink.note
+    ).join(
+        Notes.user
+    ).order_by(
+        Notes.note_id
+    ).all()
+
+    notes_by_group = defaultdict(list)
+    for note in notes:
+        notes_by_group[note.group_id].append(note)
+
     for notes_group in notes_groups:
-        notes_group = notes_group.__dict__
-        notes_group['notes'] = get_notes_from_group(notes_group['group_id'], case_id)
+        notes_group.__dict__['notes'] = notes_by_group.get(notes_group.group_id, [])
 
     return notes_groups
 
@@ -239,8 +242,31 @@ def export_case_notes_json(case_id):
     # Fetch all notes associated with the case
     notes = Notes.query.filter(
         Notes.note_case_id == case_id
+    ).options(
+        joinedload(Notes.directory)
     ).all()
 
+    # Fetch all the notes comments at once, grouped by note
+    comments = Comments.query.with_entities(
+        Comments,
+        NotesComments.comment_note_id
+    ).join(
+        NotesComments,
+        Comments.comment_id == NotesComments.comment_id
+    ).join(
+        NotesComments.note
+    ).filter(
+        Notes.note_case_id == case_id
+    ).options(
+        joinedload(Comments.user)
+    ).order_by(
+        Comments.comment_date.asc()
+    ).all()
+
+    comments_by_note = defaultdict(list)
+    for comment, note_id in comments:
+        comments_by_note[note_id].append(comment)
+
     # Initialize the schemas
     note_schema = CaseNoteSchema()
     comments_schema = CommentSchema(many=True)
@@ -248,9 +274,8 @@ def export_case_notes_json(case_id):
     # Serialize the notes and their comments
     serialized_notes = []
     for note in notes:
-        note_comments = get_case_note_comments(note.note_id)
         serialized_note = note_schema.dump(note)
-        serialized_note['comments'] = comments_schema.dump(note_comments)
+        serialized_note['comments'] = comments_schema.dump(comments_by_note.get(note.note_id, []))
         serialized_note["note_content"] = process_md_images_links_for_report(serialized_note["note_content"])
 
         serialized_notes.append(serialized_note)
@@ -258,7 +283,61 @@ def export_case_notes_json(case_id):
     return serialized_notes
 
 
-def export_case_tm_json(case_id):
+# Number of events loaded at once, along with their linked assets and IOCs, when exporting a timeline
+TIMELINE_EXPORT_BATCH_SIZE = 1000
+
+
+def _get_events_assets(events_ids):
+    assets = CaseEventsAssets.query.with_entities(
+        CaseEventsAssets.event_id,
+        CaseAssets.asset_id,
+        CaseAssets.asset_name,
+        AssetsType.asset_name.label('type')
+    ).filter(
+        CaseEventsAssets.event_id.in_(events_ids)
+    ).join(
+        CaseEventsAssets.asset
+    ).join(
+        CaseAssets.asset_type
+    ).all()
+
+    assets_by_event = defaultdict(list)
+    for asset in assets:
+        assets_by_event[asset.event_id].append(asset)
+
+    return assets_by_event
+
+
+def _get_events_iocs(events_ids):
+    iocs = CaseEventsIoc.query.with_entities(
+        CaseEventsIoc.event_id,
+        CaseEventsIoc.ioc_id,
+        Ioc.ioc_value,
+        Ioc.ioc_description,
+        Tlp.tlp_name,
+        IocType.type_name.label('type')
+    ).filter(
+        CaseEventsIoc.event_id.in_(events_ids)
+    ).join(
+        CaseEventsIoc.ioc
+    ).join(
+        Ioc.ioc_type
+    ).join(
+        Ioc.tlp
+    ).all()
+
+    iocs_by_event = defaultdict(list)
+    for ioc in iocs:
+        iocs_by_event[ioc.event_id].append(ioc)
+
+    return iocs_by_event
+
+
+def _iter_case_tm_events(case_id):
+    """
+    Yield the events of a case timeline with their linked assets and IOCs. Events are fetched by batches and the
+    links of a batch are loaded with one query per link type, so the memory stays flat whatever the timeline size
+    """
     timeline = CasesEvent.query.with_entities(
         CasesEvent.event_id,
         CasesEvent.event_title,
@@ -281,61 +360,77 @@ def export_case_tm_json(case_id):
     ).filter(
         CasesEvent.case_id == case_id
     ).order_by(
-        CasesEvent.event_date
+        CasesEvent.event_date,
+        CasesEvent.event_id
     ).join(
         CasesEvent.user
     ).outerjoin(
         CasesEvent.category
-    ).all()
+    ).yield_per(TIMELINE_EXPORT_BATCH_SIZE)
+
+    timeline = iter(timeline)
+    while partition := list(islice(timeline, TIMELINE_EXPORT_BATCH_SIZE)):
+        events_ids = [row.event_id for row in partition]
+        assets_by_event = _get_events_assets(events_ids)
+        iocs_by_event = _get_events_iocs(events_ids)
 
-    tim = []
-    for row in timeline:
+        for row in partition:
+            yield row, assets_by_event.get(row.event_id, []), iocs_by_event.get(row.event_id, [])
+
+
+def iter_case_tm_json(case_id):
+    """
+    Yield the events of a case timeline as exported in the reports
+    """
+    for row, assets, iocs in _iter_case_tm_events(case_id):
         ras = row._asdict()
-        ras['assets'] = None
-
-        as_list = CaseEventsAssets.query.with_entities(
-            CaseAssets.asset_id,
-            CaseAssets.asset_name,
-            AssetsType.asset_name.label('type')
-        ).filter(
-            CaseEventsAssets.event_id == row.event_id
-        ).join(
-            CaseEventsAssets.asset
-        ).join(
-            CaseAssets.asset_type
-        ).all()
-
-        alki = []
-        for asset in as_list:
-            alki.append("{} ({})".format(asset.asset_name, asset.type))
-
-        ras['assets'] = alki
-
-        iocs_list = CaseEventsIoc.query.with_entities(
-            CaseEventsIoc.ioc_id,
-            Ioc.ioc_value,
-            Ioc.ioc_description,
-            Tlp.tlp_name,
-            IocType.type_name.label('type')
-        ).filter(
-            CaseEventsIoc.event_id == row.event_id
-        ).join(
-            CaseEventsIoc.ioc
-        ).join(
-            Ioc.ioc_type
-        ).join(
-            Ioc.tlp
-        ).all()
-
-        ras['iocs'] = [ioc._asdict() for ioc in iocs_list]
-
-        tim.append(ras)
-
-    return tim
+        ras['assets'] = ["{} ({})".format(asset.asset_name, asset.type) for asset in assets]
+
+        ioc_fields = ['ioc_id', 'ioc_value', 'ioc_description', 'tlp_name', 'type']
+        ras['iocs'] = [{field: getattr(ioc, field) for field in ioc_fields} for ioc in iocs]
+
+        yield ras
+
+
+def export_case_tm_json(case_id):
+    return list(iter_case_tm_json(case_id))
+
+
+def iter_case_tm_jsonl(case_id):
+    """
+    Yield the events of a case timeline in the JSON lines exchange format. The fields are named after the CSV
+    import ones, so a record can be imported back in a case with the same assets and IOCs
+    """
+    for row, assets, iocs in _iter_case_tm_events(case_id):
+        yield {
+            'event_uuid': row.event_uuid,
+            'event_date': row.event_date_wtz.isoformat(timespec='milliseconds') if row.event_date_wtz else None,
+            'event_tz': row.event_tz,
+            'event_title': row.event_title,
+            'event_category': row.category,
+            'event_content': row.event_content,
+            'event_raw': row.event_raw,
+            'event_source': row.event_source,
+            'event_assets': [asset.asset_name for asset in assets],
+            'event_iocs': [ioc.ioc_value for ioc in iocs],
+            'event_tags': row.event_tags.split(',') if row.event_tags else [],
+            'event_color': row.event_color,
+            'event_in_summary': row.event_in_summary,
+            'event_in_graph': row.event_in_graph,
+            'event_is_flagged': row.event_is_flagged,
+            'custom_attributes': row.custom_attributes
+        }
 
 
 def export_case_iocs_json(case_id):
-    iocs = get_iocs(case_id)
+    iocs = Ioc.query.join(
+        IocLink,
+        IocLink.ioc_id == Ioc.ioc_id
+    ).filter(
+        IocLink.case_id == case_id
+    ).options(
+        joinedload(Ioc.ioc_type)
+    ).all()
 
     iocs_serialized = IocSchema().dump(iocs, many=True)
 
@@ -362,39 +457,58 @@ def export_case_tasks_json(case_id):
 
     tasks = [c._asdict() for c in res]
 
-    task_with_assignees = []
+    assignees = TaskAssignee.query.with_entities(
+        TaskAssignee.task_id,
+        User.user,
+        User.id,
+        User.name
+    ).join(
+        TaskAssignee.user
+    ).join(
+        TaskAssignee.task
+    ).filter(
+        CaseTasks.task_case_id == case_id
+    ).all()
+
+    assignee_list = defaultdict(list)
+    for member in assignees:
+        assignee_list[member.task_id].append({
+            'user': member.user,
+            'name': member.name,
+            'id': member.id
+        })
+
     for task in tasks:
-        task_id = task['id']
-        get_assignee_list = TaskAssignee.query.with_entities(
-            TaskAssignee.task_id,
-            User.user,
-            User.id,
-            User.name
-        ).join(
-            TaskAssignee.user
-        ).filter(
-            TaskAssignee.task_id == task_id
-        ).all()
-
-        assignee_list = {}
-        for member in get_assignee_list:
-            if member.task_id not in assignee_list:
-
-                assignee_list[member.task_id] = [{
-                    'user': member.user,
-                    'name': member.name,
-                    'id': member.id
-                }]
-            else:
-                assignee_list[member.task_id].append({
-                    'user': member.user,
-                    'name': member.name,
-                    'id': member.id
-                })
         task['task_assignees'] = assignee_list.get(task['id'], [])
-        task_with_assignees.append(task)
 
-    return task_with_assignees
+    return tasks
+
+
+def get_case_assets_iocs(case_id):
+    """
+    Return the IOCs linked to each asset of a case, as a map of asset ID to a list of IOCs
+    """
+    links = IocAssetLink.query.with_entities(
+        IocAssetLink.asset_id,
+        Ioc.ioc_value,
+        IocType.type_name,
+        Ioc.ioc_description
+    ).join(
+        IocAssetLink.ioc
+    ).join(
+        Ioc.ioc_type
+    ).join(
+        IocAssetLink.asset
+    ).filter(
+        CaseAssets.case_id == case_id
+    ).all()
+
+    assets_iocs = defaultdict(list)
+    for link in links:
+        ioc = link._asdict()
+        assets_iocs[ioc.pop('asset_id')].append(ioc)
+
+    return assets_iocs
 
 
 def export_case_assets_json(case_id):
@@ -422,26 +536,12 @@ def export_case_assets_json(case_id):
         CaseAssets.analysis_status
     ).order_by(desc(CaseAssets.asset_compromise_status_id)).all()
 
+    assets_iocs = get_case_assets_iocs(case_id)
+
     for row in res:
         row = row._asdict()
         row['light_asset_description'] = row['asset_description']
-
-        ial = IocAssetLink.query.with_entities(
-            Ioc.ioc_value,
-            IocType.type_name,
-            Ioc.ioc_description
-        ).filter(
-            IocAssetLink.asset_id == row['asset_id']
-        ).join(
-            IocAssetLink.ioc
-        ).join(
-            Ioc.ioc_type
-        ).all()
-
-        if ial:
-            row['asset_ioc'] = [row._asdict() for row in ial]
-        else:
-            row['asset_ioc'] = []
+        row['asset_ioc'] = assets_iocs.get(row['asset_id'], [])
 
         if row['asset_compromise_status_id'] is None:
             row['asset_compromise_status_id'] = CompromiseStatus.unknown.value
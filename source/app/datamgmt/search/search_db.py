@@ -0,0 +1,288 @@
+#  IRIS Source Code
+#  Copyright (C) 2024 - DFIR-IRIS
+#  contact@dfir-iris.org
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 3 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import base64
+import json
+
+from sqlalchemy import Float
+from sqlalchemy import case
+from sqlalchemy import cast
+from sqlalchemy import func
+from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy import text
+from sqlalchemy import tuple_
+
+from app import app
+from app import db
+from app.datamgmt.observables.observables_db import normalize_observable_value
+from app.datamgmt.observables.observables_db import rebuild_observable_index
+from app.models import Cases
+from app.models import Client
+from app.models import Comments
+from app.models import Ioc
+from app.models import IocType
+from app.models import Notes
+from app.models import ObservableIndex
+from app.models import Tlp
+from app.models.authorization import UserCaseEffectiveAccess
+
+SEARCH_TYPES = ['ioc', 'notes', 'comments']
+
+# Text search configuration of the search vectors of the notes and comments. It must stay the one of their
+# generated columns, and 'simple' does not stem, which suits technical content
+SEARCH_TEXT_CONFIG = 'simple'
+
+# Highlighted matches are wrapped in <mark> tags, the rest of the snippet is left as is and must be escaped
+SEARCH_HEADLINE_OPTIONS = 'StartSel=<mark>, StopSel=</mark>, MaxWords=30, MinWords=10, MaxFragments=2, ' \
+                          'FragmentDelimiter=" ... "'
+
+# Indexes the search relies on, created by the search migration. The trigram ones need the pg_trgm extension
+SEARCH_INDEXES = {
+    'ix_notes_note_search_vector': 'ON notes USING gin (note_search_vector)',
+    'ix_notes_note_content_trgm': 'ON notes USING gin (note_content gin_trgm_ops)',
+    'ix_comments_comment_search_vector': 'ON comments USING gin (comment_search_vector)',
+    'ix_comments_comment_text_trgm': 'ON comments USING gin (comment_text gin_trgm_ops)',
+    'ix_observable_index_normalized_value_trgm': 'ON observable_index USING gin (normalized_value gin_trgm_ops)'
+}
+
+
+def encode_search_cursor(rank, object_id):
+    """
+    Encode the position of the last result of a page, the next page starts right after it
+    """
+    return base64.urlsafe_b64encode(json.dumps([rank, object_id]).encode()).decode()
+
+
+def decode_search_cursor(cursor):
+    """
+    Decode a cursor returned by a previous page
+
+    raises:
+        ValueError: If the cursor is not a valid cursor
+    """
+    try:
+        rank, object_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (AttributeError, TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+
+    if not isinstance(rank, (int, float)) or not isinstance(object_id, int):
+        raise ValueError('Invalid cursor')
+
+    return rank, object_id
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _paginate(query, rank, object_id, cursor, limit):
+    # Keyset pagination on (rank, id), so a page costs the same whatever its position
+    if cursor:
+        query = query.filter(tuple_(rank, object_id) < tuple_(*decode_search_cursor(cursor)))
+
+    rows = query.order_by(rank.desc(), object_id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_search_cursor(rows[-1].search_rank, rows[-1].search_id)
+
+    return [row._asdict() for row in rows], next_cursor
+
+
+def _search_iocs(search_value, cases_ids, cursor, limit):
+    normalized_value = normalize_observable_value(search_value)
+
+    # Exact matches first, then the values starting with the search, then the values containing it
+    rank = case(
+        (ObservableIndex.normalized_value == normalized_value, 2),
+        (ObservableIndex.normalized_value.like(f'{_escape_like(normalized_value)}%', escape='\\'), 1),
+        else_=0
+    )
+
+    query = ObservableIndex.query.with_entities(
+        Ioc.ioc_value.label('ioc_name'),
+        Ioc.ioc_description.label('ioc_description'),
+        Ioc.ioc_misp,
+        IocType.type_name,
+        Tlp.tlp_name,
+        Tlp.tlp_bscolor,
+        Cases.name.label('case_name'),
+        Cases.case_id,
+        Client.name.label('customer_name'),
+        rank.label('search_rank'),
+        ObservableIndex.id.label('search_id')
+    ).join(
+        Ioc, Ioc.ioc_id == ObservableIndex.object_id
+    ).join(
+        Ioc.ioc_type
+    ).join(
+        Ioc.tlp
+    ).join(
+        ObservableIndex.case
+    ).join(
+        ObservableIndex.customer
+    ).filter(
+        ObservableIndex.observable_kind == 'ioc',
+        ObservableIndex.case_id.in_(cases_ids),
+        ObservableIndex.normalized_value.like(f'%{_escape_like(normalized_value)}%', escape='\\')
+    )
+
+    return _paginate(query, rank, ObservableIndex.id, cursor, limit)
+
+
+def _search_notes(search_value, cases_ids, cursor, limit):
+    ts_query = func.websearch_to_tsquery(SEARCH_TEXT_CONFIG, search_value)
+    # ts_rank is a real, compared as a double with the rank of the cursor. Cast so that it round trips exactly
+    rank = cast(func.ts_rank(Notes.note_search_vector, ts_query), Float(53))
+
+    query = Notes.query.with_entities(
+        Notes.note_id,
+        Notes.note_title,
+        func.ts_headline(SEARCH_TEXT_CONFIG, Notes.note_content, ts_query,
+                         SEARCH_HEADLINE_OPTIONS).label('snippet'),
+        Cases.name.label('case_name'),
+        Client.name.label('client_name'),
+        Cases.case_id,
+        rank.label('search_rank'),
+        Notes.note_id.label('search_id')
+    ).join(
+        Notes.case
+    ).join(
+        Cases.client
+    ).filter(
+        Notes.note_case_id.in_(cases_ids),
+        # Words are matched on the search vector, anything else, e.g. part of a hash, on the trigram index
+        or_(
+            Notes.note_search_vector.op('@@')(ts_query),
+            Notes.note_content.ilike(f'%{_escape_like(search_value)}%', escape='\\')
+        )
+    )
+
+    return _paginate(query, rank, Notes.note_id, cursor, limit)
+
+
+def _search_comments(search_value, cases_ids, cursor, limit):
+    ts_query = func.websearch_to_tsquery(SEARCH_TEXT_CONFIG, search_value)
+    rank = cast(func.ts_rank(Comments.comment_search_vector, ts_query), Float(53))
+
+    query = Comments.query.with_entities(
+        Comments.comment_id,
+        Comments.comment_text,
+        func.ts_headline(SEARCH_TEXT_CONFIG, Comments.comment_text, ts_query,
+                         SEARCH_HEADLINE_OPTIONS).label('snippet'),
+        Cases.name.label('case_name'),
+        Client.name.label('customer_name'),
+        Cases.case_id,
+        rank.label('search_rank'),
+        Comments.comment_id.label('search_id')
+    ).join(
+        Comments.case
+    ).join(
+        Cases.client
+    ).filter(
+        Comments.comment_case_id.in_(cases_ids),
+        or_(
+            Comments.comment_search_vector.op('@@')(ts_query),
+            Comments.comment_text.ilike(f'%{_escape_like(search_value)}%', escape='\\')
+        )
+    )
+
+    return _paginate(query, rank, Comments.comment_id, cursor, limit)
+
+
+def global_search(search_type, search_value, user_id, case_id=None, cursor=None, limit=None):
+    """
+    Search the IOCs, notes or comments of the cases a user can access. The results are ranked, the best matches
+    first, and returned by pages.
+
+    args:
+        search_type (str): One of SEARCH_TYPES
+        search_value (str): The words or the part of a value to look for
+        user_id (int): The user searching
+        case_id (int): Only search in this case
+        cursor (str): The cursor returned with the previous page, to get the next one
+        limit (int): The number of results of the page, SEARCH_PAGE_SIZE by default
+
+    returns:
+        dict: The results of the page, with their snippet for notes and comments, and the cursor of the next page,
+            None if it is the last one
+
+    raises:
+        ValueError: If the search type or the cursor is invalid
+    """
+    if search_type not in SEARCH_TYPES:
+        raise ValueError('Invalid search type')
+
+    if limit is None:
+        limit = app.config['SEARCH_PAGE_SIZE']
+    limit = max(1, min(limit, app.config['SEARCH_MAX_PAGE_SIZE']))
+
+    if not search_value:
+        return {'results': [], 'next_cursor': None}
+
+    # The cases the user can access, filtered in the search query itself
+    cases_ids = select(UserCaseEffectiveAccess.case_id).where(UserCaseEffectiveAccess.user_id == user_id)
+    if case_id is not None:
+        cases_ids = cases_ids.where(UserCaseEffectiveAccess.case_id == case_id)
+
+    if search_type == 'ioc':
+        results, next_cursor = _search_iocs(search_value, cases_ids, cursor, limit)
+
+    elif search_type == 'notes':
+        results, next_cursor = _search_notes(search_value, cases_ids, cursor, limit)
+
+    else:
+        results, next_cursor = _search_comments(search_value, cases_ids, cursor, limit)
+
+    return {'results': results, 'next_cursor': next_cursor}
+
+
+def reindex_search(concurrently=True, log=print):
+    """
+    Rebuild what the global search relies on: the observable index is rebuilt from the cases, the search indexes
+    are created if missing, e.g. when pg_trgm was installed after the migration, or rebuilt otherwise.
+
+    args:
+        concurrently (bool): Whether to build the indexes without locking writes, which takes longer
+        log: Function called with the progress messages
+    """
+    log('Rebuilding the observable index')
+    log(f'{rebuild_observable_index()} observables indexed')
+
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+
+        existing_indexes = {row.indexname for row in connection.execute(
+            text('SELECT indexname FROM pg_indexes WHERE indexname = ANY(:names)'),
+            {'names': list(SEARCH_INDEXES.keys())}
+        )}
+
+        option = ' CONCURRENTLY' if concurrently else ''
+        for index_name, index_definition in SEARCH_INDEXES.items():
+            if index_name in existing_indexes:
+                log(f'Rebuilding index {index_name}')
+                connection.execute(text(f'REINDEX INDEX{option} {index_name}'))
+            else:
+                log(f'Creating index {index_name}')
+                connection.execute(text(f'CREATE INDEX{option} IF NOT EXISTS {index_name} {index_definition}'))
+
+        connection.execute(text('ANALYZE notes, comments, observable_index'))
+
+    log('Search reindexed')
@@ -129,3 +129,11 @@ def update_notes_state(caseid, userid=None):
 
 def get_notes_state(caseid):
     return get_object_state('notes', caseid=caseid)
+
+
+def update_datastore_state(caseid, userid=None):
+    return _update_object_state('datastore', caseid=caseid, userid=userid)
+
+
+def get_datastore_state(caseid):
+    return get_object_state('datastore', caseid=caseid)
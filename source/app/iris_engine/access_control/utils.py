@@ -1,11 +1,19 @@
+from datetime import datetime
+from flask import g
+from flask import has_app_context
+from flask import has_request_context
 from flask import session
 from flask_login import current_user
 from sqlalchemy import and_
+from sqlalchemy import bindparam
+from sqlalchemy import func
+from sqlalchemy import text
 
 import app
+from app import cache
 from app import db
-from app.datamgmt.manage.manage_access_control_db import check_ua_case_client
 from app.models import Cases, Client
+from app.models import ObjectState
 from app.models.authorization import CaseAccessLevel, UserClient
 from app.models.authorization import Group
 from app.models.authorization import GroupCaseAccess
@@ -20,6 +28,90 @@ from app.models.authorization import UserOrganisation
 
 log = app.app.logger
 
+# Name of the object state holding the generation of the access cache. It has no case
+_AC_CACHE_STATE_NAME = 'access_control_cache'
+
+
+def _ac_cache_generation():
+    """
+    Returns the generation prefixing the shared access cache keys. It is kept in the database rather than in the
+    cache, which is per process, so an invalidation made by any process, workers included, is seen by all of them
+    from their next request. It is read once per request
+    """
+    if has_request_context() and '_ac_cache_generation' in g:
+        return g._ac_cache_generation
+
+    generation = ObjectState.query.with_entities(
+        func.max(ObjectState.object_state)
+    ).filter(
+        ObjectState.object_name == _AC_CACHE_STATE_NAME,
+        ObjectState.object_case_id.is_(None)
+    ).scalar()
+
+    if has_request_context():
+        g._ac_cache_generation = generation
+
+    return generation
+
+
+def _ac_cached(key, loader):
+    """
+    Returns the value of key from the per-request memo, then from the shared cache, and calls loader otherwise.
+    loader returns a tuple (value, cacheable). Values are stored within a tuple so None can be cached.
+    """
+    memo = None
+    if has_app_context():
+        memo = g.setdefault('_ac_cache_memo', {})
+        if key in memo:
+            return memo[key][0]
+
+    ttl = app.app.config.get('ACCESS_CONTROL_CACHE_TTL')
+    shared_key = None
+    if ttl:
+        shared_key = f'iris_ac_{_ac_cache_generation()}_{key}'
+        cached = cache.get(shared_key)
+        if cached is not None:
+            if memo is not None:
+                memo[key] = cached
+            return cached[0]
+
+    value, cacheable = loader()
+    if not cacheable:
+        return value
+
+    if memo is not None:
+        memo[key] = (value,)
+    if shared_key:
+        cache.set(shared_key, (value,), timeout=ttl)
+
+    return value
+
+
+def ac_invalidate_access_cache(commit=True):
+    """
+    Invalidate the cached cases access levels and cases existence, for all users and in all processes.
+    Needs to be called after any change of the effective access or deletion of users or cases. Without commit, the
+    invalidation is committed along with the change by the caller
+    """
+    updated = ObjectState.query.filter(
+        ObjectState.object_name == _AC_CACHE_STATE_NAME,
+        ObjectState.object_case_id.is_(None)
+    ).update({
+        ObjectState.object_state: ObjectState.object_state + 1,
+        ObjectState.object_last_update: datetime.utcnow()
+    }, synchronize_session=False)
+
+    if not updated:
+        db.session.add(ObjectState(object_name=_AC_CACHE_STATE_NAME, object_state=1,
+                                   object_last_update=datetime.utcnow()))
+
+    if commit:
+        db.session.commit()
+
+    if has_app_context():
+        g.pop('_ac_cache_memo', None)
+        g.pop('_ac_cache_generation', None)
+
 
 def ac_flag_match_mask(flag, mask):
     return (flag & mask) == mask
@@ -286,10 +378,7 @@ def ac_trace_effective_user_permissions(user_id):
     return perms
 
 
-def ac_fast_check_user_has_case_access(user_id, cid, access_level):
-    """
-    Returns true if the user has access to the case
-    """
+def _ac_load_user_case_access_level(user_id, cid):
     ucea = UserCaseEffectiveAccess.query.with_entities(
         UserCaseEffectiveAccess.access_level
     ).filter(
@@ -297,48 +386,169 @@ def ac_fast_check_user_has_case_access(user_id, cid, access_level):
         UserCaseEffectiveAccess.case_id == cid
     ).first()
 
-    if not ucea:
-        # The user has no direct access, check if he is part of the client
-        cuacu = check_ua_case_client(user_id, cid)
-        if cuacu is None:
-            return None
-        ac_set_case_access_for_user(user_id, cid, cuacu.access_level)
+    return (ucea[0] if ucea else None), True
 
-        return cuacu.access_level
 
-    if ac_flag_match_mask(ucea[0], CaseAccessLevel.deny_all.value):
+def ac_fast_check_user_has_case_access(user_id, cid, access_level):
+    """
+    Returns the access level of the user on the case if it matches one of the requested access levels.
+    No effective access row means the user is denied
+    """
+    user_access_level = _ac_cached(f'case_access_{user_id}_{cid}',
+                                   lambda: _ac_load_user_case_access_level(user_id, cid))
+
+    if user_access_level is None:
+        return None
+
+    if ac_flag_match_mask(user_access_level, CaseAccessLevel.deny_all.value):
         return None
 
     for acl in access_level:
-        if ac_flag_match_mask(ucea[0], acl.value):
-            return ucea[0]
+        if ac_flag_match_mask(user_access_level, acl.value):
+            return user_access_level
 
     return None
 
 
+def _ac_load_case_exists(cid):
+    case = Cases.query.with_entities(Cases.case_id).filter(Cases.case_id == cid).first()
+
+    return case is not None, True
+
+
+def ac_fast_check_case_exists(cid):
+    """
+    Returns true if the case exists
+    """
+    return _ac_cached(f'case_exists_{cid}', lambda: _ac_load_case_exists(cid))
+
+
 def ac_fast_check_current_user_has_case_access(cid, access_level):
     return ac_fast_check_user_has_case_access(current_user.id, cid, access_level)
 
 
-def ac_recompute_effective_ac_from_users_list(users_list):
+def ac_recompute_effective_access(users_ids=None, cases_ids=None):
     """
-    Recompute all users effective access of users
+    Recompute the effective access of the given users on the given cases with a single statement, and only write
+    the pairs which changed. None means all the users, or all the cases.
+
+    The effective access of a user on a case is, by order of precedence, the user case access, the user client
+    access, and the highest access of the user groups on the case. deny_all is the implicit default: no row is
+    stored for it, so the statement only walks the existing grants and its cost does not depend on the number
+    of users.
     """
-    for member in users_list:
-        ac_auto_update_user_effective_access(user_id=member['id'])
+    if users_ids is not None and not users_ids:
+        return
+
+    if cases_ids is not None and not cases_ids:
+        return
+
+    params = {'deny_all': CaseAccessLevel.deny_all.value}
+    bind_params = []
+    users_filter = ''
+    cases_filter = ''
+
+    if users_ids is not None:
+        params['users_ids'] = list(set(users_ids))
+        bind_params.append(bindparam('users_ids', expanding=True))
+        users_filter = 'AND {column} IN :users_ids'
+
+    if cases_ids is not None:
+        params['cases_ids'] = list(set(cases_ids))
+        bind_params.append(bindparam('cases_ids', expanding=True))
+        cases_filter = 'AND {column} IN :cases_ids'
+
+    statement = text(f"""
+        WITH grants AS (
+            SELECT user_id, case_id, max(access_level) AS access_level, 1 AS precedence
+            FROM user_case_access
+            WHERE TRUE {users_filter.format(column='user_id')} {cases_filter.format(column='case_id')}
+            GROUP BY user_id, case_id
+            UNION ALL
+            SELECT ucl.user_id, c.case_id, max(ucl.access_level), 2
+            FROM user_client ucl
+            JOIN cases c ON c.client_id = ucl.client_id
+            WHERE TRUE {users_filter.format(column='ucl.user_id')} {cases_filter.format(column='c.case_id')}
+            GROUP BY ucl.user_id, c.case_id
+            UNION ALL
+            SELECT ug.user_id, g.case_id, max(g.access_level), 3
+            FROM user_group ug
+            JOIN group_case_access g ON g.group_id = ug.group_id
+            WHERE TRUE {users_filter.format(column='ug.user_id')} {cases_filter.format(column='g.case_id')}
+            GROUP BY ug.user_id, g.case_id
+        ), effective AS (
+            SELECT DISTINCT ON (user_id, case_id) user_id, case_id, access_level
+            FROM grants
+            ORDER BY user_id, case_id, precedence
+        ), revoked AS (
+            DELETE FROM user_case_effective_access e
+            WHERE TRUE {users_filter.format(column='e.user_id')} {cases_filter.format(column='e.case_id')}
+            AND NOT EXISTS (
+                SELECT 1 FROM effective f
+                WHERE f.user_id = e.user_id AND f.case_id = e.case_id AND f.access_level <> :deny_all
+            )
+        )
+        INSERT INTO user_case_effective_access (user_id, case_id, access_level)
+        SELECT user_id, case_id, access_level
+        FROM effective
+        WHERE access_level <> :deny_all
+        ON CONFLICT (user_id, case_id) DO UPDATE SET access_level = EXCLUDED.access_level
+        WHERE user_case_effective_access.access_level <> EXCLUDED.access_level
+    """).bindparams(*bind_params)
+
+    db.session.flush()
+    db.session.execute(statement, params)
+    db.session.commit()
 
-    return
+    ac_invalidate_access_cache()
 
 
-def ac_recompute_all_users_effective_ac():
+def ac_get_groups_cases_ids(groups_ids):
     """
-    Recompute all users effective access
+    Returns the IDs of the cases on which the groups have an access
     """
-    users = User.query.with_entities(
-        User.id
+    gcas = GroupCaseAccess.query.with_entities(
+        GroupCaseAccess.case_id
+    ).filter(
+        GroupCaseAccess.group_id.in_(groups_ids)
+    ).distinct().all()
+
+    return [gca.case_id for gca in gcas]
+
+
+def ac_get_clients_cases_ids(clients_ids):
+    """
+    Returns the IDs of the cases of the clients
+    """
+    cases = Cases.query.with_entities(
+        Cases.case_id
+    ).filter(
+        Cases.client_id.in_(clients_ids)
     ).all()
-    for user_id in users:
-        ac_auto_update_user_effective_access(user_id[0])
+
+    return [case.case_id for case in cases]
+
+
+def ac_recompute_effective_ac_from_users_list(users_list, cases_ids=None):
+    """
+    Recompute the effective access of users, optionally restricted to some cases
+    """
+    ac_recompute_effective_access(users_ids=[member['id'] for member in users_list], cases_ids=cases_ids)
+
+    return
+
+
+def ac_recompute_all_users_effective_ac(progress_callback=None, users_chunk_size=50):
+    """
+    Recompute all users effective access, by chunks of users so the progress can be reported
+    """
+    users_ids = [user.id for user in User.query.with_entities(User.id).order_by(User.id).all()]
+
+    for index in range(0, len(users_ids), users_chunk_size):
+        ac_recompute_effective_access(users_ids=users_ids[index:index + users_chunk_size])
+
+        if progress_callback:
+            progress_callback(min(index + users_chunk_size, len(users_ids)), len(users_ids))
 
     return
 
@@ -363,7 +573,7 @@ def ac_add_users_multi_effective_access(users_list, cases_list, access_level):
 
 def ac_add_user_effective_access(users_list, case_id, access_level):
     """
-    Directly add a set of effective user access
+    Directly add a set of effective user access. deny_all is not stored, the users rows are only removed
     """
 
     UserCaseEffectiveAccess.query.filter(
@@ -371,102 +581,55 @@ def ac_add_user_effective_access(users_list, case_id, access_level):
         UserCaseEffectiveAccess.user_id.in_(users_list)
     ).delete()
 
-    access_to_add = []
-    for user_id in users_list:
-        ucea = UserCaseEffectiveAccess()
-        ucea.user_id = user_id
-        ucea.case_id = case_id
-        ucea.access_level = access_level
-        access_to_add.append(ucea)
+    if access_level != CaseAccessLevel.deny_all.value:
+        db.session.add_all([
+            UserCaseEffectiveAccess(user_id=user_id, case_id=case_id, access_level=access_level)
+            for user_id in set(users_list)
+        ])
 
-    db.session.add_all(access_to_add)
     db.session.commit()
 
-
-def ac_add_user_effective_access_from_map(users_map, case_id):
-    """
-    Directly add a set of effective user access
-    """
-    UserCaseEffectiveAccess.query.filter(
-        UserCaseEffectiveAccess.case_id == case_id,
-        UserCaseEffectiveAccess.user_id.in_(users_map.keys())
-    ).delete()
-
-    access_to_add = []
-    for user_id in users_map:
-        ucea = UserCaseEffectiveAccess()
-        ucea.user_id = user_id
-        ucea.case_id = case_id
-        ucea.access_level = users_map[user_id]
-        access_to_add.append(ucea)
-
-    db.session.add_all(access_to_add)
-    db.session.commit()
+    ac_invalidate_access_cache()
 
 
 def ac_set_new_case_access(org_members, case_id, customer_id = None):
     """
-    Set a new case access
+    Set a new case access. Only the grants are written: the autofollow groups access and the full access of the
+    user creating the case. The effective access is then derived from them, and from the customer members, with a
+    single statement. Every other user is implicitly denied.
     """
 
-    users = ac_apply_autofollow_groups_access(case_id)
-    if current_user.id in users.keys():
-        del users[current_user.id]
-
-    users_full = User.query.with_entities(User.id).all()
-    users_full_access = list(set([u.id for u in users_full]) - set(users.keys()))
-
-    # Default users case access - Full access
-    ac_add_user_effective_access(users_full_access, case_id, CaseAccessLevel.deny_all.value)
+    ac_apply_autofollow_groups_access(case_id)
 
     # Add specific right for the user creating the case
     UserCaseAccess.query.filter(
         UserCaseAccess.case_id == case_id,
         UserCaseAccess.user_id == current_user.id
     ).delete()
-    db.session.commit()
+
     uca = UserCaseAccess()
     uca.case_id = case_id
     uca.user_id = current_user.id
     uca.access_level = CaseAccessLevel.full_access.value
     db.session.add(uca)
-    db.session.commit()
 
-    ac_add_user_effective_access([current_user.id], case_id, CaseAccessLevel.full_access.value)
-
-    # Add customer permissions for all users belonging to the customer
-    if customer_id:
-        users_client = UserClient.query.filter(
-            UserClient.client_id == customer_id
-        ).with_entities(
-            UserClient.user_id,
-            UserClient.access_level
-        ).all()
-        users_map = { u.user_id: u.access_level for u in users_client }
-        ac_add_user_effective_access_from_map(users_map, case_id)
+    ac_recompute_effective_access(cases_ids=[case_id])
 
 
 def ac_apply_autofollow_groups_access(case_id):
     """
-    Apply a direct effective user access to users within a group
+    Give the autofollow groups their access on a case. The effective access of their members is left to
+    ac_recompute_effective_access
     """
 
     groups = get_auto_follow_groups()
-    users = ac_combine_groups_access(groups)
-
-    rows_to_push = []
-    for user_id in users:
-        ucea = UserCaseEffectiveAccess()
-        ucea.user_id = user_id
-        ucea.case_id = case_id
-        ucea.access_level = users[user_id]
-        rows_to_push.append(ucea)
 
     grps_to_add = {}
     for group in groups:
         if group.group_id not in grps_to_add:
             grps_to_add[group.group_id] = group.group_auto_follow_access_level
 
+    rows_to_push = []
     for group_id in grps_to_add:
         gca = GroupCaseAccess()
         gca.case_id = case_id
@@ -475,84 +638,34 @@ def ac_apply_autofollow_groups_access(case_id):
         rows_to_push.append(gca)
 
     db.session.add_all(rows_to_push)
-    db.session.commit()
-    return users
+    db.session.flush()
+
+    return grps_to_add
 
 
 def ac_auto_update_user_effective_access(user_id):
     """
     Updates the effective access of a user given its ID
     """
-    uceas = UserCaseEffectiveAccess.query.filter(
-        UserCaseEffectiveAccess.user_id == user_id
-    ).all()
-
-    grouped_uca = {}
-    for ucea in uceas:
-        grouped_uca[ucea.case_id] = ucea.access_level
-
-    target_ucas = ac_get_user_cases_access(user_id)
-
-    ucea_to_add = {}
-    cid_to_remove = []
-
-    for case_id in target_ucas:
-        if case_id not in grouped_uca:
-            ucea_to_add.update({case_id: target_ucas[case_id]})
-        else:
-            if not ac_flag_match_mask(grouped_uca[case_id], target_ucas[case_id]):
-                cid_to_remove.append(case_id)
-                ucea_to_add.update({case_id: target_ucas[case_id]})
-
-    for prev_case_id in grouped_uca:
-        if prev_case_id not in target_ucas.keys():
-            cid_to_remove.append(prev_case_id)
-
-    UserCaseEffectiveAccess.query.where(and_(
-        UserCaseEffectiveAccess.user_id == user_id,
-        UserCaseEffectiveAccess.case_id.in_(cid_to_remove)
-    )).delete()
-
-    for case_id in ucea_to_add:
-        ucea = UserCaseEffectiveAccess()
-        ucea.user_id = user_id
-        ucea.case_id = case_id
-        ucea.access_level = ucea_to_add[case_id]
-        db.session.add(ucea)
-
-    db.session.commit()
+    ac_recompute_effective_access(users_ids=[user_id])
 
     return
 
 
 def ac_remove_case_access_from_user(user_id, case_id):
     """
-    Remove a case access from a user
+    Remove a case access from a user. deny_all being the default, the effective access row is simply deleted
     """
 
-    uac = UserCaseEffectiveAccess.query.where(and_(
+    UserCaseEffectiveAccess.query.filter(
         UserCaseEffectiveAccess.user_id == user_id,
         UserCaseEffectiveAccess.case_id == case_id
-    )).all()
-
-    if len(uac) > 1:
-        log.error(f'Multiple access found for user {user_id} and case {case_id}')
-        for u in uac:
-            db.session.delete(u)
-        db.session.commit()
-
-        uac = UserCaseEffectiveAccess()
-        uac.user_id = user_id
-        uac.case_id = case_id
-        uac.access_level = CaseAccessLevel.deny_all.value
-        db.session.add(uac)
-
-    elif len(uac) == 1:
-        uac = uac[0]
-        uac.access_level = CaseAccessLevel.deny_all.value
+    ).delete()
 
     db.session.commit()
 
+    ac_invalidate_access_cache()
+
     return
 
 
@@ -577,32 +690,30 @@ def ac_set_case_access_for_users(users, case_id, access_level):
 
 def ac_set_case_access_for_user(user_id, case_id, access_level, commit=True):
     """
-    Set a case access from a user
+    Set a case access from a user. Setting deny_all removes the effective access row
     """
 
-    uac = UserCaseEffectiveAccess.query.where(and_(
-        UserCaseEffectiveAccess.user_id == user_id,
-        UserCaseEffectiveAccess.case_id == case_id
-    )).all()
+    if access_level == CaseAccessLevel.deny_all.value:
+        UserCaseEffectiveAccess.query.filter(
+            UserCaseEffectiveAccess.user_id == user_id,
+            UserCaseEffectiveAccess.case_id == case_id
+        ).delete()
 
-    if len(uac) > 1:
-        log.error(f'Multiple access found for user {user_id} and case {case_id}')
-        for u in uac:
-            db.session.delete(u)
-        db.session.commit()
+    else:
+        uac = UserCaseEffectiveAccess.query.filter(
+            UserCaseEffectiveAccess.user_id == user_id,
+            UserCaseEffectiveAccess.case_id == case_id
+        ).first()
 
-        uac = UserCaseEffectiveAccess()
-        uac.user_id = user_id
-        uac.case_id = case_id
-        uac.access_level = access_level
-        db.session.add(uac)
+        if not uac:
+            uac = UserCaseEffectiveAccess()
+            uac.user_id = user_id
+            uac.case_id = case_id
+            db.session.add(uac)
 
-    elif len(uac) == 1:
-        uac = uac[0]
         uac.access_level = access_level
 
-    if commit:
-        db.session.commit()
+    ac_invalidate_access_cache(commit=commit)
 
     return
 
@@ -610,18 +721,16 @@ def ac_set_case_access_for_user(user_id, case_id, access_level, commit=True):
 def ac_get_fast_user_cases_access(user_id):
     ucea = UserCaseEffectiveAccess.query.with_entities(
         UserCaseEffectiveAccess.case_id
-    ).filter(and_(
-        UserCaseEffectiveAccess.user_id == user_id,
-        UserCaseEffectiveAccess.access_level != CaseAccessLevel.deny_all.value
-    )).all()
+    ).filter(
+        UserCaseEffectiveAccess.user_id == user_id
+    ).all()
 
     return [e.case_id for e in ucea]
 
 
 def ac_get_user_case_counts(user_id):
     query = UserCaseEffectiveAccess.query.filter(
-        UserCaseEffectiveAccess.user_id == user_id,
-        UserCaseEffectiveAccess.access_level != CaseAccessLevel.deny_all.value
+        UserCaseEffectiveAccess.user_id == user_id
     )
 
     ucea_count = query.count()
@@ -17,15 +17,17 @@
 #  You should have received a copy of the GNU Lesser General Public License
 #  along with this program; if not, write to the Free Software Foundation,
 #  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+import json
+import threading
+import time
 import traceback
 
-import base64
 import importlib
 from flask_login import current_user
 from packaging import version
-from pickle import dumps
-from pickle import loads
 from sqlalchemy import and_
+from sqlalchemy import inspect
+from sqlalchemy import tuple_
 
 from app import app
 from app import celery
@@ -37,12 +39,17 @@ from app.datamgmt.iris_engine.modules_db import modules_list_pipelines
 from app.models import IrisHook
 from app.models import IrisModule
 from app.models import IrisModuleHook
-from app.util import hmac_sign
-from app.util import hmac_verify
 from iris_interface import IrisInterfaceStatus as IStatus
 
 log = app.logger
 
+# In-process registry of the modules subscribed to each hook, and pool of the modules instances used for the
+# synchronous calls. Both are invalidated when modules are changed, and expire after MODULES_HOOKS_CACHE_TTL seconds
+# so the other processes (web workers, celery) eventually see changes made elsewhere.
+_hooks_registry = {}
+_modules_instances = {}
+_hooks_registry_lock = threading.Lock()
+
 
 def check_module_compatibility(module_version):
     return True
@@ -155,6 +162,79 @@ def check_module_health(module_instance):
         return False, logs
 
 
+def invalidate_modules_hooks_cache():
+    """
+    Drop the hooks registry and the pooled modules instances of the current process.
+    Needs to be called whenever modules or their hooks are added, removed, enabled, disabled or reconfigured.
+    """
+    with _hooks_registry_lock:
+        _hooks_registry.clear()
+        _modules_instances.clear()
+
+
+def _get_hook_subscribers(hook_name: str) -> list:
+    """
+    Get the active modules registered to a hook, from the in-process registry when possible
+    :param hook_name: Name of the hook
+    :raises: Exception if hook name doesn't exist
+    :return: List of (run_asynchronously, module_name, manual_hook_ui_name)
+    """
+    ttl = app.config.get('MODULES_HOOKS_CACHE_TTL')
+    now = time.monotonic()
+
+    if ttl:
+        cached = _hooks_registry.get(hook_name)
+        if cached and cached[0] > now:
+            return cached[1]
+
+    hook = IrisHook.query.filter(IrisHook.hook_name == hook_name).first()
+    if not hook:
+        log.critical(f'Hook name {hook_name} not found')
+        raise Exception(f'Hook name {hook_name} not found')
+
+    modules = IrisModuleHook.query.with_entities(
+        IrisModuleHook.run_asynchronously,
+        IrisModule.module_name,
+        IrisModuleHook.manual_hook_ui_name
+    ).filter(and_(
+        IrisModule.is_active == True,
+        IrisModuleHook.hook_id == hook.id
+    )).join(
+        IrisModule, IrisModuleHook.module_id == IrisModule.id
+    ).all()
+
+    subscribers = [(module.run_asynchronously, module.module_name, module.manual_hook_ui_name) for module in modules]
+
+    if ttl:
+        with _hooks_registry_lock:
+            _hooks_registry[hook_name] = (now + ttl, subscribers)
+
+    return subscribers
+
+
+def _get_module_instance(module_name: str):
+    """
+    Get an instance of a module, reusing the pooled one when possible
+    :param module_name: Name of the module
+    :return: Class instance or None
+    """
+    ttl = app.config.get('MODULES_HOOKS_CACHE_TTL')
+    now = time.monotonic()
+
+    if ttl:
+        cached = _modules_instances.get(module_name)
+        if cached and cached[0] > now:
+            return cached[1]
+
+    mod_inst, _ = instantiate_module_from_name(module_name=module_name)
+
+    if ttl and mod_inst:
+        with _hooks_registry_lock:
+            _modules_instances[module_name] = (now + ttl, mod_inst)
+
+    return mod_inst
+
+
 def instantiate_module_from_name(module_name):
     """
     Instantiate a module from a name. The method is not Exception protected.
@@ -384,6 +464,8 @@ def register_hook(module_id: int, iris_hook_name: str, manual_hook_name: str = N
         except Exception as e:
             return False, [str(e)]
 
+        invalidate_modules_hooks_cache()
+
         return True, [f"Hook {iris_hook_name} registered"]
 
     else:
@@ -410,9 +492,91 @@ def deregister_from_hook(module_id: int, iris_hook_name: str):
             log.info(f'Deregistered module #{module_id} from {iris_hook_name}')
             db.session.delete(hook)
 
+        invalidate_modules_hooks_cache()
+
     return True, ['Hook deregistered']
 
 
+def _get_mapped_classes() -> dict:
+    return {mapper.class_.__name__: mapper.class_ for mapper in db.Model.registry.mappers}
+
+
+def build_hook_task_envelope(data: any) -> dict:
+    """
+    Build the payload of an asynchronous hook task. Database objects are replaced by their type and primary key,
+    so the task doesn't carry whole objects (descriptions, alerts contents, ...) through the broker. Other values
+    are passed as JSON.
+
+    :param data: Data associated with the hook. An object, a value or a list of them
+    :return: Dict envelope, JSON serializable
+    """
+    items = []
+    for element in data if isinstance(data, list) else [data]:
+        state = inspect(element, raiseerr=False)
+
+        if state is not None and getattr(state, 'mapper', None) is not None:
+            if state.identity is None:
+                log.warning(f'Unable to pass a non persisted {type(element).__name__} to an asynchronous hook')
+                continue
+
+            items.append({'model': state.mapper.class_.__name__, 'pk': list(state.identity)})
+
+        else:
+            items.append({'value': json.loads(json.dumps(element, default=str))})
+
+    return {'version': 1, 'items': items}
+
+
+def load_hook_task_envelope(envelope: dict) -> list:
+    """
+    Rebuild the data of an asynchronous hook task, loading the objects with one query per type.
+    Objects deleted in the meantime are dropped.
+
+    :param envelope: Envelope built by build_hook_task_envelope
+    :return: List of objects and values, in the order they were sent
+    """
+    if not isinstance(envelope, dict) or envelope.get('version') != 1:
+        raise Exception('Unable to instantiate target module. Data has not been correctly serialised')
+
+    items = envelope.get('items', [])
+    mapped_classes = _get_mapped_classes()
+
+    pks_by_model = {}
+    for item in items:
+        if 'model' in item:
+            pks_by_model.setdefault(item['model'], []).append(tuple(item['pk']))
+
+    loaded = {}
+    for model_name, pks in pks_by_model.items():
+        model = mapped_classes.get(model_name)
+        if model is None:
+            raise Exception(f'Unknown object type {model_name}')
+
+        pk_columns = inspect(model).primary_key
+        if len(pk_columns) == 1:
+            condition = pk_columns[0].in_([pk[0] for pk in pks])
+        else:
+            condition = tuple_(*pk_columns).in_(pks)
+
+        for obj in model.query.filter(condition).all():
+            loaded[(model_name, tuple(inspect(obj).identity))] = obj
+
+    data = []
+    for item in items:
+        if 'model' not in item:
+            data.append(item['value'])
+            continue
+
+        obj = loaded.get((item['model'], tuple(item['pk'])))
+        if obj is None:
+            log.warning(f'{item["model"]} {item["pk"]} not found, it was probably deleted before the hook ran')
+            continue
+
+        data.append(obj)
+
+    return data
+
+
 @celery.task(bind=True)
 def task_hook_wrapper(self, module_name, hook_name, hook_ui_name, data, init_user, caseid):
     """
@@ -422,48 +586,14 @@ def task_hook_wrapper(self, module_name, hook_name, hook_ui_name, data, init_use
     :param module_name: Module name to instanciate and call
     :param hook_name: Name of the hook which was triggered
     :param hook_ui_name: Name of the UI hook so module knows which hook was called
-    :param data: Data associated to the hook to process
+    :param data: Envelope of the data associated to the hook to process, see build_hook_task_envelope
     :param init_user: User initiating the task
     :param caseid: Case associated
     :return: A task status JSON task_success or task_failure
     """
     try:
-        # Data is serialized, so deserialized
-        signature, pdata = data.encode("utf-8").split(b" ")
-        is_verified = hmac_verify(signature, pdata)
-        if is_verified is False:
-            log.warning("data argument has not been correctly serialised")
-            raise Exception('Unable to instantiate target module. Data has not been correctly serialised')
-
-        deser_data = loads(base64.b64decode(pdata))
-
-    except Exception as e:
-        log.exception(e)
-        raise Exception(e)
-
-    try:
-
-        _obj = None
-        # The received object will most likely be cleared when handled by the task,
-        # so we need to attach it to the session in the task
-        _obj = []
-        if isinstance(deser_data, list):
-            _obj = []
-            for dse_data in deser_data:
-                obj = db.session.merge(dse_data)
-                db.session.commit()
-                _obj.append(obj)
-
-        elif isinstance(deser_data, str) or isinstance(deser_data, int):
-            _obj = [deser_data]
-
-        elif isinstance(deser_data, dict):
-            _obj = [deser_data]
-
-        else:
-            _obj_a = db.session.merge(deser_data)
-            db.session.commit()
-            _obj.append(_obj_a)
+        # The objects are shipped as references, so reload them in the task session
+        _obj = load_hook_task_envelope(data)
 
     except Exception as e:
         log.exception(e)
@@ -492,7 +622,8 @@ def task_hook_wrapper(self, module_name, hook_name, hook_ui_name, data, init_use
     return task_status
 
 
-def call_modules_hook(hook_name: str, data: any, caseid: int = None, hook_ui_name: str = None, module_name: str = None) -> any:
+def call_modules_hook(hook_name: str, data: any, caseid: int = None, hook_ui_name: str = None, module_name: str = None,
+                      init_user: str = None) -> any:
     """
     Calls modules which have registered the specified hook
 
@@ -502,53 +633,31 @@ def call_modules_hook(hook_name: str, data: any, caseid: int = None, hook_ui_nam
     :param data: Data associated with the hook
     :param module_name: Name of the module to call. If None, all modules matching the hook will be called
     :param caseid: Case ID
+    :param init_user: Name of the user initiating the hook. Needed when called outside a request, defaults to the
+                      current user
     :return: Any
     """
-    hook = IrisHook.query.filter(IrisHook.hook_name == hook_name).first()
-    if not hook:
-        log.critical(f'Hook name {hook_name} not found')
-        raise Exception(f'Hook name {hook_name} not found')
-
-    if hook_ui_name:
-        condition = and_(
-            IrisModule.is_active == True,
-            IrisModuleHook.hook_id == hook.id,
-            IrisModuleHook.manual_hook_ui_name == hook_ui_name
-        )
-    else:
-        condition = and_(
-            IrisModule.is_active == True,
-            IrisModuleHook.hook_id == hook.id
-        )
-
-    if module_name:
-        condition = and_(
-            condition,
-            IrisModule.module_name == module_name
-        )
-
-    modules = IrisModuleHook.query.with_entities(
-        IrisModuleHook.run_asynchronously,
-        IrisModule.module_name,
-        IrisModuleHook.manual_hook_ui_name
-    ).filter(condition).join(
-        IrisModule, IrisModuleHook.module_id == IrisModule.id
-    ).all()
-
-    for module in modules:
-        if module.run_asynchronously and "on_preload_" not in hook_name:
-            log.info(f'Calling module {module.module_name} asynchronously for hook {hook_name} :: {hook_ui_name}')
+    modules = [
+        module for module in _get_hook_subscribers(hook_name)
+        if (not hook_ui_name or module[2] == hook_ui_name) and (not module_name or module[1] == module_name)
+    ]
+
+    envelope = None
+    for run_asynchronously, mod_name, manual_hook_ui_name in modules:
+        if run_asynchronously and "on_preload_" not in hook_name:
+            log.info(f'Calling module {mod_name} asynchronously for hook {hook_name} :: {hook_ui_name}')
             # We cannot directly pass the sqlalchemy in data, as it needs to be serializable
-            # So pass a dumped instance and then rebuild on the task side
-            ser_data = base64.b64encode(dumps(data))
-            ser_data_auth = hmac_sign(ser_data) + b" " + ser_data
-            task_hook_wrapper.delay(module_name=module.module_name, hook_name=hook_name,
-                                    hook_ui_name=module.manual_hook_ui_name, data=ser_data_auth.decode("utf8"),
-                                    init_user=current_user.name, caseid=caseid)
+            # So pass references to the objects and reload them on the task side
+            if envelope is None:
+                envelope = build_hook_task_envelope(data)
+
+            task_hook_wrapper.delay(module_name=mod_name, hook_name=hook_name,
+                                    hook_ui_name=manual_hook_ui_name, data=envelope,
+                                    init_user=init_user if init_user else current_user.name, caseid=caseid)
 
         else:
             # Direct call. Should be fast
-            log.info(f'Calling module {module.module_name} for hook {hook_name}')
+            log.info(f'Calling module {mod_name} for hook {hook_name}')
 
             try:
                 was_list = True
@@ -560,11 +669,11 @@ def call_modules_hook(hook_name: str, data: any, caseid: int = None, hook_ui_nam
                 else:
                     data_list = data
 
-                mod_inst, _ = instantiate_module_from_name(module_name=module.module_name)
-                status = mod_inst.hooks_handler(hook_name, module.manual_hook_ui_name, data=data_list)
+                mod_inst = _get_module_instance(module_name=mod_name)
+                status = mod_inst.hooks_handler(hook_name, manual_hook_ui_name, data=data_list)
 
             except Exception as e:
-                log.critical(f"Failed to run hook {hook_name} with module {module.module_name}. Error {str(e)}")
+                log.critical(f"Failed to run hook {hook_name} with module {mod_name}. Error {str(e)}")
                 continue
 
             if status.is_success():
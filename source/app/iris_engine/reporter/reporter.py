@@ -25,6 +25,7 @@
 # CONTENT ------------------------------------------------
 import logging as log
 import os
+from collections import defaultdict
 from datetime import datetime
 
 import jinja2
@@ -42,6 +43,7 @@ from app.datamgmt.activities.activities_db import get_auto_activities
 from app.datamgmt.activities.activities_db import get_manual_activities
 from app.datamgmt.case.case_db import case_get_desc_crc
 from app.datamgmt.reporter.report_db import export_case_json
+from app.datamgmt.reporter.report_db import get_case_assets_iocs
 from app.models import AssetsType
 from app.models import CaseAssets
 from app.models import CaseEventsAssets
@@ -49,7 +51,6 @@ from app.models import CaseReceivedFile
 from app.models import CaseTemplateReport
 from app.models import CasesEvent
 from app.models import Ioc
-from app.models import IocAssetLink
 from app.models import IocLink
 from app.iris_engine.reporter.ImageHandler import ImageHandler
 
@@ -62,11 +63,13 @@ class IrisReportMaker(object):
     IRIS generical report maker
     """
 
-    def __init__(self, tmp_dir, report_id, caseid, safe_mode=False):
+    def __init__(self, tmp_dir, report_id, caseid, safe_mode=False, user_name=None):
         self._tmp = tmp_dir
         self._report_id = report_id
         self._case_info = {}
         self._caseid = caseid
+        # Needed when generated outside a request, defaults to the current user
+        self._user_name = user_name if user_name else current_user.name
         self.safe_mode = safe_mode
 
     def get_case_info(self, doc_type):
@@ -99,7 +102,7 @@ class IrisReportMaker(object):
             'auto_activities': auto_activities,
             'manual_activities': manual_activities,
             'date': datetime.utcnow(),
-            'gen_user': current_user.name,
+            'gen_user': self._user_name,
             'case': {'name': case_info_in['case'].get('name'),
                      'open_date': case_info_in['case'].get('open_date'),
                      'for_customer': case_info_in['case'].get('client').get('customer_name'),
@@ -119,7 +122,7 @@ class IrisReportMaker(object):
 
         # Get customer, user and case title
         case_info['doc_id'] = IrisReportMaker.get_docid()
-        case_info['user'] = current_user.name
+        case_info['user'] = self._user_name
 
         # Set date
         case_info['date'] = datetime.utcnow().strftime("%Y-%m-%d")
@@ -173,28 +176,22 @@ class IrisReportMaker(object):
             CasesEvent.event_date
         ).all()
 
-        cache_id = {}
-        ras = {}
-        tim = []
-        for row in timeline:
-            ras = row
-            setattr(ras, 'asset', None)
-
-            as_list = CaseEventsAssets.query.with_entities(
-                CaseAssets.asset_id,
-                CaseAssets.asset_name,
-                AssetsType.asset_name.label('type')
-            ).filter(
-                CaseEventsAssets.event_id == row.event_id
-            ).join(CaseEventsAssets.asset, CaseAssets.asset_type).all()
-
-            alki = []
-            for asset in as_list:
-                alki.append("{} ({})".format(asset.asset_name, asset.type))
+        events_assets = CaseEventsAssets.query.with_entities(
+            CaseEventsAssets.event_id,
+            CaseAssets.asset_name,
+            AssetsType.asset_name.label('type')
+        ).filter(
+            CaseEventsAssets.case_id == caseid
+        ).join(CaseEventsAssets.asset, CaseAssets.asset_type).all()
 
-            setattr(ras, 'asset', "\r\n".join(alki))
+        assets_by_event = defaultdict(list)
+        for asset in events_assets:
+            assets_by_event[asset.event_id].append("{} ({})".format(asset.asset_name, asset.type))
 
-            tim.append(ras)
+        tim = []
+        for row in timeline:
+            setattr(row, 'asset', "\r\n".join(assets_by_event.get(row.event_id, [])))
+            tim.append(row)
 
         return tim
 
@@ -232,7 +229,7 @@ class IrisReportMaker(object):
             CaseAssets.asset_id,
             CaseAssets.asset_name,
             CaseAssets.asset_description,
-            CaseAssets.asset_compromised.label('compromised'),
+            CaseAssets.asset_compromise_status_id.label('compromise_status'),
             AssetsType.asset_name.label("type"),
             CaseAssets.custom_attributes,
             CaseAssets.asset_tags
@@ -240,26 +237,14 @@ class IrisReportMaker(object):
             CaseAssets.case_id == caseid
         ).join(
             CaseAssets.asset_type
-        ).order_by(desc(CaseAssets.asset_compromised)).all()
+        ).order_by(desc(CaseAssets.asset_compromise_status_id)).all()
+
+        assets_iocs = get_case_assets_iocs(caseid)
 
         for row in res:
             row = row._asdict()
             row['light_asset_description'] = row['asset_description']
-
-            ial = IocAssetLink.query.with_entities(
-                Ioc.ioc_value,
-                Ioc.ioc_type,
-                Ioc.ioc_description
-            ).filter(
-                IocAssetLink.asset_id == row['asset_id']
-            ).join(
-                IocAssetLink.ioc
-            ).all()
-
-            if ial:
-                row['asset_ioc'] = [row._asdict() for row in ial]
-            else:
-                row['asset_ioc'] = []
+            row['asset_ioc'] = assets_iocs.get(row['asset_id'], [])
 
             ret.append(row)
 
@@ -284,11 +269,12 @@ class IrisMakeDocReport(IrisReportMaker):
     Generates a DOCX report for the case
     """
 
-    def __init__(self, tmp_dir, report_id, caseid, safe_mode=False):
+    def __init__(self, tmp_dir, report_id, caseid, safe_mode=False, user_name=None):
         self._tmp = tmp_dir
         self._report_id = report_id
         self._case_info = {}
         self._caseid = caseid
+        self._user_name = user_name if user_name else current_user.name
         self._safe_mode = safe_mode
 
     def generate_doc_report(self, doc_type):
@@ -345,7 +331,7 @@ class IrisMakeDocReport(IrisReportMaker):
             'auto_activities': auto_activities,
             'manual_activities': manual_activities,
             'date': datetime.utcnow(),
-            'gen_user': current_user.name,
+            'gen_user': self._user_name,
             'case': {'name': case_info_in['case'].get('name'),
                      'open_date': case_info_in['case'].get('open_date'),
                      'for_customer': case_info_in['case'].get('for_customer'),
@@ -365,176 +351,25 @@ class IrisMakeDocReport(IrisReportMaker):
 
         # Get customer, user and case title
         case_info['doc_id'] = IrisMakeDocReport.get_docid()
-        case_info['user'] = current_user.name
+        case_info['user'] = self._user_name
 
         # Set date
         case_info['date'] = datetime.utcnow().strftime("%Y-%m-%d")
 
         return case_info
 
-    @staticmethod
-    def get_case_summary(caseid):
-        """
-        Retrieve the case summary from thehive
-        :return:
-        """
-
-        _crc32, descr = case_get_desc_crc(caseid)
-
-        # return IrisMakeDocReport.markdown_to_text(descr)
-        return descr
-
-    @staticmethod
-    def get_case_files(caseid):
-        """
-        Retrieve the list of files with their hashes
-        :return:
-        """
-        files = CaseReceivedFile.query.filter(
-            CaseReceivedFile.case_id == caseid
-        ).with_entities(
-            CaseReceivedFile.filename,
-            CaseReceivedFile.date_added,
-            CaseReceivedFile.file_hash,
-            CaseReceivedFile.custom_attributes
-        ).order_by(
-            CaseReceivedFile.date_added
-        ).all()
-
-        if files:
-            return [row._asdict() for row in files]
-
-        else:
-            return []
-
-    @staticmethod
-    def get_case_timeline(caseid):
-        """
-        Retrieve the case timeline
-        :return:
-        """
-        timeline = CasesEvent.query.filter(
-            CasesEvent.case_id == caseid
-        ).order_by(
-            CasesEvent.event_date
-        ).all()
-
-        cache_id = {}
-        ras = {}
-        tim = []
-        for row in timeline:
-            ras = row
-            setattr(ras, 'asset', None)
-
-            as_list = CaseEventsAssets.query.with_entities(
-                CaseAssets.asset_id,
-                CaseAssets.asset_name,
-                AssetsType.asset_name.label('type')
-            ).filter(
-                CaseEventsAssets.event_id == row.event_id
-            ).join(CaseEventsAssets.asset, CaseAssets.asset_type).all()
-
-            alki = []
-            for asset in as_list:
-                alki.append("{} ({})".format(asset.asset_name, asset.type))
-
-            setattr(ras, 'asset', "\r\n".join(alki))
-
-            tim.append(ras)
-
-        return tim
-
-    @staticmethod
-    def get_case_ioc(caseid):
-        """
-        Retrieve the list of IOC linked to the case
-        :return:
-        """
-        res = IocLink.query.distinct().with_entities(
-            Ioc.ioc_value,
-            Ioc.ioc_type,
-            Ioc.ioc_description,
-            Ioc.ioc_tags,
-            Ioc.custom_attributes
-        ).filter(
-            IocLink.case_id == caseid
-        ).join(IocLink.ioc).order_by(Ioc.ioc_type).all()
-
-        if res:
-            return [row._asdict() for row in res]
-
-        else:
-            return []
-
-    @staticmethod
-    def get_case_assets(caseid):
-        """
-        Retrieve the assets linked ot the case
-        :return:
-        """
-        ret = []
-
-        res = CaseAssets.query.distinct().with_entities(
-            CaseAssets.asset_id,
-            CaseAssets.asset_name,
-            CaseAssets.asset_description,
-            CaseAssets.asset_compromise_status_id.label('compromise_status'),
-            AssetsType.asset_name.label("type"),
-            CaseAssets.custom_attributes,
-            CaseAssets.asset_tags
-        ).filter(
-            CaseAssets.case_id == caseid
-        ).join(
-            CaseAssets.asset_type
-        ).order_by(desc(CaseAssets.asset_compromise_status_id)).all()
-
-        for row in res:
-            row = row._asdict()
-            row['light_asset_description'] = row['asset_description']
-
-            ial = IocAssetLink.query.with_entities(
-                Ioc.ioc_value,
-                Ioc.ioc_type,
-                Ioc.ioc_description
-            ).filter(
-                IocAssetLink.asset_id == row['asset_id']
-            ).join(
-                IocAssetLink.ioc
-            ).all()
-
-            if ial:
-                row['asset_ioc'] = [row._asdict() for row in ial]
-            else:
-                row['asset_ioc'] = []
-
-            ret.append(row)
-
-        return ret
-
-    @staticmethod
-    def get_docid():
-        return "{}".format(
-            datetime.utcnow().strftime("%y%m%d_%H%M"))
-
-    @staticmethod
-    def markdown_to_text(markdown_string):
-        """
-        Converts a markdown string to plaintext
-        """
-        return markdown_string.replace('\n', '</w:t></w:r><w:r/></w:p><w:p><w:r><w:t xml:space="preserve">').replace(
-            '#', '')
-
 
 class IrisMakeMdReport(IrisReportMaker):
     """
     Generates a MD report for the case
     """
 
-    def __init__(self, tmp_dir, report_id, caseid, safe_mode=False):
+    def __init__(self, tmp_dir, report_id, caseid, safe_mode=False, user_name=None):
         self._tmp = tmp_dir
         self._report_id = report_id
         self._case_info = {}
         self._caseid = caseid
+        self._user_name = user_name if user_name else current_user.name
         self.safe_mode = safe_mode
 
     def generate_md_report(self, doc_type):
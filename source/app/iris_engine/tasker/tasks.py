@@ -17,16 +17,32 @@
 #  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 # IMPORTS ------------------------------------------------
+import logging
 import os
 import urllib.parse
+from celery.schedules import crontab
 from celery.signals import task_prerun
 from flask_login import current_user
 
 from app import app
+from app import celery
 from app import db
+from app.business.datastore_uploads import archive_uploaded_file
+from app.business.errors import BusinessProcessingError
+from app.business.events_import import import_events_file
+from app.business.reports import generate_report
+from app.datamgmt.activities.activities_db import prune_user_activities
+from app.datamgmt.alerts.alerts_db import cache_similar_alerts_from_alerts
+from app.datamgmt.alerts.alerts_db import get_alerts_by_ids
+from app.datamgmt.alerts.alerts_db import prune_similar_alerts_cache
 from app.datamgmt.case.case_db import get_case
+from app.iris_engine.access_control.utils import ac_recompute_all_users_effective_ac
+from app.iris_engine.module_handler.module_handler import call_modules_hook
 from app.iris_engine.module_handler.module_handler import pipeline_dispatcher
+from app.iris_engine.reporter.reporter import QueuingHandler
 from app.iris_engine.utils.common import build_upload_path
+from app.iris_engine.utils.tracker import batch_activities
+from app.iris_engine.utils.tracker import record_activities
 from app.iris_engine.utils.tracker import track_activity
 from iris_interface import IrisInterfaceStatus as IStatus
 from iris_interface.IrisModuleInterface import IrisPipelineTypes
@@ -40,6 +56,16 @@ def on_task_init(*args, **kwargs):
     db.engine.dispose()
 
 
+def is_task_of(task, caseid, user_id):
+    """
+    Tell whether a task was queued in a case by a user, from the arguments stored along with its result
+    (result_extended). The arguments are only stored once a worker picked the task, before that it is pending and
+    nothing but its state can be read.
+    """
+    task_kwargs = task.kwargs or {}
+    return task_kwargs.get('caseid') == caseid and task_kwargs.get('user_id') == user_id
+
+
 def task_case_update(module, pipeline, pipeline_args, caseid):
     """
     Update the current case of the current user with fresh data.
@@ -98,3 +124,196 @@ def chunks(lst, n):
     """Yield successive n-sized chunks from lst."""
     for i in range(0, len(lst), n):
         yield lst[i:i + n]
+
+
+def alerts_post_process(alert_ids, init_user, user_id):
+    """
+    Run the processing following the creation of alerts: population of the similar alerts cache,
+    on_postload_alert_create hooks and activity tracking. The alerts are handled by chunks so
+    modules are called with lists of alerts rather than once per alert.
+
+    :param alert_ids: IDs of the alerts to process
+    :param init_user: Name of the user who created the alerts
+    :param user_id: ID of the user who created the alerts
+    :return: IrisInterfaceStatus
+    """
+    processed = 0
+    with batch_activities():
+        for alert_ids_chunk in chunks(alert_ids, app.config.get('ALERTS_POST_PROCESSING_CHUNK_SIZE')):
+            alerts = get_alerts_by_ids(alert_ids_chunk)
+            if not alerts:
+                continue
+
+            cache_similar_alerts_from_alerts(alerts)
+
+            call_modules_hook('on_postload_alert_create', data=alerts, init_user=init_user)
+
+            if len(alerts) == 1:
+                track_activity(f"created alert #{alerts[0].alert_id} - {alerts[0].alert_title}", ctx_less=True,
+                               user_id=user_id)
+            else:
+                track_activity(f"created alerts #{','.join(str(alert.alert_id) for alert in alerts)}",
+                               ctx_less=True, user_id=user_id)
+
+            processed += len(alerts)
+
+    return IStatus.I2Success(f'{processed} alerts post-processed')
+
+
+@celery.task(bind=True)
+def task_alerts_post_process(self, alert_ids, init_user, user_id):
+    """
+    Celery wrapper around alerts_post_process, so that alerts creation requests only need to persist the alerts
+    """
+    return alerts_post_process(alert_ids, init_user, user_id)
+
+
+def dispatch_alerts_post_process(alert_ids, init_user, user_id):
+    """
+    Queue the post-processing of newly created alerts. If the broker can't be reached, the processing is done
+    synchronously so the alerts are not left half processed.
+
+    :return: True if the processing was queued, False if it was done synchronously
+    """
+    try:
+        task_alerts_post_process.delay(alert_ids=alert_ids, init_user=init_user, user_id=user_id)
+        return True
+
+    except Exception as e:
+        app.logger.warning(f'Unable to queue the alerts post-processing, running it synchronously: {e}')
+
+    alerts_post_process(alert_ids, init_user, user_id)
+    return False
+
+
+@celery.task
+def task_prune_similar_alerts_cache():
+    """
+    Drop the similar alerts cache entries older than ALERTS_CORRELATION_RETENTION_DAYS
+    """
+    retention_days = app.config.get('ALERTS_CORRELATION_RETENTION_DAYS')
+    if not retention_days:
+        return IStatus.I2Success('Similar alerts cache retention disabled')
+
+    deleted = prune_similar_alerts_cache(retention_days)
+    app.logger.info(f'Cron - Pruned {deleted} similar alerts cache entries older than {retention_days} days')
+
+    return IStatus.I2Success(f'{deleted} similar alerts cache entries pruned')
+
+
+@celery.on_after_finalize.connect
+def setup_periodic_similar_alerts_cache_pruning(self, **kwargs):
+    if app.config.get('ALERTS_CORRELATION_RETENTION_DAYS'):
+        self.add_periodic_task(
+            crontab(hour=1, minute=0),
+            task_prune_similar_alerts_cache.s(),
+            name='iris_prune_similar_alerts_cache'
+        )
+
+
+@celery.task
+def task_prune_user_activities():
+    """
+    Drop the user activities older than ACTIVITY_RETENTION_DAYS
+    """
+    retention_days = app.config.get('ACTIVITY_RETENTION_DAYS')
+    if not retention_days:
+        return IStatus.I2Success('User activities retention disabled')
+
+    deleted = prune_user_activities(retention_days)
+    app.logger.info(f'Cron - Pruned {deleted} user activities older than {retention_days} days')
+
+    return IStatus.I2Success(f'{deleted} user activities pruned')
+
+
+@celery.on_after_finalize.connect
+def setup_periodic_user_activities_pruning(self, **kwargs):
+    if app.config.get('ACTIVITY_RETENTION_DAYS'):
+        self.add_periodic_task(
+            crontab(hour=1, minute=30),
+            task_prune_user_activities.s(),
+            name='iris_prune_user_activities'
+        )
+
+
+@celery.task(bind=True)
+def task_recompute_all_users_effective_access(self):
+    """
+    Recompute the effective access of all users, reporting the number of users processed as progress
+    """
+    def report_progress(processed, total):
+        self.update_state(state='PROGRESS', meta={'processed': processed, 'total': total})
+
+    ac_recompute_all_users_effective_ac(progress_callback=report_progress)
+
+    return IStatus.I2Success('Effective access of all users recomputed')
+
+
+@celery.task(bind=True)
+def task_import_events(self, file_path, caseid, user_id, file_format, options):
+    """
+    Import a timeline file uploaded in a case, reporting the number of records processed as progress. The uploaded
+    file is removed once imported
+    """
+    def report_progress(processed, total):
+        self.update_state(state='PROGRESS', meta={'processed': processed, 'total': total})
+
+    try:
+        imported = import_events_file(file_path, caseid, user_id, file_format=file_format, options=options,
+                                      progress_callback=report_progress)
+
+    except BusinessProcessingError as e:
+        return IStatus.I2Error(message=e.get_message(), logs=[str(e.get_data())], caseid=caseid)
+
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+    return IStatus.I2Success(f'{imported} events imported')
+
+
+@celery.task(bind=True)
+def task_generate_report(self, caseid, report_id, doc_type, safe_mode, user_id):
+    """
+    Generate a case report and store it as an artifact. The generation logs are reported as progress
+    """
+    handler = QueuingHandler(task_self=self, message_queue=[])
+    handler.setLevel(logging.INFO)
+    logger = logging.getLogger()
+    logger.addHandler(handler)
+
+    try:
+        token = generate_report(caseid, report_id, doc_type, safe_mode, user_id)
+
+    except BusinessProcessingError as e:
+        return IStatus.I2Error(message=e.get_message(), logs=handler.message_queue + [str(e.get_data())],
+                               caseid=caseid)
+
+    finally:
+        logger.removeHandler(handler)
+
+    return IStatus.I2Success(message='Report generated', data={'artifact': token})
+
+
+@celery.task(bind=True)
+def task_archive_datastore_file(self, file_id, caseid, file_path):
+    """
+    Encrypt a file uploaded in the datastore in its archive
+    """
+    try:
+        archive_uploaded_file(file_id, caseid, file_path)
+
+    except BusinessProcessingError as e:
+        return IStatus.I2Error(message=e.get_message(), logs=[str(e.get_data())], caseid=caseid)
+
+    return IStatus.I2Success('File archived')
+
+
+@celery.task(bind=True)
+def task_record_activities(self, records):
+    """
+    Write user activities the web process could not write in time
+    """
+    record_activities(records)
+
+    return IStatus.I2Success(f'{len(records)} activities recorded')
@@ -17,9 +17,19 @@
 #  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 # IMPORTS ------------------------------------------------
+import atexit
+import os
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+from flask import g
+from flask import has_app_context
+from flask import has_request_context
 from flask import request
 from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy import insert
 
 import app
 from app import db
@@ -27,19 +37,162 @@ from app.models import UserActivity
 
 log = app.app.logger
 
+# Activity tracking modes:
+#  - sync: each activity is committed when tracked, in the order of the actions. For strict audit trails
+#  - buffered: the activities of a request are written at its end with a single insert
+#  - async: the activities of a request are queued at its end and written by a background thread of the process
+ACTIVITY_TRACKING_MODES = ['sync', 'buffered', 'async']
+
+# Activity kinds:
+#  - case: an action on the case the activity is bound to, reported in its activities
+#  - global: an action outside of any case, or done from a case without being about it, e.g. on a global task
+ACTIVITY_KINDS = ['case', 'global']
+
+# Maximum number of activities written by a single insert of the background writer
+_WRITER_BATCH_SIZE = 1000
+
+_activities_queue = None
+_activities_writer_pid = None
+_activities_writer_lock = threading.Lock()
+
 
 # CONTENT ------------------------------------------------
-def track_activity(message, caseid=None, ctx_less=False, user_input=False, display_in_ui=True):
+def _get_tracking_mode():
+    mode = app.app.config.get('ACTIVITY_TRACKING_MODE', 'buffered')
+    return mode if mode in ACTIVITY_TRACKING_MODES else 'buffered'
+
+
+def _session_has_writes():
+    return bool(db.session.info.get('has_writes') or db.session.new or db.session.dirty or db.session.deleted)
+
+
+def _insert_activities(records):
+    if not records:
+        return
+
+    # Own transaction, so the activities never commit nor roll back the work of the caller
+    with db.engine.begin() as connection:
+        connection.execute(insert(UserActivity), records)
+
+
+def _record_activities_in_worker(records):
+    from app.iris_engine.tasker.tasks import task_record_activities
+
+    try:
+        task_record_activities.delay([dict(record, activity_date=record['activity_date'].isoformat())
+                                      for record in records])
+
+    except Exception as e:
+        log.warning(f'Unable to queue {len(records)} activities to the worker, writing them now: {e}')
+        _insert_activities(records)
+
+
+def _write_queued_activities(flask_app):
+    while True:
+        records = list(_activities_queue.get())
+
+        # Whatever else is already queued goes in the same insert
+        while len(records) < _WRITER_BATCH_SIZE:
+            try:
+                records.extend(_activities_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        try:
+            with flask_app.app_context():
+                _insert_activities(records)
+
+        except Exception as e:
+            log.exception(f'Unable to write {len(records)} activities: {e}')
+
+
+def _drain_queued_activities():
+    records = []
+    while _activities_queue is not None:
+        try:
+            records.extend(_activities_queue.get_nowait())
+        except queue.Empty:
+            break
+
+    if records:
+        with app.app.app_context():
+            _insert_activities(records)
+
+
+def _enqueue_activities(records):
+    global _activities_queue, _activities_writer_pid
+
+    with _activities_writer_lock:
+        # Started lazily, and again in forked processes which do not inherit the thread
+        if _activities_writer_pid != os.getpid():
+            _activities_queue = queue.Queue(maxsize=app.app.config.get('ACTIVITY_QUEUE_SIZE', 1000))
+            threading.Thread(target=_write_queued_activities, args=(app.app,), daemon=True,
+                             name='iris-activities-writer').start()
+            _activities_writer_pid = os.getpid()
+
+    try:
+        _activities_queue.put_nowait(records)
+
+    except queue.Full:
+        # The database does not keep up, the worker takes over rather than slowing down the requests
+        _record_activities_in_worker(records)
+
+
+def flush_activities(records):
+    """
+    Write tracked activities according to the tracking mode
+    """
+    if not records:
+        return
+
+    if _get_tracking_mode() == 'async':
+        _enqueue_activities(records)
+    else:
+        _insert_activities(records)
+
+
+def record_activities(records):
+    """
+    Write activities sent to the worker, when the background writer of a process could not keep up
+    """
+    _insert_activities([dict(record, activity_date=datetime.fromisoformat(record['activity_date']))
+                        for record in records])
+
+
+@contextmanager
+def batch_activities():
+    """
+    Buffer the activities tracked in the block and write them at its end with a single insert. Requests are already
+    buffered, this is meant for loops running outside of them, such as the worker tasks.
+    """
+    if not has_app_context() or g.get('activities_buffer') is not None or _get_tracking_mode() == 'sync':
+        yield
+        return
+
+    g.activities_buffer = []
+    try:
+        yield
+    finally:
+        flush_activities(g.pop('activities_buffer', None))
+
+
+def track_activity(message, caseid=None, ctx_less=False, user_input=False, display_in_ui=True, user_id=None,
+                   kind=None):
     """
     Register a user activity in DB.
+    The activity is written according to the ACTIVITY_TRACKING_MODE, and at the latest at the end of the request.
+    Pending changes of the caller are committed, as callers rely on it.
     :param message: Message to save as activity
-    :return: Nothing
+    :param user_id: ID of the user who did the action. Needed when called outside a request, defaults to the
+                    current user
+    :param kind: One of ACTIVITY_KINDS, defaults to case for the activities bound to a case and global otherwise
+    :return: The activity
     """
     ua = UserActivity()
 
     try:
 
-        ua.user_id = current_user.id
+        ua.user_id = user_id if user_id is not None else current_user.id
 
     except:
         pass
@@ -51,9 +204,12 @@ def track_activity(message, caseid=None, ctx_less=False, user_input=False, displ
 
     ua.activity_date = datetime.utcnow()
     ua.activity_desc = message.capitalize()
+    ua.activity_kind = kind if kind is not None else ('case' if ua.case_id is not None else 'global')
 
-    if current_user.is_authenticated:
+    if current_user and current_user.is_authenticated:
         log.info(f"{current_user.user} [#{current_user.id}] :: Case {caseid} :: {ua.activity_desc}")
+    elif ua.user_id is not None:
+        log.info(f"User [#{ua.user_id}] :: Case {caseid} :: {ua.activity_desc}")
     else:
         log.info(f"Anonymous :: Case {caseid} :: {ua.activity_desc}")
 
@@ -62,7 +218,70 @@ def track_activity(message, caseid=None, ctx_less=False, user_input=False, displ
 
     ua.is_from_api = (request.cookies.get('session') is None if request else False)
 
-    db.session.add(ua)
-    db.session.commit()
+    # Activities entered by users are their content and not a trace of an action, they are saved right away
+    if _get_tracking_mode() == 'sync' or user_input:
+        db.session.add(ua)
+        db.session.commit()
+
+        return ua
+
+    if _session_has_writes():
+        db.session.commit()
+
+    record = {
+        'user_id': ua.user_id,
+        'case_id': ua.case_id,
+        'activity_date': ua.activity_date,
+        'activity_desc': ua.activity_desc,
+        'activity_kind': ua.activity_kind,
+        'user_input': ua.user_input,
+        'is_from_api': ua.is_from_api,
+        'display_in_ui': ua.display_in_ui
+    }
+
+    if has_request_context():
+        g.setdefault('activities_buffer', []).append(record)
+
+    elif has_app_context() and g.get('activities_buffer') is not None:
+        g.activities_buffer.append(record)
+
+    else:
+        flush_activities([record])
 
     return ua
+
+
+def _flush_request_activities(exception=None):
+    try:
+        flush_activities(g.pop('activities_buffer', None))
+
+    except Exception as e:
+        log.exception(f'Unable to write the activities of the request: {e}')
+
+
+def _mark_session_writes(session, *args):
+    session.info['has_writes'] = True
+
+
+def _mark_session_executed_writes(orm_execute_state):
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info['has_writes'] = True
+
+
+def _clear_session_writes(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('has_writes', None)
+
+
+def init_activity_tracking(flask_app):
+    """
+    Write the activities buffered by the requests at their end, and keep track of the uncommitted writes of the
+    sessions, which track_activity commits
+    """
+    flask_app.teardown_request(_flush_request_activities)
+
+    event.listen(db.session, 'after_flush', _mark_session_writes)
+    event.listen(db.session, 'do_orm_execute', _mark_session_executed_writes)
+    event.listen(db.session, 'after_transaction_end', _clear_session_writes)
+
+    atexit.register(_drain_queued_activities)
@@ -6,6 +6,7 @@ from sqlalchemy import BigInteger, Table, Boolean
 from sqlalchemy import Column
 from sqlalchemy import DateTime
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
 from sqlalchemy import Integer
 from sqlalchemy import Text
 from sqlalchemy import text
@@ -26,6 +27,9 @@ class AlertCaseAssociation(db.Model):
 
 class Alert(db.Model):
     __tablename__ = 'alerts'
+    __table_args__ = (
+        Index('ix_alerts_source_event_time_alert_id', 'alert_source_event_time', 'alert_id'),
+    )
 
     alert_id = Column(BigInteger, primary_key=True)
     alert_uuid = Column(UUID(as_uuid=True), default=uuid.uuid4, nullable=False,
@@ -89,6 +93,10 @@ class AlertResolutionStatus(db.Model):
 
 class SimilarAlertsCache(db.Model):
     __tablename__ = 'similar_alerts_cache'
+    __table_args__ = (
+        Index('ix_similar_alerts_cache_customer_key_created', 'customer_id', 'key_hash', 'created_at'),
+        Index('ix_similar_alerts_cache_alert_id', 'alert_id'),
+    )
 
     id = Column(BigInteger, primary_key=True)
     customer_id = Column(BigInteger, ForeignKey('client.client_id'), nullable=False)
@@ -96,6 +104,7 @@ class SimilarAlertsCache(db.Model):
     ioc_value = Column(Text, nullable=True)
     alert_id = Column(BigInteger, ForeignKey('alerts.alert_id'), nullable=False)
     created_at = Column(DateTime, nullable=False, server_default=text("now()"))
+    key_hash = Column(BigInteger, nullable=True)
 
     asset_type_id = Column(Integer, ForeignKey('assets_type.asset_id'), nullable=True)
     ioc_type_id = Column(Integer, ForeignKey('ioc_type.type_id'), nullable=True)
@@ -106,7 +115,7 @@ class SimilarAlertsCache(db.Model):
     ioc_type = relationship('IocType')
 
     def __init__(self, customer_id, alert_id, asset_name=None, ioc_value=None, asset_type_id=None, ioc_type_id=None,
-                 created_at=None):
+                 created_at=None, key_hash=None):
         self.customer_id = customer_id
         self.asset_name = asset_name
         self.ioc_value = ioc_value
@@ -114,3 +123,4 @@ class SimilarAlertsCache(db.Model):
         self.asset_type_id = asset_type_id
         self.ioc_type_id = ioc_type_id
         self.created_at = created_at if created_at else datetime.utcnow()
+        self.key_hash = key_hash
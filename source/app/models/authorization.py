@@ -7,6 +7,7 @@ from sqlalchemy import BigInteger, JSON
 from sqlalchemy import Boolean
 from sqlalchemy import Column
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
 from sqlalchemy import Integer
 from sqlalchemy import String
 from sqlalchemy import Text
@@ -125,6 +126,9 @@ class UserCaseAccess(db.Model):
 
 class UserCaseEffectiveAccess(db.Model):
     __tablename__ = "user_case_effective_access"
+    __table_args__ = (
+        Index('uq_user_case_effective_access_user_case', 'user_id', 'case_id', unique=True),
+    )
 
     id = Column(BigInteger, primary_key=True, nullable=False)
     user_id = Column(BigInteger, ForeignKey('user.id'), nullable=False)
@@ -134,8 +138,6 @@ class UserCaseEffectiveAccess(db.Model):
     user = relationship('User')
     case = relationship('Cases')
 
-    UniqueConstraint('case_id', 'user_id')
-
 
 class UserOrganisation(db.Model):
     __tablename__ = "user_organisation"
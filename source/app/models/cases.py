@@ -26,6 +26,7 @@ from sqlalchemy import Column
 from sqlalchemy import Date
 from sqlalchemy import DateTime
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
 from sqlalchemy import Integer
 from sqlalchemy import String
 from sqlalchemy import Text
@@ -190,6 +191,8 @@ class CasesEvent(db.Model):
     event_date_wtz = Column(DateTime)
     event_is_flagged = Column(Boolean, default=False)
     custom_attributes = Column(JSONB)
+    # event_search_vector is a generated column maintained by PostgreSQL for the timeline full-text search. It is
+    # deliberately not mapped, see timeline_search_vector in case_events_db
 
     case = relationship('Cases')
     user = relationship('User')
@@ -201,6 +204,7 @@ class CasesEvent(db.Model):
 
     __table_args__ = (
         CheckConstraint('event_id != parent_event_id', name='check_different_ids'),
+        Index('ix_cases_events_case_id_event_date_event_id', 'case_id', 'event_date', 'event_id'),
     )
 
 
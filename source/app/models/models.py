@@ -24,8 +24,10 @@ import uuid
 from sqlalchemy import BigInteger, UniqueConstraint, Table
 from sqlalchemy import Boolean
 from sqlalchemy import Column
+from sqlalchemy import Computed
 from sqlalchemy import DateTime
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
 from sqlalchemy import Integer
 from sqlalchemy import LargeBinary
 from sqlalchemy import Sequence
@@ -35,8 +37,10 @@ from sqlalchemy import Text
 from sqlalchemy import create_engine
 from sqlalchemy import text
 from sqlalchemy.dialects.postgresql import JSON, JSONB
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import deferred
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.sql import func
@@ -170,6 +174,10 @@ alert_iocs_association = Table(
 
 class CaseAssets(db.Model):
     __tablename__ = 'case_assets'
+    __table_args__ = (
+        Index('ix_case_assets_case_id', 'case_id'),
+        Index('ix_case_assets_asset_name_asset_type_id', 'asset_name', 'asset_type_id'),
+    )
 
     asset_id = Column(BigInteger, primary_key=True)
     asset_uuid = Column(UUID(as_uuid=True), server_default=text("gen_random_uuid()"), nullable=False)
@@ -448,6 +456,10 @@ class DataStorePath(db.Model):
 
 class DataStoreFile(db.Model):
     __tablename__ = 'data_store_file'
+    __table_args__ = (
+        Index('ix_data_store_file_file_sha256', 'file_sha256'),
+        Index('ix_data_store_file_file_local_name', 'file_local_name'),
+    )
 
     file_id = Column(BigInteger, primary_key=True)
     file_uuid = Column(UUID(as_uuid=True), default=uuid.uuid4, server_default=text("gen_random_uuid()"), nullable=False)
@@ -471,6 +483,22 @@ class DataStoreFile(db.Model):
     data_parent = relationship('DataStorePath')
 
 
+class DataStoreBlob(db.Model):
+    """
+    Content stored once in the datastore and shared by the files with the same content, whatever their case. The
+    files point to the blob through their local name, the blob is removed when its last file is.
+    """
+    __tablename__ = 'data_store_blob'
+
+    blob_id = Column(BigInteger, primary_key=True)
+    blob_key = Column(Text, nullable=False, unique=True)
+    blob_sha256 = Column(Text, nullable=False, index=True)
+    blob_local_name = Column(Text, nullable=False, unique=True)
+    blob_size = Column(BigInteger)
+    blob_ref_count = Column(BigInteger, nullable=False, default=0)
+    blob_date_added = Column(DateTime)
+
+
 class IocType(db.Model):
     __tablename__ = 'ioc_type'
 
@@ -484,6 +512,10 @@ class IocType(db.Model):
 
 class IocLink(db.Model):
     __tablename__ = 'ioc_link'
+    __table_args__ = (
+        Index('ix_ioc_link_ioc_id_case_id', 'ioc_id', 'case_id'),
+        Index('ix_ioc_link_case_id', 'case_id'),
+    )
 
     ioc_link_id = Column(Integer, primary_key=True)
     ioc_id = Column(ForeignKey('ioc.ioc_id'))
@@ -493,6 +525,37 @@ class IocLink(db.Model):
     case = relationship('Cases')
 
 
+class ObservableIndex(db.Model):
+    """
+    Index of the IOCs and assets of all the cases, to pivot on an observable across cases. There is one entry per
+    observable and case, maintained along with the IOC links and the assets. The key hash is the one of the similar
+    alerts cache, so the cases and the alerts sharing an observable are found with the same key.
+    """
+    __tablename__ = 'observable_index'
+    __table_args__ = (
+        UniqueConstraint('observable_kind', 'object_id', 'case_id', name='uq_observable_index_kind_object_case'),
+        Index('ix_observable_index_key_hash_customer_id', 'key_hash', 'customer_id'),
+        Index('ix_observable_index_normalized_value', 'normalized_value',
+              postgresql_ops={'normalized_value': 'text_pattern_ops'}),
+        Index('ix_observable_index_case_id', 'case_id'),
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    observable_kind = Column(Text, nullable=False)
+    object_id = Column(BigInteger, nullable=False)
+    type_id = Column(Integer)
+    value = Column(Text)
+    normalized_value = Column(Text)
+    key_hash = Column(BigInteger, nullable=False)
+    customer_id = Column(ForeignKey('client.client_id'), nullable=False)
+    case_id = Column(ForeignKey('cases.case_id'), nullable=False)
+    first_seen = Column(DateTime, nullable=False)
+    last_seen = Column(DateTime, nullable=False)
+
+    case = relationship('Cases')
+    customer = relationship('Client')
+
+
 class IocAssetLink(db.Model):
     __tablename__ = 'ioc_asset_link'
 
@@ -525,6 +588,9 @@ class CasesAssetsExt(db.Model):
 
 class Notes(db.Model):
     __tablename__ = 'notes'
+    __table_args__ = (
+        Index('ix_notes_note_search_vector', 'note_search_vector', postgresql_using='gin'),
+    )
 
     note_id = Column(BigInteger, primary_key=True)
     note_uuid = Column(UUID(as_uuid=True), default=uuid.uuid4, server_default=text("gen_random_uuid()"), nullable=False)
@@ -537,6 +603,10 @@ class Notes(db.Model):
     custom_attributes = Column(JSON)
     directory_id = Column(ForeignKey('note_directory.id'), nullable=True)
     modification_history = Column(JSON)
+    # Maintained by the database for the global search, only loaded on access
+    note_search_vector = deferred(Column(TSVECTOR, Computed(
+        "to_tsvector('simple'::regconfig, coalesce(note_title, '') || ' ' || coalesce(note_content, ''))",
+        persisted=True)))
 
     user = relationship('User')
     case = relationship('Cases')
@@ -738,12 +808,17 @@ class GlobalTasks(db.Model):
 
 class UserActivity(db.Model):
     __tablename__ = "user_activity"
+    __table_args__ = (
+        Index('ix_user_activity_case_id_activity_date', 'case_id', 'activity_date'),
+        Index('ix_user_activity_activity_date', 'activity_date'),
+    )
 
     id = Column(BigInteger, primary_key=True)
     user_id = Column(ForeignKey('user.id'), nullable=True)
     case_id = Column(ForeignKey('cases.case_id'), nullable=True)
     activity_date = Column(DateTime)
     activity_desc = Column(Text)
+    activity_kind = Column(Text, nullable=False, server_default=text("'case'"))
     user_input = Column(Boolean, default=False)
     is_from_api = Column(Boolean, default=False)
     display_in_ui = Column(Boolean, default=True)
@@ -772,6 +847,9 @@ class ServerSettings(db.Model):
 
 class Comments(db.Model):
     __tablename__ = "comments"
+    __table_args__ = (
+        Index('ix_comments_comment_search_vector', 'comment_search_vector', postgresql_using='gin'),
+    )
 
     comment_id = Column(BigInteger, primary_key=True)
     comment_uuid = Column(UUID(as_uuid=True), default=uuid.uuid4, server_default=text("gen_random_uuid()"),
@@ -782,6 +860,9 @@ class Comments(db.Model):
     comment_user_id = Column(ForeignKey('user.id'))
     comment_case_id = Column(ForeignKey('cases.case_id'))
     comment_alert_id = Column(ForeignKey('alerts.alert_id'))
+    # Maintained by the database for the global search, only loaded on access
+    comment_search_vector = deferred(Column(TSVECTOR, Computed(
+        "to_tsvector('simple'::regconfig, coalesce(comment_text, ''))", persisted=True)))
 
     user = relationship('User')
     case = relationship('Cases')
@@ -20,12 +20,9 @@ import dateutil.parser
 import marshmallow
 import os
 import psycopg2
-import pyminizip
 import random
 import re
-import shutil
 import string
-import tempfile
 from flask_login import current_user
 from marshmallow import ValidationError, EXCLUDE
 from marshmallow import fields
@@ -43,8 +40,10 @@ from app import app
 from app import db
 from app import ma
 from app.datamgmt.datastore.datastore_db import datastore_get_standard_path
+from app.datamgmt.datastore.datastore_db import datastore_store_blob
 from app.datamgmt.manage.manage_attribute_db import merge_custom_attributes
 from app.datamgmt.manage.manage_tags_db import add_db_tag
+from app.datamgmt.states import update_datastore_state
 from app.iris_engine.access_control.utils import ac_mask_from_val_list
 from app.models import AnalysisStatus, CaseClassification, SavedFilter, DataStorePath, IrisModuleHook, Tags, \
     ReviewStatus, EvidenceTypes, CaseStatus, NoteDirectory, NoteRevisions
@@ -73,11 +72,13 @@ from app.models.authorization import Group
 from app.models.authorization import Organisation
 from app.models.authorization import User
 from app.models.cases import CaseState, CaseProtagonist
-from app.util import file_sha256sum, str_to_bool, assert_type_mml
+from app.util import str_to_bool, assert_type_mml
+from app.util import save_stream_sha256sum
 from app.util import stream_sha256sum
 
 ALLOWED_EXTENSIONS = {'png', 'svg'}
 POSTGRES_INT_MAX = 2147483647
+EVENT_COLORS = ['#fff', '#1572E899', '#6861CE99', '#48ABF799', '#31CE3699', '#F2596199', '#FFAD4699']
 POSTGRES_BIGINT_MAX = 9223372036854775807
 
 log = app.logger
@@ -388,6 +389,7 @@ class CommentSchema(ma.SQLAlchemyAutoSchema):
         model = Comments
         load_instance = True
         include_fk = True
+        exclude = ['comment_search_vector']
         unknown = EXCLUDE
 
 
@@ -416,6 +418,7 @@ class CaseNoteSchema(ma.SQLAlchemyAutoSchema):
         model = Notes
         load_instance = True
         include_fk = True
+        exclude = ['note_search_vector']
         unknown = EXCLUDE
 
     def verify_directory_id(self, data: Dict[str, Any], **kwargs: Any) -> Dict[str, Any]:
@@ -1171,8 +1174,7 @@ class EventSchema(ma.SQLAlchemyAutoSchema):
             if not ast:
                 raise marshmallow.exceptions.ValidationError("Invalid IOC ID", field_name="event_assets")
 
-        if data.get('event_color') and data.get('event_color') not in ['#fff', '#1572E899', '#6861CE99', '#48ABF799',
-                                                                       '#31CE3699', '#F2596199', '#FFAD4699']:
+        if data.get('event_color') and data.get('event_color') not in EVENT_COLORS:
             data['event_color'] = ''
 
         if data.get('event_tags'):
@@ -1267,7 +1269,11 @@ class DSFileSchema(ma.SQLAlchemyAutoSchema):
             filename = filename.rstrip().replace('\t', '').replace('\n', '').replace('\r', '')
             file_hash = stream_sha256sum(file_content)
 
-            dsf = DataStoreFile.query.filter(DataStoreFile.file_sha256 == file_hash).first()
+            dsf = DataStoreFile.query.filter(
+                DataStoreFile.file_sha256 == file_hash,
+                DataStoreFile.file_case_id == cid,
+                DataStoreFile.file_password == ''
+            ).first()
             if dsf:
                 exists = True
 
@@ -1289,12 +1295,15 @@ class DSFileSchema(ma.SQLAlchemyAutoSchema):
                 db.session.add(dsf)
                 db.session.commit()
 
-                dsf.file_local_name = datastore_get_standard_path(dsf, cid).as_posix()
-                db.session.commit()
-
-                with open(dsf.file_local_name, 'wb') as fout:
+                location = datastore_get_standard_path(dsf, cid)
+                with open(location, 'wb') as fout:
                     fout.write(file_content)
 
+                dsf.file_size = len(file_content)
+                dsf.file_local_name = datastore_store_blob(location, file_hash, dsf.file_size)
+                update_datastore_state(cid)
+                db.session.commit()
+
                 exists = False
 
         except Exception as e:
@@ -1312,8 +1321,8 @@ class DSFileSchema(ma.SQLAlchemyAutoSchema):
         """Stores a file in the data store.
 
         This method stores a file in the data store. If the file is an IOC and no password is provided, it uses a default
-        password. If a password is provided, it encrypts the file with the password. It returns the path, size, and hash
-        of the stored file.
+        password. If a password is provided, it encrypts the file with the password. Files with the same content, and
+        password if any, share the same blob of the datastore. It returns the path, size, and hash of the stored file.
 
         Args:
             file_storage: The file to store.
@@ -1345,38 +1354,20 @@ class DSFileSchema(ma.SQLAlchemyAutoSchema):
             elif password:
                 passwd = password
 
-            if passwd is not None:
-                try:
-                    with tempfile.NamedTemporaryFile(delete=False) as tmp:
-                        file_storage.save(tmp)
-                        file_storage.close()
-
-                        fn = tmp
-
-                    file_hash = file_sha256sum(fn.name)
-                    file_size = os.stat(fn.name).st_size
+            # The file is written once, hashed while it is received, then moved to the blob of its content
+            file_size, sha256_hash = save_stream_sha256sum(file_storage.stream, location)
+            file_storage.close()
+            file_hash = sha256_hash.hexdigest().upper()
 
-                    file_path = location.as_posix() + '.zip'
+            try:
+                file_path = datastore_store_blob(location, file_hash, file_size, passwd)
 
-                    shutil.copyfile(fn.name, Path(fn.name).parent / file_hash)
-
-                    pyminizip.compress((Path(fn.name).parent / file_hash).as_posix(), None, file_path, passwd, 0)
-                    os.unlink(Path(tmp.name).parent / file_hash)
-                    os.unlink(fn.name)
-
-                except Exception as e:
-                    log.exception(e)
-                    raise marshmallow.exceptions.ValidationError(
-                        str(e),
-                        field_name='file_password'
-                    )
-
-            else:
-                file_storage.save(location)
-                file_storage.close()
-                file_path = location.as_posix()
-                file_size = location.stat().st_size
-                file_hash = file_sha256sum(file_path)
+            except Exception as e:
+                log.exception(e)
+                raise marshmallow.exceptions.ValidationError(
+                    str(e),
+                    field_name='file_password' if passwd is not None else 'file_content'
+                )
 
         except Exception as e:
             raise marshmallow.exceptions.ValidationError(
@@ -64,7 +64,9 @@ function refresh_activities() {
     notify_success('Refreshed');
 }
 
-function get_activities () {
+var activities_next_cursor = null;
+
+function get_activities (cursor) {
     show_loader();
     if ($('#non_case_related_act').is(':checked')) {
         url = '/activities/list-all';
@@ -72,15 +74,24 @@ function get_activities () {
         url = '/activities/list';
     }
 
+    if (cursor) {
+        url += '?cursor=' + encodeURIComponent(cursor);
+    }
+
     get_request_api(url)
     .done((data) => {
         if(notify_auto_api(data, true)) {
             jsdata = data;
             if (jsdata.status == "success") {
-                  Table.clear();
-                  Table.rows.add(data.data);
-                  Table.columns.adjust().draw();
+                  if (!cursor) {
+                      Table.clear();
+                  }
+                  Table.rows.add(data.data.activities);
+                  Table.columns.adjust().draw(false);
                   Table.buttons().container().appendTo($('#activities_table_info'));
+
+                  activities_next_cursor = data.data.next_cursor;
+                  $('#activities_more').toggle(activities_next_cursor !== null);
                 hide_loader();
             }
         }
@@ -88,12 +99,19 @@ function get_activities () {
         hide_loader();
         Table.clear();
         Table.columns.adjust().draw();
+        $('#activities_more').hide();
     });
 }
 
+function get_more_activities() {
+    if (activities_next_cursor) {
+        get_activities(activities_next_cursor);
+    }
+}
+
 $(document).ready(function(){
     get_activities();
     $('#non_case_related_act').on('change', function() {
         get_activities();
     });
-});
\ No newline at end of file
+});
@@ -2112,7 +2112,13 @@ $(document).ready(function () {
     socket.on('new_alert', function (data) {
         const badge = $('#newAlertsBadge');
         const currentCount = parseInt(badge.text()) || 0;
-        badge.text(currentCount + 1).show();
+        let newAlertsCount = 1;
+        try {
+            newAlertsCount = JSON.parse(data).alerts_count || 1;
+        } catch (e) {
+            newAlertsCount = 1;
+        }
+        badge.text(currentCount + newAlertsCount).show();
         badge.attr('title', 'New alerts available');
     });
 
@@ -114,20 +114,57 @@ function report_template_selector() {
     $('#modal_select_report').modal({ show: true });
 }
 
+function poll_report_generation(task_id) {
+    get_request_api('/case/report/status/' + task_id)
+    .done((data) => {
+        if (!notify_auto_api(data, true)) {
+            return;
+        }
+        let task = data.data;
+        if (task.state === 'PROGRESS' || task.state === 'PENDING' || task.state === 'STARTED') {
+            setTimeout(() => poll_report_generation(task_id), 2000);
+            return;
+        }
+
+        if (task.success) {
+            notify_success('Report generated');
+            // Served as an attachment, so the page stays in place
+            window.location.href = task.download_url;
+        } else {
+            notify_error(task.message ? task.message : 'Failed to generate the report');
+        }
+    });
+}
+
+function request_report(url) {
+    get_raw_request_api(url)
+    .done((data) => {
+        if (!notify_auto_api(data, true)) {
+            return;
+        }
+        if (data.data.download_url) {
+            window.location.href = data.data.download_url;
+        } else {
+            notify_success('Report generation started, it will be downloaded once ready');
+            poll_report_generation(data.data.task_id);
+        }
+    });
+}
+
 function gen_report(safe) {
-    url = '/case/report/generate-investigation/' + $("#select_report option:selected").val() + case_param();
+    url = '/case/report/generate-investigation/' + $("#select_report option:selected").val() + case_param() + '&async=true';
     if (safe === true) {
-        url += '&safe=true';
+        url += '&safe-mode=true';
     }
-    window.open(url, '_blank');
+    request_report(url);
 }
 
 function gen_act_report(safe) {
-    url = '/case/report/generate-activities/' + $("#select_report_act option:selected").val() + case_param();
+    url = '/case/report/generate-activities/' + $("#select_report_act option:selected").val() + case_param() + '&async=true';
     if (safe === true) {
-        url += '&safe=true';
+        url += '&safe-mode=true';
     }
-    window.open(url, '_blank');
+    request_report(url);
 }
 
 function act_report_template_selector() {
@@ -1,6 +1,12 @@
 var tm_filter = null;
 var selector_active;
 var current_timeline;
+var timeline_filter_query = null;
+var timeline_previous_cursor = null;
+var timeline_next_cursor = null;
+var timeline_loading = false;
+var timeline_render = null;
+var timeline_histogram = [];
 var g_event_id = null;
 var g_event_desc_editor = null;
 
@@ -807,13 +813,8 @@ function buildEvent(event_data, compact, comments_map, tree, tesk, tmb, idx, rea
 }
 
 function build_timeline(data) {
-    let compact = is_timeline_compact_view();
     let tree = is_timeline_tree_view();
-    var is_i = false;
-    current_timeline = data.data.tim;
-    let tmb = [];
-
-    let reid = 0;
+    current_timeline = [];
 
     $('#time_timeline_select').empty();
 
@@ -829,6 +830,7 @@ function build_timeline(data) {
                 {value: 'title:', score: 10, meta: 'Match title of events'},
                 {value: 'source:', score: 10, meta: 'Match source of events'},
                 {value: 'raw:', score: 10, meta: 'Match raw data of events'},
+                {value: 'search:', score: 10, meta: 'Full-text search in events'},
                 {value: 'ioc', score: 10, meta: "Match ioc value in events"},
                 {value: 'ioc_id', score: 10, meta: "Match ioc ID in events"},
                 {value: 'event_id', score: 10, meta: "Match event ID in events"},
@@ -856,7 +858,6 @@ function build_timeline(data) {
           enableLiveAutocompletion: true,
     });
 
-    let tesk = false;
     let reap = [];
     let ioc_list = data.data.iocs;
     for (ioc in ioc_list) {
@@ -877,39 +878,93 @@ function build_timeline(data) {
         let replacement = `$1<span class="text-warning-high ml-1 link_asset" data-toggle="popover" style="cursor: pointer;" data-trigger="hover" data-content="${sanitizeHTML(ioc_list[ioc]['ioc_description'])}" title="IOC">${sanitizeHTML(ioc_list[ioc]['ioc_value'])}</span>`;
         reap.push([re, replacement]);
     }
-    let idx = 0;
+    timeline_render = {
+        compact: is_timeline_compact_view(),
+        tree: tree,
+        tesk: false,
+        tmb: [],
+        idx: 0,
+        reap: reap,
+        converter: get_showdown_convert(),
+        comments_map: {}
+    };
+
+    if (tree) {
+        $('#timeline_list').addClass('timeline-t');
+    } else {
+        $('#timeline_list').removeClass('timeline-t');
+    }
+
+    render_timeline_events(data.data.tim, data.data.comments_map, false);
+    timeline_previous_cursor = data.data.previous_cursor;
+    timeline_next_cursor = data.data.next_cursor;
+
+    if (data.data.tim.length === 0) {
+       $('#card_main_load').append('<h3 class="ml-mr-auto text-center" id="no_events_msg">No events in current view</h3>');
+       $('#timeline_list').hide();
+    } else {
+        $('#timeline_list').show();
+        $('#no_events_msg').remove('h3');
+    }
+
+    set_last_state(data.data.state);
+    hide_loader();
+
+    if (location.href.indexOf("#") != -1) {
+        var current_url = window.location.href;
+        var id = current_url.substr(current_url.indexOf("#") + 1);
+        if ($('#event_'+id).offset() != undefined) {
+            $('.content').animate({ scrollTop: $('#event_'+id).offset().top - 180 });
+            $('#event_'+id).addClass('fade-it');
+        }
+    }
+
+}
 
-    let converter = get_showdown_convert();
+/* Render a slice of the timeline, appended after or prepended before the events already displayed */
+function render_timeline_events(events, comments_map, prepend) {
+    let rd = timeline_render;
+    // Days badges are rebuilt for a prepended slice, the first badge already displayed is dropped if repeated
+    let tmb = prepend ? [] : rd.tmb;
+    let events_ids = new Set(events.map((evt) => evt.event_id));
     let child_events = Object();
+    let entries = [];
+
+    Object.assign(rd.comments_map, comments_map);
 
-    for (let index in data.data.tim) {
-        let evt =  data.data.tim[index];
-        let eki = buildEvent(evt, compact, data.data.comments_map, tree, tesk, tmb, idx, reap, converter);
-        tesk = !tesk;
+    for (let index in events) {
+        let evt = events[index];
+        let eki = buildEvent(evt, rd.compact, rd.comments_map, rd.tree, rd.tesk, tmb, rd.idx, rd.reap, rd.converter);
+        rd.tesk = !rd.tesk;
 
-        is_i = false;
         let entry = eki[0];
         let tmb_d = eki[1];
 
-        if (evt.parent_event_id != null) {
+        // The parent of a child event may be out of the loaded slices, the child is then displayed on its own
+        if (evt.parent_event_id != null
+            && (events_ids.has(evt.parent_event_id) || $('#event_' + evt.parent_event_id).length > 0)) {
             if (!(evt.parent_event_id in child_events)) {
                 child_events[evt.parent_event_id] = [];
             }
             child_events[evt.parent_event_id].push(entry);
-            tesk = !tesk;
+            rd.tesk = !rd.tesk;
 
         } else {
-            $('#timeline_list').append(tmb_d);
-            $('#timeline_list').append(entry);
+            entries.push(tmb_d);
+            entries.push(entry);
         }
-
     }
 
-
-    if (tree) {
-        $('#timeline_list').addClass('timeline-t');
+    if (prepend) {
+        let first_badge = $('#timeline_list > li[id^="time_"]').first();
+        $('#timeline_list').prepend(entries.join(''));
+        if (tmb.includes(first_badge.find('small').text())) {
+            first_badge.remove();
+        }
+        current_timeline = events.concat(current_timeline);
     } else {
-        $('#timeline_list').removeClass('timeline-t');
+        $('#timeline_list').append(entries.join(''));
+        current_timeline = current_timeline.concat(events);
     }
 
     for (let parent_id in child_events) {
@@ -921,15 +976,17 @@ function build_timeline(data) {
         // Reverse the order of the child events list
         child_events[parent_id] = child_events[parent_id].reverse();
 
-        // Add button on parent to toggle child events
-        let button = $('<button>');
-        button.attr('type', 'button');
-        button.attr('class', 'btn btn-light btn-xs mt-2');
-        button.attr('onclick', `toggle_child_events_of_event(${parent_id});`);
-        button.attr('title', 'Toggle child events');
-        button.html('<span class="btn-label"><i class="fa fa-chevron-down"></i></span>');
+        // Add button on parent to toggle child events, unless a previous slice already did
+        if (parent_event.find('.timeline-body > button[title="Toggle child events"]').length === 0) {
+            let button = $('<button>');
+            button.attr('type', 'button');
+            button.attr('class', 'btn btn-light btn-xs mt-2');
+            button.attr('onclick', `toggle_child_events_of_event(${parent_id});`);
+            button.attr('title', 'Toggle child events');
+            button.html('<span class="btn-label"><i class="fa fa-chevron-down"></i></span>');
 
-        parent_event.find('.timeline-body').append(button);
+            parent_event.find('.timeline-body').append(button);
+        }
 
         for (let child_html in child_events[parent_id]) {
 
@@ -955,32 +1012,12 @@ function build_timeline(data) {
 
     }
 
-    //match_replace_ioc(data.data.iocs, "timeline_list");
     $('[data-toggle="popover"]').popover();
 
-    if (data.data.tim.length === 0) {
-       $('#card_main_load').append('<h3 class="ml-mr-auto text-center" id="no_events_msg">No events in current view</h3>');
-       $('#timeline_list').hide();
-    } else {
-        $('#timeline_list').show();
-        $('#no_events_msg').remove('h3');
-    }
-
-    set_last_state(data.data.state);
-    hide_loader();
-
-    if (location.href.indexOf("#") != -1) {
-        var current_url = window.location.href;
-        var id = current_url.substr(current_url.indexOf("#") + 1);
-        if ($('#event_'+id).offset() != undefined) {
-            $('.content').animate({ scrollTop: $('#event_'+id).offset().top - 180 });
-            $('#event_'+id).addClass('fade-it');
-        }
-    }
-
     // re-enable onclick event on timeline if selector_active is true
     if(selector_active == true) {
-        $(".timeline li .timeline-panel").on('click', function(){
+        $("[id^=dropa_]").removeAttr('data-toggle');
+        $(".timeline li .timeline-panel").off('click').on('click', function(){
             if($(this).hasClass("timeline-selected")) {
                 $(this).removeClass("timeline-selected");
             } else {
@@ -990,6 +1027,100 @@ function build_timeline(data) {
     }
 }
 
+/* Load the slice of the timeline following (after) or preceding (before) the displayed events */
+function load_timeline_page(direction) {
+    let cursor = direction === 'before' ? timeline_previous_cursor : timeline_next_cursor;
+    if (timeline_loading || !cursor) {
+        return;
+    }
+
+    timeline_loading = true;
+    let params = { 'q': timeline_filter_query };
+    params[direction] = cursor;
+
+    get_request_data_api("/case/timeline/events/window", params)
+    .done((data) => {
+        if (!notify_auto_api(data, true)) {
+            return;
+        }
+        if (direction === 'before') {
+            // Keep the displayed events in place while the slice is inserted above them
+            let doc_height = $(document).height();
+            render_timeline_events(data.data.tim, data.data.comments_map, true);
+            $(window).scrollTop($(window).scrollTop() + $(document).height() - doc_height);
+            timeline_previous_cursor = data.data.previous_cursor;
+        } else {
+            render_timeline_events(data.data.tim, data.data.comments_map, false);
+            timeline_next_cursor = data.data.next_cursor;
+        }
+    })
+    .always(() => {
+        timeline_loading = false;
+    });
+}
+
+function on_timeline_scroll() {
+    if (timeline_render === null || timeline_loading) {
+        return;
+    }
+
+    let scroll_top = $(window).scrollTop();
+    if (scroll_top + $(window).height() >= $(document).height() - 400) {
+        load_timeline_page('after');
+    } else if (scroll_top <= 100) {
+        load_timeline_page('before');
+    }
+}
+
+/* The histogram of the events per day acts as the scrollbar of the whole timeline */
+function load_timeline_histogram() {
+    get_request_data_api("/case/timeline/events/histogram", { 'q': timeline_filter_query, 'bucket': 'day' })
+    .done((data) => {
+        if (notify_auto_api(data, true)) {
+            build_timeline_histogram(data.data.buckets);
+        }
+    });
+}
+
+function build_timeline_histogram(buckets) {
+    let histogram = $('#timeline_histogram');
+    timeline_histogram = buckets;
+    histogram.empty();
+
+    if (buckets.length < 2) {
+        histogram.hide();
+        return;
+    }
+
+    let max_count = Math.max(...buckets.map((bucket) => bucket.count));
+    for (let bucket of buckets) {
+        let bar = $('<div>');
+        bar.attr('class', 'bg-primary');
+        bar.attr('title', `${bucket.start.split('T')[0]} - ${bucket.count} event(s)`);
+        bar.css({
+            'flex': '1 1 0',
+            'min-width': '2px',
+            'height': `${Math.max(5, Math.round(bucket.count * 100 / max_count))}%`,
+            'cursor': 'pointer'
+        });
+        bar.on('click', function() {
+            go_to_timeline_date(bucket.start);
+        });
+        histogram.append(bar);
+    }
+
+    histogram.css('display', 'flex');
+}
+
+function go_to_timeline_date(date) {
+    apply_filtering(function() {
+        let target = current_timeline.find((evt) => evt.event_date >= date);
+        if (target !== undefined && $('#event_' + target.event_id).offset() !== undefined) {
+            $('html, body').animate({ scrollTop: $('#event_' + target.event_id).offset().top - 80 });
+        }
+    }, date);
+}
+
 function toggle_child_events() {
     let child_events = $('.timeline-child');
     if (child_events.is(':visible')) {
@@ -1056,16 +1187,33 @@ function match_replace_ioc(entry, reap) {
 }
 
 function to_page_up() {
+  if (timeline_previous_cursor) {
+      // The beginning of the timeline is not loaded
+      apply_filtering(to_page_up);
+      return;
+  }
   document.body.scrollTop = 0; // For Safari
   document.documentElement.scrollTop = 0; // For Chrome, Firefox, IE and Opera
 }
 
 function to_page_down() {
+    if (timeline_next_cursor && timeline_histogram.length > 0) {
+        // The end of the timeline is not loaded, jump to its last day
+        apply_filtering(scroll_to_timeline_end, timeline_histogram[timeline_histogram.length - 1].start);
+        return;
+    }
+    scroll_to_timeline_end();
+}
+
+function scroll_to_timeline_end() {
     // Get last element ID of the timeline
-    let last_element_id = $('.timeline li:last > div').attr('id').replace('event_', '');
+    let last_element_id = $('.timeline li:last > div').attr('id');
+    if (last_element_id === undefined) {
+        return;
+    }
 
     // Scroll to the last element
-    $('html').animate({ scrollTop: $('#event_'+last_element_id).offset().top - 80 });
+    $('html').animate({ scrollTop: $('#' + last_element_id).offset().top - 80 });
 }
 
 function show_time_converter(){
@@ -1149,7 +1297,7 @@ function goToSharedLink(){
         }
    }
    shared_id = getSharedLink();
-   if (shared_id) {
+   if (shared_id && $('#event_'+shared_id).offset() !== undefined) {
         $('html, body').animate({ scrollTop: $('#event_'+shared_id).offset().top - 80 });
         $('#event_'+shared_id).addClass('fade-it');
     }
@@ -1204,7 +1352,7 @@ function timelineToCsvWithUI(){
 
 let parsed_filter = {};
 let keywords = ['asset', 'asset_id', 'tag', 'title', 'description', 'ioc', 'ioc_id',
-        'raw', 'category', 'source', 'flag', 'startDate', 'endDate', 'event_id'];
+        'raw', 'category', 'source', 'flag', 'startDate', 'endDate', 'event_id', 'search'];
 
 function parse_filter(str_filter, keywords) {
   for (var k = 0; k < keywords.length; k++) {
@@ -1251,20 +1399,28 @@ function reset_filters() {
     window.location = new_path;
 }
 
-function apply_filtering(post_req_fn) {
+function apply_filtering(post_req_fn, around) {
     keywords = ['asset', 'asset_id', 'tag', 'title', 'description', 'ioc', 'ioc_id',
-        'raw', 'category', 'source', 'flag', 'startDate', 'endDate', 'event_id'];
+        'raw', 'category', 'source', 'flag', 'startDate', 'endDate', 'event_id', 'search'];
 
     parsed_filter = {};
     parse_filter(tm_filter.getValue(), keywords);
-    filter_query = encodeURIComponent(JSON.stringify(parsed_filter));
+    timeline_filter_query = encodeURIComponent(JSON.stringify(parsed_filter));
+
+    let params = { 'q': timeline_filter_query };
+    if (around !== undefined) {
+        params['around'] = around;
+    }
 
     $('#timeline_list').empty();
     show_loader();
-    get_request_data_api("/case/timeline/advanced-filter",{ 'q': filter_query })
+    get_request_data_api("/case/timeline/events/window", params)
     .done((data) => {
         if(notify_auto_api(data, true)) {
             build_timeline(data);
+            if (around === undefined) {
+                load_timeline_histogram();
+            }
             if(post_req_fn !== undefined) {
                 post_req_fn();
             }
@@ -1308,35 +1464,61 @@ function fire_upload_csv_events() {
     $('#modal_upload_csv_events').modal('show');
 }
 
+function poll_csv_events_import(api_path, task_id, modal_dlg) {
+    get_request_api(`${api_path}/${task_id}`)
+    .done((data) => {
+        if (!notify_auto_api(data, true)) {
+            return;
+        }
+        let task = data.data;
+        if (task.state === 'PROGRESS' || task.state === 'PENDING' || task.state === 'STARTED') {
+            if (task.progress) {
+                $('#csv_import_progress').text(`${task.progress.processed} / ${task.progress.total} events imported`);
+            }
+            setTimeout(() => poll_csv_events_import(api_path, task_id, modal_dlg), 2000);
+            return;
+        }
+
+        $('#csv_import_progress').text('');
+        apply_filtering();
+        if (task.success) {
+            $(modal_dlg).modal('hide');
+            swal("Got news for you", task.message, "success");
+        } else {
+            swal("Got bad news for you", task.logs && task.logs.length > 0 ? task.logs.join('\n') : task.message, "error");
+        }
+    });
+}
+
 function upload_csv_events() {
-    const api_path =  '/case/timeline/events/csv_upload';
     const modal_dlg = '#modal_upload_csv_events'
     const file_input = '#input_upload_csv_events'
 
     var file = $(file_input).get(0).files[0];
+    // JSON lines files, as downloaded from the timeline, have their own import endpoint
+    const file_format = /\.(jsonl|ndjson)$/i.test(file.name) ? 'jsonl' : 'csv';
+    const api_path = `/case/timeline/events/${file_format}_upload`;
 
-    var reader = new FileReader();
-    reader.onload = function (e) {
-        let fileData = e.target.result
-        let data = new Object();
-        data['csrf_token'] = $('#csrf_token').val();
-        data['CSVData'] = fileData;
+    // The file is sent as is, so large CSV are neither loaded in memory nor wrapped in JSON
+    let data = new FormData();
+    data.append('csrf_token', $('#csrf_token').val());
+    data.append('file', file);
 
-        post_request_api(api_path, JSON.stringify(data), true)
-        .done((data) => {
+    post_request_data_api(api_path, data, true)
+    .done((data) => {
 
-            if (notify_auto_api(data)) {
-                apply_filtering();
-                $(modal_dlg).modal('hide');
-                swal("Got news for you", data.message, "success");
-            } else {
-                //alert( JSON.stringify(data.data,null,2));
-                swal("Got bad news for you", data.message, "error");
+        if (notify_auto_api(data)) {
+            if (data.data && data.data.task_id) {
+                poll_csv_events_import(api_path, data.data.task_id, modal_dlg);
+                return;
             }
-        })
-
-    };
-    reader.readAsText(file)
+            apply_filtering();
+            $(modal_dlg).modal('hide');
+            swal("Got news for you", data.message, "success");
+        } else {
+            swal("Got bad news for you", data.message, "error");
+        }
+    })
 
     return false;
 }
@@ -1401,6 +1583,8 @@ $(document).ready(function(){
 
     get_or_filter_tm();
 
+    $(window).on('scroll', on_timeline_scroll);
+
     setInterval(function() { check_update('timeline/state'); }, 3000);
 
     collab_case.on('case-obj-notif', function(data) {
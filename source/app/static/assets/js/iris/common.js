@@ -645,7 +645,7 @@ function copy_text_clipboard(data){
 function load_case_activity(){
     get_request_api('/case/activities/list')
     .done((data) => {
-        js_data = data.data;
+        js_data = data.data.activities;
         $('#case_activities').empty();
         for (index in js_data) {
 
@@ -277,8 +277,81 @@ function info_ds_file(node) {
     });
 }
 
+function ds_upload_form_data() {
+    let formData = new FormData();
+    formData.append('csrf_token', $('#csrf_token').val());
+    return formData;
+}
+
+async function upload_ds_file_chunked(node, formData, file, on_progress) {
+    /* Upload a file in chunks, resuming from the offset known by the server when a chunk fails */
+    formData.set('file_size', file.size);
+    formData.delete('file_content');
+
+    let upload;
+    try {
+        upload = await post_request_data_api('/datastore/file/upload/' + node + '/init', formData, true);
+    } catch (error) {
+        return;
+    }
+
+    let upload_uri = '/datastore/file/upload/' + upload.data.upload_id;
+    let chunk_size = upload.data.chunk_size;
+    let offset = upload.data.offset;
+    let retries = 0;
+
+    while (offset < file.size) {
+        let chunkData = ds_upload_form_data();
+        chunkData.append('offset', offset);
+        chunkData.append('file_content', file.slice(offset, offset + chunk_size), file.name);
+
+        try {
+            let chunk = await post_request_data_api(upload_uri + '/chunk', chunkData, false);
+            offset = chunk.data.offset;
+            retries = 0;
+        } catch (error) {
+            retries += 1;
+            try {
+                if (retries > 3) {
+                    throw error;
+                }
+                let status = await get_request_api(upload_uri, false);
+                offset = status.data.offset;
+            } catch (status_error) {
+                post_request_data_api(upload_uri + '/cancel', ds_upload_form_data(), false);
+                return;
+            }
+        }
+
+        if (on_progress !== undefined) {
+            on_progress(offset, file.size);
+        }
+    }
+
+    /* The password is not kept by the server while the file is uploaded */
+    let completeData = ds_upload_form_data();
+    if (formData.get('file_password')) {
+        completeData.append('file_password', formData.get('file_password'));
+    }
+
+    try {
+        return await post_request_data_api(upload_uri + '/complete', completeData, true);
+    } catch (error) {
+        return;
+    }
+}
+
+function swal_ds_file_upload(title) {
+    window.swal({
+        title: title,
+        text: "Please wait. This window will close automatically when the file is uploaded.",
+        icon: "/static/assets/img/loader.gif",
+        button: false,
+        allowOutsideClick: false
+    });
+}
+
 async function save_ds_multi_files(node, index_i) {
-    let formData = new FormData($('#form_new_ds_files')[0]);
     let totalFiles = $('#input_upload_ds_files').prop('files').length;
     let index = index_i === undefined ? 0 : index_i;
     if (index >= totalFiles) {
@@ -286,31 +359,51 @@ async function save_ds_multi_files(node, index_i) {
         $('#modal_ds_file').modal("hide");
         return;
     }
+    let formData = new FormData($('#form_new_ds_files')[0]);
     let file = $('#input_upload_ds_files').prop('files')[index];
-    formData.append('file_content', file);
-    formData.append('file_original_name', file.name);
-    let uri = '/datastore/file/add/' + node;
-    await post_request_data_api(uri, formData, true, function () {
-        window.swal({
-            title: `File ${file.name} is uploading. (${index}/${totalFiles} files)`,
-            text: "Please wait. This window will close automatically when the file is uploaded.",
-            icon: "/static/assets/img/loader.gif",
-            button: false,
-            allowOutsideClick: false
+    formData.set('file_original_name', file.name);
+
+    let title = `File ${file.name} is uploading. (${index}/${totalFiles} files)`;
+    swal_ds_file_upload(title);
+
+    try {
+        let data = await upload_ds_file_chunked(node, formData, file, function (offset, size) {
+            $('.swal-title').text(`${title} ${Math.floor(offset * 100 / size)}%`);
         });
-    }).then((data) => {
-        notify_auto_api(data);
-        index += 1;
-        save_ds_multi_files(node, index);
-        load_datastore();
-    }).always((data) => {
+        if (data !== undefined) {
+            notify_auto_api(data);
+        }
+    } finally {
         window.swal.close();
-    });
+    }
+
+    save_ds_multi_files(node, index + 1);
+    load_datastore();
 }
 
-function save_ds_file(node, file_id) {
+async function save_ds_file(node, file_id) {
     var formData = new FormData($('#form_new_ds_file')[0]);
-    formData.append('file_content', $('#input_upload_ds_file').prop('files')[0]);
+    let file = $('#input_upload_ds_file').prop('files')[0];
+
+    if (file_id === undefined && file !== undefined) {
+        swal_ds_file_upload("File is uploading");
+
+        try {
+            let data = await upload_ds_file_chunked(node, formData, file, function (offset, size) {
+                $('.swal-title').text(`File is uploading ${Math.floor(offset * 100 / size)}%`);
+            });
+            if (data !== undefined && notify_auto_api(data)) {
+                $('#modal_ds_file').modal("hide");
+                reset_ds_file_view();
+                load_datastore();
+            }
+        } finally {
+            window.swal.close();
+        }
+        return;
+    }
+
+    formData.append('file_content', file);
     let uri = '';
 
     if (file_id === undefined) {
@@ -320,13 +413,7 @@ function save_ds_file(node, file_id) {
     }
 
     post_request_data_api(uri, formData, true, function() {
-        window.swal({
-              title: "File is uploading",
-              text: "Please wait. This window will close automatically when the file is uploaded.",
-              icon: "/static/assets/img/loader.gif",
-              button: false,
-              allowOutsideClick: false
-        });
+        swal_ds_file_upload("File is uploading");
     })
     .done(function (data){
         if(notify_auto_api(data)){
@@ -126,63 +126,99 @@ Table_comments = $("#comments_search_table").DataTable({
 });
 $("#comments_search_table").css("font-size", 12);
 
+var search_next_cursor = null;
+var search_sent = null;
+
 $('#submit_search').click(function () {
     search();
 });
 
+$('#search_more').click(function () {
+    search(search_next_cursor);
+});
+
+function search_snippet_html(snippet) {
+    // Only the highlighting of the matches is kept from the snippet
+    return sanitizeHTML(snippet, {whiteList: {mark: []}});
+}
+
+function search(cursor) {
+    if (cursor) {
+        // Next page of the current search, whatever the form holds now
+        var data_sent = Object.assign({}, search_sent, {'cursor': cursor});
+    } else {
+        var data_sent = $('form#form_search').serializeObject();
+        data_sent['csrf_token'] = $('#csrf_token').val();
+        search_sent = data_sent;
+    }
 
-function search() {
-    var data_sent = $('form#form_search').serializeObject();
-    data_sent['csrf_token'] = $('#csrf_token').val();
     post_request_api('/search', JSON.stringify(data_sent), true, function (data) {
             $('#submit_search').text("Searching...");
     })
     .done((data) => {
         if(notify_auto_api(data, true)) {
+            let results = data.data.results;
+            search_next_cursor = data.data.next_cursor;
+
+            if (!cursor) {
               $('#notes_msearch_list').empty();
               Table_1.clear();
               Table_comments.clear();
               $('#search_table_wrapper_1').hide();
               $('#search_table_wrapper_2').hide();
               $('#search_table_wrapper_3').hide();
-            val = $("input[type='radio']:checked").val();
+            }
+
+            val = search_sent['search_type'];
             if (val == "ioc") {
-                Table_1.rows.add(data.data);
+                Table_1.rows.add(results);
                 Table_1.columns.adjust().draw();
                 $('#search_table_wrapper_1').show();
 
-                $('#search_table_wrapper_1').on('click', function(e){
+                $('#search_table_wrapper_1').off('click').on('click', function(e){
                     if($('.popover').length>1)
                         $('.popover').popover('hide');
                         $(e.target).popover('toggle');
                 });
             }
             else if (val == "notes") {
-                for (e in data.data) {
+                for (e in results) {
                     let li_anchor = $('<i>');
                     li_anchor.addClass('list-group-item');
                     let span_anchor = $('<span>');
                     span_anchor.addClass('name');
                     span_anchor.attr('style', 'cursor:pointer');
                     span_anchor.attr('title', 'Click to open note');
-                    span_anchor.attr('onclick', 'note_in_details(' + data.data[e]['note_id'] + ', ' + data.data[e]['case_id'] + ');');
-                    span_anchor.text(data.data[e]['note_title'] + ' - ' + data.data[e]['case_name'] + ' - ' + data.data[e]['client_name']);
+                    span_anchor.attr('onclick', 'note_in_details(' + results[e]['note_id'] + ', ' + results[e]['case_id'] + ');');
+                    span_anchor.text(results[e]['note_title'] + ' - ' + results[e]['case_name'] + ' - ' + results[e]['client_name']);
                     li_anchor.append(span_anchor);
+                    if (results[e]['snippet']) {
+                        let snippet_anchor = $('<div>');
+                        snippet_anchor.addClass('text-muted small');
+                        snippet_anchor.html(search_snippet_html(results[e]['snippet']));
+                        li_anchor.append(snippet_anchor);
+                    }
                     $('#notes_msearch_list').append(li_anchor);
 
                 }
                 $('#search_table_wrapper_2').show();
             } else if (val == "comments") {
-                Table_comments.rows.add(data.data);
+                Table_comments.rows.add(results);
                 Table_comments.columns.adjust().draw();
                 $('#search_table_wrapper_3').show();
 
-                $('#search_table_wrapper_3').on('click', function(e){
+                $('#search_table_wrapper_3').off('click').on('click', function(e){
                     if($('.popover').length>1)
                         $('.popover').popover('hide');
                         $(e.target).popover('toggle');
                 });
             }
+
+            if (search_next_cursor) {
+                $('#search_more_wrapper').show();
+            } else {
+                $('#search_more_wrapper').hide();
+            }
         }
     })
     .always(() => {
@@ -40,6 +40,7 @@ from flask import Request
 from flask import render_template
 from flask import request
 from flask import session
+from flask import stream_with_context
 from flask import url_for
 from flask_login import current_user
 from flask_login import login_user
@@ -59,6 +60,7 @@ from app import db
 from app.datamgmt.case.case_db import get_case
 from app.datamgmt.manage.manage_access_control_db import user_has_client_access
 from app.datamgmt.manage.manage_users_db import get_user
+from app.iris_engine.access_control.utils import ac_fast_check_case_exists
 from app.iris_engine.access_control.utils import ac_fast_check_user_has_case_access
 from app.iris_engine.access_control.utils import ac_get_effective_permissions_of_user
 from app.iris_engine.utils.tracker import track_activity
@@ -88,17 +90,73 @@ def response_error(msg, data=None, status=400):
                               mimetype='application/json')
 
 
-def response_success(msg='', data=None):
+def response_success(msg='', data=None, status=200):
     rsp = {
         "status": "success",
         "message": msg,
         "data": data if data is not None else []
     }
     return app.response_class(response=json.dumps(rsp, cls=AlchemyEncoder),
-                              status=200,
+                              status=status,
                               mimetype='application/json')
 
 
+def response_success_stream(msg='', data=None, items_key='items', items=(), tail=None, ndjson=False,
+                            chunk_size=500):
+    """
+    Same payload as response_success, but the items are serialized and sent by chunks while they are iterated, so
+    the response starts before the whole list is built.
+
+    data holds the other keys of the payload, and tail is an optional callable returning more keys once the items
+    are consumed. In ndjson mode, each item is sent on its own line, and the last line holds the usual envelope
+    without the items.
+    """
+    data = data if data is not None else {}
+
+    def _serialized_chunks():
+        chunk = []
+        for item in items:
+            chunk.append(json.dumps(item, cls=AlchemyEncoder))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+
+        if chunk:
+            yield chunk
+
+    def _remaining_data():
+        remaining = dict(data)
+        if tail:
+            remaining.update(tail())
+
+        return remaining
+
+    def generate_json():
+        yield f'{{"status": "success", "message": {json.dumps(msg)}, "data": {{{json.dumps(items_key)}: ['
+
+        separator = ''
+        for chunk in _serialized_chunks():
+            yield separator + ', '.join(chunk)
+            separator = ', '
+
+        yield ']'
+
+        for key, value in _remaining_data().items():
+            yield f', {json.dumps(key)}: {json.dumps(value, cls=AlchemyEncoder)}'
+
+        yield '}}'
+
+    def generate_ndjson():
+        for chunk in _serialized_chunks():
+            yield '\n'.join(chunk) + '\n'
+
+        yield json.dumps({"status": "success", "message": msg, "data": _remaining_data()}, cls=AlchemyEncoder) + '\n'
+
+    return app.response_class(response=stream_with_context(generate_ndjson() if ndjson else generate_json()),
+                              status=200,
+                              mimetype='application/x-ndjson' if ndjson else 'application/json')
+
+
 def g_db_commit():
     db.session.commit()
 
@@ -332,7 +390,7 @@ def get_case_access(request_data, access_level, from_api=False, no_cid_required=
 
     update_session(caseid, eaccess_level, from_api)
 
-    if caseid is not None and not get_case(caseid):
+    if caseid is not None and not ac_fast_check_case_exists(caseid):
         log.warning('No case found. Using default case')
         return True, 1, True
 
@@ -825,6 +883,25 @@ def stream_sha256sum(stream):
     return hashlib.sha256(stream).hexdigest().upper()
 
 
+def save_stream_sha256sum(stream, file_path, sha256_hash=None, mode='wb', block_size=1024 * 1024):
+    """
+    Write a stream to a file, hashing the content on the way so the file never needs to be read back.
+    An existing hash object can be passed along with mode 'ab' to continue hashing a partially written file.
+    Returns the number of bytes written and the hash object.
+    """
+    if sha256_hash is None:
+        sha256_hash = hashlib.sha256()
+
+    written = 0
+    with open(file_path, mode) as fout:
+        for byte_block in iter(lambda: stream.read(block_size), b""):
+            sha256_hash.update(byte_block)
+            fout.write(byte_block)
+            written += len(byte_block)
+
+    return written, sha256_hash
+
+
 @app.template_filter()
 def format_datetime(value, frmt):
     return datetime.datetime.fromtimestamp(float(value)).strftime(frmt)
@@ -0,0 +1,133 @@
+#  IRIS Source Code
+#  Copyright (C) 2024 - DFIR-IRIS
+#  contact@dfir-iris.org
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 3 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+from unittest import TestCase
+
+from datetime import datetime
+from sqlalchemy import event
+
+from app import db
+from app.datamgmt.reporter.report_db import export_case_json
+from app.models import AnalysisStatus
+from app.models import AssetsType
+from app.models import CaseAssets
+from app.models import CaseEventCategory
+from app.models import CaseEventsAssets
+from app.models import CaseEventsIoc
+from app.models import CaseTasks
+from app.models import Comments
+from app.models import EventCategory
+from app.models import Ioc
+from app.models import IocAssetLink
+from app.models import IocLink
+from app.models import IocType
+from app.models import Notes
+from app.models import NotesComments
+from app.models import TaskAssignee
+from app.models import TaskStatus
+from app.models import Tlp
+from app.models.authorization import User
+from app.models.cases import Cases
+from app.models.cases import CasesEvent
+from app.models.cases import Client
+from app.post_init import run_post_init
+from tests.clean_database import clean_db
+
+
+class TestCaseExportQueries(TestCase):
+    def setUp(self) -> None:
+        clean_db()
+        run_post_init()
+
+    def tearDown(self) -> None:
+        clean_db()
+
+    @staticmethod
+    def _create_case(objects_nb: int) -> int:
+        user = User.query.filter(User.user == 'administrator').first()
+
+        case = Cases(
+            name=f"Export {objects_nb}",
+            description="Export queries benchmark",
+            soc_id="",
+            user=user,
+            client_id=Client.query.first().client_id
+        )
+        case.save()
+
+        asset_type_id = AssetsType.query.first().asset_id
+        analysis_status_id = AnalysisStatus.query.first().id
+        ioc_type_id = IocType.query.first().type_id
+        tlp_id = Tlp.query.first().tlp_id
+        task_status_id = TaskStatus.query.first().id
+        category_id = EventCategory.query.first().id
+
+        for i in range(objects_nb):
+            asset = CaseAssets(asset_name=f"asset_{i}", asset_type_id=asset_type_id, case_id=case.case_id,
+                               analysis_status_id=analysis_status_id, user_id=user.id, date_added=datetime.utcnow())
+            ioc = Ioc(ioc_value=f"ioc_{i}", ioc_type_id=ioc_type_id, ioc_tlp_id=tlp_id, user_id=user.id)
+            event_ = CasesEvent(case_id=case.case_id, user_id=user.id, event_title=f"event_{i}",
+                                event_date=datetime.utcnow(), event_date_wtz=datetime.utcnow(), event_tz="+00:00")
+            task = CaseTasks(task_title=f"task_{i}", task_case_id=case.case_id, task_status_id=task_status_id)
+            note = Notes(note_title=f"note_{i}", note_content="", note_user=user.id, note_case_id=case.case_id)
+            comment = Comments(comment_text=f"comment_{i}", comment_user_id=user.id, comment_case_id=case.case_id,
+                               comment_date=datetime.utcnow())
+            db.session.add_all([asset, ioc, event_, task, note, comment])
+            db.session.flush()
+
+            db.session.add_all([
+                IocLink(ioc_id=ioc.ioc_id, case_id=case.case_id),
+                IocAssetLink(ioc_id=ioc.ioc_id, asset_id=asset.asset_id),
+                CaseEventsAssets(event_id=event_.event_id, asset_id=asset.asset_id, case_id=case.case_id),
+                CaseEventsIoc(event_id=event_.event_id, ioc_id=ioc.ioc_id, case_id=case.case_id),
+                CaseEventCategory(event_id=event_.event_id, category_id=category_id),
+                TaskAssignee(task_id=task.id, user_id=user.id),
+                NotesComments(comment_note_id=note.note_id, comment_id=comment.comment_id)
+            ])
+
+        db.session.commit()
+
+        return case.case_id
+
+    @staticmethod
+    def _count_export_queries(case_id: int) -> int:
+        queries = []
+
+        def count_query(conn, cursor, statement, *args):
+            queries.append(statement)
+
+        # Start from an empty identity map, so no relationship is served from the session
+        db.session.expire_all()
+
+        event.listen(db.engine, 'before_cursor_execute', count_query)
+        try:
+            export = export_case_json(case_id)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_query)
+
+        assert 'errors' not in export
+
+        return len(queries)
+
+    def test_export_case_json_queries_count_should_not_depend_on_case_size(self):
+        # Both sizes stay under a timeline export batch
+        small_case_id = self._create_case(3)
+        large_case_id = self._create_case(60)
+
+        self.assertEqual(self._count_export_queries(small_case_id), self._count_export_queries(large_case_id))
@@ -0,0 +1,99 @@
+#  IRIS Source Code
+#  Copyright (C) 2024 - DFIR-IRIS
+#  contact@dfir-iris.org
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 3 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+from unittest import TestCase
+
+from datetime import datetime
+
+from app import db
+from app.datamgmt.case.case_assets_db import get_case_similar_assets
+from app.datamgmt.case.case_iocs_db import get_case_iocs_links
+from app.models import AnalysisStatus
+from app.models import AssetsType
+from app.models import CaseAssets
+from app.models import Ioc
+from app.models import IocLink
+from app.models import IocType
+from app.models import Tlp
+from app.models.authorization import CaseAccessLevel
+from app.models.authorization import User
+from app.models.authorization import UserCaseEffectiveAccess
+from app.models.cases import Cases
+from app.models.cases import Client
+from app.post_init import run_post_init
+from tests.clean_database import clean_db
+
+
+class TestCaseLinksQueries(TestCase):
+    def setUp(self) -> None:
+        clean_db()
+        run_post_init()
+
+    def tearDown(self) -> None:
+        clean_db()
+
+    @staticmethod
+    def _create_case(user: User, name: str) -> int:
+        case = Cases(
+            name=name,
+            description="Cross-case links",
+            soc_id="",
+            user=user,
+            client_id=Client.query.first().client_id
+        )
+        case.save()
+
+        db.session.add(UserCaseEffectiveAccess(user_id=user.id, case_id=case.case_id,
+                                               access_level=CaseAccessLevel.full_access.value))
+        db.session.commit()
+
+        return case.case_id
+
+    def test_links_should_be_resolved_for_cases_of_any_size(self):
+        user = User.query.filter(User.user == 'administrator').first()
+        case_id = self._create_case(user, "Case")
+        other_case_id = self._create_case(user, "Other case")
+
+        asset_type_id = AssetsType.query.first().asset_id
+        analysis_status_id = AnalysisStatus.query.first().id
+        ioc_type_id = IocType.query.first().type_id
+        tlp_id = Tlp.query.first().tlp_id
+
+        objects_nb = 350
+        for i in range(objects_nb):
+            for cid in [case_id, other_case_id]:
+                db.session.add(CaseAssets(asset_name=f"asset_{i}", asset_type_id=asset_type_id, case_id=cid,
+                                          analysis_status_id=analysis_status_id, user_id=user.id,
+                                          date_added=datetime.utcnow()))
+
+            ioc = Ioc(ioc_value=f"ioc_{i}", ioc_type_id=ioc_type_id, ioc_tlp_id=tlp_id, user_id=user.id)
+            db.session.add(ioc)
+            db.session.flush()
+            db.session.add_all([IocLink(ioc_id=ioc.ioc_id, case_id=case_id),
+                                IocLink(ioc_id=ioc.ioc_id, case_id=other_case_id)])
+
+        db.session.commit()
+
+        similar_assets = get_case_similar_assets(case_id, Client.query.first().client_id, user.id)
+        iocs_links = get_case_iocs_links(case_id, user.id)
+
+        self.assertEqual(objects_nb, len(similar_assets))
+        self.assertTrue(all(links[0]['case_id'] == other_case_id for links in similar_assets.values()))
+        self.assertEqual(objects_nb, len(iocs_links))
+        self.assertTrue(all(links[0]['case_id'] == other_case_id for links in iocs_links.values()))
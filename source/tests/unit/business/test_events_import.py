@@ -0,0 +1,106 @@
+#  IRIS Source Code
+#  Copyright (C) 2024 - DFIR-IRIS
+#  contact@dfir-iris.org
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 3 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from app.business.errors import BusinessProcessingError
+from app.business.events_import import import_events_file
+from app.models import CasesEvent
+from app.models import Tags
+from app.models.authorization import User
+from app.models.cases import Cases
+from app.models.cases import Client
+from app.post_init import run_post_init
+from tests.clean_database import clean_db
+
+
+class TestEventsImport(TestCase):
+    def setUp(self) -> None:
+        clean_db()
+        run_post_init()
+
+        self._user = User.query.filter(User.user == 'administrator').first()
+        case = Cases(
+            name="Case",
+            description="Events import",
+            soc_id="",
+            user=self._user,
+            client_id=Client.query.first().client_id
+        )
+        case.save()
+        self._case_id = case.case_id
+
+    def tearDown(self) -> None:
+        clean_db()
+
+    def _import_jsonl(self, records):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as jsonl_file:
+            jsonl_file.write('\n'.join(json.dumps(record) for record in records))
+
+        try:
+            return import_events_file(jsonl_file.name, self._case_id, self._user.id, file_format='jsonl')
+        finally:
+            os.remove(jsonl_file.name)
+
+    def _build_record(self, **fields):
+        record = {
+            'event_date': '2023-03-26T03:00:30.000',
+            'event_tz': '+00:00',
+            'event_title': 'Logon'
+        }
+        record.update(fields)
+        return record
+
+    def test_import_should_clear_an_unknown_event_color(self):
+        self._import_jsonl([self._build_record(event_color="red' onmouseover='alert(1)")])
+
+        event = CasesEvent.query.filter(CasesEvent.case_id == self._case_id).one()
+        self.assertEqual('', event.event_color)
+
+    def test_import_should_convert_the_flags_to_booleans(self):
+        self._import_jsonl([self._build_record(event_in_summary='true', event_in_graph='0', event_is_flagged=True)])
+
+        event = CasesEvent.query.filter(CasesEvent.case_id == self._case_id).one()
+        self.assertEqual((True, False, True), (event.event_in_summary, event.event_in_graph, event.event_is_flagged))
+
+    def test_import_should_reject_an_invalid_flag_with_its_row_number(self):
+        with self.assertRaises(BusinessProcessingError) as context:
+            self._import_jsonl([self._build_record(), self._build_record(event_is_flagged='maybe')])
+
+        self.assertIn('row number: 2', context.exception.get_data()['Error'])
+        self.assertEqual(0, CasesEvent.query.filter(CasesEvent.case_id == self._case_id).count())
+
+    def test_import_should_reject_custom_attributes_which_are_not_an_object(self):
+        with self.assertRaises(BusinessProcessingError):
+            self._import_jsonl([self._build_record(custom_attributes='<script>')])
+
+    def test_import_should_reject_a_title_shorter_than_the_events_api_allows(self):
+        with self.assertRaises(BusinessProcessingError) as context:
+            self._import_jsonl([self._build_record(), self._build_record(event_title='A')])
+
+        self.assertIn('row number: 2', context.exception.get_data()['Error'])
+
+    def test_import_should_normalize_and_register_the_tags(self):
+        self._import_jsonl([self._build_record(event_tags=[' lateral ', '', 'logon'])])
+
+        event = CasesEvent.query.filter(CasesEvent.case_id == self._case_id).one()
+        self.assertEqual('lateral,logon', event.event_tags)
+        self.assertEqual(1, Tags.query.filter(Tags.tag_title == 'lateral').count())
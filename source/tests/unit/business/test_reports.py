@@ -0,0 +1,65 @@
+#  IRIS Source Code
+#  Copyright (C) 2024 - DFIR-IRIS
+#  contact@dfir-iris.org
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 3 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from unittest import TestCase
+
+from app.business.reports import get_case_report_version
+from app.iris_engine.utils.tracker import track_activity
+from app.models import CaseTemplateReport
+from app.models.authorization import User
+from app.models.cases import Cases
+from app.models.cases import Client
+from app.post_init import run_post_init
+from tests.clean_database import clean_db
+
+
+class TestReports(TestCase):
+    def setUp(self) -> None:
+        clean_db()
+        run_post_init()
+
+        self._user = User.query.filter(User.user == 'administrator').first()
+        case = Cases(
+            name="Case",
+            description="Reports",
+            soc_id="",
+            user=self._user,
+            client_id=Client.query.first().client_id
+        )
+        case.save()
+        self._case_id = case.case_id
+
+        self._report = CaseTemplateReport(name="Activities", internal_reference="activities_report.md",
+                                          naming_format="%case_name%_activities", created_by_user_id=self._user.id)
+
+    def tearDown(self) -> None:
+        clean_db()
+
+    def test_activities_report_version_should_ignore_the_report_generation(self):
+        version = get_case_report_version(self._case_id, self._report, 'Activities')
+
+        track_activity("generated a report", caseid=self._case_id, user_id=self._user.id)
+
+        self.assertEqual(version, get_case_report_version(self._case_id, self._report, 'Activities'))
+
+    def test_activities_report_version_should_change_with_the_case_activities(self):
+        version = get_case_report_version(self._case_id, self._report, 'Activities')
+
+        track_activity("added ioc", caseid=self._case_id, user_id=self._user.id)
+
+        self.assertNotEqual(version, get_case_report_version(self._case_id, self._report, 'Activities'))
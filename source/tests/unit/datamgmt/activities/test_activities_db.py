@@ -0,0 +1,105 @@
+#  IRIS Source Code
+#  Copyright (C) 2024 - DFIR-IRIS
+#  contact@dfir-iris.org
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 3 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from datetime import datetime
+from datetime import timedelta
+from unittest import TestCase
+
+from app import db
+from app.datamgmt.activities.activities_db import decode_activity_cursor
+from app.datamgmt.activities.activities_db import get_auto_activities
+from app.datamgmt.activities.activities_db import get_case_activities
+from app.datamgmt.activities.activities_db import prune_user_activities
+from app.models import UserActivity
+from app.models.authorization import User
+from app.models.cases import Cases
+from app.models.cases import Client
+from app.post_init import run_post_init
+from tests.clean_database import clean_db
+
+
+class TestActivitiesDb(TestCase):
+    def setUp(self) -> None:
+        clean_db()
+        run_post_init()
+
+        self._user = User.query.filter(User.user == 'administrator').first()
+
+        case = Cases(
+            name='Activities',
+            description="User activities",
+            soc_id="",
+            user=self._user,
+            client_id=Client.query.first().client_id
+        )
+        case.save()
+        self._case_id = case.case_id
+
+    def tearDown(self) -> None:
+        clean_db()
+
+    def _add_activity(self, description, activity_date, kind='case', user_input=False):
+        db.session.add(UserActivity(user_id=self._user.id, case_id=self._case_id, activity_date=activity_date,
+                                    activity_desc=description, activity_kind=kind, user_input=user_input,
+                                    display_in_ui=True, is_from_api=False))
+        db.session.commit()
+
+    def test_get_case_activities_should_return_all_the_activities_once_across_pages(self):
+        now = datetime.utcnow()
+        for index in range(5):
+            # Two activities at the same date, told apart by their ID
+            self._add_activity(f'Activity {index}', now - timedelta(minutes=index // 2))
+
+        descriptions = []
+        cursor = None
+        while True:
+            page = get_case_activities(self._case_id, cursor=cursor, limit=2)
+            descriptions += [activity['activity_desc'] for activity in page['activities']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+
+        self.assertEqual(5, len(descriptions))
+        self.assertEqual(5, len(set(descriptions)))
+
+    def test_decode_activity_cursor_should_reject_an_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            decode_activity_cursor('not a cursor')
+
+    def test_get_auto_activities_should_not_return_global_activities(self):
+        self._add_activity('Updated global task', datetime.utcnow(), kind='global')
+        self._add_activity('Added IOC', datetime.utcnow())
+
+        descriptions = [activity['activity_desc'] for activity in get_auto_activities(self._case_id)]
+
+        self.assertIn('Added IOC', descriptions)
+        self.assertNotIn('Updated global task', descriptions)
+
+    def test_prune_user_activities_should_keep_recent_and_user_entered_activities(self):
+        self._add_activity('Old activity', datetime.utcnow() - timedelta(days=40))
+        self._add_activity('Old task log', datetime.utcnow() - timedelta(days=40), user_input=True)
+        self._add_activity('Recent activity', datetime.utcnow())
+
+        prune_user_activities(30, batch_size=1)
+
+        descriptions = [activity.activity_desc for activity in
+                        UserActivity.query.filter(UserActivity.case_id == self._case_id).all()]
+
+        self.assertNotIn('Old activity', descriptions)
+        self.assertIn('Old task log', descriptions)
+        self.assertIn('Recent activity', descriptions)
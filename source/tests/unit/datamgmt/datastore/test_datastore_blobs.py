@@ -0,0 +1,68 @@
+#  IRIS Source Code
+#  Copyright (C) 2024 - DFIR-IRIS
+#  contact@dfir-iris.org
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 3 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+from app import app
+from app.datamgmt.datastore.datastore_db import datastore_release_blob
+from app.datamgmt.datastore.datastore_db import datastore_store_blob
+from app.models import DataStoreBlob
+from app.util import stream_sha256sum
+from tests.clean_database import clean_db
+
+
+class TestDatastoreBlobs(TestCase):
+    def setUp(self) -> None:
+        clean_db()
+        self._datastore_dir = tempfile.TemporaryDirectory()
+        self._datastore_path = app.config['DATASTORE_PATH']
+        app.config['DATASTORE_PATH'] = self._datastore_dir.name
+
+    def tearDown(self) -> None:
+        app.config['DATASTORE_PATH'] = self._datastore_path
+        self._datastore_dir.cleanup()
+        clean_db()
+
+    def _store(self, content: bytes) -> str:
+        _, file_path = tempfile.mkstemp(dir=self._datastore_dir.name)
+        Path(file_path).write_bytes(content)
+
+        return datastore_store_blob(file_path, stream_sha256sum(content), len(content))
+
+    def test_store_blob_twice_should_share_the_content(self):
+        first_path = self._store(b'sample')
+        second_path = self._store(b'sample')
+
+        blob = DataStoreBlob.query.filter(DataStoreBlob.blob_local_name == first_path).one()
+
+        self.assertEqual(first_path, second_path)
+        self.assertEqual(2, blob.blob_ref_count)
+
+    def test_release_blob_should_only_remove_the_content_with_its_last_reference(self):
+        blob_path = self._store(b'sample')
+        self._store(b'sample')
+
+        datastore_release_blob(blob_path)
+        self.assertTrue(Path(blob_path).is_file())
+
+        datastore_release_blob(blob_path)
+        self.assertFalse(Path(blob_path).is_file())
+        self.assertIsNone(DataStoreBlob.query.filter(DataStoreBlob.blob_local_name == blob_path).first())
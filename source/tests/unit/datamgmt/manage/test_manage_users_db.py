@@ -0,0 +1,56 @@
+#  IRIS Source Code
+#  Copyright (C) 2024 - DFIR-IRIS
+#  contact@dfir-iris.org
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 3 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from unittest import TestCase
+
+from app import db
+from app.datamgmt.manage.manage_users_db import get_users_list_restricted_from_case
+from app.models.authorization import CaseAccessLevel
+from app.models.authorization import User
+from app.models.authorization import UserCaseEffectiveAccess
+from app.models.cases import Cases
+from app.models.cases import Client
+from app.post_init import run_post_init
+from tests.clean_database import clean_db
+
+
+class TestManageUsersDb(TestCase):
+    def setUp(self) -> None:
+        clean_db()
+        run_post_init()
+
+        self._user = User.query.filter(User.user == 'administrator').first()
+
+    def tearDown(self) -> None:
+        clean_db()
+
+    def test_get_users_list_restricted_from_case_should_list_denied_users(self):
+        case = Cases(name='Restricted', description='Case access', soc_id='', user=self._user,
+                     client_id=Client.query.first().client_id)
+        case.save()
+
+        denied_user = User(user='denied', name='Denied', email='denied@iris.local', password=None, active=True)
+        db.session.add(denied_user)
+        db.session.add(UserCaseEffectiveAccess(user_id=self._user.id, case_id=case.case_id,
+                                               access_level=CaseAccessLevel.full_access.value))
+        db.session.commit()
+
+        users = {user['user_id']: user for user in get_users_list_restricted_from_case(case.case_id)}
+
+        self.assertEqual(CaseAccessLevel.full_access.value, users[self._user.id]['user_access_level'])
+        self.assertEqual(CaseAccessLevel.deny_all.value, users[denied_user.id]['user_access_level'])
@@ -0,0 +1,123 @@
+#  IRIS Source Code
+#  Copyright (C) 2024 - DFIR-IRIS
+#  contact@dfir-iris.org
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 3 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from unittest import TestCase
+
+from app import db
+from app.datamgmt.case.case_assets_db import create_asset
+from app.datamgmt.case.case_assets_db import delete_asset
+from app.datamgmt.case.case_iocs_db import add_ioc_link
+from app.datamgmt.case.case_iocs_db import delete_ioc
+from app.datamgmt.observables.observables_db import get_observable_pivot
+from app.models import AnalysisStatus
+from app.models import AssetsType
+from app.models import CaseAssets
+from app.models import Ioc
+from app.models import IocType
+from app.models import ObservableIndex
+from app.models import Tlp
+from app.models.authorization import CaseAccessLevel
+from app.models.authorization import User
+from app.models.authorization import UserCaseEffectiveAccess
+from app.models.cases import Cases
+from app.models.cases import Client
+from app.post_init import run_post_init
+from tests.clean_database import clean_db
+
+
+class TestObservablesDb(TestCase):
+    def setUp(self) -> None:
+        clean_db()
+        run_post_init()
+
+        self._user = User.query.filter(User.user == 'administrator').first()
+
+    def tearDown(self) -> None:
+        clean_db()
+
+    def _create_case(self, name: str, with_access: bool = True) -> int:
+        case = Cases(
+            name=name,
+            description="Observable index",
+            soc_id="",
+            user=self._user,
+            client_id=Client.query.first().client_id
+        )
+        case.save()
+
+        if with_access:
+            db.session.add(UserCaseEffectiveAccess(user_id=self._user.id, case_id=case.case_id,
+                                                   access_level=CaseAccessLevel.full_access.value))
+            db.session.commit()
+
+        return case.case_id
+
+    def _create_ioc(self, value: str) -> Ioc:
+        ioc = Ioc(ioc_value=value, ioc_type_id=IocType.query.first().type_id, ioc_tlp_id=Tlp.query.first().tlp_id,
+                  user_id=self._user.id)
+        db.session.add(ioc)
+        db.session.commit()
+
+        return ioc
+
+    def test_ioc_links_should_be_indexed_and_pivoted_on_whatever_the_case_of_the_value(self):
+        case_id = self._create_case("Case")
+        other_case_id = self._create_case("Other case")
+        ioc = self._create_ioc("Evil.example.com")
+
+        add_ioc_link(ioc.ioc_id, case_id)
+        add_ioc_link(ioc.ioc_id, other_case_id)
+
+        observables = get_observable_pivot(" evil.EXAMPLE.com ", self._user.id, observable_kind='ioc')
+
+        self.assertEqual(1, len(observables))
+        self.assertEqual("Evil.example.com", observables[0]['value'])
+        self.assertEqual({case_id, other_case_id}, {case['case_id'] for case in observables[0]['cases']})
+
+    def test_pivot_should_only_return_the_cases_the_user_can_access(self):
+        case_id = self._create_case("Case")
+        hidden_case_id = self._create_case("Hidden case", with_access=False)
+        ioc = self._create_ioc("10.0.0.1")
+
+        add_ioc_link(ioc.ioc_id, case_id)
+        add_ioc_link(ioc.ioc_id, hidden_case_id)
+
+        observables = get_observable_pivot("10.0.0.1", self._user.id)
+
+        self.assertEqual([case_id], [case['case_id'] for case in observables[0]['cases']])
+
+    def test_deleted_ioc_links_and_assets_should_be_removed_from_the_index(self):
+        case_id = self._create_case("Case")
+        other_case_id = self._create_case("Other case")
+        ioc = self._create_ioc("evil.exe")
+
+        add_ioc_link(ioc.ioc_id, case_id)
+        add_ioc_link(ioc.ioc_id, other_case_id)
+
+        asset = create_asset(CaseAssets(asset_name="WKS-01", asset_type_id=AssetsType.query.first().asset_id,
+                                        analysis_status_id=AnalysisStatus.query.first().id),
+                             case_id, self._user.id)
+        self.assertEqual(3, ObservableIndex.query.count())
+
+        delete_ioc(ioc, case_id)
+        delete_asset(asset.asset_id, case_id)
+        db.session.commit()
+
+        self.assertEqual([(other_case_id, 'ioc')],
+                         ObservableIndex.query.with_entities(ObservableIndex.case_id,
+                                                             ObservableIndex.observable_kind).all())
@@ -0,0 +1,125 @@
+#  IRIS Source Code
+#  Copyright (C) 2024 - DFIR-IRIS
+#  contact@dfir-iris.org
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 3 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from unittest import TestCase
+
+from app import db
+from app.datamgmt.search.search_db import decode_search_cursor
+from app.datamgmt.search.search_db import global_search
+from app.models import Notes
+from app.models.authorization import CaseAccessLevel
+from app.models.authorization import User
+from app.models.authorization import UserCaseEffectiveAccess
+from app.models.cases import Cases
+from app.models.cases import Client
+from app.post_init import run_post_init
+from tests.clean_database import clean_db
+
+
+class TestSearchDb(TestCase):
+    def setUp(self) -> None:
+        clean_db()
+        run_post_init()
+
+        self._user = User.query.filter(User.user == 'administrator').first()
+
+    def tearDown(self) -> None:
+        clean_db()
+
+    def _create_case(self, name: str, with_access: bool = True) -> int:
+        case = Cases(
+            name=name,
+            description="Global search",
+            soc_id="",
+            user=self._user,
+            client_id=Client.query.first().client_id
+        )
+        case.save()
+
+        if with_access:
+            db.session.add(UserCaseEffectiveAccess(user_id=self._user.id, case_id=case.case_id,
+                                                   access_level=CaseAccessLevel.full_access.value))
+            db.session.commit()
+
+        return case.case_id
+
+    def _add_notes(self, case_id: int, contents: list) -> None:
+        for content in contents:
+            db.session.add(Notes(note_title="Note", note_content=content, note_user=self._user.id,
+                                 note_case_id=case_id))
+        db.session.commit()
+
+    def test_notes_should_be_paginated_without_duplicates(self):
+        case_id = self._create_case("Case")
+        self._add_notes(case_id, [f"lateral movement to host {i}" for i in range(7)])
+
+        notes_ids = []
+        cursor = None
+        while True:
+            page = global_search('notes', 'lateral movement', self._user.id, cursor=cursor, limit=3)
+            notes_ids += [note['note_id'] for note in page['results']]
+
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+
+        self.assertEqual(7, len(notes_ids))
+        self.assertEqual(7, len(set(notes_ids)))
+
+    def test_notes_with_the_same_rank_should_be_paginated_one_by_one(self):
+        case_id = self._create_case("Case")
+        self._add_notes(case_id, ["credential dumping on the domain controller" for _ in range(4)])
+
+        notes_ids = []
+        cursor = None
+        for _ in range(5):
+            page = global_search('notes', 'credential dumping', self._user.id, cursor=cursor, limit=1)
+            notes_ids += [note['note_id'] for note in page['results']]
+
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+
+        self.assertIsNone(cursor)
+        self.assertEqual(4, len(notes_ids))
+        self.assertEqual(4, len(set(notes_ids)))
+
+    def test_notes_should_be_searched_by_part_of_a_value_and_highlighted(self):
+        case_id = self._create_case("Case")
+        self._add_notes(case_id, ["Dropped d41d8cd98f00b204e9800998ecf8427e on disk", "Nothing to see"])
+
+        page = global_search('notes', '98f00b204', self._user.id)
+        self.assertEqual(1, len(page['results']))
+
+        page = global_search('notes', 'dropped', self._user.id)
+        self.assertIn('<mark>Dropped</mark>', page['results'][0]['snippet'])
+
+    def test_search_should_only_return_the_cases_the_user_can_access(self):
+        case_id = self._create_case("Case")
+        hidden_case_id = self._create_case("Hidden case", with_access=False)
+        self._add_notes(case_id, ["ransomware note"])
+        self._add_notes(hidden_case_id, ["ransomware note"])
+
+        page = global_search('notes', 'ransomware', self._user.id)
+
+        self.assertEqual([case_id], [note['case_id'] for note in page['results']])
+        self.assertEqual([], global_search('notes', 'ransomware', self._user.id, case_id=hidden_case_id)['results'])
+
+    def test_invalid_cursor_should_be_rejected(self):
+        with self.assertRaises(ValueError):
+            decode_search_cursor('not a cursor')
@@ -0,0 +1,50 @@
+#  IRIS Source Code
+#  Copyright (C) 2024 - DFIR-IRIS
+#  contact@dfir-iris.org
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 3 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from unittest import TestCase
+
+from app import db
+from app.iris_engine.access_control.utils import _ac_cache_generation
+from app.iris_engine.access_control.utils import ac_invalidate_access_cache
+from app.post_init import run_post_init
+from tests.clean_database import clean_db
+
+
+class TestAccessCache(TestCase):
+    def setUp(self) -> None:
+        clean_db()
+        run_post_init()
+
+    def tearDown(self) -> None:
+        clean_db()
+
+    def test_invalidation_should_change_the_generation_stored_in_database(self):
+        generation = _ac_cache_generation()
+
+        ac_invalidate_access_cache()
+
+        self.assertNotEqual(generation, _ac_cache_generation())
+
+    def test_invalidation_without_commit_should_be_rolled_back_with_the_change(self):
+        ac_invalidate_access_cache()
+        generation = _ac_cache_generation()
+
+        ac_invalidate_access_cache(commit=False)
+        db.session.rollback()
+
+        self.assertEqual(generation, _ac_cache_generation())
@@ -0,0 +1,34 @@
+#  IRIS Source Code
+#  Copyright (C) 2024 - DFIR-IRIS
+#  contact@dfir-iris.org
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 3 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from types import SimpleNamespace
+from unittest import TestCase
+
+from app.iris_engine.tasker.tasks import is_task_of
+
+
+class TestTasks(TestCase):
+    def test_task_should_belong_to_the_case_and_user_it_was_queued_with(self):
+        task = SimpleNamespace(kwargs={'caseid': 1, 'user_id': 2, 'file_format': 'csv'})
+
+        self.assertTrue(is_task_of(task, 1, 2))
+        self.assertFalse(is_task_of(task, 3, 2))
+        self.assertFalse(is_task_of(task, 1, 3))
+
+    def test_task_without_stored_arguments_should_not_belong_to_anyone(self):
+        self.assertFalse(is_task_of(SimpleNamespace(kwargs=None), 1, 2))
@@ -0,0 +1,74 @@
+#  IRIS Source Code
+#  Copyright (C) 2024 - DFIR-IRIS
+#  contact@dfir-iris.org
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU Lesser General Public
+#  License as published by the Free Software Foundation; either
+#  version 3 of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#  Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from unittest import TestCase
+
+from app import app
+from app import db
+from app.iris_engine.utils.tracker import batch_activities
+from app.iris_engine.utils.tracker import track_activity
+from app.models import Client
+from app.models import UserActivity
+from app.models.authorization import User
+from app.post_init import run_post_init
+from tests.clean_database import clean_db
+
+
+class TestTracker(TestCase):
+    def setUp(self) -> None:
+        clean_db()
+        run_post_init()
+
+        self._user = User.query.filter(User.user == 'administrator').first()
+        self._tracking_mode = app.config['ACTIVITY_TRACKING_MODE']
+        app.config['ACTIVITY_TRACKING_MODE'] = 'buffered'
+
+    def tearDown(self) -> None:
+        app.config['ACTIVITY_TRACKING_MODE'] = self._tracking_mode
+        clean_db()
+
+    def _count_activities(self, message):
+        return UserActivity.query.filter(UserActivity.activity_desc == message.capitalize()).count()
+
+    def test_batch_activities_should_write_the_activities_at_the_end_of_the_block(self):
+        with batch_activities():
+            track_activity('first batched activity', ctx_less=True, user_id=self._user.id)
+            track_activity('second batched activity', ctx_less=True, user_id=self._user.id)
+
+            self.assertEqual(0, self._count_activities('first batched activity'))
+
+        self.assertEqual(1, self._count_activities('first batched activity'))
+        self.assertEqual(1, self._count_activities('second batched activity'))
+
+    def test_track_activity_should_commit_the_pending_changes_of_the_caller(self):
+        client = Client.query.first()
+        client.description = 'Tracked change'
+
+        with batch_activities():
+            track_activity('updated customer', ctx_less=True, user_id=self._user.id)
+
+        db.session.rollback()
+        self.assertEqual('Tracked change', Client.query.first().description)
+
+    def test_track_activity_should_write_the_activity_right_away_in_sync_mode(self):
+        app.config['ACTIVITY_TRACKING_MODE'] = 'sync'
+
+        with batch_activities():
+            track_activity('synchronous activity', ctx_less=True, user_id=self._user.id)
+
+            self.assertEqual(1, self._count_activities('synchronous activity'))
@@ -79,6 +79,69 @@ class Iris:
         }
         return self._api.post('/alerts/add', body)
 
+    def create_alerts_batch(self, alerts):
+        return self._api.post('/alerts/batch/add', {'alerts': alerts})
+
+    def filter_alerts(self, query_parameters):
+        return self._api.get('/alerts/filter', query_parameters)
+
+    def get_timeline_window(self, query_parameters):
+        return self._api.get('/case/timeline/events/window', query_parameters)
+
+    def get_timeline_histogram(self, query_parameters):
+        return self._api.get('/case/timeline/events/histogram', query_parameters)
+
+    def upload_timeline_csv(self, csv_data, query_parameters=None):
+        return self._api.post('/case/timeline/events/csv_upload', {'CSVData': csv_data}, query_parameters)
+
+    def generate_investigation_report(self, report_identifier, query_parameters):
+        return self._api.get(f'/case/report/generate-investigation/{report_identifier}', query_parameters)
+
+    def get_report_status(self, task_identifier, query_parameters=None):
+        return self._api.get(f'/case/report/status/{task_identifier}', query_parameters)
+
+    def add_report_template(self, file_name, template):
+        data = {
+            'report_name': 'report template',
+            'report_description': 'description',
+            'report_name_format': '%case_name%_report',
+            'report_language': 1,
+            'report_type': 1
+        }
+        return self._api.post_multipart('/manage/templates/add', data, {'file': (file_name, template)})
+
+    def download(self, path):
+        return self._api.get_content(path)
+
+    def upload_timeline_jsonl(self):
+        return self._api.post('/case/timeline/events/jsonl_upload', {})
+
+    def upload_timeline_jsonl_file(self, jsonl_data, query_parameters=None):
+        return self._api.post_multipart('/case/timeline/events/jsonl_upload', {},
+                                        {'file': ('timeline.jsonl', jsonl_data)}, query_parameters)
+
+    def export_timeline(self, query_parameters):
+        return self._api.get_content('/case/timeline/events/export', query_parameters)
+
+    def init_datastore_upload(self, folder_identifier, body):
+        return self._api.post(f'/datastore/file/upload/{folder_identifier}/init', body, {'cid': 1})
+
+    def get_datastore_upload(self, upload_identifier):
+        return self._api.get(f'/datastore/file/upload/{upload_identifier}', {'cid': 1})
+
+    def get_datastore_tree(self):
+        return self._api.get('/datastore/list/tree', {'cid': 1})
+
+    def upload_datastore_chunk(self, upload_identifier, offset, chunk):
+        return self._api.post_multipart(f'/datastore/file/upload/{upload_identifier}/chunk', {'offset': offset},
+                                        {'file_content': ('blob', chunk)}, {'cid': 1})
+
+    def complete_datastore_upload(self, upload_identifier):
+        return self._api.post(f'/datastore/file/upload/{upload_identifier}/complete', {}, {'cid': 1})
+
+    def get_datastore_file(self, file_identifier):
+        return self._api.get(f'/datastore/file/info/{file_identifier}', {'cid': 1})
+
     def create_asset(self):
         body = {
             'asset_type_id': '9',
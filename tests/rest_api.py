@@ -44,6 +44,21 @@ class RestApi:
         print(f'POST {url} {payload} => {response.status_code} {body}')
         return body
 
+    def get_content(self, path, query_parameters=None):
+        url = self._build_url(path)
+        response = requests.get(url, headers=self._headers, params=query_parameters)
+        print(f'GET {url} => {response.status_code}')
+        return response
+
+    def post_multipart(self, path, data, files, query_parameters=None):
+        url = self._build_url(path)
+        # requests sets the multipart content type with its boundary
+        headers = {'Authorization': self._headers['Authorization']}
+        response = requests.post(url, headers=headers, params=query_parameters, data=data, files=files)
+        body = response.json()
+        print(f'POST {url} {data} => {response.status_code} {body}')
+        return body
+
     def is_ready(self):
         try:
             requests.head(self._url)
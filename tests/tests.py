@@ -20,6 +20,12 @@ from iris import Iris
 from iris import API_URL
 from graphql_api import GraphQLApi
 from base64 import b64encode
+import time
+import hashlib
+import uuid
+
+_EVENTS_CSV_HEADER = 'event_date,event_tz,event_title,event_category,event_content,event_raw,event_source,' \
+                     'event_assets,event_iocs,event_tags\n'
 
 
 class Tests(TestCase):
@@ -1510,3 +1516,142 @@ class Tests(TestCase):
         self._subject.create_case()
         response = self._subject.get_cases_filter()
         self.assertEqual('success', response['status'])
+
+    def test_alerts_batch_add_should_report_invalid_alerts_without_failing_the_batch(self):
+        valid_alert = {
+            'alert_title': 'batch alert',
+            'alert_severity_id': 4,
+            'alert_status_id': 3,
+            'alert_customer_id': 1
+        }
+        invalid_alert = {
+            'alert_severity_id': 4,
+            'alert_status_id': 3,
+            'alert_customer_id': 1
+        }
+        response = self._subject.create_alerts_batch([valid_alert, invalid_alert, valid_alert])
+        self.assertEqual('success', response['status'])
+        self.assertEqual(2, response['data']['created'])
+        self.assertEqual([True, False, True], [result['success'] for result in response['data']['results']])
+
+    def test_alerts_filter_with_cursor_should_return_next_pages_without_overlap(self):
+        for _ in range(3):
+            self._subject.create_alert()
+        first_page = self._subject.filter_alerts({'cursor': '', 'per_page': 2, 'sort': 'desc'})
+        second_page = self._subject.filter_alerts({'cursor': first_page['data']['next_cursor'], 'per_page': 2,
+                                                   'sort': 'desc'})
+        first_identifiers = [alert['alert_id'] for alert in first_page['data']['alerts']]
+        second_identifiers = [alert['alert_id'] for alert in second_page['data']['alerts']]
+        self.assertEqual([], list(set(first_identifiers) & set(second_identifiers)))
+        self.assertTrue(all(a > b for a, b in zip(first_identifiers, first_identifiers[1:])))
+
+    def test_alerts_filter_with_invalid_cursor_should_fail(self):
+        response = self._subject.filter_alerts({'cursor': 'invalid'})
+        self.assertEqual('error', response['status'])
+
+    def test_timeline_window_with_invalid_cursor_should_fail(self):
+        response = self._subject.get_timeline_window({'after': 'invalid'})
+        self.assertEqual('error', response['status'])
+
+    def test_timeline_histogram_with_invalid_bucket_should_fail(self):
+        response = self._subject.get_timeline_histogram({'bucket': 'minute'})
+        self.assertEqual('error', response['status'])
+
+    def test_timeline_window_and_histogram_should_return_the_imported_events(self):
+        case_identifier = self._subject.create_case()['case_id']
+        self._subject.upload_timeline_csv(_EVENTS_CSV_HEADER + '1999-01-01T10:00:00.000,+00:00,First event,,,,,,,\n'
+                                          '1999-01-01T12:00:00.000,+00:00,Second event,,,,,,,\n',
+                                          {'cid': case_identifier})
+        window = self._subject.get_timeline_window({'cid': case_identifier, 'size': 1})
+        next_window = self._subject.get_timeline_window({'cid': case_identifier, 'size': 1,
+                                                         'after': window['data']['next_cursor']})
+        histogram = self._subject.get_timeline_histogram({'cid': case_identifier, 'bucket': 'day'})
+        self.assertEqual(['First event'], [event['event_title'] for event in window['data']['tim']])
+        self.assertEqual(['Second event'], [event['event_title'] for event in next_window['data']['tim']])
+        self.assertEqual([('1999-01-01', 2)], [(bucket['start'][:10], bucket['count'])
+                                               for bucket in histogram['data']['buckets']])
+
+    def test_timeline_csv_upload_with_missing_fields_should_return_bad_fields_mapping(self):
+        response = self._subject.upload_timeline_csv('event_date,event_title\n2023-03-26T03:00:30.000,An event\n')
+        self.assertEqual('BAD_FIELDS_MAPPING', response['data']['error_code'])
+
+    def test_timeline_csv_upload_should_create_the_events(self):
+        case_identifier = self._subject.create_case()['case_id']
+        response = self._subject.upload_timeline_csv(_EVENTS_CSV_HEADER +
+                                                      '2023-03-26T03:00:30.000,+00:00,Logon,,Interactive logon,,'
+                                                      'Security.evtx,,,logon|user\n'
+                                                      '2023-03-26T03:05:00.000,+00:00,Logoff,,,,Security.evtx,,,\n',
+                                                      {'cid': case_identifier})
+        window = self._subject.get_timeline_window({'cid': case_identifier})
+        self.assertEqual(2, response['data']['imported'])
+        self.assertEqual(['Logon', 'Logoff'], [event['event_title'] for event in window['data']['tim']])
+        self.assertEqual('logon,user', window['data']['tim'][0]['event_tags'])
+
+    def test_generate_investigation_report_asynchronously_with_unknown_template_should_fail(self):
+        response = self._subject.generate_investigation_report(1000000, {'cid': 1, 'async': 'true'})
+        self.assertEqual('Unknown report', response['message'])
+
+    def test_report_status_of_unknown_task_should_be_pending(self):
+        response = self._subject.get_report_status('00000000-0000-0000-0000-000000000000')
+        self.assertEqual('PENDING', response['data']['state'])
+
+    def test_generated_report_should_be_downloaded_with_its_token(self):
+        case_identifier = self._subject.create_case()['case_id']
+        template = self._subject.add_report_template('template.md', 'Report of {{ case.name }}')
+        response = self._subject.generate_investigation_report(template['data']['report_id'],
+                                                               {'cid': case_identifier, 'async': 'true'})
+        task_identifier = response['data']['task_id']
+        for _ in range(60):
+            if task_identifier is None or response['data'].get('state') in ('SUCCESS', 'FAILURE'):
+                break
+            time.sleep(1)
+            response = self._subject.get_report_status(task_identifier, {'cid': case_identifier})
+        report = self._subject.download(response['data']['download_url'])
+        self.assertEqual(200, report.status_code)
+        self.assertIn('Report of ', report.text)
+        self.assertIn('case name', report.text)
+
+    def test_timeline_jsonl_upload_without_file_should_fail(self):
+        response = self._subject.upload_timeline_jsonl()
+        self.assertEqual('error', response['status'])
+
+    def test_timeline_export_should_be_imported_back_with_the_jsonl_upload(self):
+        case_identifier = self._subject.create_case()['case_id']
+        self._subject.upload_timeline_csv(_EVENTS_CSV_HEADER +
+                                          '2023-03-26T03:00:30.000,+00:00,Logon,,,,Security.evtx,,,logon\n'
+                                          '2023-03-26T03:05:00.000,+00:00,Logoff,,,,Security.evtx,,,\n',
+                                          {'cid': case_identifier})
+        export = self._subject.export_timeline({'cid': case_identifier})
+        other_case_identifier = self._subject.create_case()['case_id']
+        response = self._subject.upload_timeline_jsonl_file(export.content, {'cid': other_case_identifier})
+        window = self._subject.get_timeline_window({'cid': other_case_identifier})
+        self.assertEqual(2, len(export.text.splitlines()))
+        self.assertEqual(2, response['data']['imported'])
+        self.assertEqual(['Logon', 'Logoff'], [event['event_title'] for event in window['data']['tim']])
+        self.assertEqual('logon', window['data']['tim'][0]['event_tags'])
+
+    def test_datastore_upload_init_with_unknown_folder_should_fail(self):
+        response = self._subject.init_datastore_upload(1000000, {'file_original_name': 'file.txt', 'file_size': 10})
+        self.assertEqual('Invalid path node for this case', response['message'])
+
+    def test_datastore_upload_status_of_unknown_upload_should_fail(self):
+        response = self._subject.get_datastore_upload('00000000-0000-0000-0000-000000000000')
+        self.assertEqual('Unknown upload', response['message'])
+
+    def test_datastore_chunked_upload_should_create_the_file(self):
+        content = f'{uuid.uuid4()}\n'.encode() * 1000
+        tree = self._subject.get_datastore_tree()
+        folder_identifier = int(next(iter(tree['data'])).split('-')[1])
+        upload = self._subject.init_datastore_upload(folder_identifier, {'file_original_name': 'chunked.txt',
+                                                                         'file_size': len(content)})
+        upload_identifier = upload['data']['upload_id']
+        half = len(content) // 2
+        first_chunk = self._subject.upload_datastore_chunk(upload_identifier, 0, content[:half])
+        self._subject.upload_datastore_chunk(upload_identifier, first_chunk['data']['offset'], content[half:])
+        response = self._subject.complete_datastore_upload(upload_identifier)
+        file = self._subject.get_datastore_file(response['data']['file_id'])
+        expected_sha256 = hashlib.sha256(content).hexdigest().upper()
+        self.assertEqual(half, first_chunk['data']['offset'])
+        self.assertEqual(expected_sha256, response['data']['file_sha256'])
+        self.assertEqual((expected_sha256, len(content), 'chunked.txt'),
+                         (file['data']['file_sha256'], file['data']['file_size'], file['data']['file_original_name']))